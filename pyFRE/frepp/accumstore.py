@@ -0,0 +1,397 @@
+"""Running sums for multi-year averages.
+
+annualAVxyrfromann (and the other ``...fromav`` producers) build a 5, 10, 20
+or 100-year average when its interval closes, by copying every 1-year average
+of the interval, concatenating them with ncrcat and running TIMAVG. With an
+:class:`AccumulatorStore`, each 1-year average is instead added, as soon as
+it's written, to persistent weighted running sums for each of the intervals
+it belongs to; closing an interval then reads the accumulator only.
+
+Each accumulator is a directory in the store holding
+
+* ``state.npz``: for each averaged variable, the sum of its values weighted by
+  each file's average_DT (or time bounds), and the sum of those weights over
+  the points where it isn't missing, in double precision; and the members
+  added so far and the averaging period,
+* ``template.nc``: the first file added, whose metadata and static variables
+  are used to write the average.
+
+Members already added are skipped, so rerunning a year doesn't count it twice.
+Updates hold a lock on the accumulator's directory and replace its state file
+in one step, so frepp jobs of different years can add to the same
+accumulator concurrently.
+The result is the TIMAVG weighting of :mod:`~pyFRE.frepp.tsengine`; the
+``verify`` command compares an average closed from an accumulator with the
+one made from the files, to check the two paths agree.
+
+Runscripts use the command line interface::
+
+    $PYFRE_ENGINE pyFRE.frepp.accumstore -d $accumdir add -c $component -p ann -s 1981 -n 5,10 $file
+    $PYFRE_ENGINE pyFRE.frepp.accumstore -d $accumdir close -o $outdir atmos.1981-1985.ann
+"""
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import re
+import shutil
+import sys
+
+import numpy as np
+import netCDF4
+
+from pyFRE.lib import FREUtil
+from . import ncio, tsengine
+
+import logging
+_log = logging.getLogger(__name__)
+
+DIR_NAME = '.frepp_accum'
+STATE_NAME = 'state.npz'
+# exit status of close when members are missing, so that runscripts can fall
+# back to averaging the files
+INCOMPLETE = 2
+
+class AccumulatorError(Exception):
+    """Raised when an accumulator can't be updated or closed."""
+    pass
+
+def interval_key(component, first, last, period):
+    """Name of the accumulator of *period* (eg. ``ann``, ``01`` or ``DJF``)
+    averages of *component* over the years *first* to *last*, which is also
+    the name of the average (without ``.nc``), eg. ``atmos.1981-1985.ann``.
+    """
+    return f"{component}.{FREUtil.padzeros(first)}-{FREUtil.padzeros(last)}.{period}"
+
+def interval_of(year, start, nyears):
+    """(first, last) years of the *nyears*-year interval containing *year*,
+    for intervals beginning with year *start*.
+    """
+    first = start + ((int(year) - start) // nyears) * nyears
+    return (first, first + nyears - 1)
+
+_year_regex = re.compile(r'\.(\d{4,})\.')
+
+def file_year(path):
+    """Year of a 1-year average file named ``{component}.{yyyy}.{period}...``."""
+    m = _year_regex.search(os.path.basename(path))
+    if not m:
+        raise AccumulatorError(f"Can't find the year in '{path}'.")
+    return int(m.group(1))
+
+
+class Accumulator():
+    """Running weighted sums of the record variables of the files added, for
+    the average called *key*, stored in the directory *path*.
+    """
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self._reset()
+        if os.path.exists(self._state_file):
+            self._load()
+
+    def _reset(self):
+        self.members = []
+        self.t1 = None
+        self.t2 = None
+        self.dt = 0.0
+        self.sums = dict()
+        self.weights = dict()
+
+    @property
+    def _state_file(self):
+        return os.path.join(self.path, STATE_NAME)
+
+    @property
+    def template(self):
+        return os.path.join(self.path, 'template.nc')
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold an exclusive lock on the accumulator (creating its directory),
+        and reload its state, which may have been updated by another process.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._reset()
+            if os.path.exists(self._state_file):
+                self._load()
+            yield self
+        finally:
+            os.close(fd)
+
+    def _load(self):
+        with np.load(self._state_file) as npz:
+            state = json.loads(str(npz['state']))
+            for name in state['variables']:
+                self.sums[name] = npz[f'sum.{name}']
+                self.weights[name] = npz[f'weight.{name}']
+        self.members = state['members']
+        self.t1, self.t2, self.dt = state['t1'], state['t2'], state['dt']
+
+    def _save(self):
+        arrays = dict()
+        for name in self.sums:
+            arrays[f'sum.{name}'] = self.sums[name]
+            arrays[f'weight.{name}'] = self.weights[name]
+        arrays['state'] = np.array(json.dumps({'members': self.members,
+            't1': self.t1, 't2': self.t2, 'dt': self.dt,
+            'variables': list(self.sums)}))
+        # replaced in one step, so an interrupted update leaves the previous
+        # state
+        tmpfile = f"{self._state_file}.{os.getpid()}.tmp.npz"
+        np.savez(tmpfile, **arrays)
+        os.replace(tmpfile, self._state_file)
+
+    @staticmethod
+    def _read_sums(path, variables=None):
+        """Weighted sums, sums of weights and averaging period of the
+        records of the averaged file *path*.
+        """
+        sums, weights = dict(), dict()
+        with ncio.open_dataset(path) as src:
+            tname = ncio.record_dim(src)
+            if tname is None:
+                raise AccumulatorError(f"No record dimension in {path}.")
+            t1, t2, dt = ncio.averaging_period(src, tname)
+            skip = set(ncio.AVERAGE_INFO_VARS) | {tname, ncio.bounds_var(src, tname)}
+            for name, var in src.variables.items():
+                if name in skip or not ncio.is_record_var(var, tname):
+                    continue
+                if variables and name not in variables:
+                    continue
+                data = np.ma.asarray(var[:])
+                w = dt.reshape(dt.shape + (1,) * (data.ndim - 1))
+                valid = ~np.ma.getmaskarray(data)
+                sums[name] = np.sum(np.ma.filled(data.astype('f8'), 0.0) * w, axis=0)
+                weights[name] = np.sum(valid * w, axis=0)
+        return sums, weights, (t1, t2, dt)
+
+    def add(self, path, member=None, variables=None):
+        """Add the records of the averaged file *path* to the sums, unless
+        *member* (by default, its file name) was added already. Returns True
+        if the file was added.
+        """
+        if member is None:
+            member = os.path.basename(path)
+        if member in self.members:
+            _log.debug(f"{member} already added to {self.key}.")
+            return False
+        # read outside the lock; only the update is serialized
+        sums, weights, (t1, t2, dt) = self._read_sums(path, variables)
+        with self.locked():
+            if member in self.members:
+                _log.debug(f"{member} already added to {self.key}.")
+                return False
+            for name, s in sums.items():
+                if name in self.sums and self.sums[name].shape != s.shape:
+                    raise AccumulatorError((f"{name} in {path} has shape "
+                        f"{s.shape}; expected {self.sums[name].shape}."))
+            for name, s in sums.items():
+                if name in self.sums:
+                    self.sums[name] += s
+                    self.weights[name] += weights[name]
+                else:
+                    self.sums[name] = s
+                    self.weights[name] = weights[name]
+            if not self.members:
+                shutil.copyfile(path, self.template)
+            self.t1 = float(np.min(t1)) if self.t1 is None else min(self.t1, float(np.min(t1)))
+            self.t2 = float(np.max(t2)) if self.t2 is None else max(self.t2, float(np.max(t2)))
+            self.dt += float(np.sum(dt))
+            self.members.append(member)
+            self._save()
+        return True
+
+    def means(self):
+        return {name: s / np.ma.masked_equal(self.weights[name], 0.0)
+            for name, s in self.sums.items()}
+
+    def write(self, outfile):
+        """Write the average of the files added to *outfile*."""
+        if not self.members:
+            raise AccumulatorError(f"Nothing was added to {self.key}.")
+        with ncio.open_dataset(self.template) as src:
+            tname = ncio.record_dim(src)
+            exclude = [name for name, var in src.variables.items()
+                if ncio.is_record_var(var, tname) and name not in self.sums
+                and name not in ncio.AVERAGE_INFO_VARS and name != tname
+                and name != ncio.bounds_var(src, tname)]
+            tsengine._write_means(outfile, src, tname, self.means(),
+                self.t1, self.t2, self.dt, exclude=exclude)
+            # as ncatted -a filename,global,m,c,... did
+            if 'filename' in src.ncattrs():
+                with netCDF4.Dataset(outfile, 'a') as dst:
+                    dst.filename = os.path.basename(outfile)
+        return outfile
+
+
+class AccumulatorStore():
+    """Accumulators, in subdirectories of the directory *path*."""
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def for_statedir(cls, statedir):
+        return cls(os.path.join(statedir, DIR_NAME))
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.path, key, STATE_NAME))
+
+    def keys(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(k for k in os.listdir(self.path) if k in self)
+
+    def get(self, key):
+        return Accumulator(os.path.join(self.path, key), key)
+
+    def add(self, path, component, period, start, intervals, year=None,
+        variables=None):
+        """Add the 1-year average *path* (of *year*, by default parsed from the
+        file name) to the accumulators of each of the *intervals* (lengths in
+        years, of intervals beginning with year *start*) containing it.
+        Returns the keys of the accumulators added to.
+        """
+        if year is None:
+            year = file_year(path)
+        keys = []
+        for nyears in intervals:
+            first, last = interval_of(year, int(start), int(nyears))
+            key = interval_key(component, first, last, period)
+            if self.get(key).add(path, member=FREUtil.padzeros(year),
+                variables=variables):
+                keys.append(key)
+        return keys
+
+    def missing(self, key):
+        """Years of the interval *key* not added to its accumulator."""
+        m = re.search(r'\.(\d{4,})-(\d{4,})\.[^.]+$', key)
+        if not m:
+            raise AccumulatorError(f"Malformed accumulator name '{key}'.")
+        members = set(self.get(key).members) if key in self else set()
+        return [FREUtil.padzeros(y) for y in range(int(m.group(1)), int(m.group(2)) + 1)
+            if FREUtil.padzeros(y) not in members]
+
+    def close(self, key, outdir, keep=False):
+        """Write the average *key* to ``{outdir}/{key}.nc``, and forget the
+        accumulator unless *keep* is True. Raises AccumulatorError if some
+        years of the interval haven't been added.
+        """
+        missing = self.missing(key)
+        if missing:
+            raise AccumulatorError(f"{key} is missing {', '.join(missing)}.")
+        acc = self.get(key)
+        with acc.locked():
+            missing = self.missing(key)
+            if missing:
+                raise AccumulatorError(f"{key} is missing {', '.join(missing)}.")
+            outfile = acc.write(os.path.join(outdir, f"{key}.nc"))
+            if not keep:
+                self.discard(key)
+        return outfile
+
+    def discard(self, key):
+        shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+
+
+def compare(path_a, path_b, rtol=0.0, atol=0.0):
+    """Compare the variables of two netCDF files. Returns a list of
+    ``(name, max_abs_diff, message)`` for the variables that differ by more
+    than the tolerances (all of them must match exactly with the default
+    tolerances of zero), or are missing from one of the files.
+    """
+    problems = []
+    with ncio.open_dataset(path_a, use_mmap=False) as a, \
+        ncio.open_dataset(path_b, use_mmap=False) as b:
+        for name in sorted(set(a.variables) | set(b.variables)):
+            if name not in a.variables or name not in b.variables:
+                problems.append((name, None, "not in both files"))
+                continue
+            va, vb = a.variables[name][:], b.variables[name][:]
+            if np.shape(va) != np.shape(vb):
+                problems.append((name, None, f"shapes {np.shape(va)} and {np.shape(vb)}"))
+                continue
+            if va.dtype.kind not in 'fiu' or vb.dtype.kind not in 'fiu':
+                if not np.array_equal(np.ma.filled(va), np.ma.filled(vb)):
+                    problems.append((name, None, "values differ"))
+                continue
+            ma, mb = np.ma.getmaskarray(va), np.ma.getmaskarray(vb)
+            if not np.array_equal(ma, mb):
+                problems.append((name, None, "missing values differ"))
+                continue
+            da = np.ma.filled(va.astype('f8'), 0.0)
+            db = np.ma.filled(vb.astype('f8'), 0.0)
+            diff = np.abs(da - db)
+            maxdiff = float(diff.max()) if diff.size else 0.0
+            if not np.all(diff <= atol + rtol * np.abs(db)):
+                problems.append((name, maxdiff, f"max abs difference {maxdiff:g}"))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.accumstore",
+        description="Running sums for frepp's multi-year averages.")
+    parser.add_argument('-d', '--dir', default=None,
+        help="Accumulator store directory.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('add', help="Add 1-year averages to the accumulators.")
+    p.add_argument('-c', '--component', required=True)
+    p.add_argument('-p', '--period', required=True,
+        help="Period averaged (ann, a month or a season), as in the file names.")
+    p.add_argument('-s', '--start', type=int, required=True,
+        help="First year of the first interval.")
+    p.add_argument('-n', '--intervals', required=True,
+        help="Comma-separated interval lengths in years.")
+    p.add_argument('-v', '--variables', default=None)
+    p.add_argument('files', nargs='+')
+    p = subparsers.add_parser('close', help=("Write averages; exits with status "
+        f"{INCOMPLETE} if years are missing."))
+    p.add_argument('-o', '--outdir', required=True)
+    p.add_argument('-k', '--keep', action='store_true')
+    p.add_argument('keys', nargs='+')
+    subparsers.add_parser('list', help="List accumulators and the years they hold.")
+    p = subparsers.add_parser('verify', help=("Compare an average from an "
+        "accumulator with one made from the files."))
+    p.add_argument('-r', '--rtol', type=float, default=0.0)
+    p.add_argument('-a', '--atol', type=float, default=0.0)
+    p.add_argument('files', nargs=2)
+    args = parser.parse_args(argv)
+
+    if args.command == 'verify':
+        problems = compare(*args.files, rtol=args.rtol, atol=args.atol)
+        for name, _, msg in problems:
+            print(f"{name}: {msg}")
+        return 1 if problems else 0
+
+    if args.dir is None:
+        parser.error("-d is required.")
+    store = AccumulatorStore(args.dir)
+    try:
+        if args.command == 'add':
+            variables = [v for v in (args.variables or '').split(',') if v]
+            intervals = [int(n) for n in args.intervals.split(',') if n]
+            for f in args.files:
+                store.add(f, args.component, args.period, args.start, intervals,
+                    variables=variables)
+        elif args.command == 'close':
+            for key in args.keys:
+                missing = store.missing(key)
+                if missing:
+                    print(f"{key}: missing {' '.join(missing)}", file=sys.stderr)
+                    return INCOMPLETE
+                store.close(key, args.outdir, keep=args.keep)
+        else:
+            for key in store.keys():
+                print(key, ' '.join(store.get(key).members))
+    except (AccumulatorError, OSError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
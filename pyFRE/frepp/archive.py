@@ -0,0 +1,365 @@
+"""Read and update cpio and tar archives in place.
+
+:func:`~pyFRE.frepp.sub.createcpio` used to add files to an existing
+``.nc.cpio`` archive by listing it with ``cpio -it``, comparing names in a
+nested csh loop, and -- if any file was already archived -- unpacking the whole
+archive and archiving everything again. :class:`Archive` instead reads the
+member index from the headers (seeking over the data), and
+
+* appends new members after the last one, overwriting the trailer,
+* overwrites a replaced member's data in place if its size didn't change,
+* otherwise only rewrites the members from the first resized one onwards,
+  copying the unchanged ones among them byte for byte.
+
+Member data is streamed with large buffers and never held in memory. The
+"odc" (POSIX) and "newc" (SVR4) cpio formats, GNU cpio's default "bin" format
+(little-endian) and tar are supported; an existing archive keeps its format.
+
+From the runscript::
+
+    $PYFRE_ENGINE pyFRE.frepp.archive -f $cpiofile add $files
+"""
+import argparse
+import collections
+import os
+import stat
+import struct
+import sys
+import tarfile
+import tempfile
+
+import logging
+_log = logging.getLogger(__name__)
+
+BUFSIZE = 1 << 22
+FORMATS = ('odc', 'newc', 'bin', 'tar')
+_TRAILER = 'TRAILER!!!'
+_BIN_MAGIC = 0o070707
+_BIN_STRUCT = struct.Struct('<13H')
+
+Member = collections.namedtuple('Member',
+    ['name', 'offset', 'data_offset', 'size', 'end', 'mtime', 'mode'])
+Member.__doc__ = """Index entry of an archive member. The member's headers
+start at *offset*, its data spans *size* bytes from *data_offset*, and the next
+member starts at *end* (after padding).
+"""
+
+
+def _pad(n, align):
+    return (-n) % align
+
+def copy_range(src, dst, size, bufsize=BUFSIZE):
+    """Copy *size* bytes from the current position of file object *src* to
+    that of *dst*.
+    """
+    while size > 0:
+        buf = src.read(min(bufsize, size))
+        if not buf:
+            raise EOFError("Unexpected end of archive.")
+        dst.write(buf)
+        size -= len(buf)
+
+def detect_format(path):
+    """Return the format of the archive at *path* (one of :data:`FORMATS`), or
+    None if it's empty or missing.
+    """
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(6)
+    except FileNotFoundError:
+        return None
+    if not magic:
+        return None
+    if magic == b'070707':
+        return 'odc'
+    if magic in (b'070701', b'070702'):
+        return 'newc'
+    if len(magic) >= 2 and struct.unpack('<H', magic[:2])[0] == _BIN_MAGIC:
+        return 'bin'
+    if tarfile.is_tarfile(path):
+        return 'tar'
+    raise ValueError(f"{path} is not a supported cpio or tar archive.")
+
+
+class Archive():
+    """cpio or tar archive at *path*. *format* is only used if the archive is
+    created; by default it's tar for ``.tar`` files and odc otherwise.
+    """
+    def __init__(self, path, format=None):
+        self.path = path
+        existing = detect_format(path)
+        if existing is None:
+            if format is None:
+                format = 'tar' if path.endswith('.tar') else 'odc'
+            if format not in FORMATS:
+                raise ValueError(f"Unknown archive format '{format}'.")
+        self.format = existing or format
+        self._index = None
+        self._end = 0 # offset of the trailer
+
+    # ---- index --------------------------------------------------------------
+
+    @property
+    def index(self):
+        """Dict from member name to :class:`Member`, in archive order. Read
+        from the archive headers on first access.
+        """
+        if self._index is None:
+            self._index = collections.OrderedDict()
+            self._end = 0
+            if os.path.exists(self.path) and os.path.getsize(self.path):
+                if self.format == 'tar':
+                    self._read_tar_index()
+                else:
+                    self._read_cpio_index()
+        return self._index
+
+    def names(self):
+        return list(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index.values())
+
+    def _read_tar_index(self):
+        with tarfile.open(self.path, 'r:') as tar:
+            for info in tar:
+                data_end = info.offset_data + (info.size if info.isreg() else 0)
+                end = data_end + _pad(data_end, tarfile.BLOCKSIZE)
+                ftype = stat.S_IFREG if info.isreg() else \
+                    (stat.S_IFDIR if info.isdir() else 0)
+                self._index[info.name] = Member(info.name, info.offset,
+                    info.offset_data, info.size if info.isreg() else 0,
+                    end, info.mtime, ftype | info.mode)
+                self._end = end
+
+    def _read_cpio_header(self, f):
+        offset = f.tell()
+        if self.format == 'odc':
+            hdr = f.read(76)
+            if len(hdr) < 76 or hdr[:6] != b'070707':
+                raise ValueError(f"Bad odc header at offset {offset} in {self.path}.")
+            mode, mtime = int(hdr[18:24], 8), int(hdr[48:59], 8)
+            namesize, size = int(hdr[59:65], 8), int(hdr[65:76], 8)
+            name = f.read(namesize)
+            data_offset, align = offset + 76 + namesize, 1
+        elif self.format == 'newc':
+            hdr = f.read(110)
+            if len(hdr) < 110 or hdr[:6] not in (b'070701', b'070702'):
+                raise ValueError(f"Bad newc header at offset {offset} in {self.path}.")
+            fields = [int(hdr[i:i + 8], 16) for i in range(6, 110, 8)]
+            mode, mtime, size, namesize = fields[1], fields[5], fields[6], fields[11]
+            name = f.read(namesize)
+            data_offset = offset + 110 + namesize
+            data_offset += _pad(data_offset, 4)
+            align = 4
+        else:
+            hdr = f.read(_BIN_STRUCT.size)
+            if len(hdr) < _BIN_STRUCT.size:
+                raise ValueError(f"Bad bin header at offset {offset} in {self.path}.")
+            fields = _BIN_STRUCT.unpack(hdr)
+            if fields[0] != _BIN_MAGIC:
+                raise ValueError(f"Bad bin header at offset {offset} in {self.path}.")
+            mode, mtime = fields[3], (fields[8] << 16) | fields[9]
+            namesize, size = fields[10], (fields[11] << 16) | fields[12]
+            name = f.read(namesize)
+            data_offset = offset + _BIN_STRUCT.size + namesize
+            data_offset += _pad(data_offset, 2)
+            align = 2
+        name = name.rstrip(b'\0').decode('utf-8', 'surrogateescape')
+        end = data_offset + size
+        end += _pad(end, align)
+        return Member(name, offset, data_offset, size, end, mtime, mode)
+
+    def _read_cpio_index(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                m = self._read_cpio_header(f)
+                if m.name == _TRAILER:
+                    self._end = m.offset
+                    break
+                self._index[m.name] = m
+                f.seek(m.end)
+
+    # ---- writing ------------------------------------------------------------
+
+    def _header(self, name, st, ino):
+        """Header bytes (including name and padding) for a member *name* with
+        the stat result *st*, starting at an aligned offset.
+        """
+        mode = stat.S_IFREG | stat.S_IMODE(st.st_mode) if st is not None else 0
+        mtime = int(st.st_mtime) if st is not None else 0
+        size = st.st_size if st is not None else 0
+        nlink = 1 if st is not None else 0
+        bname = name.encode('utf-8', 'surrogateescape') + b'\0'
+        if self.format == 'tar':
+            info = tarfile.TarInfo(name)
+            info.size, info.mtime, info.mode = size, mtime, stat.S_IMODE(mode)
+            return info.tobuf(tarfile.GNU_FORMAT, 'utf-8', 'surrogateescape')
+        if self.format == 'odc':
+            if size >= 8**11:
+                raise ValueError(f"{name} is too large for the odc cpio format.")
+            return (f"070707{0:06o}{ino % 8**6:06o}{mode:06o}{0:06o}{0:06o}{nlink:06o}"
+                f"{0:06o}{mtime:011o}{len(bname):06o}{size:011o}").encode() + bname
+        if self.format == 'newc':
+            if size >= 1 << 32:
+                raise ValueError(f"{name} is too large for the newc cpio format.")
+            hdr = b'070701' + b''.join(f"{x:08X}".encode() for x in (
+                ino, mode, 0, 0, nlink, mtime, size, 0, 0, 0, 0, len(bname), 0))
+            hdr += bname
+            return hdr + b'\0' * _pad(len(hdr), 4)
+        if size >= 1 << 32:
+            raise ValueError(f"{name} is too large for the bin cpio format.")
+        hdr = _BIN_STRUCT.pack(_BIN_MAGIC, 0, ino & 0xFFFF, mode & 0xFFFF, 0, 0,
+            nlink, 0, (mtime >> 16) & 0xFFFF, mtime & 0xFFFF, len(bname),
+            size >> 16, size & 0xFFFF) + bname
+        return hdr + b'\0' * _pad(len(hdr), 2)
+
+    def _data_align(self):
+        return {'tar': tarfile.BLOCKSIZE, 'newc': 4, 'bin': 2}.get(self.format, 1)
+
+    def _write_member(self, f, path, name, ino):
+        st = os.stat(path)
+        offset = f.tell()
+        hdr = self._header(name, st, ino)
+        f.write(hdr)
+        with open(path, 'rb') as src:
+            copy_range(src, f, st.st_size)
+        end = offset + len(hdr) + st.st_size
+        f.write(b'\0' * _pad(end, self._data_align()))
+        return Member(name, offset, offset + len(hdr), st.st_size,
+            end + _pad(end, self._data_align()), int(st.st_mtime),
+            stat.S_IFREG | stat.S_IMODE(st.st_mode))
+
+    def _write_trailer(self, f):
+        if self.format == 'tar':
+            f.write(b'\0' * (2 * tarfile.BLOCKSIZE))
+            f.write(b'\0' * _pad(f.tell(), tarfile.RECORDSIZE))
+        else:
+            f.write(self._header(_TRAILER, None, 0))
+            f.write(b'\0' * _pad(f.tell(), 512))
+        f.truncate()
+
+    def add(self, paths, arcnames=None):
+        """Add the files *paths* to the archive, as *arcnames* (by default,
+        their basenames). Files not yet in the archive are appended; members
+        with the same name are replaced, in place if their size is unchanged.
+        Returns a dict with the lists of ``appended``, ``replaced`` (in place)
+        and ``moved`` (rewritten) member names.
+        """
+        paths = list(paths)
+        if arcnames is None:
+            arcnames = [os.path.basename(p) for p in paths]
+        files = collections.OrderedDict(zip(arcnames, paths))
+        index = self.index
+        result = {'appended': [], 'replaced': [], 'moved': []}
+
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        with open(self.path, mode) as f:
+            resized = []
+            for name, path in files.items():
+                if name not in index:
+                    continue
+                m = index[name]
+                st = os.stat(path)
+                hdr = self._header(name, st, len(index))
+                if st.st_size != m.size or len(hdr) != m.data_offset - m.offset:
+                    resized.append(name)
+                    continue
+                f.seek(m.offset)
+                f.write(hdr)
+                with open(path, 'rb') as src:
+                    copy_range(src, f, st.st_size)
+                index[name] = m._replace(mtime=int(st.st_mtime))
+                result['replaced'].append(name)
+
+            # rewrite everything from the first resized member on
+            cut = min((index[n].offset for n in resized), default=self._end)
+            tail = [m for m in index.values() if m.offset >= cut and m.name not in resized]
+            with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.path))) as spool:
+                for m in tail:
+                    f.seek(m.offset)
+                    copy_range(f, spool, m.end - m.offset)
+                spool.seek(0)
+                f.seek(cut)
+                for m in tail:
+                    delta = f.tell() - m.offset
+                    copy_range(spool, f, m.end - m.offset)
+                    index[m.name] = m._replace(offset=m.offset + delta,
+                        data_offset=m.data_offset + delta, end=m.end + delta)
+                    index.move_to_end(m.name)
+                    result['moved'].append(m.name)
+            for name, path in files.items():
+                if name in index and name not in resized:
+                    continue
+                if name in resized:
+                    del index[name]
+                    result['replaced'].append(name)
+                else:
+                    result['appended'].append(name)
+                index[name] = self._write_member(f, path, name, len(index) + 1)
+            self._end = f.tell()
+            self._write_trailer(f)
+        return result
+
+    # ---- reading ------------------------------------------------------------
+
+    def extract(self, dest, names=None):
+        """Write the members *names* (by default, all) into the directory
+        *dest*, restoring their mtimes. Returns the paths written.
+        """
+        members = list(self) if names is None else [self.index[n] for n in names]
+        os.makedirs(dest, exist_ok=True)
+        written = []
+        with open(self.path, 'rb') as f:
+            for m in members:
+                if not stat.S_ISREG(m.mode):
+                    continue
+                out = os.path.join(dest, os.path.basename(m.name))
+                f.seek(m.data_offset)
+                with open(out, 'wb') as dst:
+                    copy_range(f, dst, m.size)
+                os.chmod(out, stat.S_IMODE(m.mode) or 0o644)
+                os.utime(out, (m.mtime, m.mtime))
+                written.append(out)
+        return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.archive",
+        description="List, update or extract cpio and tar archives.")
+    parser.add_argument('-f', '--file', required=True, help="Archive file.")
+    parser.add_argument('-H', '--format', choices=FORMATS, default=None,
+        help="Format of a new archive (default: tar for .tar files, else odc).")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="List member names.")
+    p = subparsers.add_parser('add', help="Append or replace members.")
+    p.add_argument('paths', nargs='+')
+    p = subparsers.add_parser('extract', help="Extract members.")
+    p.add_argument('-C', '--directory', default='.')
+    p.add_argument('names', nargs='*')
+    args = parser.parse_args(argv)
+
+    try:
+        archive = Archive(args.file, format=args.format)
+        if args.command == 'list':
+            for name in archive.names():
+                print(name)
+        elif args.command == 'add':
+            result = archive.add(args.paths)
+            print((f"{args.file}: appended {len(result['appended'])}, replaced "
+                f"{len(result['replaced'])}, moved {len(result['moved'])} members"))
+        else:
+            archive.extract(args.directory, args.names or None)
+    except Exception as exc:
+        print(f"ERROR: archive {args.command} {args.file}: {exc!r}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""NetCDF compression of postprocessed files, replacing the ``ncdump -hs`` /
+``grep _DeflateLevel`` probes of the history files and the serial ``nccopy``
+passes emitted by :func:`~pyFRE.frepp.sub.compress_csh` and
+:func:`~pyFRE.frepp.sub.uncompress_history_csh`.
+
+The compression settings (deflate level and shuffle) of each variable of a
+diag source are read from one of its history files once and cached in a
+directory shared by the experiment's jobs, keyed by the diag source. Output
+files are then compressed with those settings per variable -- variables the
+source doesn't have get the settings given by ``$nc_compression_flags`` --
+by a bounded pool of worker processes. Files whose variables are already
+stored with the target settings aren't rewritten. Each file compressed adds
+a line (component, bytes before and after, seconds) to a report, which
+``report`` summarizes per component.
+
+Can be called from the generated runscript via
+``python3 -m pyFRE.frepp.compression``.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from . import fanout, ncconcat, ncio
+
+import logging
+_log = logging.getLogger(__name__)
+
+DIR_NAME = '.frepp_compression'
+REPORT_NAME = 'report.jsonl'
+
+class CompressionError(Exception):
+    """Raised when a file can't be compressed."""
+    pass
+
+def var_settings(var):
+    """``(deflate level, shuffle)`` of netCDF4 Variable *var*; level 0 if it
+    isn't compressed.
+    """
+    try:
+        filters = var.filters() or dict()
+    except (AttributeError, RuntimeError):
+        filters = dict()
+    if not filters.get('zlib'):
+        return (0, False)
+    return (int(filters.get('complevel') or 0), bool(filters.get('shuffle')))
+
+def file_settings(path):
+    """``{var: (deflate level, shuffle)}`` for the variables of *path* that
+    have dimensions.
+    """
+    with ncio.open_dataset(path) as ds:
+        return {name: var_settings(var) for name, var in ds.variables.items()
+            if var.dimensions}
+
+def flags_settings(flags):
+    """``(deflate level, shuffle)`` given by nccopy options *flags*."""
+    opts = ncconcat.parse_nccopy_flags(flags)
+    return (opts['complevel'] or 0, opts['shuffle'])
+
+def summary_settings(settings):
+    """Settings equivalent to the ``sort -r | head -n 1`` of the old probes:
+    the highest deflate level of any variable, and whether any variable is
+    shuffled.
+    """
+    levels = [s[0] for s in settings.values()]
+    return (max(levels, default=0), any(s[1] for s in settings.values()))
+
+
+class SettingsCache():
+    """Compression settings of diag sources, as a JSON file per source in
+    directory *path*.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._memo = dict()
+
+    def _file(self, source):
+        return os.path.join(self.path, f"{source}.json")
+
+    def get(self, source):
+        """Cached ``{var: (deflate level, shuffle)}`` of *source*, or None."""
+        if source not in self._memo:
+            try:
+                with open(self._file(source)) as f:
+                    self._memo[source] = {k: tuple(v) for k, v in json.load(f).items()}
+            except FileNotFoundError:
+                return None
+        return self._memo[source]
+
+    def probe(self, source, path):
+        """Settings of *source*: cached, or read from its history file
+        *path* and cached.
+        """
+        settings = self.get(source)
+        if settings is not None:
+            return settings
+        settings = file_settings(path)
+        os.makedirs(self.path, exist_ok=True)
+        tmpfile = f"{self._file(source)}.{os.getpid()}.tmp"
+        with open(tmpfile, 'w') as f:
+            json.dump({k: list(v) for k, v in settings.items()}, f, indent=1, sort_keys=True)
+        os.replace(tmpfile, self._file(source))
+        self._memo[source] = settings
+        return settings
+
+
+def plan(path, default, source_settings=None):
+    """``{var: (deflate level, shuffle)}`` to store the variables of *path*
+    with: those of *source_settings* where it has the variable, else
+    *default*.
+    """
+    source_settings = source_settings or dict()
+    return {name: source_settings.get(name, default) for name in file_settings(path)}
+
+def needs_rewrite(path, target):
+    """True unless every variable of *path* is stored as in *target*."""
+    current = file_settings(path)
+    return any(current.get(name) != tuple(settings) for name, settings in target.items())
+
+def rewrite(path, target):
+    """Rewrite *path* in place, storing each variable with the ``(deflate
+    level, shuffle)`` of *target*. Classic-format files that are to be
+    compressed become netCDF-4 classic files, as with nccopy.
+    """
+    tmpfile = path + '.compressed'
+    with ncio.open_dataset(path) as src:
+        compress = any(level for level, _ in target.values())
+        fmt = ncio.output_format(src.data_model, compress=compress)
+        dst = ncio.create_like(tmpfile, src, exclude=src.variables, fmt=fmt)
+        try:
+            for var in src.variables.values():
+                level, shuffle = target.get(var.name, (0, False))
+                ncio.copy_var_def(dst, var, zlib=bool(level), complevel=level or None,
+                    shuffle=shuffle)
+            for name, var in src.variables.items():
+                var.set_auto_maskandscale(False)
+                out = dst.variables[name]
+                out.set_auto_maskandscale(False)
+                if var.dimensions:
+                    out[:] = var[:]
+                else:
+                    out.assignValue(var.getValue())
+        except BaseException:
+            dst.close()
+            os.remove(tmpfile)
+            raise
+        dst.close()
+    os.replace(tmpfile, path)
+
+def compress_file(path, default, source_settings=None, component=None):
+    """Store *path* with the settings of :func:`plan`, unless it already is.
+    Returns a report record ``{'file', 'component', 'before', 'after',
+    'seconds', 'skipped'}``.
+    """
+    start = time.perf_counter()
+    before = os.path.getsize(path)
+    target = plan(path, default, source_settings)
+    skipped = not needs_rewrite(path, target)
+    if not skipped:
+        rewrite(path, target)
+    if component is None:
+        component = os.path.basename(path).split('.')[0]
+    return {'file': path, 'component': component, 'before': before,
+        'after': os.path.getsize(path), 'seconds': time.perf_counter() - start,
+        'skipped': skipped}
+
+def compress_files(paths, default, source_settings=None, component=None, nworkers=1):
+    """:func:`compress_file` each of *paths*, in *nworkers* worker processes.
+    Returns the report records, in the order of *paths*.
+    """
+    def run(path):
+        return compress_file(path, default, source_settings, component)
+    return list(fanout.map_ordered(run, paths, nworkers=nworkers))
+
+def append_report(report_path, records):
+    """Append *records* (skipped files excepted) to the report at
+    *report_path*.
+    """
+    lines = [json.dumps(r, sort_keys=True) for r in records if not r['skipped']]
+    if not lines:
+        return
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'a') as f:
+        f.write(''.join(line + '\n' for line in lines))
+
+def summarize(report_path):
+    """Totals per component of the report at *report_path*: ``{component:
+    {'files', 'before', 'after', 'saved', 'seconds'}}``.
+    """
+    totals = dict()
+    with open(report_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            r = json.loads(line)
+            t = totals.setdefault(r['component'],
+                {'files': 0, 'before': 0, 'after': 0, 'saved': 0, 'seconds': 0.0})
+            t['files'] += 1
+            t['before'] += r['before']
+            t['after'] += r['after']
+            t['saved'] += r['before'] - r['after']
+            t['seconds'] += r['seconds']
+    return totals
+
+def format_summary(totals):
+    """Table of :func:`summarize` *totals*."""
+    lines = [f"{'component':<24} {'files':>6} {'MB before':>10} {'MB after':>10} "
+        f"{'MB saved':>10} {'seconds':>9} {'MB/s saved':>10}"]
+    for component in sorted(totals):
+        t = totals[component]
+        rate = (t['saved'] / 2**20 / t['seconds']) if t['seconds'] else 0.
+        lines.append(f"{component:<24} {t['files']:>6} {t['before'] / 2**20:>10.1f} "
+            f"{t['after'] / 2**20:>10.1f} {t['saved'] / 2**20:>10.1f} "
+            f"{t['seconds']:>9.1f} {rate:>10.2f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.compression",
+        description="Compress postprocessed netCDF files.")
+    sub_parsers = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub_parsers.add_parser('probe',
+        help="Print (and cache) a diag source's compression settings.")
+    p.add_argument('-D', '--cache-dir', required=True, help="Settings cache directory.")
+    p.add_argument('-s', '--source', required=True, help="Diag source.")
+    p.add_argument('-f', '--field', choices=('deflate', 'shuffle', 'flags'), default='flags',
+        help="Print the deflate level, shuffle (true/false) or nccopy flags.")
+    p.add_argument('file', help="History file of the diag source.")
+
+    p = sub_parsers.add_parser('compress', help="Compress files in place.")
+    p.add_argument('-z', '--nccopy-flags', default='',
+        help="nccopy options giving the default settings (eg. '-d 2 -s').")
+    p.add_argument('-D', '--cache-dir', default=None, help="Settings cache directory.")
+    p.add_argument('-s', '--source', default=None,
+        help="Diag source whose cached per-variable settings to use.")
+    p.add_argument('-c', '--component', default=None,
+        help="Component to report (default: first field of the file name).")
+    p.add_argument('-r', '--report', default=None, help="Report file to append to.")
+    p.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes.")
+    p.add_argument('files', nargs='+')
+
+    p = sub_parsers.add_parser('report', help="Summarize a report per component.")
+    p.add_argument('report')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.cmd == 'probe':
+            settings = SettingsCache(args.cache_dir).probe(args.source, args.file)
+            level, shuffle = summary_settings(settings)
+            if args.field == 'deflate':
+                print(level)
+            elif args.field == 'shuffle':
+                print('true' if shuffle else 'false')
+            elif level:
+                print(f"-d {level}" + (" -s" if shuffle else ""))
+        elif args.cmd == 'compress':
+            default = flags_settings(args.nccopy_flags)
+            source_settings = None
+            if args.source:
+                if not args.cache_dir:
+                    raise CompressionError("-s requires -D.")
+                source_settings = SettingsCache(args.cache_dir).get(args.source)
+            nworkers = args.jobs
+            if nworkers is None:
+                nworkers = fanout.default_workers(len(args.files))
+            records = compress_files(args.files, default, source_settings,
+                args.component, nworkers=nworkers)
+            if args.report:
+                append_report(args.report, records)
+            _log.info(f"Compressed {sum(not r['skipped'] for r in records)} of "
+                f"{len(records)} files.")
+        else:
+            print(format_summary(summarize(args.report)))
+    except (CompressionError, ncconcat.ConcatError, OSError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
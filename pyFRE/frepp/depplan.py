@@ -0,0 +1,259 @@
+"""Planner for resubmitting the component-years a frepp job depends on.
+
+Instead of starting one frepp (and one batch submission) per missing or failed
+year, :class:`DependencyPlan` collects the component-years that need redoing,
+together with the dependencies between them, and submits them as one Slurm job
+array per "wave" of the dependency graph. Each wave waits on the previous one
+with an ``afterok`` dependency, so recovering N years takes one scheduler
+interaction per wave instead of one per year. The runscript of each
+component-year is generated up front by the planning frepp (frepp without
+``-s``, see :func:`generate_runscript`); the array tasks only run them, with
+the batch directives the runscripts would have been submitted with. The
+years each runscript depends on and the running jobs it's to be held on are
+read back from its ``#INFO:depyears=`` and ``#INFO:holds=`` lines.
+"""
+import collections
+import dataclasses as dc
+import os
+import re
+
+import pyFRE.util as util
+
+import logging
+_log = logging.getLogger(__name__)
+
+_jobid_regex = re.compile(r'Submitted batch job (\d+)')
+# runscript directives that apply to the array tasks running them
+ARRAY_DIRECTIVES = ('--time', '--chdir', '--comment', '--constraint')
+_directive_regex = re.compile(r'#SBATCH\s+(--[\w-]+)(?:[= ]\s*(\S.*))?$')
+
+
+@dc.dataclass(frozen=True)
+class ComponentYear():
+    """Node of the dependency graph. ``str()`` gives its key in the state store."""
+    component: str
+    year: str
+
+    def __str__(self):
+        return f"{self.component}.{self.year}"
+
+
+@dc.dataclass
+class DependencyTask():
+    """Redoing one component-year: *command* wrote the runscript *outscript*
+    without submitting it, and the array task runs it.
+    """
+    node: ComponentYear
+    command: str
+    outscript: str
+
+
+def parse_jobid(submit_output):
+    """Return the job ID from the last line of *submit_output* (sbatch's
+    "Submitted batch job N"), or None.
+    """
+    lines = submit_output.strip().splitlines()
+    if not lines:
+        return None
+    match = _jobid_regex.match(lines[-1].strip())
+    if not match:
+        return None
+    return match.group(1)
+
+
+def generate_runscript(command, outscript, runner=None):
+    """Run the frepp *command* writing the runscript *outscript* of a
+    component-year. Returns False if frepp found the year already completed
+    (so there's nothing to redo), True if the runscript was written; raises
+    :class:`~pyFRE.util.MDTFCalledProcessError` otherwise.
+    """
+    if runner is None:
+        runner = lambda cmd: util.shell(cmd, log=_log)
+    output = runner(command.strip())
+    lines = output.strip().splitlines()
+    if lines and "has already been completed" in lines[-1]:
+        return False
+    if not os.path.exists(outscript):
+        raise util.MDTFCalledProcessError(1, command,
+            f"Runscript {outscript} wasn't written.")
+    return True
+
+def _walltime_seconds(walltime):
+    """Seconds in a Slurm time limit ("MM", "HH:MM:SS", "D-HH", ...)."""
+    days, _, rest = walltime.rpartition('-')
+    fields = [int(f) for f in rest.split(':')]
+    if days:
+        # after a day count the fields are hours, minutes, seconds
+        fields += [0] * (3 - len(fields))
+    elif len(fields) < 3:
+        # minutes, or minutes:seconds
+        fields = [0] + fields + [0] * (2 - len(fields))
+    h, m, sec = fields
+    return ((int(days or 0) * 24 + h) * 60 + m) * 60 + sec
+
+def runscript_directives(paths, keys=ARRAY_DIRECTIVES):
+    """The ``#SBATCH`` lines for options *keys* of the runscripts *paths*, to
+    be used for a job array running all of them. Options are taken from the
+    first runscript setting them, except ``--time``, which is the longest of
+    any. Runscripts that don't exist are skipped.
+    """
+    found = dict()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                match = _directive_regex.match(line.strip())
+                if not match or match.group(1) not in keys or not match.group(2):
+                    continue
+                key, value = match.groups()
+                if key == '--time' and key in found:
+                    if _walltime_seconds(value) <= _walltime_seconds(found[key]):
+                        continue
+                elif key in found:
+                    continue
+                found[key] = value
+    return [f"#SBATCH {k}={found[k]}" for k in keys if k in found]
+
+
+def runscript_info(path, key):
+    """Value of the ``#INFO:{key}=`` line of the runscript *path* (eg. the
+    ``depyears`` and the ``holds`` on running jobs frepp found for it), or ''.
+    """
+    prefix = f"#INFO:{key}="
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(prefix):
+                return line[len(prefix):].strip()
+    return ""
+
+def runscript_holds(paths):
+    """Sorted job IDs that any of the runscripts *paths* is to be held on."""
+    return sorted({jobid for path in paths if os.path.exists(path)
+        for jobid in runscript_info(path, 'holds').split(':') if jobid})
+
+
+class DependencyPlan():
+    """Set of component-years to redo and the ``afterok`` edges between them."""
+    def __init__(self):
+        self.tasks = dict() # ComponentYear -> DependencyTask, in insertion order
+        self.after = collections.defaultdict(set)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __contains__(self, node):
+        return node in self.tasks
+
+    def add(self, component, year, command, outscript, after=()):
+        """Add the component-year (*component*, *year*), to be run after the
+        component-years in *after*, which need not have been added yet. Adding
+        a node twice only merges its dependencies.
+        """
+        node = ComponentYear(component, str(year))
+        if node not in self.tasks:
+            self.tasks[node] = DependencyTask(node, command.strip(), outscript)
+        for dep in after:
+            if not isinstance(dep, ComponentYear):
+                dep = ComponentYear(*dep)
+            self.after[node].add(dep)
+        return node
+
+    def waves(self):
+        """Split the tasks into waves: each task only depends on tasks in
+        earlier waves. Dependencies on nodes that aren't part of the plan (eg.
+        years that are already OK) are ignored. Raises ValueError on cycles.
+        """
+        pending = {
+            node: {dep for dep in self.after[node] if dep in self.tasks}
+            for node in self.tasks
+        }
+        waves = []
+        done = set()
+        while pending:
+            wave = [n for n, deps in pending.items() if deps <= done]
+            if not wave:
+                cycle = ', '.join(str(n) for n in pending)
+                raise ValueError(f"Circular dependency between {cycle}.")
+            for node in wave:
+                del pending[node]
+            done.update(wave)
+            waves.append([self.tasks[n] for n in wave])
+        return waves
+
+    @staticmethod
+    def array_script(tasks, job_name, output=None, directives=()):
+        """Return the csh script for a Slurm job array running *tasks*; array
+        index i runs the runscript of ``tasks[i]``. *directives* are extra
+        ``#SBATCH`` lines (see :func:`runscript_directives`).
+        """
+        header = [
+            "#!/bin/csh -f",
+            f"#SBATCH --job-name={job_name}",
+            "#SBATCH --ntasks=1",
+            f"#SBATCH --array=0-{len(tasks) - 1}",
+        ]
+        if output:
+            header.append(f"#SBATCH --output={output}")
+        header += list(directives)
+        lines = ["", "switch ( $SLURM_ARRAY_TASK_ID )"]
+        for i, task in enumerate(tasks):
+            lines += [
+                f"    case {i}:",
+                f"        echo \"Redoing {task.node}\"",
+                f"        csh -f {task.outscript}",
+                "        exit $status",
+            ]
+        lines += [
+            "    default:",
+            f"        echo \"ERROR: no task $SLURM_ARRAY_TASK_ID in {job_name}\"",
+            "        exit 1",
+            "endsw",
+        ]
+        return '\n'.join(header + lines) + '\n'
+
+    def submit(self, scriptdir, job_name, batch_submit, store=None,
+        after=(), output=None, runner=None):
+        """Write and submit one job array per wave. Wave k is held with
+        ``afterok`` on the array job of wave k-1 (wave 0 on the job IDs in
+        *after*), and on the running jobs its runscripts record holds on. If a :class:`~pyFRE.frepp.statestore.StateStore` *store* is
+        given, each component-year's state is set to the ID of the array task
+        that redoes it, as a submitted frepp job would have done.
+
+        Returns the list of array job IDs, one per wave.
+        """
+        if runner is None:
+            runner = lambda cmd: util.shell(cmd, log=_log)
+        if not os.path.isdir(scriptdir):
+            os.makedirs(scriptdir)
+        jobids = []
+        holds = list(after)
+        for k, tasks in enumerate(self.waves()):
+            script = os.path.join(scriptdir, f"{job_name}.wave{k}")
+            directives = runscript_directives([t.outscript for t in tasks])
+            with open(script, 'w') as f:
+                f.write(self.array_script(tasks, f"{job_name}.wave{k}", output,
+                    directives))
+            os.chmod(script, 0o775)
+
+            holds += [j for j in runscript_holds([t.outscript for t in tasks])
+                if j not in holds]
+            cmd = f"{batch_submit} --array=0-{len(tasks) - 1}"
+            if holds:
+                cmd += f" --dependency=afterok:{':'.join(holds)}"
+            _log.debug(f"Executing '{cmd} {script}'")
+            jobid = parse_jobid(runner(f"{cmd} {script}"))
+            if not jobid:
+                raise util.MDTFCalledProcessError(1, cmd,
+                    f"No jobid resulted from the submission of {script}.")
+            _log.info((f"Submitted {len(tasks)} dependent component-years as "
+                f"job array {jobid}: {', '.join(str(t.node) for t in tasks)}"))
+            if store is not None:
+                store.set_many(
+                    (t.node.component, t.node.year, f"{jobid}_{i}")
+                    for i, t in enumerate(tasks)
+                )
+            jobids.append(jobid)
+            holds = [jobid]
+        return jobids
@@ -0,0 +1,117 @@
+"""Batched creation of frepp's output directories.
+
+frepp.pl collected the archive directories each component writes to in one
+``mkdir -p`` command string, which :func:`~pyFRE.frepp.sub.createdirs` split at
+5000 characters and ran on the archive host, once or twice per component.
+:class:`DirectoryPlan` collects the directories as a set instead:
+
+* duplicates, and directories that are a parent of another requested
+  directory (which ``mkdir -p`` creates anyway), are dropped,
+* directories already created (or found to exist) are remembered, so later
+  components and years don't request them again,
+* the remaining ones are created with one ``mkdir -p`` on the archive host
+  (split only if the command would exceed *max_cmdlen*), or locally with a
+  thread pool of :func:`os.makedirs` calls.
+"""
+import concurrent.futures
+import os
+import shlex
+
+import logging
+_log = logging.getLogger(__name__)
+
+
+class DirectoryPlan():
+    """Set of directories to create.
+
+    If *host* is given, directories are created by calling ``runner(host,
+    cmd)`` with ``mkdir -p`` commands (frepp passes
+    :func:`~pyFRE.frepp.sub.execute`); otherwise they're created locally.
+    """
+    def __init__(self, host=None, runner=None, nworkers=8, max_cmdlen=100000):
+        self.host = host
+        self.runner = runner
+        self.nworkers = max(nworkers, 1)
+        self.max_cmdlen = max_cmdlen
+        self.known = set() # directories known to exist
+        self._pending = set()
+
+    def __len__(self):
+        return len(self.pending())
+
+    def __bool__(self):
+        return bool(self._pending)
+
+    def add(self, *paths):
+        """Request the directories *paths* (and their parents)."""
+        for path in paths:
+            if not path:
+                continue
+            path = os.path.normpath(path)
+            if path not in self.known:
+                self._pending.add(path)
+
+    def pending(self):
+        """Sorted list of the directories that will be created, without those
+        that are parents of other pending directories.
+        """
+        leaves = []
+        # in sorted order, a directory's descendants directly follow it
+        for path in sorted(self._pending, key=lambda p: p.split(os.sep)):
+            if leaves and path.startswith(leaves[-1].rstrip(os.sep) + os.sep):
+                leaves.pop()
+            leaves.append(path)
+        return leaves
+
+    def drain(self):
+        """Sorted list of all the directories requested and not yet created,
+        including those that are parents of others; they are no longer
+        pending afterwards.
+        """
+        paths = sorted(self._pending)
+        self._pending.clear()
+        return paths
+
+    def _mark_known(self, paths):
+        for path in paths:
+            while path and path not in self.known:
+                self.known.add(path)
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+
+    def commands(self):
+        """``mkdir -p`` command lines creating the pending directories, each at
+        most *max_cmdlen* characters long (unless a single path is longer).
+        """
+        cmds = []
+        cmd = ""
+        for path in self.pending():
+            arg = shlex.quote(path)
+            if cmd and len(cmd) + 1 + len(arg) > self.max_cmdlen:
+                cmds.append(cmd)
+                cmd = ""
+            cmd = f"{cmd} {arg}" if cmd else f"mkdir -p {arg}"
+        if cmd:
+            cmds.append(cmd)
+        return cmds
+
+    def create(self):
+        """Create the pending directories and remember them as existing.
+        Returns the list of directories that were requested.
+        """
+        leaves = self.pending()
+        if not leaves:
+            return leaves
+        if self.host is not None:
+            _log.debug(f"Creating {len(leaves)} directories on {self.host}.")
+            for cmd in self.commands():
+                self.runner(self.host, cmd)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.nworkers) as pool:
+                # raise the first error, if any
+                list(pool.map(lambda p: os.makedirs(p, exist_ok=True), leaves))
+        self._mark_known(leaves)
+        self._pending.clear()
+        return leaves
@@ -0,0 +1,73 @@
+"""Ordered fan-out of independent work items to forked worker processes.
+
+Used by frepp to render the scripts of the postprocessing components of an
+experiment in parallel with ``-c split``. Workers are forked, so they inherit
+the parent's (expensive to build, read-only) state -- the parsed XML, diag
+table and experiment settings -- copy-on-write instead of having it pickled:
+only the index of each work item is sent to a worker, and only results are
+sent back. Results are yielded in the order of the items, whichever worker
+finishes first, so everything the caller does with them (writing scripts,
+submitting jobs) happens in the same order as in a sequential run.
+"""
+import multiprocessing
+import os
+
+import logging
+_log = logging.getLogger(__name__)
+
+# set in the parent before forking; read by the workers
+_func = None
+_items = None
+
+
+def fork_available():
+    """True if worker processes can be started with fork()."""
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+def default_workers(nitems, max_workers=8):
+    """Number of workers to use for *nitems* items by default."""
+    return max(1, min(nitems, max_workers, os.cpu_count() or 1))
+
+def _init_worker(initializer):
+    if initializer is not None:
+        initializer()
+
+def _call(i):
+    try:
+        return (True, _func(_items[i]))
+    except SystemExit as exc:
+        # frepp exits on fatal errors; don't let that take down the worker
+        return (False, exc.code)
+
+def map_ordered(func, items, nworkers=1, initializer=None):
+    """Yield ``func(item)`` for each of *items*, in order. With *nworkers* > 1
+    (and fork() available) the calls are made in that many forked processes,
+    each of which first calls *initializer()* (eg. to reopen database
+    connections that can't be shared with the parent). *func* and *items*
+    don't need to be picklable, but the results do.
+
+    A SystemExit raised by *func* in a worker is re-raised in the parent;
+    other exceptions propagate as with :meth:`multiprocessing.pool.Pool.imap`.
+    """
+    global _func, _items
+    items = list(items)
+    if nworkers <= 1 or len(items) <= 1 or not fork_available():
+        for item in items:
+            yield func(item)
+        return
+
+    nworkers = min(nworkers, len(items))
+    _log.debug(f"Processing {len(items)} items with {nworkers} worker processes.")
+    _func, _items = func, items
+    ctx = multiprocessing.get_context('fork')
+    pool = ctx.Pool(nworkers, initializer=_init_worker, initargs=(initializer, ))
+    try:
+        for ok, result in pool.imap(_call, range(len(items))):
+            if not ok:
+                raise SystemExit(result)
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        _func, _items = None, None
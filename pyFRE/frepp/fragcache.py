@@ -0,0 +1,268 @@
+"""Cache of rendered csh fragments for incremental frepp runs.
+
+Each timeSeries, timeAverage and static request of a component is rendered by
+the ts_ta machinery into a csh fragment, plus the history sources it needs and
+the years it depends on. With ``--incremental``, frepp keys each fragment by a
+fingerprint of everything that goes into it -- the component's XML subtree,
+the request node, the command-line options, the experiment and component
+settings (which include the dates being processed), the platform csh and diag
+table, and the source of the code generating the fragments -- and keeps the
+rendered fragments in a SQLite database in the state directory. When the
+fingerprint matches, the fragment is reused instead of being rendered again,
+so regenerating the scripts of a component-year (on resubmission, or when a
+dependency job redoes it) skips ts_ta altogether.
+
+Rendering a fragment also has side effects on the experiment and component
+(archive directories to create, the longest chunk length and the monthly cpio
+commands); these are recorded along with the fragment and replayed on reuse.
+"""
+import argparse
+import collections
+import dataclasses as dc
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import pyFRE.util as util
+from . import dirplan
+
+import logging
+_log = logging.getLogger(__name__)
+
+DB_NAME = '.frepp_fragments.sqlite'
+
+# fields that vary between otherwise identical runs and don't affect fragments
+_volatile_fields = frozenset([
+    'beginTime', 'createdate', 'frepp_plus_calls', 'maxyrs',
+    'cshscript', 'hsmfiles', 'depyears', 'cpiomonTS', 'didsomething', 'context_key'
+])
+# source files whose code renders fragments
+_code_files = ('ts_ta.py', 'sub.py', 'frepp.py', 'fragcache.py')
+_address_regex = re.compile(r' at 0x[0-9a-fA-F]+')
+
+Fragment = collections.namedtuple('Fragment',
+    ['cshscript', 'hsmfiles', 'dep', 'dirs', 'maxyrs', 'cpiomonTS'])
+Fragment.__doc__ = """A rendered request: the arguments to
+:meth:`~pyFRE.frepp.frepp.FREppComponent.ts_ta_update` and the recorded side
+effects of rendering it.
+"""
+
+
+def _update(h, part):
+    if part is None or isinstance(part, (bool, int, float)):
+        h.update(repr(part).encode())
+    elif isinstance(part, str):
+        h.update(b's%d:' % len(part))
+        h.update(part.encode('utf-8', 'surrogateescape'))
+    elif isinstance(part, bytes):
+        h.update(b'b%d:' % len(part))
+        h.update(part)
+    elif hasattr(part, 'fingerprint'):
+        h.update(b'f')
+        h.update(part.fingerprint().encode())
+    elif isinstance(part, util.ScriptTemplateParts):
+        _update(h, part.join())
+    elif isinstance(part, dict):
+        h.update(b'{')
+        for k in sorted(part, key=str):
+            if k in _volatile_fields:
+                continue
+            _update(h, str(k))
+            _update(h, part[k])
+        h.update(b'}')
+    elif isinstance(part, (list, tuple)):
+        h.update(b'[')
+        for p in part:
+            _update(h, p)
+        h.update(b']')
+    elif isinstance(part, (set, frozenset)):
+        _update(h, sorted(part, key=str))
+    elif dc.is_dataclass(part):
+        _update(h, {f.name: getattr(part, f.name) for f in dc.fields(part)})
+    else:
+        # repr() of other objects, without memory addresses
+        _update(h, _address_regex.sub('', repr(part)))
+
+def fingerprint(*parts):
+    """Hex digest identifying *parts*: strings, numbers, containers,
+    dataclasses and objects with a ``fingerprint()`` method (eg.
+    :class:`~pyFRE.lib.FREXML.FREXMLNode`). Dataclass fields and dict keys in
+    ``_volatile_fields`` are ignored.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
+
+_code_version = None
+
+def code_version():
+    """Fingerprint of the source of the modules rendering fragments, so that
+    fragments rendered by a different version of the code aren't reused.
+    """
+    global _code_version
+    if _code_version is None:
+        h = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in _code_files:
+            try:
+                with open(os.path.join(here, name), 'rb') as f:
+                    h.update(f.read())
+            except OSError:
+                h.update(name.encode())
+        _code_version = h.hexdigest()
+    return _code_version
+
+def context_key(pp, exp, cpt):
+    """Fingerprint of the run-wide and per-component inputs of all of a
+    component's fragments.
+    """
+    return fingerprint(code_version(), pp, getattr(pp, 'opt', None),
+        getattr(pp, 'platform_opt', None), exp, cpt)
+
+
+class FragmentCache():
+    """Rendered fragments, stored in the SQLite database at *path*."""
+    def __init__(self, path, timeout=60.):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fragments (
+                key TEXT PRIMARY KEY,
+                cshscript TEXT NOT NULL,
+                hsmfiles TEXT,
+                dep TEXT NOT NULL,
+                dirs TEXT NOT NULL,
+                maxyrs INTEGER NOT NULL,
+                cpiomonTS TEXT NOT NULL,
+                used REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    @classmethod
+    def for_statedir(cls, statedir):
+        return cls(os.path.join(statedir, DB_NAME))
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM fragments").fetchone()[0]
+
+    def get(self, key):
+        """Return the :class:`Fragment` stored under *key*, or None."""
+        row = self._conn.execute(
+            "SELECT cshscript, hsmfiles, dep, dirs, maxyrs, cpiomonTS "
+            "FROM fragments WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE fragments SET used = ? WHERE key = ?",
+            (time.time(), key))
+        csh, hsmfiles, dep, dirs, maxyrs, cpiomon = row
+        return Fragment(csh, hsmfiles, json.loads(dep), tuple(json.loads(dirs)),
+            maxyrs, cpiomon)
+
+    def put(self, key, frag):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO fragments VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, str(frag.cshscript), frag.hsmfiles, json.dumps(frag.dep), json.dumps(frag.dirs),
+                frag.maxyrs, frag.cpiomonTS, time.time())
+        )
+
+    def prune(self, max_age):
+        """Forget fragments that haven't been used for *max_age* seconds.
+        Returns the number of fragments removed.
+        """
+        cur = self._conn.execute("DELETE FROM fragments WHERE used < ?",
+            (time.time() - max_age, ))
+        return cur.rowcount
+
+    def clear(self):
+        self._conn.execute("DELETE FROM fragments")
+
+    def render(self, key, render, exp, cpt):
+        """Return the :class:`Fragment` for *key*, calling *render()* (which
+        returns the cshscript, hsmfiles and dep arguments of
+        :meth:`~pyFRE.frepp.frepp.FREppComponent.ts_ta_update`) only on a
+        cache miss. Either way, the fragment's side effects on *exp* and *cpt*
+        are applied.
+        """
+        frag = self.get(key)
+        if frag is not None:
+            self.hits += 1
+            replay(frag, exp, cpt)
+            return frag
+        self.misses += 1
+        frag = record(render, exp, cpt)
+        self.put(key, frag)
+        return frag
+
+
+def record(render, exp, cpt):
+    """Call *render()* and return its result as a :class:`Fragment`, with the
+    side effects it had on *exp* and *cpt*.
+    """
+    saved_plan, maxyrs, cpiomon = exp.dirplan, exp.maxyrs, cpt.cpiomonTS
+    # collect all directories requested, including those known to exist
+    exp.dirplan = dirplan.DirectoryPlan()
+    try:
+        csh, hsmfiles, dep = render()
+        dirs = tuple(exp.dirplan.drain())
+    finally:
+        exp.dirplan = saved_plan
+    if exp.dirplan is not None:
+        exp.dirplan.add(*dirs)
+    return Fragment(str(csh), hsmfiles, dep, dirs,
+        exp.maxyrs if exp.maxyrs > maxyrs else 0,
+        cpt.cpiomonTS[len(cpiomon):] if cpt.cpiomonTS.startswith(cpiomon) else '')
+
+def replay(frag, exp, cpt):
+    """Apply the recorded side effects of *frag* to *exp* and *cpt*."""
+    if exp.dirplan is not None:
+        exp.dirplan.add(*frag.dirs)
+    exp.maxyrs = max(exp.maxyrs, frag.maxyrs)
+    cpt.cpiomonTS += frag.cpiomonTS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.fragcache",
+        description="Inspect or clear frepp's cache of rendered csh fragments.")
+    parser.add_argument('-d', '--db', required=True,
+        help="Fragment database, or the state directory containing it.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('count', help="Print the number of cached fragments.")
+    subparsers.add_parser('clear', help="Remove all cached fragments.")
+    p = subparsers.add_parser('prune', help="Remove fragments not used recently.")
+    p.add_argument('days', type=float)
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.db):
+        cache = FragmentCache.for_statedir(args.db)
+    else:
+        cache = FragmentCache(args.db)
+    with cache:
+        if args.command == 'count':
+            print(len(cache))
+        elif args.command == 'clear':
+            cache.clear()
+        else:
+            print(cache.prune(args.days * 86400.))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
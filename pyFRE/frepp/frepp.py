@@ -1,5 +1,6 @@
 """Transliteration of main body of FRE/bin/frepp.pl.
 """
+import copy
 import os
 from posixpath import dirname
 import sys
@@ -15,7 +16,7 @@ from textwrap import dedent
 
 from pyFRE.lib import FRE, FREAnalysis, FREDefaults, FREExperiment, FRETargets, FREUtil, FREVersion
 import pyFRE.util as util
-from . import logs, sub, ts_ta
+from . import accumstore, compression, depplan, dirplan, fanout, fragcache, jobstate, logs, ncheader, statestore, sub, ts_ta
 
 import logging
 _log = logging.getLogger(__name__)
@@ -29,7 +30,7 @@ class FREppComponent():
     component: str = ""
     dtvars: dict = dc.field(default_factory=dict)
     sim0: str = "" # simulation start date
-    cshscript: str = ""
+    cshscript: util.ScriptTemplateParts = dc.field(default_factory=util.ScriptTemplateParts)
     hsmfiles: str = ""
     depyears: str = ""
 
@@ -44,6 +45,9 @@ class FREppComponent():
     cpiomonTS: str = ""
     startofrun: bool = False
     didsomething: bool = False
+    npool: int = 1 # number of variables to process concurrently
+    context_key: str = "" # fragcache fingerprint of the component's settings
+    checktransfer: str = "" # csh exiting after a failed retry of a data transfer
 
     def ts_ta_update(self, new_cshscript, new_hsmfiles, dep):
         """Add commands and dependent years corresponding to a single requested
@@ -55,6 +59,19 @@ class FREppComponent():
         if dep is not None: # not passed in static case
             self.depyears += dep
 
+    def add_fragment(self, exp, label, node, render):
+        """Add the fragment for the request *node* returned by *render()* (a
+        tuple of the arguments to :meth:`ts_ta_update`), reusing a previously
+        rendered one from the experiment's
+        :class:`~pyFRE.frepp.fragcache.FragmentCache`, if any.
+        """
+        if exp.fragcache is None:
+            self.ts_ta_update(*render())
+            return
+        key = fragcache.fingerprint(self.context_key, label, node.parentNode, node)
+        frag = exp.fragcache.render(key, render, exp, self)
+        self.ts_ta_update(frag.cshscript, frag.hsmfiles, frag.dep)
+
 
 @dc.dataclass
 class FREpp():
@@ -135,7 +152,10 @@ class FREpp():
             ("refineDiag", "refineDiag"),
             ("mppnccombine_opts", "mppnccombine_opts"),
             ("compress", "compress"),
-            ("epmt", "epmt")
+            ("pool_size", "pool_size"),
+            ("epmt", "epmt"),
+            ("incremental", "incremental"),
+            ("component_pool", "component_pool")
         )}
 
         if opt['r'] and opt['D']:
@@ -277,6 +297,18 @@ class FREpp():
         d.update(self.platform_opt)
         return d
 
+    def template_lookup(self, name):
+        """Value of a single key of :meth:`template_dict`, without building the
+        whole dict. Raises KeyError if not found.
+        """
+        if name.startswith('opt_') and name[4:] in self.opt:
+            return self.opt[name[4:]]
+        if name.startswith('time_') and name[5:] in self.time:
+            return self.time[name[5:]]
+        if name in self.platform_opt:
+            return self.platform_opt[name]
+        return util.dataclass_template_lookup(self, name)
+
 
 def setup_fre(pp):
     # frepp.pl l.406
@@ -349,6 +381,12 @@ def setup_expt(expt, fre, pp):
         exp.statedir = os.path.join(exp.statedir, pp.opt['u'])
     if not (os.path.isdir(exp.statedir) or pp.opt['A']):
         os.makedirs(exp.statedir)
+    if os.path.isdir(exp.statedir):
+        exp.statestore = statestore.StateStore.for_statedir(exp.statedir)
+        # check all jobs recorded in this experiment's states with one query
+        jobstate.default_service().watch_store(exp.statestore)
+        if pp.opt['incremental']:
+            exp.fragcache = fragcache.FragmentCache.for_statedir(exp.statedir)
     exp.aoutscriptdir = os.path.join(exp.scriptsDir, "analysis")
     if pp.opt['O']:
         exp.aoutscriptdir = pp.opt['O']
@@ -391,7 +429,8 @@ def setup_expt(expt, fre, pp):
         exp.ptmpDir = os.path.join(exp.ptmpDir, pp.opt['u'])
 
     # set whether to aggregate time series files in archive
-    agg = FREUtil.getxpathval('postProcess/@archiveTimeSeries')
+    agg = FREUtil.getxpathval('postProcess/@archiveTimeSeries', expt, pp.root,
+        exp.rootDir, exp.archiveDir)
     if agg == 'byVariable':
         exp.aggregateTS = False
 
@@ -477,14 +516,14 @@ def expt_loop_pre_component(fre, pp, exp):
     """Construct csh runscript from template. Second block of code in body of
     frepp loop over expts."""
     # frepp.pl l.716
-    exp.cshscripttmpl = sub.getTemplate(pp.platform)
+    exp.cshscripttmpl = sub.getTemplate(pp.platform, exp.workdir)
 
     # environment setup for FRE
     freCommandsHomeDir = fre.home()
     siteconfig = _template(f"""
         setenv FRE_COMMANDS_HOME_FREPP $freCommandsHomeDir
     """, freCommandsHomeDir=freCommandsHomeDir)
-    exp.cshscripttmpl.replace('#get_site_config', siteconfig)
+    exp.cshscripttmpl.fill('#get_site_config', siteconfig)
 
     # platform_csh and check for FRE version mismatch
     if pp.platform_opt['platformcsh']:
@@ -522,45 +561,49 @@ def expt_loop_pre_component(fre, pp, exp):
             endif
         """, fremodule=fremodule, xmlfremodule=xmlfremodule)
 
-    exp.cshscripttmpl = exp.cshscripttmpl.replace('#platform_csh', platformcsh)
-    _subs = []
+    exp.cshscripttmpl.fill('#platform_csh', platformcsh)
+    _lines = []
     if pp.platform == 'x86_64':
-        _subs += [
-            (r'(#SBATCH --job-name)', rf'\1={exp.batch_job_name}'),
-            (r'(#SBATCH --time)', rf'\1={pp.platform_opt["maxruntime"]}'),
-            (r'(#SBATCH --output)', rf'\1={exp.stdoutDir}/postProcess/%x.o%j'),
-            (r'(#SBATCH --chdir)', rf'\1={os.environ["HOME"]}'),
-            (r'(setenv FRE_STDOUT_PATH)', rf'\1 {exp.stdoutDir}/postProcess/{exp.batch_job_name}.o$JOB_ID'),
+        _lines += [
+            ('#SBATCH --job-name', f'={exp.batch_job_name}'),
+            ('#SBATCH --time', f'={pp.platform_opt["maxruntime"]}'),
+            ('#SBATCH --output', f'={exp.stdoutDir}/postProcess/%x.o%j'),
+            ('#SBATCH --chdir', f'={os.environ["HOME"]}'),
+            ('setenv FRE_STDOUT_PATH', f' {exp.stdoutDir}/postProcess/{exp.batch_job_name}.o$JOB_ID'),
         ]
-    _subs += [
-        (r'#version_info', rf'# {FREVersion.VERSION}\n{exp.version_info}'),
-        (r'set name', rf'set name = {exp.expt}'),
-        (r'set rtsxml', rf'set rtsxml = {pp.abs_xml_path}'),
-        (r'set work', rf'set work = {exp.workdir}'),
-        (r'set tempCache', rf'set tempCache = {exp.tempCache}'),
-        (r'set root', rf'set root = {exp.rootDir}'),
-        (r'set archive', rf'set archive = {exp.archiveDir}'),
-        (r'set scriptName', rf'set scriptName = {exp.outscript}'),
-        (r'set oname', rf'set oname = {pp.hDate}'),
-        (r'set exp.histDir', rf'set exp.histDir = {pp.opt["d"]}'),
-        (r'set ptmpDir', rf'set ptmpDir = {exp.ptmpDir}'),
-        (r'set platform', rf'set platform = {pp.opt["P"]}'),
-        (r'set target', rf'set target = {pp.opt["T"]}'),
-        (r'set segment_months', rf'set segment_months = {ts_ta.segmentLengthInMonths()}'),
-        (r'(#SBATCH --mail-user).*', rf'\1={pp.mailList}'),
-        (r'(#SBATCH --comment).*', rf'\1=fre/{os.environ["FRE_COMMANDS_VERSION"]}')
+    _lines += [
+        ('set name', f' = {exp.expt}'),
+        ('set rtsxml', f' = {pp.abs_xml_path}'),
+        ('set work', f' = {exp.workdir}'),
+        ('set tempCache', f' = {exp.tempCache}'),
+        ('set root', f' = {exp.rootDir}'),
+        ('set archive', f' = {exp.archiveDir}'),
+        ('set scriptName', f' = {exp.outscript}'),
+        ('set oname', f' = {pp.hDate}'),
+        ('set histDir', f' = {pp.opt["d"]}'),
+        ('set ptmpDir', f' = {exp.ptmpDir}'),
+        ('set platform', f' = {pp.opt["P"]}'),
+        ('set target', f' = {pp.opt["T"]}'),
+        ('set segment_months', f' = {ts_ta.segmentLengthInMonths(pp, exp)}'),
+        ('set statedb', f' = {os.path.join(exp.statedir, statestore.DB_NAME)}'),
+        ('set accumdir', f' = {os.path.join(exp.statedir, accumstore.DIR_NAME)}'),
+        ('set compressdir', f' = {os.path.join(exp.statedir, compression.DIR_NAME)}'),
+        ('set headerdb', f' = {os.path.join(exp.statedir, ncheader.DB_NAME)}'),
+        ('#SBATCH --mail-user', f'={pp.mailList}'),
+        ('#SBATCH --comment', f'=fre/{os.environ["FRE_COMMANDS_VERSION"]}')
     ]
-    for _old, _new in _subs:
-        exp.cshscripttmpl = re.sub(_old, _new, exp.cshscripttmpl)
+    exp.cshscripttmpl.fill('#version_info', f'# {FREVersion.VERSION}\n{exp.version_info}')
+    for _key, _rest in _lines:
+        exp.cshscripttmpl.set_line(_key, _rest)
 
     # if using XTMP filesystem for PTMP location, let scheduler know via Slurm --comment directive
     # so it can set $TMPDIR accordingly
     if exp.ptmpDir.startswith('/xtmp'):
-        exp.cshscripttmpl = re.sub(r'(#SBATCH --comment)=?(.*)', r'\1=\2,xtmp', exp.cshscripttmpl)
+        exp.cshscripttmpl.sub(r'(#SBATCH --comment)=?(.*)', r'\1=\2,xtmp', key='#SBATCH --comment')
 
     exp.statefile = None
     if pp.opt['r']:    #if a regression test, no further postprocessing
-        exp.cshscripttmpl = re.sub(r'(#INFO:max_years=)', r'\1{exp.maxyrs}', exp.cshscripttmpl)
+        exp.cshscripttmpl.set_line('#INFO:max_years=', f'{exp.maxyrs}')
         sub.writescript(
             exp.cshscripttmpl, exp.outscript,
             f"{pp.platform_opt['batchSubmit']}{pp.opt['w']} {pp.opt['m']}",
@@ -572,8 +615,8 @@ def expt_loop_pre_component(fre, pp, exp):
     exp.ppNode = FREUtil.getppNode(exp.expt)
     if not pp.opt['f'] and not exp.ppNode:  #if no pp node, no further postprocessing
         if pp.platform == 'x86_64':
-            exp.cshscripttmpl = re.sub(r'(#SBATCH --time).*', r'\1=01:00:00', exp.cshscripttmpl)
-        exp.cshscripttmpl = re.sub(r'(#INFO:max_years=)', r'\1{exp.maxyrs}', exp.cshscripttmpl)
+            exp.cshscripttmpl.set_line('#SBATCH --time', '=01:00:00')
+        exp.cshscripttmpl.set_line('#INFO:max_years=', f'{exp.maxyrs}')
         sub.writescript(
             exp.cshscripttmpl, exp.outscript,
             f"{pp.platform_opt['batchSubmit']}{pp.opt['w']} {pp.opt['m']}",
@@ -583,8 +626,8 @@ def expt_loop_pre_component(fre, pp, exp):
         return (pp, exp) # next;
 
     if pp.opt['M']:
-        # XXX $exp.cshscripttmpl =~ s/(#SBATCH --mail-type=)NONE/$1END/;
-        exp.cshscripttmpl = re.sub(r'((#SBATCH --mail-type=)', r'\1END', exp.cshscripttmpl)
+        # $cshscripttmpl =~ s/(#SBATCH --mail-type=)NONE/$1END/;
+        exp.cshscripttmpl.set_line('#SBATCH --mail-type', '=END')
 
     if pp.opt['C']:
         caltype = pp.opt['C']
@@ -670,13 +713,13 @@ def expt_loop_pre_component(fre, pp, exp):
                 exp.refinedir, exp.this_frepp_cmd,
                 ' '.join(hf), ' '.join(hsmf)
             )
-            exp.cshscripttmpl = exp.cshscripttmpl.replace('#hsmget_history_files', hsmget_history)
+            exp.cshscripttmpl.fill('#hsmget_history_files', hsmget_history)
             uncompress = sub.uncompress_history_csh(exp.tmphistdir)
-            exp.cshscripttmpl = exp.cshscripttmpl.replace('#uncompress_history_files', uncompress)
+            exp.cshscripttmpl.fill('#uncompress_history_files', uncompress)
             hf.sort()
             check_history = sub.checkHistComplete(exp.tmphistdir, hf[0],
                 exp.this_frepp_cmd, hsmf, exp.diagtablecontent)
-            exp.cshscripttmpl = exp.cshscripttmpl.replace('#check_history_files', check_history)
+            exp.cshscripttmpl.fill('#check_history_files', check_history)
 
         if pp.opt['D'] and pp.opt['plus']:
             call_frepp = sub.call_frepp(pp.abs_xml_path, exp.outscript, pp.opt['c'], "", "", pp)
@@ -686,8 +729,8 @@ def expt_loop_pre_component(fre, pp, exp):
 
         exp.cshscripttmpl += logs.mailerrors(exp.outscript)
         if pp.platform == 'x86_64':
-            exp.cshscripttmpl = re.sub(r'(#SBATCH --time).*', rf'\1={pp.platform_opt["maxruntime"]}', exp.cshscripttmpl)
-        exp.cshscripttmpl = re.sub(r'(#INFO:max_years=)', rf'\1{exp.maxyrs}', exp.cshscripttmpl)
+            exp.cshscripttmpl.set_line('#SBATCH --time', f'={pp.platform_opt["maxruntime"]}')
+        exp.cshscripttmpl.set_line('#INFO:max_years=', f'{exp.maxyrs}')
         sub.writescript(
             exp.cshscripttmpl, exp.outscript,
             f"{pp.platform_opt['batchSubmit']}{pp.opt['w']} {pp.opt['m']}",
@@ -696,20 +739,19 @@ def expt_loop_pre_component(fre, pp, exp):
         pp.opt['w'] = ''
         return (pp, exp) # next;
     else:
-        exp.cshscripttmpl = re.sub(r'set histDir = .*', rf'set histDir = {exp.tmphistdir}', exp.cshscripttmpl)
+        exp.cshscripttmpl.set_line('set histDir', f' = {exp.tmphistdir}')
 
     if not pp.opt['A']:
-        writeIDorINTER = _template("""
-            echo $JOB_ID > $exp.statefile
-        """)
-        exp.cshscripttmpl = exp.cshscripttmpl.replace('#write_to_statefile', writeIDorINTER)
+        writeIDorINTER = statestore.setstate_csh('$JOB_ID')
+        exp.cshscripttmpl.fill('#write_to_statefile', writeIDorINTER)
         pp.writestate = _template("""
             if ( "\$prevjobstate" == "ERROR" ) then
-                echo FATAL > $statefile
+                $setstate_fatal
             else
-                echo ERROR > $statefile
+                $setstate_error
             endif
-        """, statefile=exp.statefile)
+        """, setstate_fatal=statestore.setstate_csh('FATAL').rstrip(),
+            setstate_error=statestore.setstate_csh('ERROR').rstrip())
 
     checktransfer = _template("""
         if ( \$status ) then
@@ -742,9 +784,10 @@ def expt_loop_pre_component(fre, pp, exp):
     if pp.opt['A'] and not os.path.isdir(exp.ppRootDir):
         _log.critical(f"Directory {exp.ppRootDir} not found. Exiting.")
         sys.exit(1)
-    exp.mkdircommand = ""
+    if exp.dirplan is None:
+        exp.dirplan = dirplan.DirectoryPlan(host='ac-arch', runner=sub.execute)
     if not pp.opt['A']:
-        exp.mkdircommand += f"mkdir -p {exp.ppRootDir}/.dec {exp.ppRootDir}/.checkpoint "
+        exp.dirplan.add(f"{exp.ppRootDir}/.dec", f"{exp.ppRootDir}/.checkpoint")
     nocommentver = exp.version_info
     nocommentver = nocommentver.replace('#', "")
     archive_command = _template("""
@@ -761,7 +804,7 @@ def expt_loop_pre_component(fre, pp, exp):
 
         #check_history_files
     """, exp, freVersion=pp.freVersion, nocommentver=nocommentver)
-    exp.cshscripttmpl += archive_command
+    exp.cshscripttmpl.add_template(archive_command)
 
     getgridspec = f"cd \$work; dmget {gridspec}\n"
     if gridspec.endswith('cpio'):
@@ -797,8 +840,8 @@ def expt_loop_pre_component(fre, pp, exp):
 
         # Check for a suitable regrid file in FMS-land
         set mosaic_gridfile = `ncks -H -v gridfiles $input_mosaic | head -n 1 | sed 's/.*="//;s/"//'`
-        @ remap_source_x = `ncdump -h $mosaic_gridfile | grep "nx =" | sed 's/.*=//;s/;//;s/ //g'` / 2
-        @ remap_source_y = `ncdump -h $mosaic_gridfile | grep "ny =" | sed 's/.*=//;s/;//;s/ //g'` / 2
+        @ remap_source_x = `$PYFRE_ENGINE pyFRE.frepp.ncheader -d $headerdb dim nx $mosaic_gridfile` / 2
+        @ remap_source_y = `$PYFRE_ENGINE pyFRE.frepp.ncheader -d $headerdb dim ny $mosaic_gridfile` / 2
         set fms_remap_file = $fregrid_remap_file:t
         set fms_remap_file = `echo $fms_remap_file | sed 's/^\.//'`
     """)
@@ -904,13 +947,13 @@ def expt_loop_pre_component(fre, pp, exp):
         endif
 
         # Get the associated_files
-        foreach assocFileBase ( `ncdump -h \$fregrid_in.nc | $grepAssocFiles` )
+        foreach assocFileBase ( `\$PYFRE_ENGINE pyFRE.frepp.ncheader -d \$headerdb associated_files \$fregrid_in.nc` )
             set assocFileYear = `echo \$assocFileBase | cut -c 1-4`
             foreach aff ( `ls -1 \$histDir/\$assocFileYear*/*\${assocFileBase}*` )
                 if ( ! -e `basename \$aff` ) ln -s \$aff .
             end
         end
-    """, pp, exp, checktransfer=checktransfer, grepAssocFiles=sub.grepAssocFiles)
+    """, pp, exp, checktransfer=checktransfer)
     call_tile_fregrid += _template("""
         if (\$#attCmds > 0) then
             $time_ncatted ncatted -h -O \$attCmds \$fregrid_in.tile1.nc
@@ -946,9 +989,9 @@ def expt_loop_pre_component(fre, pp, exp):
         # Correct associated_file year (for static files) and get files
         foreach f ( \$fregrid_in*.nc )
             set fregrid_yr = `echo \$fregrid_in_date | cut -c 1-4`
-            set oldassoc = `ncdump -h \$f | grep ':associated_files' | cut -d'"' -f2`
+            set oldassoc = `\$PYFRE_ENGINE pyFRE.frepp.ncheader -d \$headerdb attr associated_files \$f`
             if ("\$oldassoc" != '' ) then
-                set newassoc = `ncdump -h \$f | grep ':associated_files' | cut -d'"' -f2 | sed "s/: [0-9]\\{4\\}/: \$fregrid_yr/g"`
+                set newassoc = `echo \$oldassoc | sed "s/: [0-9]\\{4\\}/: \$fregrid_yr/g"`
                 if ("\$oldassoc" != "\$newassoc") then
                     # If file is a link, then copy and make sure it is writable
                     if ( -l \$f ) then
@@ -963,7 +1006,7 @@ def expt_loop_pre_component(fre, pp, exp):
 
                 # For now, remove the '.tile[1-6]' from all associated files.  fregrid will add it back in
                 #TODO - When fregrid is updated, remove this
-                set newassoc = `ncdump -h \$f | grep ':associated_files' | cut -d'"' -f2 | sed "s/\.tile[0-6]//g"`
+                set newassoc = `echo \$newassoc | sed "s/\.tile[0-6]//g"`
                 if ( -l \$f ) then
                     $time_cp cp \$f copy
                     $time_rm rm -f \$f
@@ -1034,7 +1077,7 @@ def expt_loop_pre_component(fre, pp, exp):
 
     # frepp.pl l.1317
     #process each component
-    return (pp, exp)
+    return process_components(ppComponentNodes, fre, pp, exp)
 
 
 
@@ -1074,7 +1117,7 @@ def component_loop_setup(ppcNode, fre, pp, exp):
 
     cpt = FREppComponent(component=component) ### XXX added
     cpt.cpiomonTS = ''
-    cpt.cshscript = exp.cshscripttmpl
+    cpt.cshscript = exp.cshscripttmpl.copy()
 
     this_component_cmd = exp.this_frepp_cmd.replace(' -c split ', f' -c {component} ')
     checktransfer = _template("""
@@ -1098,37 +1141,36 @@ def component_loop_setup(ppcNode, fre, pp, exp):
             exit 7
         endif
     """, pp, component=component, this_component_cmd=this_component_cmd)
+    cpt.checktransfer = checktransfer
 
     if pp.opt['c']: #append component name to job and file name
-        cshscript = exp.cshscripttmpl
         origoutscript = exp.outscript
-        exp.outscript = f"{exp.outscriptdir}/{exp.expt}_{component}_{pp.hDate}"
+        exp.outscript = sub.component_outscript(exp, component, pp.hDate)
         batch_job_name = exp.expt
         if pp.opt['u']:
             batch_job_name += f"_{pp.opt['u']}"
         batch_job_name += f"_{component}_{pp.hDate}"
 
-        _subs = [
-            (r'set scriptName = .*', rf'set scriptName = {exp.outscript}'),
-            (r'(setenv FRE_STDOUT_PATH).*', rf'\1 {exp.stdoutdir}/postProcess/{batch_job_name}.o$JOB_ID'),
-            (r'(#SBATCH --job-name).*', rf'\1={batch_job_name}'),
-            (r'(-w $expt)', rf'\1_{component}'),
-            (r'(#INFO:component=)', rf'\1{component}')
+        _lines = [
+            ('set scriptName', f' = {exp.outscript}'),
+            ('setenv FRE_STDOUT_PATH', f' {exp.stdoutdir}/postProcess/{batch_job_name}.o$JOB_ID'),
+            ('#SBATCH --job-name', f'={batch_job_name}'),
+            ('#INFO:component=', f'{component}')
         ]
         # special case: ocean_(annual|month) jobs can run into memory issues, so require bigmem node
         if ('ocean_annual' in component) or ('ocean_monthly' in component):
             _log.debug((f"Requesting large-memory node for component='{component}' "
                 "due to the possibly large ocean files."))
-            _subs += [(r'(#SBATCH --job-name.*)', r'\1\n#SBATCH --constraint=bigmem')]
-        for _old, _new in _subs:
-            cshscript = re.sub(_old, _new, cshscript)
-        exp.statefile = f"{exp.statedir}/{component}.{pp.userstartyear}"
+            _lines[2] = ('#SBATCH --job-name', f'={batch_job_name}\n#SBATCH --constraint=bigmem')
+        for _key, _rest in _lines:
+            cpt.cshscript.set_line(_key, _rest)
+        exp.statefile = statestore.state_key(component, pp.userstartyear)
 
         #check status of this frepp year
         if not pp.opt['A']:
-            if os.exists(exp.statefile):
-                with open(exp.statefile, 'r') as f:
-                    state = FREUtil.cleanstr(f.read())
+            state = exp.statestore.get(component, pp.userstartyear)
+            if state is not None:
+                state = FREUtil.cleanstr(state)
                 _log.info((f"This year ({pp.hDate}) has a state file with state "
                     f"'{state}' for {component}."))
                 if state == 'OK':
@@ -1147,7 +1189,8 @@ def component_loop_setup(ppcNode, fre, pp, exp):
                 elif state == 'FATAL':
                     _log.error((f"This year ({pp.hDate}) got an error in multiple "
                         f"attempts, skipping this component.  To retry {component} "
-                        f"processing, delete the state file {exp.statefile}"))
+                        f"processing, clear its state with 'python -m pyFRE.frepp.statestore "
+                        f"-d {exp.statedir} clear {exp.statefile}'"))
                     return (pp, exp) # XXX next;
                 elif state == 'INTERACTIVE':
                     _log.info((f"This year ({pp.hDate}) was partially run interactively "
@@ -1160,13 +1203,13 @@ def component_loop_setup(ppcNode, fre, pp, exp):
                         f"frepp attempt due to missing history data, resubmitting "
                         f"{component}..."))
                 elif not state:
-                    _log.error(f"exp.statefile {exp.statefile} exists but is empty, exiting.")
+                    _log.error(f"State of {exp.statefile} is empty, exiting.")
                     #what if this is the -c split job? continue to other components
                     return (pp, exp) # XXX next;
                 else:
                     #check that jobid is still running
                     jobrunning = logs.isjobrunning(state)
-                    _log.info((f"Checking state in {exp.statefile}: {state}: jobrunning: "
+                    _log.info((f"Checking state of {exp.statefile}: {state}: jobrunning: "
                         f"{jobrunning}"))
                     if jobrunning:
                         _log.info((f"Previous frepp job ({state}) for {pp.hDate} "
@@ -1176,8 +1219,8 @@ def component_loop_setup(ppcNode, fre, pp, exp):
                         _log.info((f"Previous frepp job for {pp.hDate} was lost, "
                             f"resubmitting {component}..."))
 
-            cshscript = re.sub(r'set prevjobstate.*', rf"set prevjobstate = '{state}'", cshscript)
-            cshscript = re.sub(r'set exp.statefile.*', rf"set exp.statefile = '{exp.statefile}'", cshscript)
+            cpt.cshscript.set_line('set prevjobstate', f" = '{state or ''}'")
+            cpt.cshscript.set_line('set statefile', f" = '{exp.statefile}'")
     ## end if ($opt_c)
 
     #initialize per component
@@ -1290,6 +1333,16 @@ def component_loop_setup(ppcNode, fre, pp, exp):
     if xyInterpOptions:
         _log.info(f"Custom xyInterp options: '{xyInterpOptions}'")
 
+    # number of variables to postprocess concurrently; attribute overrides -pool_size
+    poolSize = ppcNode.findvalue('@poolSize') or pp.opt['pool_size']
+    if poolSize:
+        try:
+            cpt.npool = max(1, int(poolSize))
+        except ValueError:
+            _log.critical(f"poolSize for {component} must be a positive integer, not '{poolSize}'")
+            sys.exit(1)
+        _log.info(f"Processing up to {cpt.npool} variables of {component} concurrently")
+
     #get list of all diagnostic output files from source attributes, remove duplicates
     sourceatts = ppcNode.findnodes('*/@source')
     sourceatts += util.to_iter(ppcNode.findnodes('@source'))
@@ -1378,9 +1431,9 @@ def component_loop_setup(ppcNode, fre, pp, exp):
     _log.debug(f"\tsim0 is {cpt.sim0} (from exp.basedate or start attribute)")
 
     #get simulation end date from production xml -> simEND
-    simTime  = FREUtil.getxpathval('runtime/production/@simTime') #not currently used
-    simUnits = FREUtil.getxpathval('runtime/production/@units') #not currently used
-    segTime, segUnits = ts_ta.getSegmentLength() # global
+    simTime  = FREUtil.getxpathval('runtime/production/@simTime', exp.expt, pp.root) #not currently used
+    simUnits = FREUtil.getxpathval('runtime/production/@units', exp.expt, pp.root) #not currently used
+    segTime, segUnits = ts_ta.getSegmentLength(pp, exp) # global
 
     simEND = FREUtil.modifydate(run0, f"+ {simTime} {simUnits} - 1 sec")
 
@@ -1396,8 +1449,11 @@ def component_loop_setup(ppcNode, fre, pp, exp):
 
     scriptcopy = cshscript
     cpt.depyears = []
+    if exp.fragcache is not None:
+        cpt.context_key = fragcache.context_key(pp, exp, cpt)
     standardTarget, targeterr = FRETargets.standardize(pp.opt['T'])
     # frepp.pl l.1676
+    return cpt
 
 # //////////////////////////////////////////////////////////////////////////////#
 
@@ -1405,11 +1461,10 @@ def timeseries_static(ppcNode, pp, exp, cpt):
     #STATIC
     # frepp.pl l.1678
     this_cshscript = ""
-    monthnodes = ppcNode.findnodes('timeSeries[@freq="monthly"]')
+    monthnodes = ppcNode.timeseries('monthly')
     diag_source = ""
     if monthnodes:
-        monthnode = ppcNode.findnodes('timeSeries[@freq="monthly"]')->get_node(1) # XXX
-        diag_source = monthnode.getAttribute('@source')
+        diag_source = monthnodes[0].getAttribute('@source')
     if not diag_source:
         diag_source = ppcNode.findvalue('@source')
     if not diag_source:
@@ -1418,10 +1473,14 @@ def timeseries_static(ppcNode, pp, exp, cpt):
         diag_source = re.sub(r'_.*', r'', diag_source)
     staticfile = f"{exp.ppRootDir}/{cpt.component}/{cpt.component}.static.nc"
     _log.debug(f"\tstatic vars from '{diag_source}'")
-    if not pp.opt['A']:
-        this_cshscript += sub.staticvars(diag_source, exp.ptmpDir, exp.tmphistdir, exp.refinedir)
+
+    def render():
+        csh = this_cshscript
+        if not pp.opt['A']:
+            csh += sub.staticvars(diag_source, exp.ptmpDir, exp.tmphistdir, exp.refinedir)
+        return (csh, None, None)
     # frepp.pl l.1692
-    cpt.ts_ta_update(this_cshscript, new_hsmfiles=None, dep=None)
+    cpt.add_fragment(exp, f'static:{diag_source}', ppcNode, render)
     return cpt
 
 # //////////////////////////////////////////////////////////////////////////////#
@@ -1433,33 +1492,34 @@ by_interval = op.methodcaller('findvalue', '@interval')
 
 def timesaverages_setup(ppcNode, ta_freq, pp, exp, cpt):
     """Setup for loop over time averages for a given time average interval."""
-    if ta_freq == 'monthly':
-        xpath_expn = 'timeAverage[@source="monthly"]'
-    elif ta_freq == 'annual':
-        xpath_expn = 'timeAverage[@source="annual" and @interval!="1yr"]'
-    elif ta_freq == 'seasonal':
-        xpath_expn = 'timeAverage[@source="seasonal"]'
-    else:
+    if ta_freq not in ('monthly', 'annual', 'seasonal'):
         raise ValueError(ta_freq)
-
-    taNodes = sorted(ppcNode.findnodes(xpath_expn), key=by_interval)
+    taNodes = ppcNode.timeaverages(source=ta_freq)
+    if ta_freq == 'annual':
+        # 1yr annual averages are made from history, below
+        taNodes = [n for n in taNodes if n.findvalue('@interval') != "1yr"]
+    taNodes = sorted(taNodes, key=by_interval)
     intervals = [n.findvalue('@interval') for n in taNodes]
     diag_source = " "
 
     if ta_freq == 'annual':
         # frepp.pl l.1751
-        annavnodes = ppcNode.findnodes('timeAverage[@source="annual" and @interval="1yr"]')
+        annavnodes = ppcNode.timeaverages(source='annual', interval='1yr')
         annCalcInterval = ''
         if annavnodes:
-            taNode = ppcNode.findnodes('timeAverage[@source="annual" and @interval="1yr"]')->get_node(1) # XXX
+            taNode = annavnodes[0]
             annCalcInterval = taNode.findvalue('@calcInterval')
             if not taNodes or annCalcInterval == "1yr":
                 intervals.append(annCalcInterval)
-                if not pp.opt['A']:
-                    _log.debug("\tannual av int=1yr subint=history")
-                    this_cshscript = ts_ta.annualAV1yrfromhist(taNode, cpt.sim0, 1)
-                this_cshscript += FREAnalysis.FREAnalysis(pp, exp, node=taNode, type="timeAverage", dtvarsRef=cpt.dtvars) # XXX
-                cpt.ts_ta_update(this_cshscript, new_hsmfiles=sub.jpkSrcFiles(taNode), dep=None)
+
+                def render():
+                    this_cshscript = ""
+                    if not pp.opt['A']:
+                        _log.debug("\tannual av int=1yr subint=history")
+                        this_cshscript = ts_ta.annualAV1yrfromhist(taNode, cpt.sim0, 1)
+                    this_cshscript += FREAnalysis.FREAnalysis(pp, exp, node=taNode, type="timeAverage", dtvarsRef=cpt.dtvars) # XXX
+                    return (this_cshscript, sub.jpkSrcFiles(taNode), None)
+                cpt.add_fragment(exp, 'ta:annual:1yr', taNode, render)
     else:
         annavnodes = None
         annCalcInterval = None
@@ -1474,21 +1534,24 @@ def add_timeaverage(pp, exp, cpt, ta_loop_tuple):
         _log.debug(f"\t{ta_freq} av int={int_} subint=history")
     else:
         _log.debug(f"\t{ta_freq} av int={int_} subint={subint}")
-    this_cshscript = ""
-    if not pp.opt['A']:
-        if ta_freq == 'annual':
-            if subint > 1:
-                this_cshscript += ts_ta.annualAVfromav(taNode, cpt.sim0, subint)
-            else:
-                this_cshscript += ts_ta.annualAVxyrfromann(taNode, cpt.sim0, ppcNode, len(annavnodes), annCalcInterval)
-        else:
-            # monthly, seasonal
-            if subint:
-                this_cshscript += ts_ta.monthlyAVfromav(taNode, cpt.sim0, subint)
+
+    def render():
+        this_cshscript = ""
+        if not pp.opt['A']:
+            if ta_freq == 'annual':
+                if subint > 1:
+                    this_cshscript += ts_ta.annualAVfromav(taNode, cpt.sim0, subint)
+                else:
+                    this_cshscript += ts_ta.annualAVxyrfromann(taNode, cpt.sim0, ppcNode, len(annavnodes), annCalcInterval)
             else:
-                this_cshscript += ts_ta.monthlyAVfromhist(taNode, cpt.sim0)
-    this_cshscript += FREAnalysis.FREAnalysis(pp, exp, node=taNode, type="timeAverage", dtvarsRef=" ") # XXX
-    cpt.ts_ta_update(this_cshscript, new_hsmfiles=sub.jpkSrcFiles(taNode), dep=dep)
+                # monthly, seasonal
+                if subint:
+                    this_cshscript += ts_ta.monthlyAVfromav(taNode, cpt.sim0, subint)
+                else:
+                    this_cshscript += ts_ta.monthlyAVfromhist(taNode, cpt.sim0, npool=cpt.npool)
+        this_cshscript += FREAnalysis.FREAnalysis(pp, exp, node=taNode, type="timeAverage", dtvarsRef=" ") # XXX
+        return (this_cshscript, sub.jpkSrcFiles(taNode), dep)
+    cpt.add_fragment(exp, f'ta:{ta_freq}:{intervals}', taNode, render)
     return cpt
 
 # //////////////////////////////////////////////////////////////////////////////#
@@ -1504,19 +1567,17 @@ def timeseries_setup(ppcNode, ts_freq, pp, exp, cpt):
     if ts_freq.endswith('min') or ts_freq.endswith('hr') or ts_freq == 'hourly':
         #TIMESERIES - HOURLY
         # frepp.pl l.1911
-        xpath_expn = f"timeSeries[\@freq='{ts_freq}']"
+        freqs = ts_freq
     elif ts_freq == 'daily':
-        xpath_expn = 'timeSeries[@freq="daily" or @freq="day"]'
+        freqs = ('daily', 'day')
     elif ts_freq == 'monthly':
-        xpath_expn = 'timeSeries[@freq="monthly" or @freq="month"]'
-    elif ts_freq == 'annual':
-        xpath_expn = 'timeSeries[@freq="annual"]'
-    elif ts_freq == 'seasonal':
-        xpath_expn = 'timeSeries[@freq="seasonal"]'
+        freqs = ('monthly', 'month')
+    elif ts_freq in ('annual', 'seasonal'):
+        freqs = ts_freq
     else:
         raise ValueError(ts_freq)
 
-    tsNodes = sorted(ppcNode.findnodes(xpath_expn), key=by_chunk)
+    tsNodes = sorted(ppcNode.timeseries(freqs), key=by_chunk)
     chunks = [n.findvalue('@chunkLength') for n in tsNodes]
     diag_source = sub.diagfile(ppcNode, ts_freq)
     return [(n, ts_freq, chunks, diag_source) for n in tsNodes]
@@ -1528,11 +1589,11 @@ def add_timeseries(pp, exp, cpt, ts_loop_tuple):
     if ts_freq.endswith('min') or ts_freq.endswith('hr') \
         or ts_freq in ('hourly', 'daily', 'monthly'):
         # hourly: frepp.pl l.1915, daily: frepp.pl l.1973, monthly: frepp.pl l.2030
-        has_subchunk_func = ts_ta.TSfromts
-        no_subchunk_func = ts_ta.directTS
+        has_subchunk_func = functools.partial(ts_ta.TSfromts, npool=cpt.npool)
+        no_subchunk_func = functools.partial(ts_ta.directTS, npool=cpt.npool)
     elif ts_freq == 'annual':
         # frepp.pl l.2086
-        has_subchunk_func = ts_ta.TSfromts
+        has_subchunk_func = functools.partial(ts_ta.TSfromts, npool=cpt.npool)
         no_subchunk_func = functools.partial(
             ts_ta.annualTS,
             diagtablecontent= '\n'.join(exp.diagtablecontent)
@@ -1549,14 +1610,17 @@ def add_timeseries(pp, exp, cpt, ts_loop_tuple):
         _log.debug(f"\t{ts_freq} ts chunklength={cl} subchunk=history")
     else:
         _log.debug(f"\t{ts_freq} ts chunklength={cl} subchunk={subchunk}")
-    this_cshscript = ""
-    if not pp.opt['A']:
-        if subchunk:
-            this_cshscript += has_subchunk_func(tsNode, cpt.sim0, subchunk)
-        else:
-            this_cshscript += no_subchunk_func(tsNode, cpt.sim0, cpt.startofrun)
-    this_cshscript += FREAnalysis.FREAnalysis(pp, exp, node=tsNode, type="timeSeries", dtvarsRef=cpt.dtvars) # XXX
-    cpt.ts_ta_update(this_cshscript, new_hsmfiles=sub.jpkSrcFiles(tsNode), dep=dep)
+
+    def render():
+        this_cshscript = ""
+        if not pp.opt['A']:
+            if subchunk:
+                this_cshscript += has_subchunk_func(tsNode, cpt.sim0, subchunk)
+            else:
+                this_cshscript += no_subchunk_func(tsNode, cpt.sim0, cpt.startofrun)
+        this_cshscript += FREAnalysis.FREAnalysis(pp, exp, node=tsNode, type="timeSeries", dtvarsRef=cpt.dtvars) # XXX
+        return (this_cshscript, sub.jpkSrcFiles(tsNode), dep)
+    cpt.add_fragment(exp, f'ts:{ts_freq}:{chunks}:{diag_source}', tsNode, render)
     return cpt
 
 
@@ -1576,18 +1640,23 @@ def component_loop_dependencies(pp, exp, cpt):
     #PROCESS DEPENDENCIES
     depholds = ""
     redothisyear = False
+    plan = depplan.DependencyPlan()
 
     if not pp.opt['A']:
         #sort, unique dependencies
         cpt.depyears = sorted(list(set(cpt.depyears)))
         _log.debug(f"This frepp year depends on: {cpt.depyears}")
-        for depyear in cpt.depyears:
-            depfile  = f"{exp.statedir}/{cpt.component}.{depyear}"
+        depstates = exp.statestore.get_many(cpt.component, cpt.depyears)
+        # the years a redone year depends on in turn are checked as well
+        pending = list(cpt.depyears)
+        seen = set(pending)
+        while pending:
+            depyear = pending.pop(0)
+            depfile  = statestore.state_key(cpt.component, depyear)
             redo = False
             depstate = ''
-            if os.exists(depfile):
-                with open(depfile, 'r') as f:
-                    depstate = FREUtil.cleanstr(f.read())
+            if str(depyear) in depstates:
+                depstate = FREUtil.cleanstr(depstates[str(depyear)])
                 _log.info(f"Required year {depyear} has a state file with state "
                     "'{depstate}' for {cpt.component}.")
                 if depstate == 'OK':
@@ -1628,7 +1697,7 @@ def component_loop_dependencies(pp, exp, cpt):
                         _log.warning((f"Required year {depyear} got a history data error in the "
                             "last frepp attempt and should be rerun."))
                 elif not depstate:
-                    _log.error(f"statefile {depfile} exists but is empty, exiting.")
+                    _log.error(f"State of {depfile} is empty, exiting.")
                     #what if this is the -c split job? continue to other components
                     return # XXX
                 else:
@@ -1655,28 +1724,45 @@ def component_loop_dependencies(pp, exp, cpt):
                     _log.warning(f"Required year {depyear} missing. Use 'frepp -s' to submit with dependencies.")
 
             if redo:
-                cmd = sub.call_frepp(pp.abs_xml_path, exp.outscript, cpt.component, depyear, '', pp)
-                _log.info(f"cmd")
-                frepp_submit_output = util.shell(cmd, log=_log)
-                _log.info(f"frepp_submit_output")
-                frepp_submit_output_last_line = frepp_submit_output.splitlines()[-1]
-                depjobid = re.match(r"Submitted batch job (\d+)", frepp_submit_output_last_line)
-                if "has already been completed" not in frepp_submit_output_last_line:
-                    if not depjobid and not frepp_submit_output_last_line:
-                        _log.info(f"No jobid resulted from the job submission of {depyear}.")
-                        _log.error("Unable to submit dependent jobs, exiting.")
-                        sys.exit(1)
-                    elif not depjobid:
-                        _log.error(("the jobid returned has the wrong format: a "
-                            "frepp or batch system issue occurred."))
-                        sys.exit(1)
-                    else:
-                        depjobid = depjobid.group(1)
-                        _log.info(f"Dependent job for {depyear}='{depjobid}'")
-                        depstatefile = f"{exp.statedir}/{cpt.component}.{depyear}"
-                        depholds = depholds + depjobid + ":"
-                        with open(depstatefile, 'w') as f:
-                            f.write(depstatefile)
+                # write the runscripts of all redone years here and run them
+                # from a single job array instead of submitting a frepp for each
+                cmd = sub.call_frepp(pp.abs_xml_path, exp.outscript, cpt.component,
+                    depyear, '', pp, submit=False)
+                depscript = sub.component_outscript(exp, cpt.component,
+                    f"{depyear}{pp.userstartmo}")
+                try:
+                    generated = depplan.generate_runscript(cmd, depscript)
+                except Exception as exc:
+                    _log.error(f"Unable to write the runscript for {depyear} ({exc}), exiting.")
+                    sys.exit(1)
+                if not generated:
+                    _log.info(f"Required year {depyear} has already been completed for {cpt.component}.")
+                    continue
+                # the redone year runs after the years it depends on, if they're
+                # redone too; its holds on running jobs apply to its wave
+                subdepyears = depplan.runscript_info(depscript, 'depyears').split()
+                plan.add(cpt.component, depyear, cmd, depscript,
+                    after=[(cpt.component, y) for y in subdepyears])
+                new = [y for y in subdepyears if y not in seen]
+                if new:
+                    seen.update(new)
+                    depstates.update(exp.statestore.get_many(cpt.component, new))
+                    pending.extend(new)
+
+        if plan:
+            try:
+                depjobids = plan.submit(
+                    exp.outscriptdir,
+                    f"{exp.expt}_{cpt.component}_{pp.hDate}.deps",
+                    pp.platform_opt['batchSubmit'],
+                    store=exp.statestore,
+                    output=f"{exp.stdoutDir}/postProcess/%x.o%A_%a"
+                )
+            except Exception as exc:
+                _log.error(f"Unable to submit dependent jobs ({exc}), exiting.")
+                sys.exit(1)
+            _log.info(f"Dependent jobs for {cpt.depyears}: {depjobids}")
+            depholds = depholds + ':'.join(depjobids) + ":"
 
     if redothisyear and not pp.opt['A']:
         _log.info(f"This year ({pp.hDate}) has unmet dependencies for {cpt.component}, submitting with holds.")
@@ -1688,6 +1774,10 @@ def component_loop_dependencies(pp, exp, cpt):
         pp.opt['w'] = f" --dependency=afterok:{depholds}"
         _log.info(f"Setting holds for {pp.hDate}: {pp.opt['w']}")
 
+    # for a planning frepp running this runscript from a job array
+    cpt.cshscript.set_line('#INFO:depyears=', ' '.join(cpt.depyears))
+    cpt.cshscript.set_line('#INFO:holds=', depholds)
+
     cpt.cshscript += logs.mailcomponent()
 
     #CPIO
@@ -1699,7 +1789,7 @@ def component_loop_dependencies(pp, exp, cpt):
 
     if pp.opt['c']:
         #set up dmget, set up to postprocess the following year if necessary, write script
-        exp.mkdircommand = sub.createdirs(exp.mkdircommand)
+        sub.createdirs(exp.dirplan)
         hf = sub.dmget_files()
         hsmf = sub.jpk_hsmget_files()
         if hf:
@@ -1707,40 +1797,151 @@ def component_loop_dependencies(pp, exp, cpt):
                 exp.ptmpDir, exp.tmphistdir, exp.refinedir, exp.this_frepp_cmd,
                 ' '.join(hf), ' '.join(hsmf)
             )
-            cpt.cshscript = cpt.cshscript.replace("#hsmget_history_files", hsmget_history)
+            cpt.cshscript.fill("#hsmget_history_files", hsmget_history)
             uncompress = sub.uncompress_history_csh(exp.tmphistdir)
-            cpt.cshscript = cpt.cshscript.replace("#uncompress_history_files", uncompress)
+            cpt.cshscript.fill("#uncompress_history_files", uncompress)
             hf.sort()
             check_history = sub.checkHistComplete(exp.tmphistdir, hf[0], exp.this_frepp_cmd, hsmf, exp.diagtablecontent)
-            cpt.cshscript = cpt.cshscript.replace("#check_history_files", check_history)
+            cpt.cshscript.fill("#check_history_files", check_history)
         cpt.cshscript += sub.call_frepp(exp.abs_xml_path, exp.outscript, cpt.component, "", "", pp)
         cpt.cshscript += f"echo END-OF-SCRIPT for postprocessing job {pp.t0}-{pp.tEND} for {exp.expt}\n"
 
         # if the user sets -W, don't override the wallclock even for 1-year postprocessing
         if exp.maxyrs < 2 and not pp.opt['Walltime']:
             if pp.platform == 'x86_64':
-                cshscript = re.sub(r'(#SBATCH --time).*', r'\1=20:00:00/', cpt.cshscript)
+                cpt.cshscript.set_line('#SBATCH --time', '=20:00:00')
         if exp.maxyrs >= 20:
             if pp.platform == 'x86_64':
-                cshscript = re.sub(r'(#SBATCH --time).*', rf"\1={pp.platform_opt['maxruntime']}", cshscript)
-        cpt.cshscript = re.sub(r'(#INFO:max_years=)', rf'\1{exp.maxyrs}', cpt.cshscript)
+                cpt.cshscript.set_line('#SBATCH --time', f"={pp.platform_opt['maxruntime']}")
+        cpt.cshscript.set_line('#INFO:max_years=', f'{exp.maxyrs}')
         writefinalstate = _template("""
 
             if ( \$errors_found == 0 ) then
-                echo OK > $exp.statefile
+                $setstate_ok
             else if ( "\$prevjobstate" == "ERROR" ) then
-                echo FATAL > $statefile
+                $setstate_fatal
             else
-                echo ERROR > $statefile
+                $setstate_error
             endif
-        """, statefile=exp.statefile)
+        """, setstate_ok=statestore.setstate_csh('OK').rstrip(),
+            setstate_fatal=statestore.setstate_csh('FATAL').rstrip(),
+            setstate_error=statestore.setstate_csh('ERROR').rstrip())
         if not pp.opt['A']:
+            cpt.cshscript += writefinalstate
             sub.writescript(
-                cpt.cshscript + writefinalstate,
+                cpt.cshscript,
                 exp.outscript,
                 f"{pp.platform_opt['batchSubmit']}{pp.opt['w']} {pp.opt['m']}",
-                exp.statefile, pp
+                exp.statefile, pp, store=exp.statestore
             )
             pp.opt['w'] = ""
         # frepp.pl l.2436
     return (pp, exp)
+
+# //////////////////////////////////////////////////////////////////////////////#
+
+TA_FREQS = ('monthly', 'annual', 'seasonal')
+TS_FREQS = ('30min', 'hourly', '2hr', '3hr', '4hr', '6hr', '8hr', '12hr',
+    '120hr', 'daily', 'monthly', 'annual', 'seasonal')
+
+@dc.dataclass
+class FREppComponentResult():
+    """Rendered component, with the changes rendering made to (copies of) the
+    run-wide FREpp and FREExperiment objects.
+    """
+    cpt: FREppComponent
+    pp_changes: dict
+    opt_changes: dict
+    exp_changes: dict
+    dirs: list
+
+def _changed_fields(old, new):
+    changes = dict()
+    for f in dc.fields(new):
+        old_v, new_v = getattr(old, f.name), getattr(new, f.name)
+        if new_v is not old_v and new_v != old_v:
+            changes[f.name] = new_v
+    return changes
+
+def _copy_run_state(pp, exp):
+    """Shallow copies of *pp* and *exp* that a component can modify without
+    affecting other components.
+    """
+    cpp = copy.copy(pp)
+    cpp.opt = dict(pp.opt)
+    cexp = copy.copy(exp)
+    return cpp, cexp
+
+def generate_component(ppcNode, fre, pp, exp):
+    """Render the script of one component (component_loop_setup and the static,
+    timeAverage and timeSeries requests), on copies of *pp* and *exp*. Returns
+    a :class:`FREppComponentResult`, or None if the component is skipped.
+    """
+    cpp, cexp = _copy_run_state(pp, exp)
+    cexp.dirplan = dirplan.DirectoryPlan()
+    cpt = component_loop_setup(ppcNode, fre, cpp, cexp)
+    if not isinstance(cpt, FREppComponent):
+        return None
+    if cpp.do_static:
+        timeseries_static(ppcNode, cpp, cexp, cpt)
+    for ta_freq in TA_FREQS:
+        for ta_loop_tuple in timesaverages_setup(ppcNode, ta_freq, cpp, cexp, cpt):
+            add_timeaverage(cpp, cexp, cpt, ta_loop_tuple)
+    for ts_freq in TS_FREQS:
+        for ts_loop_tuple in timeseries_setup(ppcNode, ts_freq, cpp, cexp, cpt):
+            add_timeseries(cpp, cexp, cpt, ts_loop_tuple)
+    return FREppComponentResult(
+        cpt=cpt,
+        pp_changes=_changed_fields(pp, cpp),
+        opt_changes={k: v for k, v in cpp.opt.items() if pp.opt.get(k, None) != v},
+        exp_changes=_changed_fields(exp, cexp),
+        dirs=cexp.dirplan.drain()
+    )
+
+def _init_component_worker(exp):
+    """Reopen the experiment's databases in a forked worker, which can't use
+    the parent's connections.
+    """
+    if exp.statestore is not None:
+        exp.statestore = statestore.StateStore(exp.statestore.path)
+        service = jobstate.JobStateService()
+        service.watch_store(exp.statestore)
+        jobstate.set_default_service(service)
+    if exp.fragcache is not None:
+        exp.fragcache = fragcache.FragmentCache(exp.fragcache.path)
+
+def process_components(ppComponentNodes, fre, pp, exp):
+    """Loop over postprocessing components. With ``-c split``, the scripts of
+    the components are rendered in parallel by forked workers (up to
+    --component_pool, by default one per CPU up to 8), which share the parsed
+    XML and experiment settings read-only. Dependency checks, script writing
+    and job submission then happen in the parent, one component at a time in
+    XML order, exactly as in a sequential run.
+    """
+    nworkers = 1
+    if pp.opt['c'] == 'split':
+        if pp.opt.get('component_pool', None):
+            nworkers = int(pp.opt['component_pool'])
+        else:
+            nworkers = fanout.default_workers(len(ppComponentNodes))
+    exp.frepp_plus_calls = []
+    plus_calls = []
+    results = fanout.map_ordered(
+        lambda ppcNode: generate_component(ppcNode, fre, pp, exp),
+        ppComponentNodes, nworkers,
+        initializer=lambda: _init_component_worker(exp)
+    )
+    for result in results:
+        if result is None:
+            continue
+        cpp, cexp = _copy_run_state(pp, exp)
+        for k, v in result.pp_changes.items():
+            setattr(cpp, k, v)
+        cpp.opt.update(result.opt_changes)
+        for k, v in result.exp_changes.items():
+            setattr(cexp, k, v)
+        exp.dirplan.add(*result.dirs)
+        component_loop_dependencies(cpp, cexp, result.cpt)
+        plus_calls.extend(cexp.frepp_plus_calls)
+    exp.frepp_plus_calls = plus_calls
+    return (pp, exp)
@@ -0,0 +1,182 @@
+"""Check that the history data for a frepp year has the expected number of
+time levels for each diag file, in one pass over all history files.
+
+This replaces the csh loops :func:`~pyFRE.frepp.sub.checkHistComplete` used to
+emit, which ran ``ncdump -h | grep UNLIMITED`` once per history file. Here the
+record counts of all files are read concurrently from the file headers (see
+:func:`~pyFRE.frepp.ncio.record_count`) and summed per diag file. As before,
+only the first tile of cubed-sphere output is counted.
+
+Run from the runscript as::
+
+    $PYFRE_ENGINE pyFRE.frepp.histcheck -d $histdir -o $report \\
+        atmos_month:12:12 atmos_daily:365:366 ...
+
+where each argument gives a diag file and the two accepted numbers of time
+levels. Exits 1 if any diag file is incomplete, after writing a report.
+"""
+import argparse
+import collections
+import concurrent.futures
+import glob
+import os
+import re
+import sys
+
+from pyFRE.lib import FREUtil
+from . import ncio
+
+import logging
+_log = logging.getLogger(__name__)
+
+_other_tiles_regex = re.compile(r'\.tile[2-6]\.nc$')
+
+DiagExpectation = collections.namedtuple('DiagExpectation',
+    ['diagfile', 'efields', 'efields2'])
+DiagExpectation.__doc__ = """Accepted numbers of time levels for one diag file."""
+
+class DiagResult(collections.namedtuple('DiagResult',
+    ['diagfile', 'efields', 'efields2', 'afields', 'files'])):
+    """Expected and actual (*afields*) numbers of time levels for one diag file,
+    summed over its history *files*.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.afields in (self.efields, self.efields2)
+
+
+def parse_expectation(str_):
+    """Parse a ``diagfile:efields[:efields2]`` command-line argument."""
+    fields = str_.rsplit(':', 2)
+    try:
+        if len(fields) == 3:
+            return DiagExpectation(fields[0], int(fields[1]), int(fields[2]))
+        elif len(fields) == 2:
+            return DiagExpectation(fields[0], int(fields[1]), int(fields[1]))
+    except ValueError:
+        pass
+    raise ValueError(f"Can't parse '{str_}' as diagfile:efields[:efields2].")
+
+def expected_levels(diagtable, usedfiles, firsthist, tEND, caltype):
+    """Return the :class:`DiagExpectation` of each file in *usedfiles*
+    defined in the lines of the diag table *diagtable*, for history from the
+    date *firsthist* (``yyyymmdd``) to *tEND*. Files for which no time levels
+    can be expected (eg. daily data in a calendar other than julian) are left
+    out.
+    """
+    # frepp.pl l.2825
+    firsthisty, firsthistm, firsthistd = firsthist[:-4], firsthist[-4:-2], firsthist[-2:]
+    m = re.match(r'^(\d{4,})(\d{2})(\d{2})(?:\d{2}:\d{2}:\d{2})?$', tEND)
+    if not m:
+        raise ValueError(f"Can't parse '{tEND}' as a date.")
+    tENDy, tENDm, tENDd = m.groups()
+
+    days_firsthist = FREUtil.daysSince1BC(firsthistm, firsthistd, firsthisty)
+    days_tEND = FREUtil.daysSince1BC(tENDm, tENDd, tENDy)
+    delta = FREUtil.dateCalc(FREUtil.parseDate(firsthist), FREUtil.modifydate(tEND, "+1 sec"))
+
+    expectations = []
+    for dt in diagtable:
+        m = re.match(r'"(\w*)"\s*,\s*(\d*)\s*,\s*"(\w*)"\s*,.*,.*,.*,?', dt)
+        if not m or dt.lstrip().startswith('#'):
+            continue
+        diagfile, freq, units = m.groups()
+        if diagfile not in usedfiles or not freq or int(freq) <= 0:
+            continue
+        freq = int(freq)
+
+        #get tEND-firsthist in hours, months, (years, days)
+        efields = efields2 = 0
+        if units == "months":
+            efields = efields2 = int(FREUtil.Delta_Format(delta, 0, "%Mt")) // freq
+        elif units == "years":
+            efields = efields2 = int(FREUtil.Delta_Format(delta, 0, "%yt")) // freq
+        elif units == "days" and caltype == "julian":
+            efields = (days_tEND - days_firsthist + 1) // freq
+            efields2 = (days_tEND - days_firsthist + 2) // freq
+        elif units == "hours" and caltype == "julian":
+            efields = (days_tEND - days_firsthist + 1) * 24 // freq
+            efields2 = (days_tEND - days_firsthist + 2) * 24 // freq
+        if efields == 0:
+            continue
+        _log.debug((f"Will check that {diagfile} ({freq} {units}) history data has "
+            f"{efields} time levels ({firsthist}-{tENDy}{tENDm}{tENDd})"))
+        expectations.append(DiagExpectation(diagfile, efields, efields2))
+    return expectations
+
+def format_expectation(expectation):
+    """Command-line form of *expectation*; the inverse of :func:`parse_expectation`."""
+    return f"{expectation.diagfile}:{expectation.efields}:{expectation.efields2}"
+
+def history_files(histdir, diagfile):
+    """History files for *diagfile* in the subdirectories of *histdir*
+    (``*/*diagfile.*nc``), excluding tiles 2-6.
+    """
+    paths = glob.glob(os.path.join(glob.escape(histdir), '*', f'*{glob.escape(diagfile)}.*nc'))
+    return sorted(p for p in paths if not _other_tiles_regex.search(p))
+
+def check_history(histdir, expectations, nworkers=8):
+    """Return a list of :class:`DiagResult`, one per entry of *expectations*,
+    reading the record counts of all history files concurrently.
+    """
+    files = {e.diagfile: history_files(histdir, e.diagfile) for e in expectations}
+    paths = sorted(set(p for ps in files.values() for p in ps))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(nworkers, 1)) as pool:
+        counts = dict(zip(paths, pool.map(ncio.record_count, paths)))
+    return [
+        DiagResult(e.diagfile, e.efields, e.efields2,
+            sum(counts[p] for p in files[e.diagfile]), files[e.diagfile])
+        for e in expectations
+    ]
+
+def format_report(results, interval=""):
+    """Text for the mail sent when history data is incomplete."""
+    if interval:
+        interval = f" for the interval {interval}"
+    lines = []
+    for r in results:
+        if r.ok:
+            continue
+        lines.append((f"FRE expected {r.efields} time levels in {r.diagfile} data, "
+            f"but found {r.afields} time levels{interval} ({len(r.files)} files)."))
+    return '\n'.join(lines) + '\n'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.histcheck",
+        description="Check history data for the expected number of time levels.")
+    parser.add_argument('-d', '--histdir', required=True)
+    parser.add_argument('-o', '--report', default=None,
+        help="File to write the report to if data is incomplete.")
+    parser.add_argument('-i', '--interval', default="",
+        help="Label for the checked date range, used in the report.")
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+        help="Number of history files to read concurrently.")
+    parser.add_argument('expectations', nargs='+', type=parse_expectation,
+        metavar='DIAGFILE:EFIELDS[:EFIELDS2]')
+    args = parser.parse_args(argv)
+
+    try:
+        results = check_history(args.histdir, args.expectations, args.jobs)
+    except Exception as exc:
+        print(f"ERROR: histcheck: {exc!r}", file=sys.stderr)
+        if args.report:
+            with open(args.report, 'w') as f:
+                f.write(f"FRE could not read the history data: {exc!r}\n")
+        return 1
+    for r in results:
+        if r.ok:
+            print(f"NOTE: History data has the expected number of time levels for {r.diagfile}")
+        else:
+            print((f"ERROR: Incomplete history data: expected {r.efields} time "
+                f"levels in {r.diagfile} data, found {r.afields}"))
+    if all(r.ok for r in results):
+        return 0
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(format_report(results, args.interval))
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
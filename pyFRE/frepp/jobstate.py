@@ -0,0 +1,207 @@
+"""Batched, cached queries of batch job states.
+
+frepp checks whether the job ID recorded in a statefile is still running once
+per component-year. :class:`JobStateService` answers those checks from a
+snapshot of the scheduler's state that is taken with one query for all job IDs
+it knows about -- including every job ID recorded in the state stores
+registered with :meth:`~JobStateService.watch_store` (or in the legacy
+statefiles of directories registered with
+:meth:`~JobStateService.watch_statedir`) -- and is reused until it is older
+than ``ttl`` seconds.
+
+The scheduler is abstracted as an object with a ``query(jobids)`` method
+returning a dict from job ID to state name: :class:`SlurmScheduler` uses
+squeue/sacct, :class:`FakeScheduler` stands in for it in tests.
+"""
+import os
+import re
+import time
+
+import pyFRE.util as util
+
+import logging
+_log = logging.getLogger(__name__)
+
+# Slurm job states in which a job hasn't finished yet.
+ACTIVE_STATES = frozenset([
+    'PENDING', 'CONFIGURING', 'RUNNING', 'COMPLETING', 'REQUEUED',
+    'REQUEUE_HOLD', 'REQUEUE_FED', 'RESIZING', 'SUSPENDED', 'STOPPED',
+    'SIGNALING', 'STAGE_OUT'
+])
+
+# Job IDs as written to statefiles: plain, or array task "<jobid>_<index>".
+_jobid_regex = re.compile(r'\d+(_\d+)?')
+
+
+def is_jobid(state):
+    """True if the statefile contents *state* are a batch job ID rather than a
+    keyword (OK, ERROR, ...) or the ID of an interactive run (INT-...).
+    """
+    return bool(_jobid_regex.fullmatch(state))
+
+
+def read_statedir_jobids(statedir):
+    """Return the set of job IDs recorded in the statefiles in *statedir*."""
+    jobids = set()
+    try:
+        entries = list(os.scandir(statedir))
+    except FileNotFoundError:
+        return jobids
+    for entry in entries:
+        if entry.name.startswith('.') or not entry.is_file():
+            continue
+        # statefiles are a few bytes long; skip anything else
+        if entry.stat().st_size > 64:
+            continue
+        try:
+            with open(entry.path, 'r') as f:
+                state = f.read().strip()
+        except OSError:
+            continue
+        if is_jobid(state):
+            jobids.add(state)
+    return jobids
+
+
+class SlurmScheduler():
+    """Look up job states with one squeue call (and one sacct call for jobs
+    squeue no longer knows about) per *chunk_size* job IDs.
+    """
+    def __init__(self, chunk_size=500, use_sacct=True):
+        self.chunk_size = chunk_size
+        self.use_sacct = use_sacct
+
+    @staticmethod
+    def _parse(output):
+        states = dict()
+        for line in output.splitlines():
+            fields = line.replace('|', ' ').split()
+            if len(fields) < 2:
+                continue
+            # sacct reports eg. "CANCELLED by 1234"; keep the state name only
+            states.setdefault(fields[0], fields[1])
+        return states
+
+    def _run(self, cmd):
+        try:
+            return util.shell(cmd, log=_log)
+        except util.MDTFCalledProcessError as exc:
+            # squeue exits nonzero if none of the job IDs are known any more
+            _log.debug(f"'{cmd}' failed: {exc}")
+            return ""
+
+    def query(self, jobids):
+        states = dict()
+        jobids = sorted(jobids)
+        for i in range(0, len(jobids), self.chunk_size):
+            chunk = jobids[i:i + self.chunk_size]
+            states.update(self._parse(self._run(
+                f"squeue -h -r -o '%i %T' -j {','.join(chunk)}"
+            )))
+            missing = [j for j in chunk if j not in states]
+            if missing and self.use_sacct:
+                states.update(self._parse(self._run(
+                    f"sacct -n -X -P -o JobID,State -j {','.join(missing)}"
+                )))
+        return {j: states[j] for j in jobids if j in states}
+
+
+class FakeScheduler():
+    """In-memory scheduler for tests: *states* maps job IDs to Slurm state
+    names and can be modified between queries. Queries are recorded in
+    ``queries``.
+    """
+    def __init__(self, states=None):
+        self.states = dict(states or {})
+        self.queries = []
+
+    def query(self, jobids):
+        jobids = sorted(jobids)
+        self.queries.append(jobids)
+        return {j: self.states[j] for j in jobids if j in self.states}
+
+
+class JobStateService():
+    """Snapshot of job states, refreshed at most every *ttl* seconds, or when a
+    job ID that wasn't part of the last query is asked about.
+    """
+    def __init__(self, scheduler=None, ttl=30., clock=time.monotonic):
+        if scheduler is None:
+            scheduler = SlurmScheduler()
+        self.scheduler = scheduler
+        self.ttl = ttl
+        self.clock = clock
+        self.statedirs = set()
+        self.stores = []
+        self._jobids = set() # job IDs covered by the snapshot
+        self._states = dict()
+        self._timestamp = None
+
+    def watch_statedir(self, statedir):
+        """Include all job IDs recorded in *statedir*'s statefiles in every
+        snapshot, so that checking them later doesn't need another query.
+        """
+        if statedir not in self.statedirs:
+            self.statedirs.add(statedir)
+            self._timestamp = None
+
+    def watch_store(self, store):
+        """Include all job IDs recorded in the
+        :class:`~pyFRE.frepp.statestore.StateStore` *store* in every snapshot.
+        """
+        if store not in self.stores:
+            self.stores.append(store)
+            self._timestamp = None
+
+    def invalidate(self):
+        """Force a new query on the next lookup, eg. after submitting jobs."""
+        self._timestamp = None
+
+    def _stale(self):
+        return (self._timestamp is None) \
+            or (self.clock() - self._timestamp > self.ttl)
+
+    def refresh(self, extra_jobids=()):
+        """Query the scheduler for all known job IDs plus *extra_jobids*."""
+        jobids = set(extra_jobids)
+        if not self._stale():
+            jobids.update(self._jobids)
+        for statedir in self.statedirs:
+            jobids.update(read_statedir_jobids(statedir))
+        for store in self.stores:
+            jobids.update(s for _, _, s in store.items() if is_jobid(s))
+        self._states = self.scheduler.query(jobids) if jobids else dict()
+        self._jobids = jobids
+        self._timestamp = self.clock()
+        _log.debug(f"Queried batch system for {len(jobids)} job(s).")
+
+    def state(self, jobid):
+        """Return the scheduler's state name for *jobid*, or None if the
+        scheduler doesn't know about it.
+        """
+        jobid = str(jobid).strip()
+        if self._stale() or jobid not in self._jobids:
+            self.refresh([jobid])
+        return self._states.get(jobid, None)
+
+    def isjobrunning(self, jobid):
+        """True if *jobid* is pending or running."""
+        return self.state(jobid) in ACTIVE_STATES
+
+
+_default_service = None
+
+def default_service():
+    """Return the process-wide :class:`JobStateService`."""
+    global _default_service
+    if _default_service is None:
+        _default_service = JobStateService()
+    return _default_service
+
+def set_default_service(service):
+    """Replace the process-wide :class:`JobStateService` (eg. with one using a
+    :class:`FakeScheduler`); returns the previous one.
+    """
+    global _default_service
+    old, _default_service = _default_service, service
+    return old
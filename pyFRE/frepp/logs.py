@@ -4,6 +4,7 @@ import os
 import time
 
 import pyFRE.util as util
+from . import jobstate
 
 import logging
 _log = logging.getLogger(__name__)
@@ -218,7 +219,9 @@ def end_systime():
     """) # XXX need more vars
 
 def isjobrunning(jobid):
-    """Check whether a job is running."""
+    """Check whether a job is running. Answered from the cached snapshot of
+    :func:`~pyFRE.frepp.jobstate.default_service`, which queries the batch
+    system for all of the experiment's jobs at once.
+    """
     # frepp.pl l.3272
-    squeue_out = util.shell(f"squeue -u {os.environ['USER']} -o %i")
-    return (jobid in squeue_out)
+    return jobstate.default_service().isjobrunning(jobid)
@@ -0,0 +1,216 @@
+"""Concatenation of time series files along the record dimension, replacing
+the ``ncrcat`` / ``ncatted -a filename`` / ``nccopy`` sequence that assembles
+each time series chunk from per-year files in
+:mod:`~pyFRE.frepp.ts_ta`.
+
+That sequence writes the chunk three times: ncrcat writes it, ncatted
+rewrites it to change one attribute, and nccopy rewrites it compressed.
+:func:`concatenate` creates the output once, with its final format,
+compression, chunking and global attributes, and streams record slices from
+each input into it. Time values must increase strictly, within and across
+the inputs, as ncrcat's output is expected to.
+
+Can be called from the generated runscript via
+``python3 -m pyFRE.frepp.ncconcat``.
+"""
+import argparse
+import os
+import shlex
+import sys
+
+import numpy as np
+
+from . import ncio
+
+import logging
+_log = logging.getLogger(__name__)
+
+# bound on the size of the record slices read at a time
+SLAB_BYTES = 64 * 2**20
+# nccopy -k values
+_NCCOPY_KINDS = {
+    '1': 'NETCDF3_CLASSIC', 'classic': 'NETCDF3_CLASSIC',
+    '2': 'NETCDF3_64BIT_OFFSET', '64-bit offset': 'NETCDF3_64BIT_OFFSET',
+    '5': 'NETCDF3_64BIT_DATA', 'cdf5': 'NETCDF3_64BIT_DATA',
+    '3': 'NETCDF4', '4': 'NETCDF4', 'nc4': 'NETCDF4', 'netCDF-4': 'NETCDF4',
+    '7': 'NETCDF4_CLASSIC', '4c': 'NETCDF4_CLASSIC', 'nc7': 'NETCDF4_CLASSIC',
+    'netCDF-4 classic model': 'NETCDF4_CLASSIC',
+}
+
+class ConcatError(Exception):
+    """Raised when the inputs can't be concatenated."""
+    pass
+
+def parse_nccopy_flags(flags):
+    """Output settings ``{'fmt', 'complevel', 'shuffle'}`` equivalent to the
+    nccopy options *flags* (eg. ``$nc_compression_flags``, such as
+    ``-d 2 -s``). Options other than -d, -s, -k and the format digits are
+    ignored.
+    """
+    opts = {'fmt': None, 'complevel': None, 'shuffle': False}
+    args = shlex.split(flags or '')
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.startswith('-d'):
+            value = arg[2:] or (args[i + 1] if i + 1 < len(args) else '')
+            i += 0 if arg[2:] else 1
+            opts['complevel'] = int(value)
+        elif arg == '-s':
+            opts['shuffle'] = True
+        elif arg.startswith('-k'):
+            value = arg[2:] or (args[i + 1] if i + 1 < len(args) else '')
+            i += 0 if arg[2:] else 1
+            if value not in _NCCOPY_KINDS:
+                raise ConcatError(f"Unknown nccopy format '{value}'.")
+            opts['fmt'] = _NCCOPY_KINDS[value]
+        elif len(arg) == 2 and arg[0] == '-' and arg[1] in _NCCOPY_KINDS:
+            opts['fmt'] = _NCCOPY_KINDS[arg[1]]
+        else:
+            _log.debug(f"Ignoring nccopy option {arg}.")
+        i += 1
+    if opts['complevel'] == 0:
+        opts['complevel'] = None
+    return opts
+
+def _record_chunks(var, src, tname):
+    """One record per chunk, as the records are appended file by file."""
+    return [1 if d == tname else len(src.dimensions[d]) for d in var.dimensions]
+
+def _selected(src, tname, variables):
+    """Names of the record variables of *src* to write."""
+    keep = {tname, ncio.bounds_var(src, tname), *ncio.AVERAGE_INFO_VARS}
+    return [v.name for v in src.variables.values() if ncio.is_record_var(v, tname)
+        and (not variables or v.name in variables or v.name in keep)]
+
+def _define(path, src, tname, names, fmt, complevel, shuffle, filename):
+    record_vars = [v for v in src.variables.values() if ncio.is_record_var(v, tname)]
+    dst = ncio.create_like(path, src, exclude=[v.name for v in record_vars],
+        zlib=bool(complevel), complevel=complevel, shuffle=shuffle, fmt=fmt)
+    for var in record_vars:
+        if var.name in names:
+            ncio.copy_var_def(dst, var, zlib=bool(complevel), complevel=complevel,
+                shuffle=shuffle, chunksizes=_record_chunks(var, src, tname))
+    for var in list(src.variables.values()) + list(dst.variables.values()):
+        var.set_auto_maskandscale(False)
+    ncio.copy_static_vars(dst, src, tname)
+    if 'filename' in dst.ncattrs():
+        dst.filename = filename
+    return dst
+
+def _check_times(src, tname, path, last_time):
+    """Check that the times of *src* increase, and follow *last_time*.
+    Returns its last time.
+    """
+    if tname not in src.variables or not len(src.dimensions[tname]):
+        return last_time
+    times = np.asarray(src.variables[tname][:], dtype='f8')
+    if np.any(np.diff(times) <= 0) or (last_time is not None and times[0] <= last_time):
+        raise ConcatError(f"Time values in {path} don't increase.")
+    return times[-1]
+
+def _append(dst, src, tname, names, nrec, slab_bytes):
+    """Copy the records of variables *names* of *src* into *dst* from record
+    *nrec*, in slabs of at most *slab_bytes*.
+    """
+    n = len(src.dimensions[tname])
+    for name in names:
+        var = src.variables[name]
+        out = dst.variables[name]
+        if var.dimensions != out.dimensions:
+            raise ConcatError((f"{name} in {src.filepath()} has dimensions "
+                f"{var.dimensions}, not {out.dimensions}."))
+        axis = var.dimensions.index(tname)
+        rec_bytes = var.dtype.itemsize * int(np.prod([len(src.dimensions[d])
+            for d in var.dimensions if d != tname]))
+        step = max(1, slab_bytes // max(1, rec_bytes))
+        for i in range(0, n, step):
+            j = min(i + step, n)
+            index = [slice(None)] * var.ndim
+            out_index = [slice(None)] * var.ndim
+            index[axis] = slice(i, j)
+            out_index[axis] = slice(nrec + i, nrec + j)
+            out[tuple(out_index)] = var[tuple(index)]
+    return n
+
+def concatenate(infiles, outfile, complevel=None, shuffle=False, fmt=None,
+    filename=None, variables=None, slab_bytes=SLAB_BYTES):
+    """Concatenate *infiles* along their record dimension into *outfile*,
+    compressed with deflate level *complevel* (and *shuffle*) and in format
+    *fmt* (by default, that of the first input), with the global ``filename``
+    attribute set to *filename* (by default, the output's name) if present.
+    With *variables*, only those record variables (and the coordinates and
+    non-record variables) are written, like ``ncrcat -v``.
+
+    Non-record variables are taken from the first input. Raises ConcatError
+    if the inputs' definitions don't match, or the time values don't
+    increase. Returns the number of records written.
+    """
+    if not infiles:
+        raise ConcatError("No input files.")
+    if filename is None:
+        filename = os.path.basename(outfile)
+    tmpfile = outfile + '.tmp'
+    nrec = 0
+    last_time = None
+    dst = None
+    try:
+        for path in infiles:
+            with ncio.open_dataset(path) as src:
+                tname = ncio.record_dim(src)
+                if tname is None:
+                    raise ConcatError(f"No record dimension in {path}.")
+                if dst is None:
+                    out_tname = tname
+                    names = _selected(src, tname, variables)
+                    dst = _define(tmpfile, src, tname, names,
+                        ncio.output_format(src.data_model, fmt, bool(complevel)),
+                        complevel, shuffle, filename)
+                elif tname != out_tname:
+                    raise ConcatError(f"{path} has record dimension {tname}, not {out_tname}.")
+                missing = [n for n in names if n not in src.variables]
+                if missing:
+                    raise ConcatError(f"{path} is missing {', '.join(missing)}.")
+                for var in src.variables.values():
+                    var.set_auto_maskandscale(False)
+                last_time = _check_times(src, tname, path, last_time)
+                nrec += _append(dst, src, tname, names, nrec, slab_bytes)
+    except BaseException:
+        if dst is not None:
+            dst.close()
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+    dst.close()
+    os.replace(tmpfile, outfile)
+    return nrec
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.ncconcat",
+        description=("Concatenate netCDF files along the record dimension, "
+            "compressing the output as it's written."))
+    parser.add_argument('-o', '--output', required=True, help="Output file.")
+    parser.add_argument('-z', '--nccopy-flags', default='',
+        help="nccopy options to apply to the output (eg. '-d 2 -s').")
+    parser.add_argument('-F', '--filename', default=None,
+        help="Value of the filename global attribute (default: output name).")
+    parser.add_argument('-v', '--variables', default=None,
+        help="Comma-separated record variables to write (default: all).")
+    parser.add_argument('infiles', nargs='+')
+    args = parser.parse_args(argv)
+
+    variables = [v for v in (args.variables or '').split(',') if v]
+    try:
+        opts = parse_nccopy_flags(args.nccopy_flags)
+        nrec = concatenate(args.infiles, args.output, complevel=opts['complevel'],
+            shuffle=opts['shuffle'], fmt=opts['fmt'], filename=args.filename,
+            variables=variables)
+    except (ConcatError, OSError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    _log.info(f"Wrote {nrec} records to {args.output}.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
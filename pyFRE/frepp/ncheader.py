@@ -0,0 +1,243 @@
+"""Cached NetCDF header metadata for the generated runscripts.
+
+The runscripts ran ``ncdump -h <file> | grep UNLIMITED`` (or ``grep
+calendar_type``, ``grep -c " climatology_bounds("``, ...) over and over on
+the same files, just to learn the record dimension, calendar, variables or
+number of time levels. :func:`read_header` reads all of that from a file's
+header at once, and :class:`HeaderCache` keeps the result in a small SQLite
+database keyed by the file's path, modification time and size, so a file
+that hasn't changed is only ever opened once.
+
+Runscripts query it through the command line interface, eg.::
+
+    set taxis = `$PYFRE_ENGINE pyFRE.frepp.ncheader -d $headerdb timename $file`
+    set length = `$PYFRE_ENGINE pyFRE.frepp.ncheader -d $headerdb nrec $file`
+"""
+import argparse
+import dataclasses as dc
+import json
+import os
+import sqlite3
+import sys
+
+from . import compression, ncio
+
+import logging
+_log = logging.getLogger(__name__)
+
+DB_NAME = '.frepp_headers.sqlite'
+
+class HeaderError(Exception):
+    """Raised when a header field can't be determined."""
+    pass
+
+@dc.dataclass
+class Header():
+    """Metadata of a NetCDF file that the runscripts look up."""
+    timename: str = None
+    nrec: int = 0
+    calendar: str = None
+    calendar_type: str = None
+    time_bounds: str = None
+    dimensions: dict = dc.field(default_factory=dict)
+    variables: list = dc.field(default_factory=list)
+    # {var: (deflate level, shuffle)} of compressed variables
+    compression: dict = dc.field(default_factory=dict)
+    attributes: dict = dc.field(default_factory=dict)
+
+    def has(self, name):
+        """True if the file has variable *name*."""
+        return name in self.variables
+
+    @property
+    def deflation(self):
+        """Highest deflate level of any variable (0 if uncompressed)."""
+        return max((c[0] for c in self.compression.values()), default=0)
+
+    @property
+    def shuffle(self):
+        """True if any variable is shuffled."""
+        return any(c[1] for c in self.compression.values())
+
+    def associated_files(self):
+        """Sorted file names in the ``associated_files`` global attribute
+        (``"areacello: 19800101.ocean_static.nc ..."``).
+        """
+        value = str(self.attributes.get('associated_files', ''))
+        return sorted({f for f in value.split() if not f.endswith(':')})
+
+    def to_json(self):
+        return json.dumps(dc.asdict(self), sort_keys=True)
+
+    @classmethod
+    def from_json(cls, str_):
+        d = json.loads(str_)
+        d['compression'] = {k: tuple(v) for k, v in d['compression'].items()}
+        return cls(**d)
+
+def _text_attr(var, name):
+    if var is not None and name in var.ncattrs():
+        return str(var.getncattr(name))
+    return None
+
+def _plain(value):
+    """JSON-serializable version of attribute *value*."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return value
+
+def read_header(path):
+    """Read the :class:`Header` of the file at *path*."""
+    with ncio.open_dataset(path) as ds:
+        tname = ncio.record_dim(ds)
+        tvar = ds.variables.get(tname) if tname else None
+        settings = {name: compression.var_settings(var) for name, var in ds.variables.items()}
+        return Header(
+            timename=tname,
+            nrec=(len(ds.dimensions[tname]) if tname else 0),
+            calendar=_text_attr(tvar, 'calendar'),
+            calendar_type=_text_attr(tvar, 'calendar_type'),
+            time_bounds=(ncio.bounds_var(ds, tname) if tname else None),
+            dimensions={name: len(dim) for name, dim in ds.dimensions.items()},
+            variables=list(ds.variables),
+            compression={k: v for k, v in settings.items() if v[0]},
+            attributes={k: _plain(ds.getncattr(k)) for k in ds.ncattrs()},
+        )
+
+
+class HeaderCache():
+    """Headers of files, stored in the SQLite database at *path* and keyed by
+    file path, modification time and size.
+    """
+    def __init__(self, path, timeout=60.):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS headers (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                header TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, path):
+        """The :class:`Header` of *path*: from the cache if the file hasn't
+        changed since it was stored, else read and stored.
+        """
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        row = self._conn.execute(
+            "SELECT header FROM headers WHERE path = ? AND mtime_ns = ? AND size = ?",
+            (path, st.st_mtime_ns, st.st_size)
+        ).fetchone()
+        if row is not None:
+            return Header.from_json(row[0])
+        header = read_header(path)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO headers (path, mtime_ns, size, header) VALUES (?, ?, ?, ?)",
+            (path, st.st_mtime_ns, st.st_size, header.to_json())
+        )
+        return header
+
+    def prune(self):
+        """Drop the entries of files that no longer exist or have changed.
+        Returns the number dropped.
+        """
+        stale = []
+        for path, mtime_ns, size in self._conn.execute(
+            "SELECT path, mtime_ns, size FROM headers"):
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.append(path)
+                continue
+            if (st.st_mtime_ns, st.st_size) != (mtime_ns, size):
+                stale.append(path)
+        self._conn.executemany("DELETE FROM headers WHERE path = ?", [(p,) for p in stale])
+        return len(stale)
+
+def get_header(path, cache=None):
+    """The :class:`Header` of *path*, through :class:`HeaderCache` *cache* if
+    given.
+    """
+    if cache is None:
+        return read_header(path)
+    return cache.get(path)
+
+
+def _field(header, field, arg):
+    """Value of *field* of *header* as printed by the command line interface."""
+    if field == 'timename':
+        if header.timename is None:
+            raise HeaderError("No record dimension.")
+        return header.timename
+    elif field == 'nrec':
+        return header.nrec
+    elif field in ('calendar', 'calendar_type', 'time_bounds'):
+        value = getattr(header, field)
+        return '' if value is None else value
+    elif field == 'variables':
+        return ' '.join(header.variables)
+    elif field == 'has':
+        return 1 if header.has(arg) else 0
+    elif field == 'dim':
+        if arg not in header.dimensions:
+            raise HeaderError(f"No dimension {arg}.")
+        return header.dimensions[arg]
+    elif field == 'attr':
+        value = header.attributes.get(arg, '')
+        return ' '.join(str(v) for v in value) if isinstance(value, list) else value
+    elif field == 'associated_files':
+        return '\n'.join(header.associated_files())
+    elif field == 'deflation':
+        return header.deflation
+    elif field == 'shuffle':
+        return 'true' if header.shuffle else 'false'
+    raise HeaderError(f"Unknown field {field}.")
+
+FIELDS = ('timename', 'nrec', 'calendar', 'calendar_type', 'time_bounds', 'variables',
+    'has', 'dim', 'attr', 'associated_files', 'deflation', 'shuffle')
+# fields taking an argument (variable, dimension or attribute name)
+_ARG_FIELDS = ('has', 'dim', 'attr')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.ncheader",
+        description="Print header metadata of NetCDF files, one line per file.")
+    parser.add_argument('-d', '--db', default=None,
+        help="Header cache database (default: don't cache).")
+    parser.add_argument('field', choices=FIELDS)
+    parser.add_argument('args', nargs='+', metavar='file',
+        help="Files; 'has', 'dim' and 'attr' take a name first.")
+    args = parser.parse_args(argv)
+
+    arg, files = None, args.args
+    if args.field in _ARG_FIELDS:
+        if len(files) < 2:
+            parser.error(f"{args.field} takes a name and at least one file.")
+        arg, files = files[0], files[1:]
+    cache = HeaderCache(args.db) if args.db else None
+    try:
+        for path in files:
+            print(_field(get_header(path, cache), args.field, arg))
+    except (HeaderError, OSError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if cache is not None:
+            cache.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
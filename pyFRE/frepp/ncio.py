@@ -0,0 +1,196 @@
+"""NetCDF input/output helpers shared by the in-process postprocessing engines,
+which replace the per-file ncks/ncdump/TIMAVG invocations emitted by
+:mod:`~pyFRE.frepp.ts_ta`.
+"""
+import contextlib
+import mmap
+import os
+
+import numpy as np
+import netCDF4
+
+import logging
+_log = logging.getLogger(__name__)
+
+# variables written by the diag manager to describe each record's averaging
+# period; these are never averaged as data.
+AVERAGE_INFO_VARS = ('average_T1', 'average_T2', 'average_DT')
+
+@contextlib.contextmanager
+def open_dataset(path, use_mmap=True):
+    """Context manager opening *path* read-only. If *use_mmap* is True, the
+    file is memory-mapped and handed to netCDF4 as an in-memory buffer, so that
+    repeated slicing of record variables doesn't issue new reads.
+    """
+    if not use_mmap or os.path.getsize(path) == 0:
+        ds = netCDF4.Dataset(path, 'r')
+        try:
+            ds.set_auto_mask(True)
+            yield ds
+        finally:
+            ds.close()
+        return
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            ds = netCDF4.Dataset(path, 'r', memory=buf)
+            try:
+                ds.set_auto_mask(True)
+                yield ds
+            finally:
+                ds.close()
+        finally:
+            buf.close()
+
+def record_dim(ds):
+    """Name of the record (UNLIMITED) dimension of *ds*, or None. Equivalent to
+    ``ncdump -h | grep UNLIMITED``.
+    """
+    for name, dim in ds.dimensions.items():
+        if dim.isunlimited():
+            return name
+    return None
+
+# numrecs value written by classic-format files being streamed
+_STREAMING = {4: 0xFFFFFFFF, 8: 0xFFFFFFFFFFFFFFFF}
+
+def record_count(path):
+    """Length of the record (UNLIMITED) dimension of the file at *path*.
+
+    For classic-format files (CDF-1, 2 and 5) this is the ``numrecs`` field,
+    right after the magic number, so only the first 12 bytes are read. Other
+    files (netCDF-4/HDF5, or classic files still being written) are opened
+    with netCDF4, which only reads their metadata. Returns 0 for files without
+    a record dimension.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(12)
+    if head[:3] == b'CDF' and len(head) >= 8:
+        size = 8 if head[3] == 5 else 4
+        if len(head) >= 4 + size:
+            numrecs = int.from_bytes(head[4:4 + size], 'big')
+            if numrecs != _STREAMING[size]:
+                return numrecs
+    with open_dataset(path, use_mmap=False) as ds:
+        tname = record_dim(ds)
+        return 0 if tname is None else len(ds.dimensions[tname])
+
+def is_record_var(var, tname):
+    """True if netCDF4 Variable *var* is defined along record dimension *tname*."""
+    return bool(tname) and (tname in var.dimensions)
+
+def bounds_var(ds, tname):
+    """Name of the time bounds variable of *ds*, if present."""
+    if tname in ds.variables:
+        name = getattr(ds.variables[tname], 'bounds', None)
+        if name and name in ds.variables:
+            return name
+    for name in (f'{tname}_bounds', f'{tname}_bnds', 'time_bounds', 'time_bnds'):
+        if name in ds.variables:
+            return name
+    return None
+
+def averaging_period(ds, tname):
+    """Return arrays (t1, t2, dt) giving the start, end and length of the
+    averaging period of each record, in units of the time axis. Uses the
+    average_T1/T2/DT variables if present, then the time bounds, then falls
+    back to the time coordinate with unit weights.
+    """
+    if all(v in ds.variables for v in AVERAGE_INFO_VARS):
+        t1 = np.ma.filled(ds.variables['average_T1'][:], np.nan).astype('f8')
+        t2 = np.ma.filled(ds.variables['average_T2'][:], np.nan).astype('f8')
+        dt = np.ma.filled(ds.variables['average_DT'][:], np.nan).astype('f8')
+        return (t1, t2, dt)
+    bnds = bounds_var(ds, tname)
+    if bnds is not None:
+        b = np.ma.filled(ds.variables[bnds][:], np.nan).astype('f8')
+        return (b[:, 0], b[:, 1], b[:, 1] - b[:, 0])
+    t = np.ma.filled(ds.variables[tname][:], np.nan).astype('f8')
+    return (t, t, np.ones_like(t))
+
+def fill_value(var):
+    """Fill value to use when writing a copy of netCDF4 Variable *var*."""
+    for attr in ('_FillValue', 'missing_value'):
+        if attr in var.ncattrs():
+            val = np.asarray(var.getncattr(attr)).ravel()
+            if val.size > 0:
+                return val[0]
+    return None
+
+def output_format(src_fmt, fmt=None, compress=False):
+    """Format to write a copy of a *src_fmt* dataset in: *fmt* if given, else
+    *src_fmt*, except that, as with nccopy, compressing classic-format data
+    gives a netCDF-4 classic model file.
+    """
+    if fmt is None:
+        fmt = src_fmt
+    if compress and not fmt.startswith('NETCDF4'):
+        fmt = 'NETCDF4_CLASSIC'
+    return fmt
+
+def create_like(path, src, exclude=(), zlib=False,
+    complevel=None, shuffle=False, fmt=None):
+    """Create a new dataset at *path* with the dimensions, global attributes and
+    variable definitions of open Dataset *src*, skipping variables whose names
+    are in *exclude*. The record dimension remains unlimited; other dimensions
+    keep their lengths. Returns the open (writable) Dataset.
+    """
+    if fmt is None:
+        fmt = src.data_model
+    dst = netCDF4.Dataset(path, 'w', format=fmt)
+    dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+    for name, dim in src.dimensions.items():
+        dst.createDimension(name, (None if dim.isunlimited() else len(dim)))
+    for name, var in src.variables.items():
+        if name in exclude:
+            continue
+        copy_var_def(dst, var, zlib=zlib, complevel=complevel, shuffle=shuffle)
+    return dst
+
+def copy_var_def(dst, var, zlib=False, complevel=None, shuffle=False,
+    chunksizes=None):
+    """Define a variable in *dst* with the name, type, dimensions and attributes
+    of netCDF4 Variable *var*. Returns the new Variable.
+    """
+    kwargs = dict()
+    if zlib and dst.data_model.startswith('NETCDF4'):
+        kwargs = {'zlib': True, 'shuffle': shuffle}
+        if complevel is not None:
+            kwargs['complevel'] = complevel
+    if chunksizes is not None and dst.data_model.startswith('NETCDF4'):
+        kwargs['chunksizes'] = chunksizes
+    attrs = {k: var.getncattr(k) for k in var.ncattrs() if k != '_FillValue'}
+    new_var = dst.createVariable(var.name, var.datatype, var.dimensions,
+        fill_value=fill_value(var) if '_FillValue' in var.ncattrs() else None,
+        **kwargs)
+    new_var.set_auto_mask(True)
+    new_var.setncatts(attrs)
+    return new_var
+
+def copy_static_vars(dst, src, tname, exclude=()):
+    """Copy values of all variables in *src* that aren't defined along the
+    record dimension *tname* into *dst*.
+    """
+    for name, var in src.variables.items():
+        if name in exclude or is_record_var(var, tname) or name not in dst.variables:
+            continue
+        if var.dimensions:
+            dst.variables[name][:] = var[:]
+        else:
+            dst.variables[name].assignValue(var.getValue())
+
+def weighted_mean(data, weights, axis=0):
+    """Mean of (masked) array *data* along *axis* weighted by *weights*,
+    excluding missing values from both the numerator and the normalization (as
+    TIMAVG does.) Entries with no valid data are masked in the result.
+
+    *weights* has the shape of the leading ``axis + 1`` dimensions of *data*.
+    """
+    data = np.ma.asarray(data)
+    w = np.asarray(weights, dtype='f8')
+    w = w.reshape(w.shape + (1,) * (data.ndim - w.ndim))
+    w = np.broadcast_to(w, data.shape)
+    w = np.ma.array(w, mask=np.ma.getmaskarray(data))
+    num = np.ma.sum(data.astype('f8') * w, axis=axis)
+    den = np.ma.sum(w, axis=axis)
+    return num / np.ma.masked_equal(den, 0.0)
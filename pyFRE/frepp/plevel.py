@@ -0,0 +1,317 @@
+"""In-process interpolation of atmospheric model-level data to pressure levels,
+replacing the PLEVEL / ``ncdump -h`` / ``ncatted`` / ``mv`` sequence emitted
+by :func:`~pyFRE.frepp.ts_ta.zInterpolate` for each file.
+
+The pressure at the model's half levels is ``pk + bk * ps``; full-level
+pressures are the log-mean of the bounding half levels, as in the FMS
+dynamical cores. All 3D variables of a file are interpolated linearly in
+log(pressure), in slabs of whole records whose size is bounded by
+*chunk_mb*: the interpolation indices and weights are computed once per slab
+and shared by every variable. Values at levels below the surface are
+missing; levels above the uppermost (or below the lowermost) full level, but
+above the surface, take the value of that level.
+
+Can be called from the generated runscript via
+``python3 -m pyFRE.frepp.plevel``.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import netCDF4
+
+from . import ncio
+
+import logging
+_log = logging.getLogger(__name__)
+
+# output pressure levels (Pa) of each zInterp setting
+LEVEL_SETS = {
+    'ncep': (100000, 92500, 85000, 70000, 60000, 50000, 40000, 30000, 25000,
+        20000, 15000, 10000, 7000, 5000, 3000, 2000, 1000),
+    'am3': (100000, 92500, 85000, 70000, 60000, 50000, 40000, 30000, 25000,
+        20000, 15000, 10000, 7000, 5000, 3000, 2000, 1000, 500, 300, 200, 100),
+    'hs20': (2500, 7500, 12500, 17500, 22500, 27500, 32500, 37500, 42500,
+        47500, 52500, 57500, 62500, 67500, 72500, 77500, 82500, 87500, 92500,
+        97500),
+    'era40': (100000, 92500, 85000, 77500, 70000, 60000, 50000, 40000, 30000,
+        25000, 20000, 15000, 10000, 7000, 5000, 3000, 2000, 1000, 700, 500,
+        300, 200, 100),
+    'narcaap': tuple(range(2500, 105001, 2500)),
+    'ar5daily': (100000, 85000, 70000, 50000, 25000, 10000, 5000, 1000),
+    'ncep_subset': (92500, 85000, 70000, 50000, 25000),
+}
+# variables describing the model's vertical grid, not copied to the output
+REQUIRED_VARS = ('bk', 'pk', 'ps')
+LEVEL_DIM = 'level'
+DEFAULT_FILL = 1.0e20
+# FMS calendar_type values and the corresponding CF calendar names
+CF_CALENDARS = {
+    'NOLEAP': 'noleap', 'NO_LEAP': 'noleap', '365_DAY': 'noleap',
+    'JULIAN': 'julian', 'GREGORIAN': 'gregorian', 'STANDARD': 'standard',
+    'THIRTY_DAY_MONTHS': '360_day', '360_DAY': '360_day',
+    'ALL_LEAP': 'all_leap', '366_DAY': 'all_leap',
+    'NO_CALENDAR': 'none', 'NONE': 'none',
+}
+
+class PlevelError(Exception):
+    """Raised when a file can't be interpolated to pressure levels."""
+    pass
+
+def cf_calendar(caltype):
+    """CF name of the calendar given by an FMS ``calendar_type`` (or CF)
+    name *caltype*, or None if it's empty.
+    """
+    if not caltype:
+        return None
+    caltype = str(caltype).strip().strip('"')
+    return CF_CALENDARS.get(caltype.upper(), caltype.lower())
+
+def full_level_pressure(ph):
+    """Full-level pressures from half-level pressures *ph*, whose axis 1 runs
+    over the half levels from the top down: the log-mean of each pair of
+    half levels, or their mean where the upper one is zero (the model top).
+    """
+    upper, lower = ph[:, :-1], ph[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pf = (lower - upper) / (np.log(lower) - np.log(upper))
+    return np.where(upper > 0, pf, 0.5 * (upper + lower))
+
+def interp_weights(pf, ps, levels):
+    """Indices and weights interpolating linearly in log(pressure) from the
+    full-level pressures *pf* (shape ``(nt, nz, ...)``, increasing along axis
+    1) to the pressures *levels* (Pa). Returns ``(k0, w, below)``: the value
+    at each output level is ``v[k0] + w * (v[k0 + 1] - v[k0])``, and *below*
+    is True where the level is below the surface pressure *ps*. Each array has
+    shape ``(nt, nlev, ...)``.
+    """
+    nz = pf.shape[1]
+    levels = np.asarray(levels, dtype='f8')
+    target = levels.reshape((1, -1) + (1,) * (pf.ndim - 2))
+    # number of full levels above each target pressure
+    count = np.zeros((pf.shape[0], len(levels)) + pf.shape[2:], dtype=np.intp)
+    for k in range(nz):
+        count += pf[:, k:k+1] <= target
+    k0 = np.clip(count - 1, 0, max(nz - 2, 0))
+    if nz < 2:
+        return k0, np.zeros(k0.shape), target > ps[:, np.newaxis]
+    logp = np.log(np.maximum(pf, np.finfo('f8').tiny))
+    lp0 = np.take_along_axis(logp, k0, axis=1)
+    lp1 = np.take_along_axis(logp, k0 + 1, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = (np.log(target) - lp0) / (lp1 - lp0)
+    w = np.clip(np.nan_to_num(w), 0., 1.)
+    return k0, w, target > ps[:, np.newaxis]
+
+def apply_weights(data, k0, w, below):
+    """Interpolate masked array *data* (shape ``(nt, nz, ...)``) with the
+    result of :func:`interp_weights`. Returns a masked array.
+    """
+    data = np.ma.asarray(data)
+    values = np.ma.filled(data.astype('f8'), np.nan)
+    if values.shape[1] < 2:
+        out = np.take_along_axis(values, k0, axis=1)
+    else:
+        v0 = np.take_along_axis(values, k0, axis=1)
+        v1 = np.take_along_axis(values, k0 + 1, axis=1)
+        out = v0 + w * (v1 - v0)
+    return np.ma.masked_where(below | np.isnan(out), out)
+
+def _vertical_dims(src):
+    """Names of the half- and full-level dimensions of *src*."""
+    hdims = src.variables['bk'].dimensions
+    if len(hdims) != 1:
+        raise PlevelError("bk must be one-dimensional.")
+    hdim = hdims[0]
+    nfull = len(src.dimensions[hdim]) - 1
+    if 'pfull' in src.dimensions and len(src.dimensions['pfull']) == nfull:
+        return hdim, 'pfull'
+    for name, dim in src.dimensions.items():
+        if name != hdim and len(dim) == nfull and name in src.variables:
+            return hdim, name
+    raise PlevelError(f"No full-level dimension of length {nfull}.")
+
+def vars_3d(src, zdim=None):
+    """Names of the variables of *src* on model levels: those with the
+    dimensions of ps plus the full-level dimension after the record
+    dimension. Equivalent to ``NCVARS -st3``, restricted to what can be
+    interpolated.
+    """
+    if zdim is None:
+        zdim = _vertical_dims(src)[1]
+    ps_dims = src.variables['ps'].dimensions
+    want = ps_dims[:1] + (zdim, ) + ps_dims[1:]
+    return [name for name, var in src.variables.items() if var.dimensions == want]
+
+def _slab_records(src, names, nlev, chunk_mb):
+    """Number of records per slab such that the slab's input and output
+    (in double precision) stay within *chunk_mb* megabytes.
+    """
+    ps = src.variables['ps']
+    column = int(np.prod(ps.shape[1:], dtype=np.int64))
+    nz = len(src.dimensions[_vertical_dims(src)[1]])
+    # pressures, weights and indices, plus each variable's input and output
+    per_record = 8 * column * (2 * nz + 3 * nlev + len(names) * (nz + nlev))
+    return max(1, int(chunk_mb * 2**20) // max(per_record, 1))
+
+def _define_output(dst, src, names, levels, hdim, zdim):
+    dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+    for name, dim in src.dimensions.items():
+        if name not in (hdim, zdim):
+            dst.createDimension(name, (None if dim.isunlimited() else len(dim)))
+    dst.createDimension(LEVEL_DIM, len(levels))
+    lev = dst.createVariable(LEVEL_DIM, 'f8', (LEVEL_DIM, ))
+    lev.setncatts({'long_name': 'pressure', 'units': 'hPa', 'axis': 'Z',
+        'positive': 'down'})
+    lev[:] = np.asarray(levels, dtype='f8') / 100.
+    model_levels = set(vars_3d(src, zdim))
+    for name, var in src.variables.items():
+        if name in (hdim, zdim, 'bk', 'pk', LEVEL_DIM):
+            continue
+        if name in names:
+            fill = ncio.fill_value(var)
+            if fill is None:
+                fill = DEFAULT_FILL
+            dims = tuple(LEVEL_DIM if d == zdim else d for d in var.dimensions)
+            new_var = dst.createVariable(name, var.datatype, dims, fill_value=fill)
+            new_var.set_auto_mask(True)
+            attrs = {k: var.getncattr(k) for k in var.ncattrs() if k != '_FillValue'}
+            attrs['missing_value'] = new_var.dtype.type(fill)
+            new_var.setncatts(attrs)
+        elif name not in model_levels and hdim not in var.dimensions \
+            and zdim not in var.dimensions:
+            ncio.copy_var_def(dst, var)
+
+def _set_calendar(dst, tname, caltype):
+    """Add CF calendar attributes to the time axis (and its bounds), as
+    ``ncatted -a calendar,time,c,c,$caltype`` did: an existing calendar is
+    kept.
+    """
+    if tname is None or tname not in dst.variables:
+        return
+    tvar = dst.variables[tname]
+    attrs = tvar.ncattrs()
+    if 'calendar' in attrs:
+        calendar = tvar.getncattr('calendar')
+    else:
+        calendar = cf_calendar(tvar.getncattr('calendar_type')
+            if 'calendar_type' in attrs else caltype)
+        if calendar is None:
+            return
+        tvar.setncattr('calendar', calendar)
+    bnds = ncio.bounds_var(dst, tname)
+    if bnds is not None and 'calendar' not in dst.variables[bnds].ncattrs():
+        dst.variables[bnds].setncattr('calendar', calendar)
+
+def interpolate(infile, outfile, levels, variables=None, caltype=None,
+    chunk_mb=256, use_mmap=True):
+    """Interpolate the 3D variables of *infile* (all of them, or those named
+    in *variables*) to the pressures *levels* (Pa, or the name of one of
+    :data:`LEVEL_SETS`) and write them to *outfile*, along with the file's
+    other variables except the model's vertical grid. Variables named in
+    *variables* that aren't 3D are copied unchanged. Returns the list of
+    variables interpolated.
+    """
+    if isinstance(levels, str):
+        try:
+            levels = LEVEL_SETS[levels]
+        except KeyError:
+            raise PlevelError(f"Unknown level set '{levels}'.") from None
+    levels = [float(p) for p in levels]
+    with ncio.open_dataset(infile, use_mmap=use_mmap) as src:
+        missing = [v for v in REQUIRED_VARS if v not in src.variables]
+        if missing:
+            raise PlevelError(f"{infile} is missing {', '.join(missing)}.")
+        hdim, zdim = _vertical_dims(src)
+        names = vars_3d(src, zdim)
+        if variables:
+            unknown = [v for v in variables if v not in src.variables]
+            if unknown:
+                raise PlevelError(f"{infile} has no variables {', '.join(unknown)}.")
+            # as PLEVEL did, the others are copied through unchanged
+            flat = [v for v in variables if v not in names]
+            if flat:
+                _log.info(f"Not interpolating {', '.join(flat)}: not 3D variables.")
+            names = [v for v in names if v in variables]
+        tname = ncio.record_dim(src)
+        pk = np.ma.filled(src.variables['pk'][:], 0.).astype('f8')
+        bk = np.ma.filled(src.variables['bk'][:], 0.).astype('f8')
+        ps_var = src.variables['ps']
+        nrec = ps_var.shape[0]
+        step = _slab_records(src, names, len(levels), chunk_mb)
+        _log.debug(f"Interpolating {len(names)} variables of {infile} to "
+            f"{len(levels)} levels, {step} records at a time.")
+
+        tmpfile = outfile + '.tmp'
+        dst = netCDF4.Dataset(tmpfile, 'w', format=src.data_model)
+        try:
+            _define_output(dst, src, names, levels, hdim, zdim)
+            for name, var in src.variables.items():
+                if name not in dst.variables or name in names or name == LEVEL_DIM:
+                    continue
+                if var.dimensions:
+                    dst.variables[name][:] = var[:]
+                else:
+                    dst.variables[name].assignValue(var.getValue())
+            _set_calendar(dst, tname, caltype)
+            shape = (1, -1) + (1,) * (ps_var.ndim - 1)
+            for t0 in range(0, nrec, step):
+                t1 = min(t0 + step, nrec)
+                ps = np.ma.filled(ps_var[t0:t1], np.nan).astype('f8')
+                ph = pk.reshape(shape) + bk.reshape(shape) * ps[:, np.newaxis]
+                k0, w, below = interp_weights(full_level_pressure(ph), ps, levels)
+                for name in names:
+                    out = apply_weights(src.variables[name][t0:t1], k0, w, below)
+                    dst.variables[name][t0:t1] = out
+        except BaseException:
+            dst.close()
+            os.remove(tmpfile)
+            raise
+        dst.close()
+    os.replace(tmpfile, outfile)
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.plevel",
+        description="Interpolate model-level atmospheric data to pressure levels.")
+    parser.add_argument('-l', '--levels', required=True,
+        help=("Name of a level set (" + ', '.join(LEVEL_SETS) + ") or a "
+            "space- or comma-separated list of pressures in Pa."))
+    parser.add_argument('-i', '--input', help="Input file.")
+    parser.add_argument('-o', '--output', help="Output file.")
+    parser.add_argument('--list', action='store_true',
+        help="Print the pressures (Pa) of the levels and exit.")
+    parser.add_argument('-C', '--calendar', default=None,
+        help="Calendar of the time axis, if the file doesn't specify one.")
+    parser.add_argument('-c', '--chunk-mb', type=float, default=256.,
+        help="Approximate memory (MB) to use per slab of records.")
+    parser.add_argument('--no-mmap', action='store_true',
+        help="Read the input file without memory-mapping it.")
+    parser.add_argument('variables', nargs='*',
+        help="Variables to interpolate (default: all 3D variables).")
+    args = parser.parse_args(argv)
+
+    if args.levels in LEVEL_SETS:
+        levels = args.levels
+    else:
+        levels = [float(p) for p in args.levels.replace(',', ' ').split()]
+    if args.list:
+        print(' '.join(f'{p:g}' for p in
+            (LEVEL_SETS[levels] if isinstance(levels, str) else levels)))
+        return 0
+    if not (args.input and args.output):
+        parser.error("-i and -o are required.")
+    variables = [v for arg in args.variables for v in arg.split(',') if v]
+    try:
+        names = interpolate(args.input, args.output, levels, variables=variables,
+            caltype=args.calendar, chunk_mb=args.chunk_mb, use_mmap=not args.no_mmap)
+    except (PlevelError, OSError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    _log.info(f"Interpolated {len(names)} variables to pressure levels in {args.output}.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Splitting of multi-month history files into monthly files, replacing the
+``ncks -d time,i,i`` (one per month, per tile) and ``ln -s`` (one per month,
+for the grid_spec tiles) commands emitted by
+:func:`~pyFRE.frepp.ts_ta.convertSegments`.
+
+Each history file is opened once. Its variables that aren't defined along the
+record dimension are read once and shared by all of the monthly files
+written from it; record variables are copied one record (slice) at a time.
+The first month's file replaces the history file, as before. Cubed-sphere
+tiles are independent and can be split by parallel worker processes, and the
+grid_spec tiles are hard-linked under the names of the other months (falling
+back to symbolic links across file systems).
+
+Can be called from the generated runscript via
+``python3 -m pyFRE.frepp.segsplit``.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from . import ncio, fanout
+
+import logging
+_log = logging.getLogger(__name__)
+
+# segment lengths (months) convertSegments supports
+SEGMENT_MONTHS = (2, 3, 4, 6, 12)
+
+class SegmentError(Exception):
+    """Raised when a history file doesn't hold the expected months."""
+    pass
+
+def history_name(date, month, source):
+    """Name of the history file for *source* starting on the first of
+    *month* of year *date*, eg. ``19800401.atmos_month.nc``.
+    """
+    return f"{date}{month:02d}01.{source}.nc"
+
+def segment_plan(date, nmonths, source, months=None):
+    """Map each segment's history file name to the list of the monthly file
+    names it's split into (the first being the segment file itself), for a
+    year of *nmonths*-month segments of *source*. With *months*, only those
+    months are written.
+    """
+    if nmonths not in SEGMENT_MONTHS:
+        raise SegmentError((f"{nmonths}-month segments not supported. "
+            "Try 2, 3, 4, 6 or 12 month segments."))
+    plan = dict()
+    for start in range(1, 13, nmonths):
+        outs = [history_name(date, m, source) if (months is None or m in months) else None
+            for m in range(start, start + nmonths)]
+        if any(outs):
+            plan[history_name(date, start, source)] = outs
+    return plan
+
+def _filter_kwargs(var):
+    """Compression settings of netCDF4 Variable *var*, for copy_var_def."""
+    try:
+        filters = var.filters() or dict()
+    except (AttributeError, RuntimeError):
+        filters = dict()
+    if not filters.get('zlib'):
+        return dict()
+    return {'zlib': True, 'complevel': filters.get('complevel'),
+        'shuffle': bool(filters.get('shuffle'))}
+
+def _record_slice(var, tname, i):
+    """Index of record *i* of netCDF4 Variable *var*."""
+    return tuple(slice(i, i + 1) if d == tname else slice(None)
+        for d in var.dimensions)
+
+def split_file(infile, outfiles, workdir=None, use_mmap=True):
+    """Write record *i* of *infile* to ``outfiles[i]``, skipping None entries.
+    Paths are relative to *workdir*. An output file may be *infile* itself,
+    which is replaced once everything has been read from it. Returns the
+    paths written.
+    """
+    def path(name):
+        return name if workdir is None else os.path.join(workdir, name)
+    infile = path(infile)
+    written = []
+    with ncio.open_dataset(infile, use_mmap=use_mmap) as src:
+        tname = ncio.record_dim(src)
+        if tname is None:
+            raise SegmentError(f"No record dimension in {infile}.")
+        nrec = len(src.dimensions[tname])
+        if nrec < len(outfiles):
+            raise SegmentError((f"{infile} has {nrec} records; expected "
+                f"{len(outfiles)}."))
+        record_vars = [v for v in src.variables.values() if ncio.is_record_var(v, tname)]
+        # read once, written to every month
+        static = {name: (var[:] if var.dimensions else var.getValue())
+            for name, var in src.variables.items() if not ncio.is_record_var(var, tname)}
+        for i, name in enumerate(outfiles):
+            if name is None:
+                continue
+            outfile = path(name)
+            tmpfile = outfile + '.tmp'
+            dst = ncio.create_like(tmpfile, src, exclude=src.variables)
+            try:
+                for var in src.variables.values():
+                    ncio.copy_var_def(dst, var, **_filter_kwargs(var))
+                for vname, value in static.items():
+                    if np.ndim(value) or dst.variables[vname].dimensions:
+                        dst.variables[vname][:] = value
+                    else:
+                        dst.variables[vname].assignValue(value)
+                for var in record_vars:
+                    index = _record_slice(var, tname, i)
+                    out_index = _record_slice(var, tname, 0)
+                    dst.variables[var.name][out_index] = var[index]
+            except BaseException:
+                dst.close()
+                os.remove(tmpfile)
+                raise
+            dst.close()
+            written.append((tmpfile, outfile))
+    for tmpfile, outfile in written:
+        os.replace(tmpfile, outfile)
+    return [outfile for _, outfile in written]
+
+def link_grid_spec(date, nmonths, tile, workdir=None):
+    """Hard-link the grid_spec file of *tile* of the first segment of year
+    *date* under the names of the other months (like the ``ln -s`` commands
+    did). Returns the links made.
+    """
+    src_name = history_name(date, 1, f'grid_spec.tile{tile}')
+    src = src_name if workdir is None else os.path.join(workdir, src_name)
+    links = []
+    for month in range(2, 13):
+        name = history_name(date, month, f'grid_spec.tile{tile}')
+        dst = name if workdir is None else os.path.join(workdir, name)
+        if os.path.lexists(dst):
+            continue
+        try:
+            os.link(src, dst)
+        except OSError:
+            os.symlink(src_name, dst)
+        links.append(dst)
+    return links
+
+def split_year(date, nmonths, source, ntiles=None, months=None, grid_spec=False,
+    nworkers=1, workdir=None, use_mmap=True):
+    """Split the *nmonths*-month history files of *source* for year *date*
+    into monthly files, for each of *ntiles* tiles (``{source}.tile{i}``) if
+    given. Tiles are processed by *nworkers* worker processes. Returns the
+    paths written.
+    """
+    sources = [source] if not ntiles else [f"{source}.tile{i}" for i in range(1, ntiles + 1)]
+    jobs = []
+    for i, src in enumerate(sources, start=1):
+        jobs.append((i, segment_plan(date, nmonths, src, months=months)))
+
+    def run(job):
+        tile, plan = job
+        written = []
+        for infile, outfiles in plan.items():
+            written += split_file(infile, outfiles, workdir=workdir, use_mmap=use_mmap)
+        if grid_spec and ntiles:
+            link_grid_spec(date, nmonths, tile, workdir=workdir)
+        return written
+
+    written = []
+    for result in fanout.map_ordered(run, jobs, nworkers=nworkers):
+        written += result
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.segsplit",
+        description="Split multi-month history files into monthly files.")
+    parser.add_argument('-y', '--date', required=True,
+        help="Year (hDate) of the history files.")
+    parser.add_argument('-n', '--months-per-segment', type=int, required=True,
+        help="Length of the history segments, in months.")
+    parser.add_argument('-t', '--tiles', type=int, default=None,
+        help="Number of cubed-sphere tiles of the diag source.")
+    parser.add_argument('-g', '--grid-spec', action='store_true',
+        help="Also link the grid_spec tiles for each month.")
+    parser.add_argument('-m', '--months', default=None,
+        help="Comma-separated months to write (default: all).")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help="Worker processes splitting tiles in parallel.")
+    parser.add_argument('-C', '--workdir', default=None,
+        help="Directory containing the history files (default: current).")
+    parser.add_argument('source', help="Diag source (history file name).")
+    args = parser.parse_args(argv)
+
+    months = None
+    if args.months:
+        months = {int(m) for m in args.months.split(',') if m}
+    nworkers = args.jobs
+    if nworkers is None:
+        nworkers = fanout.default_workers(args.tiles or 1)
+    try:
+        written = split_year(args.date, args.months_per_segment, args.source,
+            ntiles=args.tiles, months=months, grid_spec=args.grid_spec,
+            nworkers=nworkers, workdir=args.workdir)
+    except (SegmentError, OSError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    _log.info(f"Wrote {len(written)} monthly files for {args.source}.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""Pipelined staging of history archives for a frepp year.
+
+The runscript used to stage history one archive and one diag source at a time
+(an ``hsmget`` per archive per source, each recalling the archive from tape and
+unpacking it before the next one started). :class:`Stager` instead
+
+* recalls all archives of the year from tape with one batched ``dmget``,
+* unpacks the requested members of each archive as soon as its recall batch
+  is online, with a bounded pool of workers, into the same places hsmget
+  used (``{ptmp}/{hsmdate}/`` as the cache, linked into ``{work}/{hsmdate}/``),
+* optionally recalls the archives of the following year(s) afterwards, so the
+  next frepp job finds them online.
+
+Each unpacked archive is marked with a ``.staged`` file in its work directory
+(or ``.failed`` on error), and :func:`wait` blocks on those markers, so the
+runscript can start the stager in the background and only wait where it first
+needs the data; prefetching continues while the year is processed.
+"""
+import argparse
+import concurrent.futures
+import fnmatch
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import time
+
+import logging
+_log = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = ('.nc.tar', '.nc.cpio')
+STAGED_MARKER = '.staged'
+FAILED_MARKER = '.failed'
+
+# YYYY...MMDD.[raw.]nc.(tar|cpio)
+_archive_regex = re.compile(r'(?P<year>\d{4,})(?P<mmdd>\d{4})\.(?P<raw>raw\.)?nc\.(?P<fmt>tar|cpio)$')
+
+
+def hsmdate(archive):
+    """Name of the directory an archive is unpacked into (hsmget's
+    ``$historyfile:r``), eg. ``19800101.nc`` for ``19800101.nc.tar``.
+    """
+    return os.path.splitext(os.path.basename(archive))[0]
+
+def list_archives(histdir, years=None, raw=False):
+    """Return a dict from year (str) to the sorted paths of the history
+    archives in *histdir*, listing the directory once. Only combined archives
+    are returned unless *raw* is True; only *years* if given.
+    """
+    years = None if years is None else set(str(y) for y in years)
+    found = dict()
+    with os.scandir(histdir) as entries:
+        for entry in entries:
+            m = _archive_regex.match(entry.name)
+            if not m or bool(m.group('raw')) != raw:
+                continue
+            if years is not None and m.group('year') not in years:
+                continue
+            found.setdefault(m.group('year'), []).append(entry.path)
+    return {y: sorted(paths) for y, paths in sorted(found.items())}
+
+def recall(paths, dmget='dmget', chunk_size=200):
+    """Bring *paths* online from tape with one ``dmget`` call per *chunk_size*
+    files. A no-op if *dmget* isn't installed (eg. on non-DMF filesystems).
+    """
+    paths = list(paths)
+    exe = shutil.which(dmget)
+    if not paths or exe is None:
+        return
+    for i in range(0, len(paths), chunk_size):
+        subprocess.run([exe] + paths[i:i + chunk_size], check=True)
+
+def member_filter(sources):
+    """Predicate on member basenames matching ``*.{source}.*`` for any of
+    *sources* (hsmget's ``$hsmdate/\\*.$hsmsrc.\\*``). All members match if
+    *sources* is empty.
+    """
+    patterns = [f"*.{s}.*" for s in sources if s]
+    if not patterns:
+        return lambda name: True
+    return lambda name: any(fnmatch.fnmatchcase(os.path.basename(name), p) for p in patterns)
+
+def extract(archive, dest, match=None, skip=()):
+    """Unpack the members of *archive* (tar or cpio) whose names satisfy
+    *match* into *dest*, except those named in *skip* (eg. because they're
+    already there). Returns the names of all matching members.
+    """
+    if match is None:
+        match = lambda name: True
+    skip = set(skip)
+    os.makedirs(dest, exist_ok=True)
+    if archive.endswith('.tar'):
+        with tarfile.open(archive, 'r:') as tar:
+            members = [m for m in tar.getmembers() if m.isfile() and match(m.name)]
+            for m in members:
+                # history tarballs are flat; never write outside dest
+                m.name = os.path.basename(m.name)
+            kwargs = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+            tar.extractall(dest, members=[m for m in members if m.name not in skip],
+                **kwargs)
+        return sorted(m.name for m in members)
+    with open(archive, 'rb') as f:
+        names = subprocess.run(['cpio', '-it', '--quiet'], stdin=f,
+            capture_output=True, text=True, check=True).stdout.split()
+    names = [n for n in names if match(n)]
+    todo = [n for n in names if n not in skip]
+    if todo:
+        with open(archive, 'rb') as f:
+            subprocess.run(['cpio', '-idu', '--quiet', '--no-absolute-filenames'] + todo,
+                stdin=f, cwd=dest, check=True)
+    return sorted(names)
+
+
+class Stager():
+    """Recall and unpack the history archives for one frepp year.
+
+    *cachedir* plays the role of hsmget's ptmp directory: members already
+    unpacked there by an earlier attempt are not extracted again.
+    """
+    def __init__(self, workdir, cachedir, sources=(), nworkers=4, dmget='dmget'):
+        self.workdir = workdir
+        self.cachedir = cachedir
+        self.match = member_filter(sources)
+        self.nworkers = max(nworkers, 1)
+        self.dmget = dmget
+
+    def _stage_one(self, archive):
+        date = hsmdate(archive)
+        cache = os.path.join(self.cachedir, date)
+        work = os.path.join(self.workdir, date)
+        os.makedirs(work, exist_ok=True)
+        try:
+            cached = os.listdir(cache) if os.path.isdir(cache) else []
+            wanted = extract(archive, cache, self.match, skip=cached)
+            for name in wanted:
+                src = os.path.join(cache, name)
+                dst = os.path.join(work, os.path.basename(name))
+                if os.path.exists(dst):
+                    continue
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    shutil.copy2(src, dst)
+        except Exception as exc:
+            with open(os.path.join(work, FAILED_MARKER), 'w') as f:
+                f.write(f"{exc!r}\n")
+            raise
+        with open(os.path.join(work, STAGED_MARKER), 'w') as f:
+            f.write('\n'.join(wanted) + '\n')
+        return work
+
+    def stage(self, archives, prefetch=()):
+        """Recall and unpack *archives*, then recall the archives in
+        *prefetch*. Archives are recalled in batches of *nworkers*, and each
+        batch is unpacked while the next one is recalled. Returns the list of
+        work directories, in the order of *archives*.
+        """
+        archives = list(archives)
+        clear_markers(self.workdir, archives)
+        batches = [archives[i:i + self.nworkers]
+            for i in range(0, len(archives), self.nworkers)]
+        futures = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.nworkers) as pool:
+            for batch in batches:
+                recall(batch, self.dmget)
+                futures.extend(pool.submit(self._stage_one, a) for a in batch)
+            # recall the next year while this year's archives are unpacked
+            if prefetch:
+                _log.info(f"Prefetching {len(prefetch)} history archives.")
+                recall(prefetch, self.dmget)
+            return [f.result() for f in futures]
+
+
+def clear_markers(workdir, archives):
+    """Remove the markers left in *workdir* for *archives* by an earlier
+    attempt, so that :func:`wait` only sees those of the next :meth:`Stager.stage`.
+    """
+    for a in archives:
+        for marker in (STAGED_MARKER, FAILED_MARKER):
+            path = os.path.join(workdir, hsmdate(a), marker)
+            if os.path.exists(path):
+                os.remove(path)
+
+def mark_failed(workdir, archives, exc):
+    """Mark those of *archives* that haven't been staged into *workdir* as
+    failed with *exc*.
+    """
+    for a in archives:
+        work = os.path.join(workdir, hsmdate(a))
+        if os.path.exists(os.path.join(work, STAGED_MARKER)):
+            continue
+        os.makedirs(work, exist_ok=True)
+        with open(os.path.join(work, FAILED_MARKER), 'w') as f:
+            f.write(f"{exc!r}\n")
+
+def wait(workdir, archives, timeout=None, poll=2.):
+    """Block until all *archives* have been staged into *workdir*. Raises
+    RuntimeError if any failed and TimeoutError after *timeout* seconds.
+    """
+    pending = [os.path.join(workdir, hsmdate(a)) for a in archives]
+    start = time.monotonic()
+    while pending:
+        failed = [d for d in pending if os.path.exists(os.path.join(d, FAILED_MARKER))]
+        if failed:
+            raise RuntimeError(f"Staging failed for {', '.join(failed)}.")
+        pending = [d for d in pending if not os.path.exists(os.path.join(d, STAGED_MARKER))]
+        if not pending:
+            break
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"Timed out waiting for {', '.join(pending)}.")
+        time.sleep(poll)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.staging",
+        description="Stage history archives for frepp.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('stage', help="Recall and unpack history archives.")
+    p.add_argument('-a', '--archive-dir', required=True,
+        help="Directory containing the history archives.")
+    p.add_argument('-p', '--cache-dir', required=True,
+        help="Directory archives are unpacked into (hsmget -p).")
+    p.add_argument('-w', '--work-dir', required=True,
+        help="Directory staged files are linked into (hsmget -w).")
+    p.add_argument('-s', '--sources', default="",
+        help="Diag sources to unpack, separated by spaces or commas (default: all).")
+    p.add_argument('-j', '--jobs', type=int, default=4)
+    p.add_argument('--prefetch-year', action='append', default=[],
+        help="Also recall the archives of this year.")
+    p.add_argument('years', nargs='+')
+    p = subparsers.add_parser('clear',
+        help="Remove the markers of an earlier attempt to stage archives.")
+    p.add_argument('-a', '--archive-dir', required=True)
+    p.add_argument('-w', '--work-dir', required=True)
+    p.add_argument('years', nargs='+')
+    p = subparsers.add_parser('wait', help="Wait for archives to be staged.")
+    p.add_argument('-a', '--archive-dir', required=True)
+    p.add_argument('-w', '--work-dir', required=True)
+    p.add_argument('-t', '--timeout', type=float, default=None)
+    p.add_argument('years', nargs='+')
+    args = parser.parse_args(argv)
+
+    archives = []
+    try:
+        available = list_archives(args.archive_dir, args.years)
+        archives = [a for y in args.years for a in available.get(str(y), [])]
+        if args.command == 'stage':
+            prefetch = list_archives(args.archive_dir, args.prefetch_year)
+            Stager(args.work_dir, args.cache_dir,
+                sources=re.split(r'[\s,]+', args.sources.strip()),
+                nworkers=args.jobs
+            ).stage(archives, prefetch=[a for ps in prefetch.values() for a in ps])
+        elif args.command == 'clear':
+            clear_markers(args.work_dir, archives)
+        else:
+            wait(args.work_dir, archives, timeout=args.timeout)
+    except Exception as exc:
+        print(f"ERROR: staging {args.command}: {exc!r}", file=sys.stderr)
+        if args.command == 'stage':
+            # don't leave a concurrent 'wait' blocking on archives we never got to
+            mark_failed(args.work_dir, archives, exc)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""Indexed store for frepp's per-component-year state.
+
+frepp.pl recorded the state of each component-year in its own small file,
+``{statedir}/{component}.{year}``, holding OK, ERROR, FATAL, INTERACTIVE,
+HISTORYDATAERROR or the ID of the batch job processing it. :class:`StateStore`
+keeps the same records in one SQLite database per state directory (in WAL mode,
+so readers don't block the runscripts writing their final state), with atomic
+state transitions and bulk queries. Keys keep the legacy ``{component}.{year}``
+form, and :meth:`StateStore.import_legacy` / :meth:`StateStore.export_legacy`
+convert to and from the one-file-per-year layout.
+
+Runscripts update the store through the command line interface::
+
+    $PYFRE_ENGINE pyFRE.frepp.statestore -d $statedb set $statefile OK
+"""
+import argparse
+import contextlib
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import logging
+_log = logging.getLogger(__name__)
+
+DB_NAME = '.frepp_state.sqlite'
+
+# states other than job IDs
+KEYWORDS = ('OK', 'ERROR', 'FATAL', 'INTERACTIVE', 'HISTORYDATAERROR')
+
+# legacy statefile names: component, '.', year (digits, optionally with the
+# month appended)
+_legacy_name_regex = re.compile(r'(?P<component>[^.].*)\.(?P<year>\d+)')
+
+def state_key(component, year):
+    """Legacy statefile name of a component-year, used as key in the store."""
+    return f"{component}.{year}"
+
+def split_key(key):
+    """Inverse of :func:`state_key`."""
+    component, _, year = str(key).rpartition('.')
+    if not component or not year:
+        raise ValueError(f"Malformed state key '{key}'.")
+    return (component, year)
+
+def setstate_csh(state, key='$statefile', db='$statedb'):
+    """csh command setting the state of the component-year *key* (by default,
+    the runscript's ``$statefile``) to *state*.
+    """
+    return f"$PYFRE_ENGINE pyFRE.frepp.statestore -d {db} set {key} {state}\n"
+
+
+class StateStore():
+    """States of component-years, stored in the SQLite database at *path*."""
+    def __init__(self, path, timeout=60.):
+        self.path = path
+        # autocommit; transactions are begun explicitly in _transaction()
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS states (
+                component TEXT NOT NULL,
+                year TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (component, year)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS states_by_state ON states (component, state)"
+        )
+
+    @classmethod
+    def for_statedir(cls, statedir, import_legacy=True):
+        """Open the store for *statedir*. When the store is first created, any
+        legacy statefiles in *statedir* are imported into it.
+        """
+        path = os.path.join(statedir, DB_NAME)
+        is_new = not os.path.exists(path)
+        store = cls(path)
+        if is_new and import_legacy:
+            n = store.import_legacy(statedir)
+            if n:
+                _log.info(f"Imported {n} legacy statefiles from {statedir}.")
+        return store
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so that read-modify-write
+        # sequences can't interleave between processes
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def get(self, component, year, default=None):
+        """Return the state of (*component*, *year*), or *default* if none is
+        recorded.
+        """
+        row = self._conn.execute(
+            "SELECT state FROM states WHERE component = ? AND year = ?",
+            (component, str(year))
+        ).fetchone()
+        return default if row is None else row[0]
+
+    def get_many(self, component, years):
+        """Return a dict from year to state for those of *years* of *component*
+        that have a recorded state, with a single query.
+        """
+        years = [str(y) for y in years]
+        states = dict()
+        for i in range(0, len(years), 500):
+            chunk = years[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            states.update(self._conn.execute(
+                f"SELECT year, state FROM states WHERE component = ? "
+                f"AND year IN ({placeholders})",
+                [component] + chunk
+            ).fetchall())
+        return states
+
+    def set(self, component, year, state):
+        """Record *state* for (*component*, *year*)."""
+        self.set_many([(component, year, state)])
+
+    def set_many(self, items):
+        """Record the states of an iterable of (component, year, state) tuples
+        in one transaction.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO states VALUES (?, ?, ?, ?)",
+                ((c, str(y), str(s).strip(), now) for c, y, s in items)
+            )
+
+    def transition(self, component, year, state, expect):
+        """Atomically set the state of (*component*, *year*) to *state* if its
+        current state is one of *expect* (None standing for "no state
+        recorded"). Returns whether the state was changed.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT state FROM states WHERE component = ? AND year = ?",
+                (component, str(year))
+            ).fetchone()
+            current = None if row is None else row[0]
+            if current not in expect:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO states VALUES (?, ?, ?, ?)",
+                (component, str(year), state, time.time())
+            )
+        return True
+
+    def delete(self, component, year):
+        """Forget the state of (*component*, *year*), eg. to retry a FATAL year."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM states WHERE component = ? AND year = ?",
+                (component, str(year)))
+
+    def items(self, component=None):
+        """Return a sorted list of (component, year, state) tuples, for all
+        components or only *component*.
+        """
+        if component is None:
+            return self._conn.execute(
+                "SELECT component, year, state FROM states ORDER BY component, year"
+            ).fetchall()
+        return self._conn.execute(
+            "SELECT component, year, state FROM states WHERE component = ? "
+            "ORDER BY year", (component,)
+        ).fetchall()
+
+    def not_ok(self, component):
+        """Return a dict from year to state for all years of *component* whose
+        state isn't OK.
+        """
+        return dict(self._conn.execute(
+            "SELECT year, state FROM states WHERE component = ? AND state != 'OK' "
+            "ORDER BY year", (component,)
+        ).fetchall())
+
+    def import_legacy(self, statedir, overwrite=False):
+        """Import the ``{component}.{year}`` statefiles in *statedir*. Existing
+        records are kept unless *overwrite* is True. Returns the number of files
+        imported.
+        """
+        items = []
+        for entry in os.scandir(statedir):
+            match = _legacy_name_regex.fullmatch(entry.name)
+            if not match or not entry.is_file():
+                continue
+            with open(entry.path, 'r') as f:
+                state = f.read().strip()
+            items.append((match.group('component'), match.group('year'), state))
+        if not overwrite:
+            items = [i for i in items if self.get(i[0], i[1]) is None]
+        if items:
+            self.set_many(items)
+        return len(items)
+
+    def export_legacy(self, statedir):
+        """Write every record as a ``{component}.{year}`` statefile in
+        *statedir*. Returns the number of files written.
+        """
+        rows = self.items()
+        for component, year, state in rows:
+            with open(os.path.join(statedir, state_key(component, year)), 'w') as f:
+                f.write(f"{state}\n")
+        return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m pyFRE.frepp.statestore",
+        description="Query or update frepp's component-year state store."
+    )
+    parser.add_argument('-d', '--db', required=True,
+        help="State database, or the state directory containing it.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('get', help="Print the state of a component-year.")
+    p.add_argument('key', help="component.year")
+    p = subparsers.add_parser('set', help="Set the state of a component-year.")
+    p.add_argument('key', help="component.year")
+    p.add_argument('state')
+    p = subparsers.add_parser('clear', help="Forget the state of a component-year.")
+    p.add_argument('key', help="component.year")
+    p = subparsers.add_parser('list', help="List recorded states.")
+    p.add_argument('component', nargs='?', default=None)
+    p.add_argument('--not-ok', action='store_true',
+        help="Only list years whose state isn't OK (requires COMPONENT).")
+    p = subparsers.add_parser('import', help="Import legacy statefiles.")
+    p.add_argument('statedir')
+    p.add_argument('--overwrite', action='store_true')
+    p = subparsers.add_parser('export', help="Write legacy statefiles.")
+    p.add_argument('statedir')
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.db):
+        store = StateStore.for_statedir(args.db, import_legacy=False)
+    else:
+        store = StateStore(args.db)
+    with store:
+        if args.command == 'get':
+            state = store.get(*split_key(args.key))
+            if state is None:
+                return 1
+            print(state)
+        elif args.command == 'set':
+            store.set(*split_key(args.key), args.state)
+        elif args.command == 'clear':
+            store.delete(*split_key(args.key))
+        elif args.command == 'list':
+            if args.not_ok:
+                if args.component is None:
+                    parser.error("--not-ok requires COMPONENT.")
+                rows = [(args.component, y, s) for y, s in store.not_ok(args.component).items()]
+            else:
+                rows = store.items(args.component)
+            for component, year, state in rows:
+                print(f"{state_key(component, year)} {state}")
+        elif args.command == 'import':
+            print(store.import_legacy(args.statedir, overwrite=args.overwrite))
+        elif args.command == 'export':
+            print(store.export_legacy(args.statedir))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
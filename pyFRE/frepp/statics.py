@@ -0,0 +1,231 @@
+"""Extraction of static (time-invariant) variables into a component's
+``{component}.static.nc`` file, replacing the ``list_ncvars.csh -s012`` and
+``split_ncvars.pl -s -v ... -f`` pair that :func:`~pyFRE.frepp.ts_ta.staticvars`
+runs for each history file (and each cubed-sphere tile).
+
+Only the headers of the source files are walked, and only the variables
+without the record dimension -- those of rank up to 2 (by default) that
+aren't coordinate variables, plus the coordinates and bounds they
+reference -- are read and copied. Variables named by the ``cell_measures``
+of a static variable but not found in its source are looked up in the files
+listed by the source's ``associated_files`` attribute, through the cached
+header index of :mod:`~pyFRE.frepp.ncheader`. Tiles are written by parallel
+worker processes.
+
+Can be called from the generated runscript via
+``python3 -m pyFRE.frepp.statics``.
+"""
+import argparse
+import os
+import re
+import sys
+
+import netCDF4
+
+from . import fanout, ncheader, ncio
+
+import logging
+_log = logging.getLogger(__name__)
+
+# rank of the static fields staticvars supports (list_ncvars.csh -s012)
+MAX_RANK = 2
+_tile_regex = re.compile(r'\.tile(\d+)\.nc$')
+_cell_measures_regex = re.compile(r'\w+:\s*(\w+)')
+
+class StaticsError(Exception):
+    """Raised when the static variables can't be written."""
+    pass
+
+def static_vars(ds, max_rank=MAX_RANK):
+    """Names of the static fields of Dataset *ds*: variables that don't use
+    the record dimension, have at most *max_rank* dimensions and aren't
+    coordinate variables.
+    """
+    tname = ncio.record_dim(ds)
+    return [name for name, var in ds.variables.items()
+        if not ncio.is_record_var(var, tname) and var.ndim <= max_rank
+        and name not in ds.dimensions]
+
+def _support_vars(ds, names):
+    """Coordinate and bounds variables that variables *names* of *ds* use."""
+    support = []
+    for name in names:
+        for dim in ds.variables[name].dimensions:
+            if dim in ds.variables and dim not in support:
+                support.append(dim)
+                bnds = getattr(ds.variables[dim], 'bounds', None)
+                if bnds in ds.variables and bnds not in support:
+                    support.append(bnds)
+    return support
+
+def cell_measure_names(var):
+    """Variable names in the ``cell_measures`` attribute of *var*
+    (``"area: areacello"``).
+    """
+    return _cell_measures_regex.findall(str(getattr(var, 'cell_measures', '')))
+
+def resolve_associated(header, names, search_dirs, cache=None):
+    """Map each of *names* to the path of an associated file (listed in the
+    ``associated_files`` of :class:`~pyFRE.frepp.ncheader.Header` *header*)
+    that has it, looking for the files in *search_dirs*. Names that can't be
+    resolved are left out.
+    """
+    found = dict()
+    for fname in header.associated_files():
+        for d in search_dirs:
+            path = os.path.join(d, fname)
+            if not os.path.exists(path):
+                continue
+            assoc = ncheader.get_header(path, cache)
+            for name in names:
+                if name not in found and assoc.has(name):
+                    found[name] = path
+            break
+    for name in names:
+        if name not in found:
+            _log.warning(f"Associated variable {name} not found.")
+    return found
+
+def _copy_vars(dst, src, names):
+    """Copy variables *names* (with dimensions) of *src* into open Dataset
+    *dst*, skipping those it already has. Returns the names copied.
+    """
+    copied = []
+    for name in names:
+        if name in dst.variables:
+            continue
+        var = src.variables[name]
+        conflict = [d for d in var.dimensions if d in dst.dimensions
+            and len(dst.dimensions[d]) != len(src.dimensions[d])]
+        if conflict:
+            raise StaticsError((f"Can't copy {name} from {src.filepath()}: "
+                f"dimension {conflict[0]} differs from the static file's."))
+        for d in var.dimensions:
+            if d not in dst.dimensions:
+                dst.createDimension(d, len(src.dimensions[d]))
+        out = ncio.copy_var_def(dst, var)
+        var.set_auto_maskandscale(False)
+        out.set_auto_maskandscale(False)
+        if var.dimensions:
+            out[:] = var[:]
+        else:
+            out.assignValue(var.getValue())
+        copied.append(name)
+    return copied
+
+def extract(infiles, outfile, max_rank=MAX_RANK, assoc_dirs=(), cache=None):
+    """Append the static fields of each of *infiles* (and the coordinates
+    they use) to *outfile*, creating it with the global attributes of the
+    first input if it doesn't exist. With *assoc_dirs*, cell measures missing
+    from a file are taken from its associated files found there. Returns the
+    names of the fields written (fields already in *outfile* are kept).
+    """
+    written = []
+    dst = None
+    try:
+        for path in infiles:
+            with ncio.open_dataset(path) as src:
+                names = static_vars(src, max_rank)
+                if not names:
+                    continue
+                if dst is None:
+                    dst = _open_output(outfile, src)
+                _copy_vars(dst, src, _support_vars(src, names))
+                written += _copy_vars(dst, src, names)
+                measures = [m for n in names for m in cell_measure_names(src.variables[n])
+                    if m not in src.variables and m not in dst.variables]
+            if measures and assoc_dirs:
+                header = ncheader.get_header(path, cache)
+                for name, assoc_path in resolve_associated(header, measures,
+                    assoc_dirs, cache).items():
+                    with ncio.open_dataset(assoc_path) as src:
+                        if ncio.is_record_var(src.variables[name], ncio.record_dim(src)):
+                            continue
+                        _copy_vars(dst, src, _support_vars(src, [name]))
+                        written += _copy_vars(dst, src, [name])
+    finally:
+        if dst is not None:
+            dst.close()
+    return written
+
+def _open_output(outfile, src):
+    """Open *outfile* for appending, or create it with the global attributes
+    of *src*; dimensions are created as the variables using them are copied.
+    """
+    if os.path.exists(outfile):
+        return netCDF4.Dataset(outfile, 'a')
+    dst = netCDF4.Dataset(outfile, 'w', format=src.data_model)
+    dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+    if 'filename' in dst.ncattrs():
+        dst.filename = os.path.basename(outfile)
+    return dst
+
+def tile_of(path):
+    """Tile number in the name of *path* (``*.tile3.nc``), or None."""
+    m = _tile_regex.search(path)
+    return int(m.group(1)) if m else None
+
+def tile_output(outfile, tile):
+    """Output file name for *tile*: ``x.static.nc`` -> ``x.static.tile3.nc``."""
+    return re.sub(r'\.nc$', f'.tile{tile}.nc', outfile)
+
+def extract_tiles(infiles, outfile, max_rank=MAX_RANK, assoc_dirs=(), db=None,
+    nworkers=1, tiles=True):
+    """:func:`extract` the files of each cubed-sphere tile of *infiles* into
+    the tile's own output (see :func:`tile_output`), in *nworkers* worker
+    processes; files without a tile number go to *outfile*. If *tiles* is
+    False, all files go to *outfile* (eg. when one tile stands in for the
+    regridded data). Returns ``{output file: fields written}``.
+    """
+    groups = dict()
+    for path in infiles:
+        tile = tile_of(path) if tiles else None
+        out = outfile if tile is None else tile_output(outfile, tile)
+        groups.setdefault(out, []).append(path)
+
+    def run(item):
+        out, paths = item
+        cache = ncheader.HeaderCache(db) if db else None
+        try:
+            return (out, extract(paths, out, max_rank, assoc_dirs, cache))
+        finally:
+            if cache is not None:
+                cache.close()
+    return dict(fanout.map_ordered(run, list(groups.items()), nworkers=nworkers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pyFRE.frepp.statics",
+        description=("Write the static variables of history files to a static "
+            "file, one per cubed-sphere tile."))
+    parser.add_argument('-o', '--output', required=True,
+        help="Static file (tile files are named *.tileN.nc).")
+    parser.add_argument('-r', '--max-rank', type=int, default=MAX_RANK,
+        help="Highest rank of the static fields copied.")
+    parser.add_argument('-a', '--assoc-dir', action='append', default=[],
+        help="Directory in which to look for associated files (repeatable).")
+    parser.add_argument('-d', '--db', default=None,
+        help="Header cache database (see pyFRE.frepp.ncheader).")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help="Worker processes writing tiles in parallel.")
+    parser.add_argument('-n', '--no-tiles', action='store_true',
+        help="Write all fields to the output, even from tile files.")
+    parser.add_argument('infiles', nargs='+')
+    args = parser.parse_args(argv)
+
+    nworkers = args.jobs
+    if nworkers is None:
+        nworkers = fanout.default_workers(len({tile_of(f) for f in args.infiles}))
+    try:
+        written = extract_tiles(args.infiles, args.output, max_rank=args.max_rank,
+            assoc_dirs=args.assoc_dir, db=args.db, nworkers=nworkers,
+            tiles=not args.no_tiles)
+    except (StaticsError, OSError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+    for out, names in written.items():
+        _log.info(f"Wrote {len(names)} variables to {out}.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,18 +11,20 @@ import time
 
 import pyFRE.util as util
 from pyFRE.lib import FREUtil
-from . import logs, epmt
+from . import logs, epmt, histcheck, staging, statestore, compression
 _template = util.pl_template # abbreviate
 
 import logging
 _log = logging.getLogger(__name__)
 
-grepAssocFiles = """grep ':associated_files' | cut -d '"' -f2 | sed "s/\w*://g" | tr ' ' '\n' | sort -u"""
-grep_netcdf_compression = """grep '_DeflateLevel' | cut -d '=' -f2 | sed s/\\;// | sort -r | head -n 1"""
-grep_netcdf_shuffle = """grep '_Shuffle' | cut -d '=' -f2 | sed s/\\;// | sed s/\\"//g | sort -r | head -n 1"""
+# number of history archives staging.py recalls and unpacks at once
+STAGING_JOBS = 4
 
-def writescript(script, outscript, batchCmd, statefile, pp):
-    """Write c-shell runscript, chmod, and optionally submit."""
+def writescript(script, outscript, batchCmd, statefile, pp, store=None):
+    """Write c-shell runscript, chmod, and optionally submit. The new job's ID
+    is recorded as the state of *statefile* in the
+    :class:`~pyFRE.frepp.statestore.StateStore` *store*.
+    """
     # frepp.pl l.7824
     directory, filename = os.path.split(outscript)
     if not os.exists(directory):
@@ -32,13 +34,14 @@ def writescript(script, outscript, batchCmd, statefile, pp):
             _log.fatal(f"Cannot make directory {directory}")
             sys.exit(1)
 
+    if not isinstance(script, util.ScriptTemplateParts):
+        script = util.ScriptTemplateParts(script)
     if pp.opt['epmt']:
-        script = re.sub(r'(#SBATCH --comment)=?(.*)', r'\1=\2,epmt')
+        script.sub(r'(#SBATCH --comment)=?(.*)', r'\1=\2,epmt', key='#SBATCH --comment')
 
-    with open(outscript, 'w') as f:
-        f.write(script)
+    script.write(outscript)
 
-    if pp.opt('epmt'):
+    if pp.opt['epmt']:
 	    epmt.epmt_transform(outscript)
 
     try:
@@ -64,15 +67,16 @@ def writescript(script, outscript, batchCmd, statefile, pp):
         elif not newjobid:
             _log.error("the jobid returned has the wrong format: a frepp or batch system issue occurred.")
             sys.exit(1)
-        if statefile:
-            with open(statefile, 'w') as f:
-                f.write(f"{newjobid}\n")
+        if statefile and store is not None:
+            store.set(*statestore.split_key(statefile), newjobid)
         else:
             _log.info(f"TO SUBMIT: {batchCmd} {outscript}")
 
 
-def call_frepp(abs_xml_path, outscript, component, year, depjobs, pp):
-    """Set up to postprocess the following year if necessary."""
+def call_frepp(abs_xml_path, outscript, component, year, depjobs, pp, submit=True):
+    """Set up to postprocess the following year if necessary. If *submit* is
+    False, the frepp call for *year* only writes the runscript.
+    """
     # frepp.pl l. 2971
     csh = ""
     nextyear = FREUtil.modifydate(pp.tEND, "+ 1 sec")
@@ -82,8 +86,11 @@ def call_frepp(abs_xml_path, outscript, component, year, depjobs, pp):
         depjobs = f"-w {depjobs.strip()} "
 
     if year:
-        year += userstartmo
-        csh  += f"\n/usr/bin/env perl {pp.absfrepp} -x {abs_xml_path} -t {year} -s -q {depjobs}"
+        year = f"{year}{pp.userstartmo}"
+        csh  += f"\n/usr/bin/env perl {pp.absfrepp} -x {abs_xml_path} -t {year} "
+        if submit:
+            csh += "-s "
+        csh += f"-q {depjobs}"
         if pp.opt['P']:
             csh += f"--platform {pp.opt['P']} "
         if pp.opt['T']:
@@ -138,6 +145,12 @@ def call_frepp(abs_xml_path, outscript, component, year, depjobs, pp):
         csh += logs.mailerrors(outscript);
     return csh
 
+def component_outscript(exp, component, date):
+    """Path of the runscript frepp writes for *component* at *date* (the value
+    of frepp's -t option).
+    """
+    return f"{exp.outscriptdir}/{exp.expt}_{component}_{date}"
+
 def form_frepp_call_for_plus_option(comp, pp):
     """Generate the frepp command for next year's frepp call when using the
     --plus option."""
@@ -188,6 +201,7 @@ def createcpio(cache, outdir, prefix, abbrev, dmputOnly, pp):
     """Create a cpio and dmput original files.  Also dmput only when a cpio is
     not created."""
     # frepp.pl l.3819
+    check_mkcpio = logs.errorstr(f"could not add files to $work/{prefix}.{abbrev}.nc.cpio")
     if dmputOnly:
         return _template("""
             cd $outdir
@@ -202,61 +216,26 @@ def createcpio(cache, outdir, prefix, abbrev, dmputOnly, pp):
             set numfilestocpio = `ls $prefix.*.nc | wc -l`
             if ( \$numfilestocpio > 0 ) then
 
-                if ( ! -e $outdir/$prefix.$abbrev.nc.cpio ) then
-                    ls -1 $prefix.*.nc | $time_mkcpio $cpio -oKvO \$work/$prefix.$abbrev.nc.cpio
-                    $time_mv $mvfile \$work/$prefix.$abbrev.nc.cpio $outdir/$prefix.$abbrev.nc.cpio
-                    if ( \$status ) then
-                        echo "WARNING: data transfer failure, retrying..."
-                        $time_mv $mvfile \$work/$prefix.$abbrev.nc.cpio $outdir/$prefix.$abbrev.nc.cpio
-                        $checktransfer
-                    endif
-                    $time_rm rm \$work/$prefix.$abbrev.nc.cpio
-                else
+                # New files are appended to an existing archive in place and
+                # replaced files are overwritten, without unpacking the archive.
+                if ( -e $outdir/$prefix.$abbrev.nc.cpio ) then
                     $time_dmget dmget $outdir/$prefix.$abbrev.nc.cpio
-                    $time_cp $cp $outdir/$prefix.$abbrev.nc.cpio .
+                    $time_cp $cp $outdir/$prefix.$abbrev.nc.cpio \$work/$prefix.$abbrev.nc.cpio
                     if ( \$status ) then
                         echo "WARNING: data transfer failure, retrying..."
-                        $time_cp $cp $outdir/$prefix.$abbrev.nc.cpio .
+                        $time_cp $cp $outdir/$prefix.$abbrev.nc.cpio \$work/$prefix.$abbrev.nc.cpio
                         $checktransfer
                     endif
-                    set files = ( `ls $prefix.*.nc` )
-                    set filesincpio = ( `$cpio -itI $prefix.$abbrev.nc.cpio` )
-                    set exist = ()
-                    foreach file ( \$files )
-                        foreach fileincpio ( \$filesincpio )
-                            if ( "\$file" == "\$fileincpio" ) then
-                                set exist = ( \$exist \$file )
-                            endif
-                        end
-                    end
-                    if ( \$#exist == 0 ) then
-                        ls -1 $prefix.*.nc | $time_mkcpio $cpio -oKvAO $prefix.$abbrev.nc.cpio
-                        $time_mv $mvfile $prefix.$abbrev.nc.cpio $outdir/$prefix.$abbrev.nc.cpio
-                        if ( \$status ) then
-                            echo "WARNING: data transfer failure, retrying..."
-                            $time_mv $mvfile $prefix.$abbrev.nc.cpio $outdir/$prefix.$abbrev.nc.cpio
-                            $checktransfer
-                        endif
-                        $time_rm rm $prefix.$abbrev.nc.cpio
-                    else
-                        mkdir \$work/mkcpio
-                        cd \$work/mkcpio
-                        $time_uncpio $cpio -ivI $outdir/$prefix.$abbrev.nc.cpio
-                        cd $outdir
-                        #this is a local cp within vftmp
-                        $time_cp cp \$files \$work/mkcpio
-                        cd \$work/mkcpio
-                        ls -1 $prefix.*.nc | $time_mkcpio $cpio -oKvO $prefix.$abbrev.nc.cpio
-                        $time_mv $mvfile $prefix.$abbrev.nc.cpio $outdir/$prefix.$abbrev.nc.cpio
-                        if ( \$status ) then
-                            echo "WARNING: data transfer failure, retrying..."
-                            $time_mv $mvfile $prefix.$abbrev.nc.cpio $outdir/$prefix.$abbrev.nc.cpio
-                            $checktransfer
-                        endif
-                        cd \$work
-                        $time_rm rm -rf \$work/mkcpio
-                    endif
                 endif
+                $time_mkcpio \$PYFRE_ENGINE pyFRE.frepp.archive -f \$work/$prefix.$abbrev.nc.cpio add $prefix.*.nc
+                $check_mkcpio
+                $time_mv $mvfile \$work/$prefix.$abbrev.nc.cpio $outdir/$prefix.$abbrev.nc.cpio
+                if ( \$status ) then
+                    echo "WARNING: data transfer failure, retrying..."
+                    $time_mv $mvfile \$work/$prefix.$abbrev.nc.cpio $outdir/$prefix.$abbrev.nc.cpio
+                    $checktransfer
+                endif
+                if ( -e \$work/$prefix.$abbrev.nc.cpio ) $time_rm rm \$work/$prefix.$abbrev.nc.cpio
 
                 cd $outdir
                 $time_dmput dmput "$prefix.*.nc"
@@ -274,16 +253,14 @@ def diagfile(ppcNode, freq, src, component):
     #STATIC
     #TIMESERIES - ANNUAL or SEASONAL
     if src in ("annual", "seasonal"):
-        monthnodes = ppcNode.findnodes('timeSeries[@freq="monthly"]')
+        monthnodes = ppcNode.timeseries('monthly')
         if monthnodes:
-            monthnode = ppcNode.findnodes('timeSeries[@freq="monthly"]')->get_node(1);
-            diag_source = monthnode.getAttribute('@source')
+            diag_source = monthnodes[0].getAttribute('@source')
     else:
         #TIMESERIES - from smaller timeSeries
-        nodes = ppcNode.findnodes(f"timeSeries[\@freq='{freq}']")
+        nodes = ppcNode.timeseries(freq)
         if nodes:
-            node = ppcNode.findnodes(f"timeSeries[\@freq='{freq}']")->get_node(1);
-            diag_source = node.getAttribute('@source')
+            diag_source = nodes[0].getAttribute('@source')
     if not diag_source:
         diag_source = ppcNode.findvalue('@source')
     if not diag_source:
@@ -383,7 +360,9 @@ def refineDiag(tmphistdir, stdoutdir, ptmpDir, basedate, refinedir, gridspec, md
     return csh
 
 def getTemplate(platform, workdir):
-    """"""
+    """Return the csh runscript header as a :class:`~pyFRE.util.ScriptTemplateParts`
+    whose placeholder comments and directive lines can be filled in place.
+    """
     # frepp.pl l.7875
     cshscripttmpl = ""
     if platform == 'x86_64':
@@ -399,6 +378,8 @@ def getTemplate(platform, workdir):
             #SBATCH --mail-user
             #INFO:component=
             #INFO:max_years=
+            #INFO:depyears=
+            #INFO:holds=
 
             if ( \$?SLURM_JOBID ) then
                 setenv JOB_ID \$SLURM_JOBID
@@ -438,6 +419,10 @@ def getTemplate(platform, workdir):
         set segment_months
         set prevjobstate
         set statefile
+        set statedb
+        set accumdir
+        set compressdir
+        set headerdb
         set experID
         set realizID
         set runID
@@ -453,6 +438,7 @@ def getTemplate(platform, workdir):
         set TIMAVG = "timavg.csh -mb"
         set PLEVEL = plevel.sh
         set SPLITNCVARS = split_ncvars.pl
+        set PYFRE_ENGINE = "python3 -m"
         set MPPNCCOMBINE = mppnccombine
         set FREGRID = fregrid
         set checkptfile = $scriptName:t
@@ -484,7 +470,7 @@ def getTemplate(platform, workdir):
         end
         shift argv
     """)
-    return cshscripttmpl
+    return util.ScriptTemplateParts(cshscripttmpl)
 
 
 
@@ -542,17 +528,22 @@ def hsmget_history_csh(ptmpDir, tmphistdir, refinedir, this_frepp_cmd, hf, hsmf)
     if pp.opt.get('mppnccombine-opts', False):
         mppnccombineOptString = pp.opt['mppnccombine-opts']
 
+    # list the history directory once for all years, instead of twice per year
+    histyears = []
     for h in histfiles:
-        os.chdir(pp.opt['d'])
         year = re.match(r'(\d{4,})\d{4}\.', h)
-        if year:
-            year = int(year.group(1))
+        if year and year.group(1) not in histyears:
+            histyears.append(year.group(1))
+    os.chdir(pp.opt['d'])
+    allraw = staging.list_archives(pp.opt['d'], histyears, raw=True)
+    allhf = staging.list_archives(pp.opt['d'], histyears)
 
+    for year in histyears:
         #print "\nyear:$year\n";
-        availraw = util.shell(f'ls -1 | egrep "{year}....\.raw\.nc\.cpio$|{year}....\.raw\.nc\.tar$"').split('\n')
+        availraw = [os.path.basename(f) for f in allraw.get(year, [])]
 
         #print "availraw:".join(", ", @availraw)."\n";
-        availhf = util.shell(f'ls -1 | egrep "{year}....\.nc\.cpio$|{year}....\.nc\.tar$"').split('\n')
+        availhf = [os.path.basename(f) for f in allhf.get(year, [])]
 
         #print "availhf:".join(", ", @availhf)."\n";
 
@@ -673,6 +664,14 @@ def hsmget_history_csh(ptmpDir, tmphistdir, refinedir, this_frepp_cmd, hf, hsmf)
                     time.sleep(2)
                     sys.exit(99)
 
+    # also bring the following years' history online for the next frepp job
+    histyears_str = ' '.join(histyears)
+    prefetch_opts = ''
+    if histyears:
+        last = int(histyears[-1])
+        prefetch_opts = ' '.join(f"--prefetch-year {last + i:04d}" for i in range(1, len(histyears) + 1))
+    staging_jobs = STAGING_JOBS
+
     #gets all avail hist files
     hsmget_history = _template("""
         cd $opt_d
@@ -700,40 +699,57 @@ def hsmget_history_csh(ptmpDir, tmphistdir, refinedir, this_frepp_cmd, hf, hsmf)
                     \$FRE_STDOUT_PATH
                 END
 
-                echo HISTORYDATAERROR > \$statefile
+                \$PYFRE_ENGINE pyFRE.frepp.statestore -d \$statedb set \$statefile HISTORYDATAERROR
                 sleep 30
                 exit 6
             endif
 
-            foreach historyfile ( \$availhf )
-                foreach hsmsrc ( $hsmf )
-                    set hsmdate = \$historyfile:r
-                    $time_hsmget \$hsmget -a $opt_d -p $ptmpDir/history -w $tmphistdir \$hsmdate/\\*.\$hsmsrc.\\*
-                    if ( \$status ) then
-                        echo "WARNING: hsmget reported failure, retrying..."
-                        $time_hsmget \$hsmget -a $opt_d -p $ptmpDir/history -w $tmphistdir \$hsmdate/\\*.\$hsmsrc.\\*
-                        $checktransfer
+            #end loop over history year
+        end
+
+        # Recall and unpack all years' archives in the background; the stager
+        # goes on to recall the next years' archives (for the next frepp job)
+        # once this job's archives are unpacked, so only wait for the latter.
+        # Markers left by an earlier attempt are cleared first so that the
+        # wait can't return on them before the stager gets to each archive.
+        mkdir -p $tmphistdir
+        \$PYFRE_ENGINE pyFRE.frepp.staging clear -a $opt_d -w $tmphistdir $histyears_str
+        $time_hsmget \$PYFRE_ENGINE pyFRE.frepp.staging stage -a $opt_d -p $ptmpDir/history -w $tmphistdir -s "$hsmf" -j $staging_jobs $prefetch_opts $histyears_str >& $tmphistdir/.staging.log &
+        $time_hsmget \$PYFRE_ENGINE pyFRE.frepp.staging wait -a $opt_d -w $tmphistdir $histyears_str
+        if ( \$status ) then
+            cat $tmphistdir/.staging.log
+            echo "WARNING: staging reported failure, retrying..."
+            # let the first attempt finish before staging the same archives again
+            wait
+            $time_hsmget \$PYFRE_ENGINE pyFRE.frepp.staging stage -a $opt_d -p $ptmpDir/history -w $tmphistdir -s "$hsmf" -j $staging_jobs $histyears_str
+            $checktransfer
+        endif
+
+        foreach hsmdir ( `ls -d $tmphistdir/*.nc` )
+            set hsmdate = \$hsmdir:t
+            foreach hsmsrc ( $hsmf )
+                # Set original history compression variables to restore before placing in archive.
+                # (Have to use the ptmp version as the vftmp version may already be uncompressed
+                # from a previous run attempt.)
+                # The settings of each diag source are read once and cached,
+                # for compress_csh to restore them per variable.
+                foreach ptmpfile ( `ls $ptmpDir/history/\$hsmdate/*.\$hsmsrc.* | head -n 1` )
+                    if (! \$?history_deflation) then
+                        set -r history_deflation = `\$PYFRE_ENGINE pyFRE.frepp.compression probe -D \$compressdir -s \$hsmsrc -f deflate \$ptmpfile`
+                        set -r history_shuffle = `\$PYFRE_ENGINE pyFRE.frepp.compression probe -D \$compressdir -s \$hsmsrc -f shuffle \$ptmpfile`
+                    else
+                        \$PYFRE_ENGINE pyFRE.frepp.compression probe -D \$compressdir -s \$hsmsrc \$ptmpfile > /dev/null
                     endif
-                    # Set original history compression variables to restore before placing in archive.
-                    # (Have to use the ptmp version as the vftmp version may already be uncompressed
-                    # from a previous run attempt.)
-                    foreach ptmpfile ( `ls $ptmpDir/history/\$hsmdate/*.\$hsmsrc.*` )
-                        if (! \$?history_deflation) then
-                            set -r history_deflation = `ncdump -sh \$ptmpfile | $grep_netcdf_compression`
-                            set -r history_shuffle = `ncdump -sh \$ptmpfile | $grep_netcdf_shuffle`
-                        endif
-                    end
-                    # Get files listed as associated_files
-                    foreach hsmsrcfile ( `ls $tmphistdir/\$hsmdate/*.\$hsmsrc.*` )
-                        # Get a list of all associated files
-                        set assocFiles = `ncdump -h \$hsmsrcfile | $grepAssocFiles`
-                        foreach assocFile ( \$assocFiles )
-                            $time_hsmget \$hsmget -a $opt_d -p $ptmpDir/history -w $tmphistdir \$hsmdate/\\*\${assocFile:r}.\\*
-                        end
+                end
+                # Get files listed as associated_files
+                foreach hsmsrcfile ( `ls $tmphistdir/\$hsmdate/*.\$hsmsrc.*` )
+                    # Get a list of all associated files
+                    set assocFiles = `\$PYFRE_ENGINE pyFRE.frepp.ncheader -d \$headerdb associated_files \$hsmsrcfile`
+                    foreach assocFile ( \$assocFiles )
+                        $time_hsmget \$hsmget -a $opt_d -p $ptmpDir/history -w $tmphistdir \$hsmdate/\\*\${assocFile:r}.\\*
                     end
                 end
             end
-            #end loop over history year
         end
 
         # Set nccopy netcdf compression flags
@@ -769,7 +785,7 @@ def hsmget_history_csh(ptmpDir, tmphistdir, refinedir, this_frepp_cmd, hf, hsmf)
                         # Get files listed as associated_files
                         foreach hsmsrcfile ( `ls $tmphistdir/\$hsmdate/*.\$hsmsrc.*` )
                             # Get a list of all associated files
-                            set assocFiles = `ncdump -h \$hsmsrcfile | $grepAssocFiles`
+                            set assocFiles = `\$PYFRE_ENGINE pyFRE.frepp.ncheader -d \$headerdb associated_files \$hsmsrcfile`
                             foreach assocFile ( \$assocFiles )
                                 $time_hsmget \$hsmget -a $refinedir -p $ptmpDir/history_refineDiag -w $tmphistdir \$hsmdate/\\*\${assocFile:r}.\\*
                                 $time_hsmget \$hsmget -a $opt_d -p $ptmpDir/history -w $tmphistdir \$hsmdate/\\*\${assocFile:r}.\\*
@@ -779,8 +795,7 @@ def hsmget_history_csh(ptmpDir, tmphistdir, refinedir, this_frepp_cmd, hf, hsmf)
                 end
             end
         endif
-    """, locals(), pp, grep_netcdf_compression=grep_netcdf_compression,
-        grep_netcdf_shuffle=grep_netcdf_shuffle)
+    """, locals(), pp)
     return hsmget_history
 
 def uncompress_history_csh(dir_):
@@ -788,29 +803,33 @@ def uncompress_history_csh(dir_):
     # frepp.pl l.2792
     check_nccopy = logs.errorstr("NCCOPY (uncompress history files)")
     return _template("""
-        # uncompress all netcdf-compressed files
+        # uncompress all netcdf-compressed files, in parallel; files that
+        # aren't compressed are left alone
         if (\$?history_deflation) then
-            foreach file (`find $dir -type f -name "*.nc"`)
-                if (`ncdump -sh \$file | $grep_netcdf_compression`) then
-                    $time_nccopy nccopy -d 0 \$file \$file.uncompressed
-                    $check_nccopy
-                    mv -f \$file.uncompressed \$file
-                    chmod 444 \$file
-                endif
-            end
+            set ncfiles = ( `find $dir -type f -name "*.nc"` )
+            if ( \$#ncfiles > 0 ) then
+                $time_nccopy \$PYFRE_ENGINE pyFRE.frepp.compression compress -z "-d 0" \$ncfiles
+                $check_nccopy
+                chmod 444 \$ncfiles
+            endif
+            unset ncfiles
         endif
-    """, locals(), dir=dir_, grep_netcdf_compression=grep_netcdf_compression)
+    """, locals(), dir=dir_)
 
-def compress_csh(file_, check_nccopy):
-    """Compress pp files before placing in archive."""
+def compress_csh(file_, check_nccopy, source=None):
+    """Compress pp files before placing in archive. *file_* may be a
+    pattern matching several files, which are compressed in parallel. With
+    the diag *source*, its variables keep the compression they have in the
+    history files.
+    """
     # frepp.pl l.2812
+    source_opt = f"-s {source} " if source else ""
     return _template("""
         if ("\$nc_compression_flags" != "") then
-            $time_nccopy nccopy \$nc_compression_flags $file $file.compressed
+            $time_nccopy \$PYFRE_ENGINE pyFRE.frepp.compression compress -z "\$nc_compression_flags" -D \$compressdir -r \$compressdir/$report $source_opt$file
             $check_nccopy
-            mv $file.compressed $file
         endif
-    """, locals(), file=file_)
+    """, locals(), file=file_, report=compression.REPORT_NAME)
 
 def checkHistComplete(dir_, hf, frepp_cmd, usedfiles, diagtablecontent):
     """Check for complete history data."""
@@ -820,117 +839,54 @@ def checkHistComplete(dir_, hf, frepp_cmd, usedfiles, diagtablecontent):
     firsthisty = re.match(r'(\d{4,})\d{4}\.', hf)
     if firsthisty:
         firsthisty = firsthisty.group(1)
-    firsthistm = str(userstartmo)[0:2]
-    firsthistd = str(userstartmo)[2:4]
-    m = re.match(r'^(\d{4,})(\d{2})(\d{2})(?:\d{2}:\d{2}:\d{2})?$', tEND)
-    if m:
-        tENDy, tENDm, tENDd = m.groups()
-    else:
-        raise ValueError(tEND)
-
-    days_firsthist = FREUtil.daysSince1BC(firsthistm, firsthistd, firsthisty)
-    days_tEND = FREUtil.daysSince1BC(tENDm, tENDd, tENDy)
-
-    firsthist = FREUtil.parseDate(firsthisty + userstartmo)
-    delta = FREUtil.dateCalc(firsthist, FREUtil.modifydate(tEND, "+1 sec"))
-
-    for dt in diagtablecontent:
-        m = re.match(r'"(\w*)"\s*,\s*(\d*)\s*,\s*"(\w*)"\s*,.*,.*,.*,?', dt)
-        # if ( /"(\w*)"\s*,\s*(\d*)\s*,\s*"(\w*)"\s*,.*,.*,.*,?/ and not /^#/ ) {
-        if m:
-            diagfile, freq, units = m.groups()
-            freq = int(freq)
-
-            if diagfile not in usedfiles:
-                continue
-
-            #get tEND-firsthist in hours, months, (years, days)
-            efields  = 0
-            efields2 = 0
-            if units == "months":
-                efields = FREUtil.Delta_Format(delta, 0, "%Mt")
-                efields = efields // freq
-                fields2 = efields
-            elif units == "years":
-                efields = FREUtil.Delta_Format(delta, 0, "%yt")
-                efields = efields // freq
-                efields2 = efields
-            elif units == "days":
-                if caltype == "julian":
-                    efields  = days_tEND - days_firsthist + 1
-                    efields2 = days_tEND - days_firsthist + 2
-                    efields = efields // freq
-                    efields2 = efields2 // freq
-            elif units == "hours":
-                if caltype == "julian":
-                    efields  = ( days_tEND - days_firsthist + 1 ) * 24
-                    efields2 = ( days_tEND - days_firsthist + 2 ) * 24
-                    efields = efields // freq
-                    efields2 = efields2 // freq
-
-            if efields == 0:
-                continue
-            _log.debug((f"Will check that {diagfile} ({freq} {units}) history data has "
-                f"{efields} time levels ({firsthisty}{firsthistm}{firsthistd}-{tENDy}{tENDm}{tENDd})"))
-
-            script += _template("""
-
-                echo NOTE: Check $diagfile time levels: compare expected and actual fields
-                set afields = 0
-                foreach file (`ls -1 */*$diagfile\.*nc | egrep -v '\.tile[2-6]\.nc'`)
-                    set nf = `ncdump -h \$file | grep UNLIMITED | sed 's/.*(//;s/ .*//'`
-                    @ afields = \$afields + \$nf
-                end
-                if ( \$afields == $efields ) then
-                    echo NOTE: History data has the expected number of time levels for $diagfile
-                else if ( \$afields == $efields2 ) then
-                    echo NOTE: History data has the expected number of time levels for $diagfile
-                else
-                    echo ERROR: Incomplete history data
-                    Mail -s "\$name year \$historyyear cannot be postprocessed" $mailList <<END
-                        Your FRE post-processing job ( \$JOB_ID ) has exited because of incomplete
-                        history data.  FRE expected $efields time levels in $diagfile data, but
-                        found \$afields time levels for the interval $firsthisty$firsthistm$firsthistd-$tENDy$tENDm$tENDd.
-
-                        FRE will attempt to transfer the history files on the remote side by retrying
-                        the failed output stager transfers.  If later postprocessing jobs require
-                        this postprocessing interval, this year of postprocessing will be rerun.
-
-                        To recover manually, please transfer the history data with gcp,
-                        and then resubmit this postprocessing job via:
-
-                        $frepp_cmd
-
-                        Job details:
-                        \$name running on \$HOST
-                        Batch job stdout:
-                        \$FRE_STDOUT_PATH
-                    END
-                    echo HISTORYDATAERROR > \$statefile
-                    sleep 30
-                    exit 7
-
-                endif
-            """, locals())
+    firsthist = firsthisty + str(userstartmo)[0:4]
+    expectations = histcheck.expected_levels(diagtablecontent, usedfiles,
+        firsthist, tEND, caltype)
+    if not expectations:
+        return script
+    # check all diag files in one pass that only reads the history file headers
+    interval = f"{firsthist}-{FREUtil.graindate(tEND, 'daily')}"
+    expectations = ' '.join(histcheck.format_expectation(e) for e in expectations)
+    script += _template("""
+
+        echo NOTE: Check history time levels: compare expected and actual fields
+        \$PYFRE_ENGINE pyFRE.frepp.histcheck -d $dir_ -o \$work/.histcheck_report -i $interval $expectations
+        if ( \$status ) then
+            echo ERROR: Incomplete history data
+            cat >> \$work/.histcheck_report <<END
+
+        Your FRE post-processing job ( \$JOB_ID ) has exited because of incomplete
+        history data.
+
+        FRE will attempt to transfer the history files on the remote side by retrying
+        the failed output stager transfers.  If later postprocessing jobs require
+        this postprocessing interval, this year of postprocessing will be rerun.
+
+        To recover manually, please transfer the history data with gcp,
+        and then resubmit this postprocessing job via:
+
+        $frepp_cmd
+
+        Job details:
+        \$name running on \$HOST
+        Batch job stdout:
+        \$FRE_STDOUT_PATH
+        END
+            Mail -s "\$name year \$historyyear cannot be postprocessed" $mailList < \$work/.histcheck_report
+            \$PYFRE_ENGINE pyFRE.frepp.statestore -d \$statedb set \$statefile HISTORYDATAERROR
+            sleep 30
+            exit 7
+        endif
+    """, locals())
     return script
 
 
-def createdirs(mkdircommand):
-    """Make directories."""
+def createdirs(plan):
+    """Make the directories collected in the
+    :class:`~pyFRE.frepp.dirplan.DirectoryPlan` *plan*."""
     # frepp.pl l.2927
-    if mkdircommand and mkdircommand != "mkdir -p ":
-        #if ( $opt_v ) { print "length of mkdircommand: ".length("$mkdircommand")."\n"; }
-        if len(mkdircommand) > 5000:
-            mkdircommand = re.sub(r"^mkdir -p ", r"", mkdircommand)
-            i = mkdircommand.index(' ', 5000)
-            f = mkdircommand[:i]
-            s = mkdircommand[i:]
-            #if($opt_v){print "executing mkdircommand:\nfirst half:\n'$f'\n\nsecond half:\n'$s'\n";}
-            execute('ac-arch', f"mkdir -p {f}")
-            execute('ac-arch', f"mkdir -p {s}")
-        else:
-            #if ( $opt_v ) { print "executing mkdircommand: $mkdircommand\n"; }
-            execute('ac-arch', mkdircommand)
-        mkdircommand = "mkdir -p "
-    return mkdircommand
+    created = plan.create()
+    if created:
+        _log.debug(f"Created {len(created)} directories.")
+    return plan
 
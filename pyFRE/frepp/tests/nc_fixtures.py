@@ -0,0 +1,54 @@
+"""Synthetic NetCDF files shaped like FRE history and time series output, for
+testing the in-process postprocessing engines.
+"""
+import numpy as np
+import netCDF4
+
+NOLEAP_MONTH_DAYS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+def monthly_bounds(nyears, start_day=0.0):
+    """Time bounds (in days) for *nyears* of noleap months."""
+    days = np.tile(NOLEAP_MONTH_DAYS, nyears).astype('f8')
+    edges = start_day + np.concatenate([[0.0], np.cumsum(days)])
+    return np.stack([edges[:-1], edges[1:]], axis=1)
+
+def write_ts(path, bnds, varname='tas', data=None, nlat=3, nlon=4,
+    fmt='NETCDF4_CLASSIC', missing=None):
+    """Write a FRE-style time series file with average_T1/T2/DT and time
+    bounds, one (time, lat, lon) variable and static lat/lon axes. Returns the
+    data written.
+    """
+    nt = bnds.shape[0]
+    if data is None:
+        rng = np.random.default_rng(42)
+        data = rng.normal(size=(nt, nlat, nlon)).astype('f4')
+    with netCDF4.Dataset(path, 'w', format=fmt) as ds:
+        ds.filename = path
+        ds.createDimension('time', None)
+        ds.createDimension('nv', 2)
+        ds.createDimension('lat', nlat)
+        ds.createDimension('lon', nlon)
+        t = ds.createVariable('time', 'f8', ('time',))
+        t.units = 'days since 0001-01-01 00:00:00'
+        t.calendar_type = 'NOLEAP'
+        t.calendar = 'noleap'
+        t.bounds = 'time_bounds'
+        lat = ds.createVariable('lat', 'f8', ('lat',))
+        lat[:] = np.linspace(-60, 60, nlat)
+        lon = ds.createVariable('lon', 'f8', ('lon',))
+        lon[:] = np.linspace(0, 270, nlon)
+        ds.createVariable('time_bounds', 'f8', ('time', 'nv'))
+        for name in ('average_T1', 'average_T2', 'average_DT'):
+            ds.createVariable(name, 'f8', ('time',))
+        kw = {} if missing is None else {'fill_value': np.float32(missing)}
+        v = ds.createVariable(varname, 'f4', ('time', 'lat', 'lon'), **kw)
+        v.units = 'K'
+        if missing is not None:
+            v.missing_value = np.float32(missing)
+        t[:] = bnds.mean(axis=1)
+        ds['time_bounds'][:] = bnds
+        ds['average_T1'][:] = bnds[:, 0]
+        ds['average_T2'][:] = bnds[:, 1]
+        ds['average_DT'][:] = bnds[:, 1] - bnds[:, 0]
+        v[:] = data
+    return data
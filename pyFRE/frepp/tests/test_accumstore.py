@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import netCDF4
+from pyFRE.frepp import accumstore, fanout, ncio, tsengine
+from pyFRE.frepp.tests import nc_fixtures
+
+class TestAccumulatorStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.store = accumstore.AccumulatorStore(os.path.join(self.dir, accumstore.DIR_NAME))
+        # 1-year averages of years 1981-1990, with some missing values
+        rng = np.random.default_rng(1)
+        self.data = rng.normal(280., 10., size=(10, 3, 4)).astype('f4')
+        self.data[2, 0, 0] = 1.0e20
+        self.files = []
+        for i in range(10):
+            bnds = np.array([[365. * i, 365. * (i + 1)]])
+            path = os.path.join(self.dir, f'atmos.{1981 + i}.ann.nc')
+            nc_fixtures.write_ts(path, bnds, data=self.data[i:i+1], missing=1.0e20)
+            self.files.append(path)
+        self.outdir = os.path.join(self.dir, 'out')
+        os.makedirs(self.outdir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def from_files(self, files, outfile):
+        """The current path: concatenate the files and average them."""
+        with ncio.open_dataset(files[0]) as src:
+            tname = ncio.record_dim(src)
+            data, t1, t2, dt = [], [], [], []
+            for f in files:
+                with ncio.open_dataset(f) as ds:
+                    data.append(ds['tas'][:])
+                    a, b, c = ncio.averaging_period(ds, tname)
+                    t1.append(a); t2.append(b); dt.append(c)
+            data = np.ma.concatenate(data)
+            dt = np.concatenate(dt)
+            tsengine._write_means(outfile, src, tname,
+                {'tas': ncio.weighted_mean(data, dt)},
+                float(np.min(t1)), float(np.max(t2)), float(np.sum(dt)))
+        return outfile
+
+    def test_interval_of(self):
+        self.assertEqual(accumstore.interval_of(1987, 1981, 5), (1986, 1990))
+        self.assertEqual(accumstore.interval_of(1981, 1981, 10), (1981, 1990))
+        self.assertEqual(accumstore.interval_key('atmos', 1, 5, 'DJF'), 'atmos.0001-0005.DJF')
+
+    def test_equivalence(self):
+        for f in self.files:
+            self.store.add(f, 'atmos', 'ann', 1981, [5, 10])
+        self.assertEqual(self.store.keys(), ['atmos.1981-1985.ann', 'atmos.1981-1990.ann',
+            'atmos.1986-1990.ann'])
+        # reruns don't count a year twice
+        self.assertEqual(self.store.add(self.files[0], 'atmos', 'ann', 1981, [5, 10]), [])
+
+        out = self.store.close('atmos.1981-1985.ann', self.outdir)
+        self.assertNotIn('atmos.1981-1985.ann', self.store)
+        ref = self.from_files(self.files[:5], os.path.join(self.dir, 'ref.nc'))
+        self.assertEqual(accumstore.compare(out, ref), [])
+        with netCDF4.Dataset(out) as ds:
+            self.assertEqual(ds['average_DT'][0], 5 * 365.)
+            np.testing.assert_array_equal(ds['time_bounds'][0], [0., 5 * 365.])
+            self.assertEqual(ds.filename, 'atmos.1981-1985.ann.nc')
+            # the missing value in 1983 is left out of that point's mean
+            self.assertAlmostEqual(float(ds['tas'][0, 0, 0]),
+                float(np.mean(self.data[[0, 1, 3, 4], 0, 0].astype('f8'))), places=4)
+
+        out = self.store.close('atmos.1981-1990.ann', self.outdir)
+        ref = self.from_files(self.files, os.path.join(self.dir, 'ref.nc'))
+        self.assertEqual(accumstore.compare(out, ref), [])
+
+    def test_persistence_and_incomplete(self):
+        for f in self.files[:3]:
+            self.store.add(f, 'atmos', 'ann', 1981, [5])
+        store = accumstore.AccumulatorStore(self.store.path)
+        self.assertEqual(store.missing('atmos.1981-1985.ann'), ['1984', '1985'])
+        with self.assertRaises(accumstore.AccumulatorError):
+            store.close('atmos.1981-1985.ann', self.outdir)
+        self.assertEqual(accumstore.main(['-d', store.path, 'close', '-o', self.outdir,
+            'atmos.1981-1985.ann']), accumstore.INCOMPLETE)
+        self.assertEqual(accumstore.main(['-d', store.path, 'add', '-c', 'atmos', '-p', 'ann',
+            '-s', '1981', '-n', '5'] + self.files[3:5]), 0)
+        self.assertEqual(accumstore.main(['-d', store.path, 'close', '-o', self.outdir,
+            'atmos.1981-1985.ann']), 0)
+        out = os.path.join(self.outdir, 'atmos.1981-1985.ann.nc')
+        ref = self.from_files(self.files[:5], os.path.join(self.dir, 'ref.nc'))
+        self.assertEqual(accumstore.main(['verify', out, ref]), 0)
+
+    @unittest.skipUnless(fanout.fork_available(), "needs fork()")
+    def test_concurrent_adds(self):
+        # one process per year, as concurrent frepp jobs would
+        def add(path):
+            return accumstore.AccumulatorStore(self.store.path).add(path, 'atmos', 'ann',
+                1981, [5])
+        results = list(fanout.map_ordered(add, self.files[:5], nworkers=5))
+        self.assertEqual(results, [['atmos.1981-1985.ann']] * 5)
+        acc = self.store.get('atmos.1981-1985.ann')
+        self.assertEqual(sorted(acc.members), ['1981', '1982', '1983', '1984', '1985'])
+        self.assertEqual(sorted(os.listdir(acc.path)), [accumstore.STATE_NAME, 'template.nc'])
+        out = self.store.close('atmos.1981-1985.ann', self.outdir)
+        ref = self.from_files(self.files[:5], os.path.join(self.dir, 'ref.nc'))
+        # the sums may be added in any order
+        self.assertEqual(accumstore.compare(out, ref, rtol=1e-6), [])
+
+    def test_compare(self):
+        a = self.files[0]
+        b = os.path.join(self.dir, 'b.nc')
+        data = self.data[:1].copy()
+        data[0, 1, 1] += 1.0e-3
+        nc_fixtures.write_ts(b, np.array([[0., 365.]]), data=data, missing=1.0e20)
+        problems = accumstore.compare(a, b)
+        self.assertEqual([p[0] for p in problems], ['tas'])
+        self.assertEqual(accumstore.compare(a, b, atol=1.0e-2), [])
+        self.assertEqual(accumstore.main(['verify', '-r', '1e-5', a, b]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+from pyFRE.frepp import archive
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, 'src')
+        os.makedirs(self.src)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, data, mtime=1000000000):
+        path = os.path.join(self.src, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def contents(self, arc):
+        out = os.path.join(self.tmp.name, 'out')
+        if os.path.exists(out):
+            for name in os.listdir(out):
+                os.remove(os.path.join(out, name))
+        arc.extract(out)
+        d = dict()
+        for name in os.listdir(out):
+            with open(os.path.join(out, name), 'rb') as f:
+                d[name] = f.read()
+        return d
+
+class TestArchive(ArchiveTestCase):
+    def _roundtrip(self, fmt):
+        path = os.path.join(self.tmp.name, f'a.{fmt}')
+        a = self.write('a.nc', b'a' * 7)
+        b = self.write('b.nc', b'b' * 1000)
+        c = self.write('c.nc', b'c' * 3)
+        arc = archive.Archive(path, format=fmt)
+        self.assertEqual(arc.add([a, b])['appended'], ['a.nc', 'b.nc'])
+        self.assertEqual(os.path.getsize(path) % 512, 0)
+
+        # a fresh reader sees the same index
+        arc = archive.Archive(path)
+        self.assertEqual(arc.format, fmt)
+        self.assertEqual(arc.names(), ['a.nc', 'b.nc'])
+        self.assertEqual(arc.index['b.nc'].size, 1000)
+        self.assertEqual(arc.index['b.nc'].mtime, 1000000000)
+
+        # append without touching existing members
+        before = arc.index['a.nc']
+        self.assertEqual(arc.add([c])['appended'], ['c.nc'])
+        self.assertEqual(archive.Archive(path).index['a.nc'], before)
+
+        # same-size replacement in place
+        self.write('b.nc', b'B' * 1000, mtime=1100000000)
+        result = arc.add([b])
+        self.assertEqual(result, {'appended': [], 'replaced': ['b.nc'], 'moved': []})
+        arc = archive.Archive(path)
+        self.assertEqual(arc.names(), ['a.nc', 'b.nc', 'c.nc'])
+        self.assertEqual(arc.index['b.nc'].mtime, 1100000000)
+
+        # resized replacement only moves the members after it
+        self.write('a.nc', b'A' * 20)
+        result = arc.add([a])
+        self.assertEqual(result, {'appended': [], 'replaced': ['a.nc'], 'moved': ['b.nc', 'c.nc']})
+        arc = archive.Archive(path)
+        self.assertEqual(arc.names(), ['b.nc', 'c.nc', 'a.nc'])
+        self.assertEqual(self.contents(arc),
+            {'a.nc': b'A' * 20, 'b.nc': b'B' * 1000, 'c.nc': b'c' * 3})
+        return path
+
+    @unittest.skipIf(shutil.which('cpio') is None, "cpio isn't installed")
+    def test_cpio_reads(self):
+        # archives written (and rewritten in place) here unpack with cpio -i
+        for fmt in ('odc', 'newc', 'bin'):
+            with self.subTest(fmt=fmt):
+                path = self._roundtrip(fmt)
+                out = os.path.join(self.tmp.name, f'cpio-{fmt}')
+                os.makedirs(out)
+                with open(path, 'rb') as f:
+                    subprocess.run(['cpio', '-idu', '--quiet', '-H', fmt], stdin=f,
+                        cwd=out, check=True)
+                d = dict()
+                for name in os.listdir(out):
+                    with open(os.path.join(out, name), 'rb') as f:
+                        d[name] = f.read()
+                self.assertEqual(d, {'a.nc': b'A' * 20, 'b.nc': b'B' * 1000, 'c.nc': b'c' * 3})
+
+    def test_odc(self):
+        path = self._roundtrip('odc')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(6), b'070707')
+
+    def test_newc(self):
+        self._roundtrip('newc')
+
+    def test_bin(self):
+        self._roundtrip('bin')
+
+    def test_tar(self):
+        path = self._roundtrip('tar')
+        with tarfile.open(path) as tar:
+            self.assertEqual(tar.getnames(), ['b.nc', 'c.nc', 'a.nc'])
+            self.assertEqual(tar.extractfile('a.nc').read(), b'A' * 20)
+        listing = subprocess.run(['tar', '-tf', path], capture_output=True,
+            text=True, check=True).stdout.split()
+        self.assertEqual(listing, ['b.nc', 'c.nc', 'a.nc'])
+
+    def test_reads_tarfile_archive(self):
+        path = os.path.join(self.tmp.name, 'x.nc.tar')
+        with tarfile.open(path, 'w') as tar:
+            tar.add(self.write('a.nc', b'xyz'), arcname='./a.nc')
+        arc = archive.Archive(path)
+        self.assertEqual(arc.format, 'tar')
+        self.assertEqual(arc.names(), ['./a.nc'])
+        arc.add([self.write('b.nc', b'12345')])
+        with tarfile.open(path) as tar:
+            self.assertEqual(tar.getnames(), ['./a.nc', 'b.nc'])
+
+    def test_bad_archive(self):
+        path = self.write('junk.cpio', b'junk' * 200)
+        with self.assertRaises(ValueError):
+            archive.Archive(path)
+
+    def test_too_large(self):
+        arc = archive.Archive(os.path.join(self.tmp.name, 'a.cpio'), format='newc')
+        st = mock.Mock(st_mode=0o100644, st_mtime=0, st_size=1 << 32)
+        with self.assertRaises(ValueError):
+            arc._header('a.nc', st, 1)
+
+class TestMain(ArchiveTestCase):
+    def test_cli(self):
+        path = os.path.join(self.tmp.name, 'a.nc.cpio')
+        a = self.write('a.nc', b'a')
+        self.assertEqual(archive.main(['-f', path, 'add', a]), 0)
+        out = os.path.join(self.tmp.name, 'out')
+        self.assertEqual(archive.main(['-f', path, 'extract', '-C', out, 'a.nc']), 0)
+        self.assertEqual(os.listdir(out), ['a.nc'])
+        self.assertEqual(archive.main(['-f', path, 'extract', 'missing.nc']), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import netCDF4
+from pyFRE.frepp import compression
+from pyFRE.frepp.tests.nc_fixtures import monthly_bounds, write_ts
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.cache_dir = os.path.join(self.dir, compression.DIR_NAME)
+        self.bnds = monthly_bounds(2)
+        self.data = np.round(np.random.default_rng(3).normal(280., 10.,
+            size=(24, 3, 4)), 1).astype('f4')
+        # a history file storing tas with deflate level 3 and shuffle
+        self.history = os.path.join(self.dir, '19800101.atmos_month.nc')
+        write_ts(self.history, self.bnds, data=self.data)
+        compression.rewrite(self.history, {'tas': (3, True)})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_output(self, name, varname='tas'):
+        """A time series file large (and smooth) enough to gain from deflation."""
+        path = os.path.join(self.dir, name)
+        data = np.broadcast_to(np.linspace(200., 300., 90)[None, :, None],
+            (24, 90, 180)).astype('f4')
+        write_ts(path, self.bnds, varname=varname, data=data, nlat=90, nlon=180,
+            fmt='NETCDF3_64BIT_OFFSET')
+        return path
+
+    def test_probe_cache(self):
+        cache = compression.SettingsCache(self.cache_dir)
+        settings = cache.probe('atmos_month', self.history)
+        self.assertEqual(settings['tas'], (3, True))
+        self.assertEqual(settings['lat'], (0, False))
+        self.assertEqual(compression.summary_settings(settings), (3, True))
+        # later probes don't read the file
+        os.remove(self.history)
+        self.assertEqual(compression.SettingsCache(self.cache_dir).probe('atmos_month',
+            self.history), settings)
+        self.assertEqual(compression.main(['probe', '-D', self.cache_dir, '-s',
+            'atmos_month', '-f', 'deflate', self.history]), 0)
+
+    def test_compress_per_variable(self):
+        source = compression.SettingsCache(self.cache_dir).probe('atmos_month', self.history)
+        tas = self.write_output('atmos.198001-198112.tas.nc')
+        pr = self.write_output('atmos.198001-198112.pr.nc', varname='pr')
+        records = compression.compress_files([tas, pr], (1, False), source, nworkers=2)
+        self.assertEqual([r['skipped'] for r in records], [False, False])
+        self.assertEqual([r['component'] for r in records], ['atmos', 'atmos'])
+        self.assertLess(records[0]['after'], records[0]['before'])
+        with netCDF4.Dataset(tas) as ds:
+            self.assertEqual(ds.data_model, 'NETCDF4_CLASSIC')
+            self.assertEqual(compression.var_settings(ds['tas']), (3, True))
+            np.testing.assert_array_equal(ds['tas'][:, :, 0],
+                np.tile(np.linspace(200., 300., 90).astype('f4'), (24, 1)))
+            np.testing.assert_array_equal(ds['time_bounds'][:], self.bnds)
+        with netCDF4.Dataset(pr) as ds:
+            # pr isn't in the source: the flags' settings
+            self.assertEqual(compression.var_settings(ds['pr']), (1, False))
+        # already stored that way
+        mtime = os.stat(tas).st_mtime_ns
+        record = compression.compress_file(tas, (1, False), source)
+        self.assertTrue(record['skipped'])
+        self.assertEqual(os.stat(tas).st_mtime_ns, mtime)
+
+    def test_uncompress(self):
+        self.assertEqual(compression.main(['compress', '-z', '-d 0', self.history]), 0)
+        with netCDF4.Dataset(self.history) as ds:
+            self.assertEqual(compression.var_settings(ds['tas']), (0, False))
+            np.testing.assert_array_equal(ds['tas'][:], self.data)
+
+    def test_report(self):
+        report = os.path.join(self.cache_dir, compression.REPORT_NAME)
+        files = [self.write_output(f'{c}.198001-198112.tas.nc') for c in ('atmos', 'land')]
+        self.assertEqual(compression.main(['compress', '-z', '-d 2 -s', '-j', '2',
+            '-r', report] + files), 0)
+        # nothing left to do, so nothing reported
+        self.assertEqual(compression.main(['compress', '-z', '-d 2 -s', '-r', report]
+            + files), 0)
+        totals = compression.summarize(report)
+        self.assertEqual(sorted(totals), ['atmos', 'land'])
+        self.assertEqual(totals['atmos']['files'], 1)
+        self.assertGreater(totals['land']['saved'], 0)
+        self.assertIn('atmos', compression.format_summary(totals))
+        self.assertEqual(compression.main(['compress', '-s', 'atmos_month'] + files), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import unittest
+from pyFRE.frepp import depplan, statestore
+
+class TestDependencyPlan(unittest.TestCase):
+    def _plan(self):
+        plan = depplan.DependencyPlan()
+        for year in ('1981', '1982', '1983'):
+            plan.add('atmos', year, f"\nfrepp -t {year}\n", f"/scripts/x_atmos_{year}")
+        # ocean 1983 needs atmos 1982 and 1983; atmos 1980 is already OK
+        plan.add('ocean', '1983', "frepp -c ocean -t 1983", "/scripts/x_ocean_1983",
+            after=[('atmos', '1982'), ('atmos', '1983'), ('atmos', '1980')])
+        return plan
+
+    def test_waves(self):
+        waves = self._plan().waves()
+        self.assertEqual([[str(t.node) for t in w] for w in waves],
+            [['atmos.1981', 'atmos.1982', 'atmos.1983'], ['ocean.1983']])
+        self.assertEqual(waves[0][0].command, "frepp -t 1981")
+
+    def test_cycle(self):
+        plan = depplan.DependencyPlan()
+        plan.add('atmos', 1981, "a", "a", after=[('atmos', '1982')])
+        plan.add('atmos', 1982, "b", "b", after=[('atmos', '1981')])
+        with self.assertRaises(ValueError):
+            plan.waves()
+
+    def test_array_script(self):
+        tasks = self._plan().waves()[0]
+        script = depplan.DependencyPlan.array_script(tasks, 'deps', output='/out/%x.o%A_%a')
+        self.assertIn('#SBATCH --array=0-2\n', script)
+        self.assertIn('#SBATCH --output=/out/%x.o%A_%a\n', script)
+        self.assertIn('    case 2:\n        echo "Redoing atmos.1983"\n'
+            '        csh -f /scripts/x_atmos_1983\n', script)
+        self.assertNotIn('frepp -t', script)
+
+    def test_runscript_directives(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i, walltime in enumerate(('04:00:00', '1-00:00:00', '600')):
+                paths.append(os.path.join(tmp, f"x_atmos_{1981 + i}"))
+                with open(paths[-1], 'w') as f:
+                    f.write((f"#!/bin/csh -f\n#SBATCH --job-name=x_atmos_{1981 + i}\n"
+                        f"#SBATCH --time={walltime}\n#SBATCH --chdir=/home/u\n"
+                        "#SBATCH --comment=fre/test\n#SBATCH --constraint=bigmem\n"))
+            directives = depplan.runscript_directives(paths + ['/no/such/script'])
+            self.assertEqual(directives, ['#SBATCH --time=1-00:00:00',
+                '#SBATCH --chdir=/home/u', '#SBATCH --comment=fre/test',
+                '#SBATCH --constraint=bigmem'])
+            script = depplan.DependencyPlan.array_script(self._plan().waves()[0],
+                'deps', directives=directives)
+            self.assertIn('#SBATCH --chdir=/home/u\n', script)
+
+    def test_generate_runscript(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            outscript = os.path.join(tmp, 'x_atmos_1981')
+            def _runner(cmd):
+                with open(outscript, 'w') as f:
+                    f.write(cmd)
+                return "TO SUBMIT: sbatch x_atmos_1981\n"
+            self.assertTrue(depplan.generate_runscript("frepp -t 1981", outscript, _runner))
+            self.assertFalse(depplan.generate_runscript("frepp -t 1980", outscript,
+                lambda cmd: "This year (1980) has already been completed for atmos.\n"))
+            with self.assertRaises(Exception):
+                depplan.generate_runscript("frepp -t 1982", os.path.join(tmp, 'missing'),
+                    lambda cmd: "")
+
+    def test_submit(self):
+        calls = []
+        def _runner(cmd):
+            calls.append(cmd)
+            return f"some output\nSubmitted batch job {100 + len(calls)}\n"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with statestore.StateStore.for_statedir(tmp) as store:
+                jobids = self._plan().submit(tmp, 'deps', 'sbatch', store=store,
+                    after=['42'], runner=_runner)
+                self.assertEqual(store.get('atmos', '1982'), "101_1")
+                self.assertEqual(store.get('ocean', 1983), "102_0")
+            self.assertEqual(jobids, ['101', '102'])
+            self.assertEqual(calls, [
+                f"sbatch --array=0-2 --dependency=afterok:42 {tmp}/deps.wave0",
+                f"sbatch --array=0-0 --dependency=afterok:101 {tmp}/deps.wave1"
+            ])
+
+    def test_runscript_holds(self):
+        # holds the runscripts' frepp found on running jobs go on their wave
+        calls = []
+        def _runner(cmd):
+            calls.append(cmd)
+            return f"Submitted batch job {100 + len(calls)}\n"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            plan = depplan.DependencyPlan()
+            for year, holds in (('1981', '55:56'), ('1982', '')):
+                path = os.path.join(tmp, f"x_atmos_{year}")
+                with open(path, 'w') as f:
+                    f.write(("#!/bin/csh -f\n#INFO:component=atmos\n"
+                        f"#INFO:depyears=1980 {year}\n#INFO:holds={holds}\n"))
+                plan.add('atmos', year, f"frepp -t {year}", path,
+                    after=[('atmos', y) for y in
+                        depplan.runscript_info(path, 'depyears').split()[:-1]])
+            plan.add('ocean', '1982', "frepp -c ocean -t 1982", os.path.join(tmp, 'missing'),
+                after=[('atmos', '1982')])
+            self.assertEqual(depplan.runscript_info(os.path.join(tmp, 'x_atmos_1982'),
+                'depyears'), '1980 1982')
+            self.assertEqual(depplan.runscript_holds([os.path.join(tmp, 'x_atmos_1981'),
+                os.path.join(tmp, 'x_atmos_1982'), os.path.join(tmp, 'missing')]), ['55', '56'])
+            plan.submit(tmp, 'deps', 'sbatch', runner=_runner)
+            self.assertEqual(calls, [
+                f"sbatch --array=0-1 --dependency=afterok:55:56 {tmp}/deps.wave0",
+                f"sbatch --array=0-0 --dependency=afterok:101 {tmp}/deps.wave1"
+            ])
+
+    def test_parse_jobid(self):
+        self.assertEqual(depplan.parse_jobid("Submitted batch job 12345\n"), '12345')
+        self.assertIsNone(depplan.parse_jobid("sbatch: error: invalid partition\n"))
+        self.assertIsNone(depplan.parse_jobid(""))
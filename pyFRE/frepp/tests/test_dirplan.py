@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from pyFRE.frepp import dirplan
+
+class TestDirectoryPlan(unittest.TestCase):
+    def test_pending_elides_parents(self):
+        plan = dirplan.DirectoryPlan()
+        plan.add('/pp/atmos/ts/monthly/5yr', '/pp/atmos', '/pp/atmos/ts/monthly/5yr/',
+            '/pp/atmos/av', '/pp/atmos_level', '/pp/atmos/ts', '', None)
+        self.assertEqual(plan.pending(),
+            ['/pp/atmos/av', '/pp/atmos/ts/monthly/5yr', '/pp/atmos_level'])
+        self.assertEqual(len(plan), 3)
+        self.assertEqual(plan.drain(), ['/pp/atmos', '/pp/atmos/av', '/pp/atmos/ts',
+            '/pp/atmos/ts/monthly/5yr', '/pp/atmos_level'])
+        self.assertFalse(plan)
+
+    def test_remote(self):
+        calls = []
+        plan = dirplan.DirectoryPlan(host='ac-arch',
+            runner=lambda host, cmd: calls.append((host, cmd)))
+        plan.add('/pp/.dec', '/pp/.checkpoint', '/pp/atmos/ts')
+        self.assertEqual(plan.create(), ['/pp/.checkpoint', '/pp/.dec', '/pp/atmos/ts'])
+        self.assertEqual(calls,
+            [('ac-arch', 'mkdir -p /pp/.checkpoint /pp/.dec /pp/atmos/ts')])
+
+        # known directories and their parents aren't requested again
+        plan.add('/pp/atmos/ts', '/pp/atmos', '/pp')
+        self.assertFalse(plan)
+        self.assertEqual(plan.create(), [])
+        plan.add('/pp/atmos/av')
+        plan.create()
+        self.assertEqual(calls[-1], ('ac-arch', 'mkdir -p /pp/atmos/av'))
+        self.assertEqual(len(calls), 2)
+
+    def test_command_length(self):
+        plan = dirplan.DirectoryPlan(host='h', max_cmdlen=30)
+        plan.add(*[f'/pp/comp{i}' for i in range(5)])
+        cmds = plan.commands()
+        self.assertEqual(cmds, ['mkdir -p /pp/comp0 /pp/comp1', 'mkdir -p /pp/comp2 /pp/comp3',
+            'mkdir -p /pp/comp4'])
+
+    def test_local(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            plan = dirplan.DirectoryPlan(nworkers=2)
+            dirs = [os.path.join(tmp, 'pp', c, 'ts', 'monthly') for c in ('a', 'b', 'c')]
+            plan.add(*dirs)
+            plan.add(os.path.join(tmp, 'pp'))
+            self.assertEqual(plan.create(), dirs)
+            for d in dirs:
+                self.assertTrue(os.path.isdir(d))
+            self.assertIn(os.path.join(tmp, 'pp'), plan.known)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+from pyFRE.frepp import fanout
+
+_state = {'shared': 'parsed xml'}
+
+@unittest.skipUnless(fanout.fork_available(), "fork() not available")
+class TestMapOrdered(unittest.TestCase):
+    def test_sequential(self):
+        pids = list(fanout.map_ordered(lambda x: os.getpid(), range(3), nworkers=1))
+        self.assertEqual(pids, [os.getpid()] * 3)
+
+    def test_parallel_ordered(self):
+        # unpicklable items and closures are fine; workers inherit them
+        items = [lambda i=i: i * i for i in range(20)]
+        results = list(fanout.map_ordered(
+            lambda f: (f(), os.getpid(), _state['shared']), items, nworkers=4))
+        self.assertEqual([r[0] for r in results], [i * i for i in range(20)])
+        self.assertNotIn(os.getpid(), set(r[1] for r in results))
+        self.assertEqual(set(r[2] for r in results), {'parsed xml'})
+
+    def test_initializer(self):
+        def init():
+            _state['shared'] = 'reopened'
+        results = list(fanout.map_ordered(lambda x: _state['shared'], range(4),
+            nworkers=2, initializer=init))
+        self.assertEqual(results, ['reopened'] * 4)
+        self.assertEqual(_state['shared'], 'parsed xml')
+
+    def test_errors(self):
+        def fail(x):
+            if x == 2:
+                raise ValueError(x)
+            return x
+        with self.assertRaises(ValueError):
+            list(fanout.map_ordered(fail, range(4), nworkers=2))
+
+        def exit_(x):
+            if x == 1:
+                sys.exit(3)
+            return x
+        with self.assertRaises(SystemExit) as cm:
+            list(fanout.map_ordered(exit_, range(4), nworkers=2))
+        self.assertEqual(cm.exception.code, 3)
+
+    def test_default_workers(self):
+        self.assertEqual(fanout.default_workers(1), 1)
+        self.assertLessEqual(fanout.default_workers(100), 8)
+
+if __name__ == '__main__':
+    unittest.main()
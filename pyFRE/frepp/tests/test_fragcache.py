@@ -0,0 +1,92 @@
+import dataclasses as dc
+import os
+import tempfile
+import unittest
+from pyFRE.frepp import dirplan, fragcache
+
+@dc.dataclass
+class _Exp():
+    expt: str = "expt"
+    maxyrs: int = 0
+
+    def __post_init__(self):
+        self.dirplan = dirplan.DirectoryPlan()
+
+@dc.dataclass
+class _Cpt():
+    component: str = "atmos"
+    sim0: str = "1980"
+    cpiomonTS: str = ""
+    hsmfiles: str = ""
+
+class TestFingerprint(unittest.TestCase):
+    def test_fingerprint(self):
+        a = fragcache.fingerprint(_Cpt(), {'t': '1985', 's': True}, ['x', 1])
+        b = fragcache.fingerprint(_Cpt(hsmfiles='atmos_month,'),
+            {'s': True, 't': '1985'}, ('x', 1))
+        self.assertEqual(a, b) # volatile fields, dict order, list vs tuple
+        self.assertNotEqual(a, fragcache.fingerprint(_Cpt(sim0='1990'),
+            {'t': '1985', 's': True}, ['x', 1]))
+        self.assertNotEqual(fragcache.fingerprint('ab', 'c'), fragcache.fingerprint('a', 'bc'))
+        self.assertEqual(fragcache.fingerprint(object()), fragcache.fingerprint(object()))
+
+class TestFragmentCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = fragcache.FragmentCache.for_statedir(self.tmp.name)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_render(self):
+        calls = []
+        def render():
+            calls.append(1)
+            exp.dirplan.add('/pp/atmos/ts/monthly/5yr', '/pp/atmos')
+            exp.maxyrs = max(exp.maxyrs, 5)
+            cpt.cpiomonTS += 'cpio atmos\n'
+            return ('ncrcat ...\n', 'atmos_month', ['1980', '1981'])
+
+        exp, cpt = _Exp(), _Cpt(cpiomonTS='before\n')
+        exp.dirplan.known.add('/pp/atmos/ts/monthly/5yr')
+        frag = self.cache.render('k', render, exp, cpt)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        self.assertEqual(frag.dirs, ('/pp/atmos', '/pp/atmos/ts/monthly/5yr'))
+        self.assertEqual((frag.maxyrs, frag.cpiomonTS), (5, 'cpio atmos\n'))
+        self.assertEqual(exp.dirplan.pending(), ['/pp/atmos'])
+
+        # replayed in a new run, from a new connection
+        self.cache.close()
+        self.cache = fragcache.FragmentCache(os.path.join(self.tmp.name, fragcache.DB_NAME))
+        exp, cpt = _Exp(), _Cpt()
+        frag = self.cache.render('k', render, exp, cpt)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+        self.assertEqual(frag.cshscript, 'ncrcat ...\n')
+        self.assertEqual(frag.hsmfiles, 'atmos_month')
+        self.assertEqual(frag.dep, ['1980', '1981'])
+        self.assertEqual(exp.dirplan.pending(), ['/pp/atmos/ts/monthly/5yr'])
+        self.assertEqual((exp.maxyrs, cpt.cpiomonTS), (5, 'cpio atmos\n'))
+
+    def test_render_error(self):
+        exp, cpt = _Exp(), _Cpt()
+        plan = exp.dirplan
+        def render():
+            raise ValueError()
+        with self.assertRaises(ValueError):
+            self.cache.render('k', render, exp, cpt)
+        self.assertIs(exp.dirplan, plan)
+        self.assertIsNone(self.cache.get('k'))
+
+    def test_prune_and_cli(self):
+        self.cache.put('k', fragcache.Fragment('csh', None, None, (), 0, ''))
+        self.assertEqual(self.cache.get('k').dep, None)
+        self.assertEqual(self.cache.prune(3600.), 0)
+        self.assertEqual(self.cache.prune(-1.), 1)
+        self.cache.put('k', fragcache.Fragment('csh', None, None, (), 0, ''))
+        self.assertEqual(fragcache.main(['-d', self.tmp.name, 'clear']), 0)
+        self.assertEqual(len(self.cache), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pyFRE.frepp import histcheck, ncio
+from pyFRE.frepp.tests import nc_fixtures
+
+class TestRecordCount(unittest.TestCase):
+    def test_formats(self):
+        bnds = nc_fixtures.monthly_bounds(1)
+        with tempfile.TemporaryDirectory() as tmp:
+            for fmt in ('NETCDF3_CLASSIC', 'NETCDF3_64BIT_OFFSET',
+                'NETCDF3_64BIT_DATA', 'NETCDF4', 'NETCDF4_CLASSIC'):
+                path = os.path.join(tmp, f'{fmt}.nc')
+                nc_fixtures.write_ts(path, bnds, fmt=fmt)
+                self.assertEqual(ncio.record_count(path), 12, fmt)
+
+class TestCheckHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        bnds = nc_fixtures.monthly_bounds(1)
+        for tarball in ('19800101.nc', '19800701.nc'):
+            os.makedirs(os.path.join(self.dir, tarball))
+        # two half-years of monthly data on 6 tiles; only tile1 is counted
+        for i, tarball in enumerate(('19800101.nc', '19800701.nc')):
+            for tile in range(1, 7):
+                nc_fixtures.write_ts(
+                    os.path.join(self.dir, tarball, f'19800101.atmos_month.tile{tile}.nc'),
+                    bnds[6 * i:6 * (i + 1)], fmt='NETCDF3_64BIT_OFFSET')
+        nc_fixtures.write_ts(os.path.join(self.dir, '19800101.nc', '19800101.ocean_month.nc'),
+            bnds[:6])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_check(self):
+        results = histcheck.check_history(self.dir, [
+            histcheck.DiagExpectation('atmos_month', 12, 12),
+            histcheck.DiagExpectation('ocean_month', 12, 12)
+        ], nworkers=4)
+        self.assertEqual([(r.diagfile, r.afields, len(r.files), r.ok) for r in results],
+            [('atmos_month', 12, 2, True), ('ocean_month', 6, 1, False)])
+        report = histcheck.format_report(results, '19800101-19801231')
+        self.assertEqual(report, ("FRE expected 12 time levels in ocean_month data, "
+            "but found 6 time levels for the interval 19800101-19801231 (1 files).\n"))
+
+    def test_main(self):
+        report = os.path.join(self.dir, 'report')
+        with mock.patch('sys.stdout', new_callable=io.StringIO):
+            self.assertEqual(histcheck.main(['-d', self.dir, '-o', report,
+                'atmos_month:12:13']), 0)
+            self.assertFalse(os.path.exists(report))
+            self.assertEqual(histcheck.main(['-d', self.dir, '-o', report,
+                'atmos_month:12', 'ocean_month:12:12']), 1)
+        with open(report) as f:
+            self.assertIn('ocean_month', f.read())
+
+    def test_parse_expectation(self):
+        self.assertEqual(histcheck.parse_expectation('atmos_8xdaily:2920:2928'),
+            ('atmos_8xdaily', 2920, 2928))
+        with self.assertRaises(ValueError):
+            histcheck.parse_expectation('atmos_month')
+
+class TestExpectedLevels(unittest.TestCase):
+    DIAG_TABLE = [
+        'ESM2M test',
+        '1980 1 1 0 0 0',
+        '#"atmos_8xdaily", 3, "hours", 1, "days", "time",',
+        '"atmos_month",    1, "months", 1, "days", "time",',
+        '"atmos_daily",    1, "days",   1, "days", "time",',
+        '"atmos_8xdaily",  3, "hours",  1, "days", "time",',
+        '"ocean_annual",   1, "years",  1, "days", "time",',
+        '"ocean_month",    1, "months", 1, "days", "time",',
+        '"atmos", "ps", "ps", "atmos_month", "all", .true., "none", 2',
+    ]
+
+    def test_julian(self):
+        expectations = histcheck.expected_levels(self.DIAG_TABLE,
+            ['atmos_month', 'atmos_daily', 'atmos_8xdaily', 'ocean_annual'],
+            '19800101', '1980123123:59:59', 'julian')
+        self.assertEqual([histcheck.format_expectation(e) for e in expectations],
+            ['atmos_month:12:12', 'atmos_daily:366:367', 'atmos_8xdaily:2928:2936',
+                'ocean_annual:1:1'])
+        self.assertEqual(histcheck.parse_expectation('atmos_daily:366:367'),
+            expectations[1])
+
+    def test_noleap(self):
+        # daily and sub-daily data are only checked in the julian calendar
+        expectations = histcheck.expected_levels(self.DIAG_TABLE,
+            ['atmos_daily', 'ocean_month'], '19800101', '19801231', 'noleap')
+        self.assertEqual(expectations, [histcheck.DiagExpectation('ocean_month', 12, 12)])
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pyFRE.frepp import jobstate, logs, statestore
+
+class _Clock():
+    def __init__(self):
+        self.t = 0.
+
+    def __call__(self):
+        return self.t
+
+class TestJobStateService(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.statedir = self.tmp.name
+        for name, state in [('atmos.1981', 'OK'), ('atmos.1982', '101'),
+            ('atmos.1983', '102_3'), ('ocean.1982', 'INT-abc123'), ('ocean.1983', '103')]:
+            with open(os.path.join(self.statedir, name), 'w') as f:
+                f.write(state + '\n')
+        self.sched = jobstate.FakeScheduler(
+            {'101': 'RUNNING', '102_3': 'PENDING', '103': 'COMPLETED'})
+        self.clock = _Clock()
+        self.service = jobstate.JobStateService(self.sched, ttl=10, clock=self.clock)
+        self.service.watch_statedir(self.statedir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_single_query(self):
+        self.assertTrue(self.service.isjobrunning('101'))
+        self.assertTrue(self.service.isjobrunning('102_3'))
+        self.assertFalse(self.service.isjobrunning('103'))
+        self.assertEqual(self.sched.queries, [['101', '102_3', '103']])
+
+    def test_ttl(self):
+        self.assertTrue(self.service.isjobrunning('101'))
+        self.sched.states['101'] = 'COMPLETED'
+        self.clock.t = 5
+        self.assertTrue(self.service.isjobrunning('101'))
+        self.clock.t = 11
+        self.assertFalse(self.service.isjobrunning('101'))
+        self.assertEqual(len(self.sched.queries), 2)
+
+    def test_unknown_jobid(self):
+        self.assertFalse(self.service.isjobrunning('999'))
+        self.assertFalse(self.service.isjobrunning('1'))
+        self.assertEqual(self.sched.queries[-1], ['1', '101', '102_3', '103', '999'])
+        self.assertIsNone(self.service.state('999'))
+
+    def test_watch_store(self):
+        service = jobstate.JobStateService(self.sched, ttl=10, clock=self.clock)
+        with statestore.StateStore(os.path.join(self.statedir, 'state.db')) as store:
+            store.set_many([('atmos', 1981, 'OK'), ('atmos', 1982, '101'),
+                ('atmos', 1983, '103')])
+            service.watch_store(store)
+            self.assertFalse(service.isjobrunning('103'))
+            self.assertTrue(service.isjobrunning('101'))
+        self.assertEqual(self.sched.queries, [['101', '103']])
+
+    def test_logs_isjobrunning(self):
+        old = jobstate.set_default_service(self.service)
+        try:
+            self.assertTrue(logs.isjobrunning('101'))
+            self.assertFalse(logs.isjobrunning('10'))
+        finally:
+            jobstate.set_default_service(old)
+
+class TestSlurmScheduler(unittest.TestCase):
+    def test_query(self):
+        outputs = {
+            'squeue': "101 RUNNING\n102_3 PENDING\n",
+            'sacct': "103|COMPLETED\n104|CANCELLED by 1234\n"
+        }
+        calls = []
+        def _shell(cmd, log):
+            calls.append(cmd)
+            return outputs[cmd.split()[0]]
+
+        with mock.patch('pyFRE.util.shell', side_effect=_shell):
+            states = jobstate.SlurmScheduler().query(['101', '102_3', '103', '104', '105'])
+        self.assertEqual(states, {'101': 'RUNNING', '102_3': 'PENDING',
+            '103': 'COMPLETED', '104': 'CANCELLED'})
+        self.assertEqual(calls, [
+            "squeue -h -r -o '%i %T' -j 101,102_3,103,104,105",
+            "sacct -n -X -P -o JobID,State -j 103,104,105"
+        ])
+
+    def test_is_jobid(self):
+        self.assertTrue(jobstate.is_jobid('12345'))
+        self.assertTrue(jobstate.is_jobid('12345_7'))
+        self.assertFalse(jobstate.is_jobid('OK'))
+        self.assertFalse(jobstate.is_jobid('INT-abc123'))
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import netCDF4
+from pyFRE.frepp import ncconcat
+from pyFRE.frepp.tests.nc_fixtures import monthly_bounds, write_ts
+
+class TestNcConcat(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        bnds = monthly_bounds(3)
+        rng = np.random.default_rng(7)
+        self.data = rng.normal(280., 10., size=(36, 3, 4)).astype('f4')
+        self.data[5, 1, 2] = 1.0e20
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.dir, f'atmos.{1980 + i}01-{1980 + i}12.tas.nc')
+            write_ts(path, bnds[12 * i:12 * (i + 1)], data=self.data[12 * i:12 * (i + 1)],
+                fmt='NETCDF3_64BIT_OFFSET', missing=1.0e20)
+            self.files.append(path)
+        self.bnds = bnds
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_nccopy_flags(self):
+        self.assertEqual(ncconcat.parse_nccopy_flags('-d 2 -s'),
+            {'fmt': None, 'complevel': 2, 'shuffle': True})
+        self.assertEqual(ncconcat.parse_nccopy_flags('-k nc7 -d1'),
+            {'fmt': 'NETCDF4_CLASSIC', 'complevel': 1, 'shuffle': False})
+        self.assertEqual(ncconcat.parse_nccopy_flags('-4 -d 0 -u')['complevel'], None)
+        with self.assertRaises(ncconcat.ConcatError):
+            ncconcat.parse_nccopy_flags('-k nc9')
+
+    def test_concatenate(self):
+        out = os.path.join(self.dir, 'atmos.198001-198212.tas.nc')
+        self.assertEqual(ncconcat.concatenate(self.files, out, complevel=2, shuffle=True), 36)
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(
+            [os.path.basename(f) for f in self.files] + [os.path.basename(out)]))
+        with netCDF4.Dataset(out) as ds:
+            # compressed classic output becomes netCDF-4 classic, as with nccopy
+            self.assertEqual(ds.data_model, 'NETCDF4_CLASSIC')
+            self.assertEqual(ds.filename, 'atmos.198001-198212.tas.nc')
+            self.assertTrue(ds.dimensions['time'].isunlimited())
+            tas = ds['tas']
+            self.assertEqual(tas.filters()['complevel'], 2)
+            self.assertTrue(tas.filters()['shuffle'])
+            self.assertEqual(tas.chunking(), [1, 3, 4])
+            tas.set_auto_mask(False)
+            np.testing.assert_array_equal(tas[:], self.data)
+            self.assertEqual(tas.missing_value, np.float32(1.0e20))
+            np.testing.assert_array_equal(ds['time_bounds'][:], self.bnds)
+            np.testing.assert_array_equal(ds['lat'][:], np.linspace(-60, 60, 3))
+            self.assertEqual(ds['time'].calendar, 'noleap')
+
+    def test_uncompressed_and_slabs(self):
+        out = os.path.join(self.dir, 'out.nc')
+        ncconcat.concatenate(self.files, out, filename='cat.nc', slab_bytes=100)
+        with netCDF4.Dataset(out) as ds:
+            self.assertEqual(ds.data_model, 'NETCDF3_64BIT_OFFSET')
+            self.assertEqual(ds.filename, 'cat.nc')
+            ds['tas'].set_auto_mask(False)
+            np.testing.assert_array_equal(ds['tas'][:], self.data)
+
+    def test_time_order(self):
+        out = os.path.join(self.dir, 'out.nc')
+        with self.assertRaises(ncconcat.ConcatError):
+            ncconcat.concatenate([self.files[1], self.files[0]], out)
+        self.assertEqual(ncconcat.main(['-o', out, self.files[0], self.files[0]]), 1)
+        self.assertFalse(os.path.exists(out))
+        self.assertFalse(os.path.exists(out + '.tmp'))
+
+    def test_main(self):
+        out = os.path.join(self.dir, 'out.nc')
+        self.assertEqual(ncconcat.main(['-o', out, '-z', '-d 1 -k nc4', '-v', 'tas']
+            + self.files), 0)
+        with netCDF4.Dataset(out) as ds:
+            self.assertEqual(ds.data_model, 'NETCDF4')
+            self.assertEqual(len(ds.dimensions['time']), 36)
+            self.assertIn('average_DT', ds.variables)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import netCDF4
+from pyFRE.frepp import compression, ncheader
+from pyFRE.frepp.tests.nc_fixtures import monthly_bounds, write_ts
+
+class TestNcHeader(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.db = os.path.join(self.dir, ncheader.DB_NAME)
+        self.file = os.path.join(self.dir, 'atmos.198001-198012.tas.nc')
+        write_ts(self.file, monthly_bounds(1))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_main(self, argv):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ret = ncheader.main(argv)
+        return ret, out.getvalue().split('\n')[:-1]
+
+    def test_read_header(self):
+        h = ncheader.read_header(self.file)
+        self.assertEqual(h.timename, 'time')
+        self.assertEqual(h.nrec, 12)
+        self.assertEqual(h.calendar, 'noleap')
+        self.assertEqual(h.calendar_type, 'NOLEAP')
+        self.assertEqual(h.time_bounds, 'time_bounds')
+        self.assertEqual(h.dimensions, {'time': 12, 'nv': 2, 'lat': 3, 'lon': 4})
+        self.assertTrue(h.has('average_DT'))
+        self.assertFalse(h.has('climatology_bounds'))
+        self.assertEqual(h.deflation, 0)
+        compression.rewrite(self.file, {'tas': (2, True)})
+        h = ncheader.read_header(self.file)
+        self.assertEqual((h.deflation, h.shuffle), (2, True))
+        self.assertEqual(ncheader.Header.from_json(h.to_json()), h)
+
+    def test_cache(self):
+        with ncheader.HeaderCache(self.db) as cache:
+            h = cache.get(self.file)
+            with mock.patch.object(ncheader, 'read_header',
+                side_effect=AssertionError("header read twice")):
+                self.assertEqual(cache.get(self.file), h)
+            # a rewritten file is read again
+            write_ts(self.file, monthly_bounds(2))
+            os.utime(self.file, ns=(0, 0))
+            self.assertEqual(cache.get(self.file).nrec, 24)
+            os.remove(self.file)
+            self.assertEqual(cache.prune(), 1)
+
+    def test_main(self):
+        self.assertEqual(self.run_main(['-d', self.db, 'timename', self.file]), (0, ['time']))
+        self.assertEqual(self.run_main(['-d', self.db, 'nrec', self.file, self.file]),
+            (0, ['12', '12']))
+        self.assertEqual(self.run_main(['has', 'climatology_bounds', self.file]), (0, ['0']))
+        self.assertEqual(self.run_main(['dim', 'lat', self.file]), (0, ['3']))
+        self.assertEqual(self.run_main(['attr', 'filename', self.file]), (0, [self.file]))
+        self.assertEqual(self.run_main(['-d', self.db, 'shuffle', self.file]), (0, ['false']))
+        self.assertEqual(self.run_main(['dim', 'lev', self.file])[0], 1)
+        with netCDF4.Dataset(self.file, 'a') as ds:
+            ds.associated_files = ('areacella: 19800101.atmos_static.nc '
+                'land_area: 19800101.land_static.nc areacella: 19800101.atmos_static.nc')
+        self.assertEqual(self.run_main(['associated_files', self.file]),
+            (0, ['19800101.atmos_static.nc', '19800101.land_static.nc']))
+
+        static = os.path.join(self.dir, 'static.nc')
+        with netCDF4.Dataset(static, 'w') as ds:
+            ds.createDimension('lat', 3)
+            ds.createVariable('land_mask', 'f4', ('lat',))[:] = np.ones(3)
+        self.assertEqual(self.run_main(['timename', static])[0], 1)
+        self.assertEqual(self.run_main(['nrec', static]), (0, ['0']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import netCDF4
+from pyFRE.frepp import plevel
+from pyFRE.frepp.tests.nc_fixtures import monthly_bounds
+
+PK = np.array([0., 5000., 20000., 30000., 20000., 0.])
+BK = np.array([0., 0., 0.1, 0.4, 0.75, 1.])
+
+def write_model_levels(path, nt=5, nlat=3, nlon=4, ps=None, caltype='NOLEAP'):
+    """Write an atmos history file on 5 hybrid levels, with temp equal to
+    log(full-level pressure) so that log-pressure interpolation is exact.
+    Returns (ps, pf).
+    """
+    bnds = monthly_bounds(1)[:nt]
+    if ps is None:
+        ps = np.linspace(95000., 102000., nt * nlat * nlon).reshape(nt, nlat, nlon)
+    ph = PK[None, :, None, None] + BK[None, :, None, None] * ps[:, None]
+    pf = plevel.full_level_pressure(ph)
+    with netCDF4.Dataset(path, 'w', format='NETCDF4_CLASSIC') as ds:
+        ds.createDimension('time', None)
+        ds.createDimension('nv', 2)
+        ds.createDimension('phalf', len(PK))
+        ds.createDimension('pfull', len(PK) - 1)
+        ds.createDimension('lat', nlat)
+        ds.createDimension('lon', nlon)
+        t = ds.createVariable('time', 'f8', ('time',))
+        t.units = 'days since 0001-01-01 00:00:00'
+        t.calendar_type = caltype
+        t.bounds = 'time_bounds'
+        ds.createVariable('time_bounds', 'f8', ('time', 'nv'))[:] = bnds
+        t[:] = bnds.mean(axis=1)
+        ds.createVariable('phalf', 'f8', ('phalf',))[:] = PK / 100. + BK * 1000.
+        ds.createVariable('pfull', 'f8', ('pfull',))[:] = np.arange(len(PK) - 1)
+        ds.createVariable('lat', 'f8', ('lat',))[:] = np.linspace(-60, 60, nlat)
+        ds.createVariable('lon', 'f8', ('lon',))[:] = np.linspace(0, 270, nlon)
+        ds.createVariable('pk', 'f8', ('phalf',))[:] = PK
+        ds.createVariable('bk', 'f8', ('phalf',))[:] = BK
+        ds.createVariable('ps', 'f4', ('time', 'lat', 'lon'))[:] = ps
+        ds.createVariable('zsurf', 'f4', ('lat', 'lon'))[:] = 1.
+        temp = ds.createVariable('temp', 'f8', ('time', 'pfull', 'lat', 'lon'))
+        temp.units = 'K'
+        temp[:] = np.log(pf)
+        ds.createVariable('ucomp', 'f4', ('time', 'pfull', 'lat', 'lon'))[:] = 2.
+    return ps, pf
+
+class TestInterpolate(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.infile = os.path.join(self.tmp.name, 'modellevels.nc')
+        self.outfile = os.path.join(self.tmp.name, 'plev.nc')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_level_sets(self):
+        for name, levels in plevel.LEVEL_SETS.items():
+            self.assertTrue(all(100 <= p <= 105000 for p in levels), name)
+        self.assertEqual(len(plevel.LEVEL_SETS['narcaap']), 42)
+
+    def test_interpolate(self):
+        ps, pf = write_model_levels(self.infile)
+        levels = [100000., 85000., 50000., 25000.]
+        names = plevel.interpolate(self.infile, self.outfile, levels, chunk_mb=1e-4)
+        self.assertEqual(names, ['temp', 'ucomp'])
+        with netCDF4.Dataset(self.outfile) as ds:
+            self.assertNotIn('bk', ds.variables)
+            self.assertNotIn('pfull', ds.dimensions)
+            self.assertEqual(ds['temp'].dimensions, ('time', 'level', 'lat', 'lon'))
+            np.testing.assert_allclose(ds['level'][:], [1000., 850., 500., 250.])
+            np.testing.assert_allclose(ds['zsurf'][:], 1.)
+            self.assertEqual(ds['time'].calendar, 'noleap')
+            temp = ds['temp'][:]
+            for i, p in enumerate(levels):
+                below = p > ps
+                self.assertTrue(np.all(np.ma.getmaskarray(temp[:, i])[below]))
+                inside = (p <= pf[:, -1]) & (p >= pf[:, 0])
+                np.testing.assert_allclose(temp[:, i][inside], np.log(p))
+                # between the lowest full level and the surface
+                near = ~below & (p > pf[:, -1])
+                np.testing.assert_allclose(temp[:, i][near], np.log(pf[:, -1][near]))
+            self.assertTrue(np.ma.is_masked(temp))
+            np.testing.assert_allclose(ds['ucomp'][:, :, 0, 0].compressed(), 2.)
+
+    def test_chunking_is_invisible(self):
+        write_model_levels(self.infile)
+        other = os.path.join(self.tmp.name, 'big.nc')
+        plevel.interpolate(self.infile, self.outfile, 'am3', ['temp'], chunk_mb=1e-4)
+        plevel.interpolate(self.infile, other, 'am3', ['temp'], chunk_mb=100)
+        with netCDF4.Dataset(self.outfile) as a, netCDF4.Dataset(other) as b:
+            self.assertNotIn('ucomp', a.variables)
+            np.testing.assert_array_equal(a['temp'][:], b['temp'][:])
+
+    def test_not_3d(self):
+        write_model_levels(self.infile)
+        names = plevel.interpolate(self.infile, self.outfile, 'ncep',
+            ['temp', 'zsurf', 'ps'])
+        self.assertEqual(names, ['temp'])
+        with netCDF4.Dataset(self.outfile) as ds:
+            self.assertNotIn('ucomp', ds.variables)
+            np.testing.assert_allclose(ds['zsurf'][:], 1.)
+        with self.assertRaises(plevel.PlevelError):
+            plevel.interpolate(self.infile, self.outfile, 'ncep', ['temp', 'vcomp'])
+
+    def test_calendar(self):
+        write_model_levels(self.infile, caltype='THIRTY_DAY_MONTHS')
+        plevel.interpolate(self.infile, self.outfile, 'ncep_subset')
+        with netCDF4.Dataset(self.outfile) as ds:
+            self.assertEqual(ds['time'].calendar, '360_day')
+            self.assertEqual(ds['time_bounds'].calendar, '360_day')
+
+    def test_missing_required(self):
+        with netCDF4.Dataset(self.infile, 'w') as ds:
+            ds.createDimension('time', None)
+            ds.createVariable('ps', 'f4', ('time',))
+        with self.assertRaises(plevel.PlevelError):
+            plevel.interpolate(self.infile, self.outfile, 'ncep')
+        self.assertFalse(os.path.exists(self.outfile))
+
+    def test_main(self):
+        write_model_levels(self.infile)
+        self.assertEqual(plevel.main(['-l', 'ncep', '-i', self.infile,
+            '-o', self.outfile, 'temp,ucomp']), 0)
+        self.assertEqual(plevel.main(['-l', '85000 50000', '-i', self.infile,
+            '-o', self.outfile, 'vcomp']), 1)
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+            self.assertEqual(plevel.main(['-l', 'ncep_subset', '--list']), 0)
+        self.assertEqual(out.getvalue(), "92500 85000 70000 50000 25000\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import netCDF4
+from pyFRE.frepp import segsplit
+from pyFRE.frepp.tests.nc_fixtures import monthly_bounds, write_ts
+
+class TestSegSplit(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_year(self, nmonths, source='atmos_month', date='1980', fmt='NETCDF4_CLASSIC'):
+        bnds = monthly_bounds(1)
+        data = dict()
+        for start in range(1, 13, nmonths):
+            path = os.path.join(self.dir, segsplit.history_name(date, start, source))
+            data[start] = write_ts(path, bnds[start - 1:start - 1 + nmonths], fmt=fmt,
+                data=np.arange(nmonths * 12, dtype='f4').reshape(nmonths, 3, 4) + 100 * start)
+        return bnds
+
+    def test_plan(self):
+        plan = segsplit.segment_plan('1980', 4, 'atmos')
+        self.assertEqual(list(plan), ['19800101.atmos.nc', '19800501.atmos.nc', '19800901.atmos.nc'])
+        self.assertEqual(plan['19800501.atmos.nc'], ['19800501.atmos.nc', '19800601.atmos.nc',
+            '19800701.atmos.nc', '19800801.atmos.nc'])
+        dec = segsplit.segment_plan('1979', 6, 'atmos', months={12})
+        self.assertEqual(dec, {'19790701.atmos.nc': [None] * 5 + ['19791201.atmos.nc']})
+        with self.assertRaises(segsplit.SegmentError):
+            segsplit.segment_plan('1980', 5, 'atmos')
+
+    def test_split_year(self):
+        bnds = self.write_year(6, fmt='NETCDF3_64BIT_OFFSET')
+        written = segsplit.split_year('1980', 6, 'atmos_month', workdir=self.dir)
+        self.assertEqual(len(written), 12)
+        for month in range(1, 13):
+            path = os.path.join(self.dir, segsplit.history_name('1980', month, 'atmos_month'))
+            with netCDF4.Dataset(path) as ds:
+                self.assertEqual(ds.data_model, 'NETCDF3_64BIT_OFFSET')
+                self.assertEqual(len(ds.dimensions['time']), 1)
+                np.testing.assert_array_equal(ds['time_bounds'][0], bnds[month - 1])
+                start = 1 if month <= 6 else 7
+                i = month - start
+                np.testing.assert_array_equal(ds['tas'][0],
+                    np.arange(12 * i, 12 * i + 12).reshape(3, 4) + 100 * start)
+                np.testing.assert_array_equal(ds['lat'][:], np.linspace(-60, 60, 3))
+                self.assertEqual(ds['time'].calendar, 'noleap')
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(os.path.basename(p) for p in written))
+
+    def test_december_only(self):
+        self.write_year(3, date='1979')
+        written = segsplit.split_year('1979', 3, 'atmos_month', months={12}, workdir=self.dir)
+        self.assertEqual(written, [os.path.join(self.dir, '19791201.atmos_month.nc')])
+        with netCDF4.Dataset(written[0]) as ds:
+            np.testing.assert_array_equal(ds['tas'][0], np.arange(24, 36).reshape(3, 4) + 1000)
+        # the segment files are untouched
+        with netCDF4.Dataset(os.path.join(self.dir, '19791001.atmos_month.nc')) as ds:
+            self.assertEqual(len(ds.dimensions['time']), 3)
+
+    def test_tiles(self):
+        for tile in (1, 2):
+            self.write_year(4, source=f'atmos_month.tile{tile}')
+            with open(os.path.join(self.dir, f'19800101.grid_spec.tile{tile}.nc'), 'w') as f:
+                f.write('grid')
+        self.assertEqual(segsplit.main(['-y', '1980', '-n', '4', '-t', '2', '-g', '-j', '2',
+            '-C', self.dir, 'atmos_month']), 0)
+        for tile in (1, 2):
+            for month in range(1, 13):
+                path = os.path.join(self.dir, f'1980{month:02d}01.atmos_month.tile{tile}.nc')
+                with netCDF4.Dataset(path) as ds:
+                    self.assertEqual(len(ds.dimensions['time']), 1)
+            grid = os.path.join(self.dir, f'19800601.grid_spec.tile{tile}.nc')
+            self.assertTrue(os.path.samefile(grid,
+                os.path.join(self.dir, f'19800101.grid_spec.tile{tile}.nc')))
+
+    def test_short_file(self):
+        bnds = monthly_bounds(1)
+        write_ts(os.path.join(self.dir, '19800101.atmos_month.nc'), bnds[:2])
+        self.assertEqual(segsplit.main(['-y', '1980', '-n', '6', '-C', self.dir,
+            '-m', '1,2,3', 'atmos_month']), 1)
+        self.assertEqual(os.listdir(self.dir), ['19800101.atmos_month.nc'])
+
+if __name__ == '__main__':
+    unittest.main()
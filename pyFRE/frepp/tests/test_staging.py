@@ -0,0 +1,166 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+from pyFRE.frepp import staging
+
+def _write_tar(path, names):
+    with tarfile.open(path, 'w') as tar:
+        for name in names:
+            data = name.encode()
+            info = tarfile.TarInfo(f'./{name}')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+class StagingTestCase(unittest.TestCase):
+    members = ['19800101.atmos_month.nc', '19800101.ocean_month.nc',
+        '19800101.atmos_daily.tile1.nc']
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archdir = os.path.join(self.tmp.name, 'history')
+        self.cachedir = os.path.join(self.tmp.name, 'ptmp')
+        self.workdir = os.path.join(self.tmp.name, 'work')
+        os.makedirs(self.archdir)
+        for name in ('19800101.nc.tar', '19800701.nc.tar', '19810101.nc.tar',
+            '19820101.raw.nc.tar'):
+            _write_tar(os.path.join(self.archdir, name), self.members)
+        with open(os.path.join(self.archdir, 'notes.txt'), 'w') as f:
+            f.write('x')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def archive(self, name):
+        return os.path.join(self.archdir, name)
+
+class TestListArchives(StagingTestCase):
+    def test_list(self):
+        self.assertEqual(staging.list_archives(self.archdir), {
+            '1980': [self.archive('19800101.nc.tar'), self.archive('19800701.nc.tar')],
+            '1981': [self.archive('19810101.nc.tar')]
+        })
+        self.assertEqual(staging.list_archives(self.archdir, [1981, 1990]),
+            {'1981': [self.archive('19810101.nc.tar')]})
+        self.assertEqual(staging.list_archives(self.archdir, raw=True),
+            {'1982': [self.archive('19820101.raw.nc.tar')]})
+
+    def test_hsmdate(self):
+        self.assertEqual(staging.hsmdate('/a/19800101.nc.tar'), '19800101.nc')
+        self.assertEqual(staging.hsmdate('19800101.nc.cpio'), '19800101.nc')
+
+class TestExtract(StagingTestCase):
+    def test_tar(self):
+        dest = os.path.join(self.tmp.name, 'out')
+        match = staging.member_filter(['atmos_month', 'atmos_daily'])
+        names = staging.extract(self.archive('19800101.nc.tar'), dest, match)
+        self.assertEqual(names, ['19800101.atmos_daily.tile1.nc', '19800101.atmos_month.nc'])
+        self.assertEqual(sorted(os.listdir(dest)), names)
+        # skipped members are reported but not rewritten
+        os.remove(os.path.join(dest, names[0]))
+        self.assertEqual(staging.extract(self.archive('19800101.nc.tar'), dest, match,
+            skip=names), names)
+        self.assertEqual(os.listdir(dest), [names[1]])
+
+    def test_member_filter(self):
+        self.assertTrue(staging.member_filter([])('anything'))
+        match = staging.member_filter(['ocean_month', ''])
+        self.assertTrue(match('./19800101.ocean_month.nc'))
+        self.assertFalse(match('19800101.ocean_month_z.nc'))
+
+    @unittest.skipIf(shutil.which('cpio') is None, "cpio not installed")
+    def test_cpio(self):
+        src = os.path.join(self.tmp.name, 'src')
+        staging.extract(self.archive('19800101.nc.tar'), src)
+        archive = os.path.join(self.archdir, '19830101.nc.cpio')
+        with open(archive, 'wb') as f:
+            staging.subprocess.run(['cpio', '-o', '--quiet'], cwd=src, stdout=f,
+                input='\n'.join(self.members).encode(), check=True)
+        dest = os.path.join(self.tmp.name, 'out')
+        names = staging.extract(archive, dest, staging.member_filter(['ocean_month']))
+        self.assertEqual(names, ['19800101.ocean_month.nc'])
+        self.assertEqual(os.listdir(dest), names)
+
+class TestStager(StagingTestCase):
+    def test_stage(self):
+        archives = [self.archive('19800101.nc.tar'), self.archive('19800701.nc.tar')]
+        stager = staging.Stager(self.workdir, self.cachedir, ['atmos_month'], nworkers=1)
+        with mock.patch.object(staging, 'recall') as recall:
+            works = stager.stage(archives, prefetch=[self.archive('19810101.nc.tar')])
+        self.assertEqual(works, [os.path.join(self.workdir, '19800101.nc'),
+            os.path.join(self.workdir, '19800701.nc')])
+        # one recall per batch, then the prefetch
+        self.assertEqual([c.args[0] for c in recall.call_args_list],
+            [archives[:1], archives[1:], [self.archive('19810101.nc.tar')]])
+        for work in works:
+            self.assertEqual(sorted(os.listdir(work)),
+                ['.staged', '19800101.atmos_month.nc'])
+        self.assertEqual(os.listdir(os.path.join(self.cachedir, '19800101.nc')),
+            ['19800101.atmos_month.nc'])
+        staging.wait(self.workdir, archives, timeout=0)
+
+    def test_reuses_cache(self):
+        archive = self.archive('19800101.nc.tar')
+        stager = staging.Stager(self.workdir, self.cachedir, ['ocean_month'])
+        stager.stage([archive])
+        shutil.rmtree(self.workdir)
+        with mock.patch.object(staging.tarfile.TarFile, 'extractall') as extractall:
+            stager.stage([archive])
+        self.assertEqual(extractall.call_args.kwargs['members'], [])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.workdir, '19800101.nc', '19800101.ocean_month.nc')))
+
+    def test_failure(self):
+        bad = os.path.join(self.archdir, '19840101.nc.tar')
+        with open(bad, 'w') as f:
+            f.write('not a tarball')
+        stager = staging.Stager(self.workdir, self.cachedir)
+        with self.assertRaises(tarfile.TarError):
+            stager.stage([bad])
+        with self.assertRaises(RuntimeError):
+            staging.wait(self.workdir, [bad], timeout=0)
+
+    def test_wait_timeout(self):
+        with self.assertRaises(TimeoutError):
+            staging.wait(self.workdir, [self.archive('19800101.nc.tar')],
+                timeout=0, poll=0)
+
+class TestMain(StagingTestCase):
+    def test_stage_and_wait(self):
+        self.assertEqual(staging.main(['wait', '-a', self.archdir, '-w', self.workdir,
+            '-t', '0', '1980']), 1)
+        with mock.patch.object(staging, 'recall') as recall:
+            self.assertEqual(staging.main(['stage', '-a', self.archdir,
+                '-p', self.cachedir, '-w', self.workdir, '-s', 'atmos_month ocean_month',
+                '--prefetch-year', '1981', '1980']), 0)
+        self.assertEqual(recall.call_args.args[0], [self.archive('19810101.nc.tar')])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.workdir, '19800701.nc'))),
+            ['.staged', '19800101.atmos_month.nc', '19800101.ocean_month.nc'])
+        self.assertEqual(staging.main(['wait', '-a', self.archdir, '-w', self.workdir,
+            '-t', '0', '1980']), 0)
+
+    def test_stage_failure_marks_archives(self):
+        with mock.patch.object(staging, 'recall', side_effect=OSError('tape')):
+            self.assertEqual(staging.main(['stage', '-a', self.archdir,
+                '-p', self.cachedir, '-w', self.workdir, '1981']), 1)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.workdir, '19810101.nc', staging.FAILED_MARKER)))
+
+    def test_clear(self):
+        # markers of an earlier attempt don't satisfy the next wait
+        with mock.patch.object(staging, 'recall'):
+            staging.main(['stage', '-a', self.archdir, '-p', self.cachedir,
+                '-w', self.workdir, '1980'])
+        self.assertEqual(staging.main(['clear', '-a', self.archdir,
+            '-w', self.workdir, '1980']), 0)
+        self.assertNotIn(staging.STAGED_MARKER,
+            os.listdir(os.path.join(self.workdir, '19800701.nc')))
+        with self.assertRaises(TimeoutError):
+            staging.wait(self.workdir, staging.list_archives(self.archdir, [1980])['1980'],
+                timeout=0, poll=0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pyFRE.frepp import statestore
+
+class TestStateStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.store = statestore.StateStore(os.path.join(self.dir, 'state.db'))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_get_set(self):
+        self.assertIsNone(self.store.get('atmos', 1981))
+        self.store.set('atmos', 1981, '12345\n')
+        self.assertEqual(self.store.get('atmos', '1981'), '12345')
+        self.store.set('atmos', 1981, 'OK')
+        self.assertEqual(self.store.get('atmos', 1981), 'OK')
+        self.store.delete('atmos', 1981)
+        self.assertEqual(self.store.get('atmos', 1981, ''), '')
+
+    def test_bulk(self):
+        self.store.set_many([('atmos', y, s) for y, s in
+            [(1981, 'OK'), (1982, 'ERROR'), (1983, '101'), (1984, 'OK')]])
+        self.store.set('ocean', 1982, 'FATAL')
+        self.assertEqual(self.store.get_many('atmos', [1981, 1983, 1985]),
+            {'1981': 'OK', '1983': '101'})
+        self.assertEqual(self.store.not_ok('atmos'), {'1982': 'ERROR', '1983': '101'})
+        self.assertEqual(self.store.items('ocean'), [('ocean', '1982', 'FATAL')])
+        self.assertEqual(len(self.store.items()), 5)
+
+    def test_transition(self):
+        self.assertTrue(self.store.transition('atmos', 1981, '101', expect=(None, 'ERROR')))
+        self.assertFalse(self.store.transition('atmos', 1981, '102', expect=(None, 'ERROR')))
+        self.assertEqual(self.store.get('atmos', 1981), '101')
+        self.assertTrue(self.store.transition('atmos', 1981, 'OK', expect=('101',)))
+
+    def test_wal(self):
+        mode = self.store._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_legacy_roundtrip(self):
+        legacy = os.path.join(self.dir, 'legacy')
+        os.makedirs(legacy)
+        for name, state in [('atmos.1981', 'OK'), ('atmos_month.1982', '101'),
+            ('ocean.1982', 'HISTORYDATAERROR')]:
+            with open(os.path.join(legacy, name), 'w') as f:
+                f.write(state + '\n')
+        with open(os.path.join(legacy, 'frepp.log'), 'w') as f:
+            f.write('not a statefile\n')
+
+        with statestore.StateStore.for_statedir(legacy) as store:
+            self.assertEqual(store.items(), [('atmos', '1981', 'OK'),
+                ('atmos_month', '1982', '101'), ('ocean', '1982', 'HISTORYDATAERROR')])
+            self.assertEqual(store.import_legacy(legacy), 0)
+            store.set('atmos', 1981, 'ERROR')
+            out = os.path.join(self.dir, 'out')
+            os.makedirs(out)
+            self.assertEqual(store.export_legacy(out), 3)
+        with open(os.path.join(out, 'atmos.1981')) as f:
+            self.assertEqual(f.read(), 'ERROR\n')
+        self.assertEqual(sorted(os.listdir(out)),
+            ['atmos.1981', 'atmos_month.1982', 'ocean.1982'])
+
+class TestCLI(unittest.TestCase):
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(statestore.main(['-d', tmp, 'set', 'atmos.1981', 'OK']), 0)
+            statestore.main(['-d', tmp, 'set', 'atmos.1982', 'ERROR'])
+            with mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+                statestore.main(['-d', tmp, 'get', 'atmos.1981'])
+                statestore.main(['-d', tmp, 'list', 'atmos', '--not-ok'])
+            self.assertEqual(out.getvalue(), 'OK\natmos.1982 ERROR\n')
+            statestore.main(['-d', tmp, 'clear', 'atmos.1981'])
+            self.assertEqual(statestore.main(['-d', tmp, 'get', 'atmos.1981']), 1)
+
+    def test_setstate_csh(self):
+        self.assertEqual(statestore.setstate_csh('OK'),
+            "$PYFRE_ENGINE pyFRE.frepp.statestore -d $statedb set $statefile OK\n")
+        self.assertEqual(statestore.split_key('atmos.month.1981'), ('atmos.month', '1981'))
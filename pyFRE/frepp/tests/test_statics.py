@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import netCDF4
+from pyFRE.frepp import ncheader, statics
+from pyFRE.frepp.tests.nc_fixtures import monthly_bounds, write_ts
+
+def add_statics(path, nlat=3, nlon=4, cell_measures=None, extra=True):
+    """Add static fields to the time series file at *path*."""
+    with netCDF4.Dataset(path, 'a') as ds:
+        land = ds.createVariable('land_mask', 'f4', ('lat', 'lon'))
+        land[:] = np.arange(nlat * nlon).reshape(nlat, nlon)
+        if cell_measures:
+            land.cell_measures = cell_measures
+        if extra:
+            ds.createVariable('zsurf', 'f4', ('lat', 'lon'))[:] = 1.
+            ds.createDimension('z', 2)
+            ds.createVariable('cube', 'f4', ('z', 'lat', 'lon'))[:] = 2.
+
+class TestStatics(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.out = os.path.join(self.dir, 'atmos.static.nc')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def history(self, name, **kwargs):
+        path = os.path.join(self.dir, name)
+        write_ts(path, monthly_bounds(1))
+        add_statics(path, **kwargs)
+        return path
+
+    def test_extract(self):
+        a = self.history('19800101.atmos_month.nc')
+        b = self.history('19800101.atmos_daily.nc')
+        written = statics.extract([a, b], self.out)
+        self.assertEqual(written, ['land_mask', 'zsurf'])
+        with netCDF4.Dataset(self.out) as ds:
+            self.assertEqual(sorted(ds.variables), ['land_mask', 'lat', 'lon', 'zsurf'])
+            self.assertEqual(sorted(ds.dimensions), ['lat', 'lon'])
+            np.testing.assert_array_equal(ds['land_mask'][:], np.arange(12).reshape(3, 4))
+            np.testing.assert_array_equal(ds['lat'][:], np.linspace(-60, 60, 3))
+            self.assertEqual(ds.filename, 'atmos.static.nc')
+        # appending to an existing static file
+        self.assertEqual(statics.extract([a], self.out, max_rank=3), ['cube'])
+        with netCDF4.Dataset(self.out) as ds:
+            self.assertEqual(ds['cube'].dimensions, ('z', 'lat', 'lon'))
+
+    def test_conflict(self):
+        a = self.history('19800101.atmos_month.nc')
+        b = os.path.join(self.dir, '19800101.atmos_coarse.nc')
+        write_ts(b, monthly_bounds(1), nlat=2)
+        add_statics(b, nlat=2, extra=False)
+        with netCDF4.Dataset(b, 'a') as ds:
+            ds.renameVariable('land_mask', 'frac')
+        self.assertEqual(statics.main(['-o', self.out, a, b]), 1)
+
+    def test_associated(self):
+        with netCDF4.Dataset(os.path.join(self.dir, '19800101.atmos_static.nc'), 'w') as ds:
+            ds.createDimension('lat', 3)
+            ds.createDimension('lon', 4)
+            ds.createVariable('area', 'f8', ('lat', 'lon'))[:] = 5.
+        a = self.history('19800101.atmos_month.nc', cell_measures='area: area', extra=False)
+        with netCDF4.Dataset(a, 'a') as ds:
+            ds.associated_files = 'area: 19800101.atmos_static.nc'
+        db = os.path.join(self.dir, ncheader.DB_NAME)
+        self.assertEqual(statics.main(['-o', self.out, '-a', self.dir, '-d', db, a]), 0)
+        with netCDF4.Dataset(self.out) as ds:
+            np.testing.assert_array_equal(ds['area'][:], 5.)
+        with ncheader.HeaderCache(db) as cache:
+            self.assertIn(os.path.realpath(a), [r[0] for r in
+                cache._conn.execute("SELECT path FROM headers")])
+
+    def test_tiles(self):
+        files = [self.history(f'19800101.atmos_month.tile{i}.nc') for i in range(1, 7)]
+        self.assertEqual(statics.main(['-o', self.out, '-j', '3'] + files), 0)
+        for i in range(1, 7):
+            with netCDF4.Dataset(os.path.join(self.dir, f'atmos.static.tile{i}.nc')) as ds:
+                self.assertEqual(sorted(ds.variables), ['land_mask', 'lat', 'lon', 'zsurf'])
+        self.assertFalse(os.path.exists(self.out))
+
+    def test_no_tiles(self):
+        # one tile's 1-D fields go to the (regridded) component static file
+        tile = self.history('19800101.atmos_month.tile1.nc')
+        with netCDF4.Dataset(tile, 'a') as ds:
+            ds.createVariable('zlat', 'f4', ('lat',))[:] = 3.
+        self.assertEqual(statics.main(['-n', '-r', '1', '-o', self.out, tile]), 0)
+        with netCDF4.Dataset(self.out) as ds:
+            self.assertEqual(sorted(ds.variables), ['lat', 'zlat'])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'atmos.static.tile1.nc')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import netCDF4
+from pyFRE.frepp import tsengine
+from pyFRE.frepp.tests import nc_fixtures
+
+class TestAnnualMeans(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.bnds = nc_fixtures.monthly_bounds(3)
+        self.infile = os.path.join(self.dir, 'atmos.000101-000312.tas.nc')
+        self.data = nc_fixtures.write_ts(self.infile, self.bnds)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_annual_means(self):
+        outfiles = tsengine.annual_means(self.infile, self.dir, 'atmos', 1)
+        self.assertEqual([os.path.basename(f) for f in outfiles],
+            ['atmos.0001.tas.nc', 'atmos.0002.tas.nc', 'atmos.0003.tas.nc'])
+        w = np.array(nc_fixtures.NOLEAP_MONTH_DAYS, dtype='f8')
+        for i, f in enumerate(outfiles):
+            with netCDF4.Dataset(f) as ds:
+                expected = np.average(self.data[12*i:12*(i+1)], axis=0, weights=w)
+                np.testing.assert_allclose(ds['tas'][0], expected, rtol=1e-6)
+                self.assertEqual(ds['average_T1'][0], 365.0 * i)
+                self.assertEqual(ds['average_T2'][0], 365.0 * (i+1))
+                self.assertEqual(ds['average_DT'][0], 365.0)
+                self.assertEqual(ds['time'][0], 365.0 * i + 182.5)
+                np.testing.assert_array_equal(ds['time_bounds'][0],
+                    [365.0 * i, 365.0 * (i+1)])
+                np.testing.assert_array_equal(ds['lat'][:],
+                    np.linspace(-60, 60, 3))
+
+    def test_missing_values(self):
+        data = np.ones((24, 3, 4), dtype='f4')
+        data[:6, 0, 0] = 1.0e20
+        data[12:, 1, 1] = 1.0e20
+        nc_fixtures.write_ts(self.infile, self.bnds[:24], data=data,
+            missing=1.0e20)
+        outfiles = tsengine.annual_means(self.infile, self.dir, 'atmos', 1)
+        with netCDF4.Dataset(outfiles[0]) as ds:
+            self.assertAlmostEqual(float(ds['tas'][0, 0, 0]), 1.0)
+        with netCDF4.Dataset(outfiles[1]) as ds:
+            self.assertTrue(np.ma.is_masked(ds['tas'][0, 1, 1]))
+
+    def test_too_few_records(self):
+        with self.assertRaises(tsengine.TSEngineError):
+            tsengine.annual_means(self.infile, self.dir, 'atmos', 1, nyears=4)
+
+    def test_cli(self):
+        self.assertEqual(tsengine.main(['annual', '-c', 'atmos', '-y', '10',
+            '-o', self.dir, self.infile]), 0)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'atmos.0012.tas.nc')))
+
+class TestHistoryAverages(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        # monthly history files for years 2-3, and December of year 1
+        bnds = nc_fixtures.monthly_bounds(3)
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(size=(36, 3, 4)).astype('f4')
+        self.files = []
+        for i in range(11, 36):
+            path = os.path.join(self.dir, f'{i // 12 + 1:04d}{i % 12 + 1:02d}01.atmos_month.nc')
+            nc_fixtures.write_ts(path, bnds[i:i+1], data=self.data[i:i+1])
+            self.files.append(path)
+        self.bnds = bnds
+        self.w = np.tile(nc_fixtures.NOLEAP_MONTH_DAYS, 3).astype('f8')
+        self.outdir = os.path.join(self.dir, 'out')
+        os.makedirs(self.outdir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def expected(self, months):
+        return np.average(self.data[months], axis=0, weights=self.w[months])
+
+    def test_all_products(self):
+        outfiles = tsengine.history_averages(self.files, self.outdir, 'atmos',
+            prev_dec=self.files[0])
+        names = sorted(os.path.basename(f) for f in outfiles)
+        self.assertEqual(len(names), 12 + 8 + 4 + 2)
+        self.assertIn('atmos.0002-0003.07.nc', names)
+        self.assertIn('atmos.0002.DJF.nc', names)
+        self.assertIn('atmos.0002-0003.SON.nc', names)
+        self.assertIn('atmos.0003.ann.nc', names)
+        # the December of the last year isn't part of a complete season
+        self.assertNotIn('atmos.0004.DJF.nc', names)
+
+        def read(name):
+            return netCDF4.Dataset(os.path.join(self.outdir, name))
+        with read('atmos.0002-0003.01.nc') as ds:
+            np.testing.assert_allclose(ds['tas'][0], self.expected([12, 24]), rtol=1e-6)
+            self.assertEqual(ds['time'].climatology, 'climatology_bounds')
+            self.assertNotIn('time_bounds', ds.variables)
+            np.testing.assert_array_equal(ds['climatology_bounds'][0],
+                [self.bnds[12, 0], self.bnds[24, 1]])
+            self.assertEqual(ds['average_DT'][0], 62.0)
+        with read('atmos.0002.DJF.nc') as ds:
+            np.testing.assert_allclose(ds['tas'][0], self.expected([11, 12, 13]), rtol=1e-6)
+            np.testing.assert_array_equal(ds['time_bounds'][0],
+                [self.bnds[11, 0], self.bnds[13, 1]])
+            self.assertEqual(ds['average_DT'][0], 90.0)
+        with read('atmos.0002-0003.DJF.nc') as ds:
+            np.testing.assert_allclose(ds['tas'][0],
+                self.expected([11, 12, 13, 23, 24, 25]), rtol=1e-6)
+        with read('atmos.0003.ann.nc') as ds:
+            np.testing.assert_allclose(ds['tas'][0], self.expected(list(range(24, 36))),
+                rtol=1e-6)
+            self.assertEqual(ds['average_DT'][0], 365.0)
+            np.testing.assert_array_equal(ds['lat'][:], np.linspace(-60, 60, 3))
+
+    def test_annual_matches_annual_means(self):
+        tsengine.history_averages(self.files[1:13], self.outdir, 'atmos', products=['annual'])
+        self.assertEqual(os.listdir(self.outdir), ['atmos.0002.ann.nc'])
+        with netCDF4.Dataset(os.path.join(self.outdir, 'atmos.0002.ann.nc')) as ds:
+            np.testing.assert_allclose(ds['tas'][0], self.expected(list(range(12, 24))),
+                rtol=1e-6)
+            self.assertFalse(hasattr(ds['time'], 'climatology'))
+
+    def test_cli(self):
+        self.assertEqual(tsengine.main(['histav', '-c', 'atmos', '-o', self.outdir,
+            '-p', 'seasonal', '-v', 'tas'] + self.files[1:13]), 0)
+        # no DJF without the previous December
+        self.assertEqual(sorted(os.listdir(self.outdir)),
+            ['atmos.0002.JJA.nc', 'atmos.0002.MAM.nc', 'atmos.0002.SON.nc'])
+        self.assertEqual(tsengine.main(['histav', '-c', 'atmos', '-o', self.outdir,
+            os.path.join(self.dir, 'missing.nc')]), 1)
+
+class TestSeasonalSeries(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        # monthly time series for years 2-5, and the one of year 1 before it
+        bnds = nc_fixtures.monthly_bounds(5)
+        rng = np.random.default_rng(1)
+        self.data = rng.normal(size=(60, 3, 4)).astype('f4')
+        self.prev = os.path.join(self.dir, 'atmos.000101-000112.tas.nc')
+        nc_fixtures.write_ts(self.prev, bnds[:12], data=self.data[:12])
+        self.infile = os.path.join(self.dir, 'atmos.000201-000512.tas.nc')
+        nc_fixtures.write_ts(self.infile, bnds[12:], data=self.data[12:])
+        self.bnds = bnds
+        self.w = np.tile(nc_fixtures.NOLEAP_MONTH_DAYS, 5).astype('f8')
+        self.outdir = os.path.join(self.dir, 'out')
+        os.makedirs(self.outdir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def expected(self, months):
+        return np.average(self.data[months], axis=0, weights=self.w[months])
+
+    def test_seasonal_series(self):
+        outfiles = tsengine.seasonal_series(self.infile, self.outdir, 'atmos', 2,
+            chunk_years=2, prev_dec=self.prev)
+        self.assertEqual([os.path.basename(f) for f in outfiles],
+            [f'atmos.{y}.{s}.tas.nc' for y in ('0002-0003', '0004-0005')
+                for s in tsengine.SEASONS])
+        with netCDF4.Dataset(os.path.join(self.outdir, 'atmos.0002-0003.DJF.tas.nc')) as ds:
+            self.assertEqual(len(ds.dimensions['time']), 2)
+            self.assertEqual(ds.filename, 'atmos.0002-0003.DJF.tas.nc')
+            np.testing.assert_allclose(ds['tas'][0], self.expected([11, 12, 13]), rtol=1e-6)
+            np.testing.assert_allclose(ds['tas'][1], self.expected([23, 24, 25]), rtol=1e-6)
+            np.testing.assert_array_equal(ds['time_bounds'][:],
+                [[self.bnds[11, 0], self.bnds[13, 1]], [self.bnds[23, 0], self.bnds[25, 1]]])
+            np.testing.assert_array_equal(ds['average_DT'][:], [90.0, 90.0])
+        with netCDF4.Dataset(os.path.join(self.outdir, 'atmos.0004-0005.SON.tas.nc')) as ds:
+            np.testing.assert_allclose(ds['tas'][1], self.expected([56, 57, 58]), rtol=1e-6)
+            self.assertEqual(ds['time'][1], 0.5 * (self.bnds[56, 0] + self.bnds[58, 1]))
+
+    def rebase_prev(self, units, offset, scale=1.):
+        with netCDF4.Dataset(self.prev, 'a') as ds:
+            ds['time'].units = units
+            for name in ('time', 'time_bounds', 'average_T1', 'average_T2'):
+                ds[name][:] = (ds[name][:] - offset) * scale
+
+    def test_prev_dec_units(self):
+        # the previous December is converted to the chunk's time units
+        self.rebase_prev('days since 0001-12-01 00:00:00', 334.)
+        tsengine.seasonal_series(self.infile, self.outdir, 'atmos', 2,
+            chunk_years=2, prev_dec=self.prev)
+        with netCDF4.Dataset(os.path.join(self.outdir, 'atmos.0002-0003.DJF.tas.nc')) as ds:
+            np.testing.assert_allclose(ds['tas'][0], self.expected([11, 12, 13]), rtol=1e-6)
+            self.assertEqual(ds['time_bounds'][0, 0], self.bnds[11, 0])
+            np.testing.assert_array_equal(ds['average_DT'][:], [90.0, 90.0])
+
+    def test_prev_dec_other_unit(self):
+        self.rebase_prev('hours since 0001-01-01 00:00:00', 0., 24.)
+        with self.assertRaises(tsengine.TSEngineError):
+            tsengine.seasonal_series(self.infile, self.outdir, 'atmos', 2,
+                prev_dec=self.prev)
+
+    def test_run_start(self):
+        # the first DJF of a run uses the December of its own year
+        tsengine.seasonal_series(self.prev, self.outdir, 'atmos', 1, run_start=True)
+        with netCDF4.Dataset(os.path.join(self.outdir, 'atmos.0001-0001.DJF.tas.nc')) as ds:
+            np.testing.assert_allclose(ds['tas'][0], self.expected([0, 1, 11]), rtol=1e-6)
+
+    def test_missing_december(self):
+        with self.assertRaises(tsengine.TSEngineError):
+            tsengine.seasonal_series(self.infile, self.outdir, 'atmos', 2)
+        # not the December before the first year
+        with self.assertRaises(tsengine.TSEngineError):
+            tsengine.seasonal_series(self.infile, self.outdir, 'atmos', 3,
+                prev_dec=self.prev)
+
+    def test_cli(self):
+        self.assertEqual(tsengine.main(['seasonal', '-c', 'atmos', '-y', '2', '-n', '4',
+            '-D', self.prev, '-z', '-d 2 -s', '-o', self.outdir, self.infile]), 0)
+        self.assertEqual(len(os.listdir(self.outdir)), 4)
+        with netCDF4.Dataset(os.path.join(self.outdir, 'atmos.0002-0005.JJA.tas.nc')) as ds:
+            self.assertEqual(ds['tas'].filters()['complevel'], 2)
+            self.assertTrue(ds['tas'].filters()['shuffle'])
+        self.assertEqual(tsengine.main(['seasonal', '-c', 'atmos', '-y', '2', '-n', '3',
+            '-D', self.prev, '-o', self.outdir, self.infile]), 1)
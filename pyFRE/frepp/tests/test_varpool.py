@@ -0,0 +1,57 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pyFRE.frepp import varpool
+
+class TestForeachCsh(unittest.TestCase):
+    def test_serial(self):
+        csh = varpool.foreach_csh('var', 'a.nc b.nc', """
+            echo $var
+            """, "TEST", "test")
+        self.assertEqual(csh.split('\n')[1:4],
+            ['foreach var ( a.nc b.nc )', 'echo $var', 'end'])
+        self.assertNotIn('varpool', csh)
+
+    def test_pool(self):
+        csh = varpool.foreach_csh('var', 'a.nc b.nc', """
+            cp $file $outdir/$var
+            """, "TEST", "test", npool=4)
+        self.assertIn('pyFRE.frepp.varpool -j 4 -l test -w $work -v var', csh)
+        self.assertIn('if ( $?outdir ) setenv outdir "$outdir"', csh)
+        self.assertNotIn('setenv var ', csh)
+        self.assertIn('cp $file $outdir/$var', csh)
+
+    def test_csh_vars_referenced(self):
+        self.assertEqual(
+            varpool.csh_vars_referenced('$a ${b} $?c $#d $status', exclude=('d',)),
+            ['a', 'b', 'c']
+        )
+
+class TestRunPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.script = os.path.join(self.dir, 'body.sh')
+        with open(self.script, 'w') as f:
+            f.write('echo "got $var"\n'
+                'if [ "$var" = "bad" ]; then echo "ERROR" >> $work/.errors; exit 1; fi\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @mock.patch.object(varpool, 'SHELL', ['/bin/sh'])
+    def test_run_pool(self):
+        out = io.StringIO()
+        env = dict(os.environ, work=self.dir)
+        failed = varpool.run_pool(self.script, ['a', 'bad', 'c'], 2, self.dir,
+            env=env, out=out)
+        self.assertEqual(failed, ['bad'])
+        self.assertEqual(out.getvalue().split('\n')[:6],
+            ['# var = a', 'got a', '# var = bad', 'got bad', '# var = c', 'got c'])
+        with open(os.path.join(self.dir, '.errors')) as f:
+            self.assertEqual(f.read(), 'ERROR\n')
+        # scratch dirs of successful runs are removed
+        self.assertEqual(os.listdir(os.path.join(self.dir, '.pool.pool')),
+            ['00001.bad'])
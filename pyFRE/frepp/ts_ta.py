@@ -10,7 +10,7 @@ from textwrap import dedent
 
 from pyFRE.lib import FREUtil
 import pyFRE.util as util
-from . import logs, sub
+from . import logs, segsplit, sub, varpool, plevel
 
 import logging
 _log = logging.getLogger(__name__)
@@ -22,102 +22,51 @@ def zInterpolate(zInterp, infile, outfile, caltype, variables, source, pp):
     # frepp.pl l.3286
     csh = ""
 
-    #set up atmospheric pressure levels
-    ncep_levels = dedent("""
-        echo 'Using zInterp ncep'
-        set levels = (100000 92500 85000 70000 60000 50000 40000 30000 25000 20000 15000 \\
-                    10000  7000  5000  3000  2000  1000                               )
-    """)
-    am3_levels = dedent("""
-        echo 'Using zInterp am3'
-        set levels = (100000 92500 85000 70000 60000 50000 40000 30000 25000 20000 15000 \\
-                      10000  7000  5000  3000  2000  1000   500   300   200   100       )
-    """)
-    hs20_levels = dedent("""
-        echo 'Using zInterp hs20'
-        set levels = ( 2500  7500 12500 17500 22500 27500 32500 37500 42500 47500 \\
-                       52500 57500 62500 67500 72500 77500 82500 87500 92500 97500 )
-    """)
-    era40_levels = dedent("""
-        echo 'Using zInterp era40'
-        set levels = (100000 92500 85000 77500 70000 60000 50000 40000 30000 25000 20000 15000 \\
-                        10000  7000  5000  3000  2000  1000   700   500   300   200   100       )
-    """)
-    narcaap_levels = dedent("""
-        echo 'Using zInterp narcaap'
-        set levels = ( 2500  5000  7500  10000  12500  15000 17500 20000 22500 25000 27500 30000 \\
-                      32500 35000 37500  40000  42500  45000 47500 50000 52500 55000 57500 60000 \\
-                      62500 65000 67500  70000  72500  75000 77500 80000 82500 85000 87500 90000 \\
-                      92500 95000 97500 100000 102500 105000 )
-    """)
-    ar5daily_levels = dedent("""
-        echo 'Using zInterp ar5daily'
-        set levels = (100000 85000 70000 50000 25000 10000 5000 1000)
-    """)
-    ncepSubset_levels = dedent("""
-        echo 'Using zInterp ncep_subset'
-        set levels = ( 925 850 700 500 250 )
-    """)
-
-    if zInterp == "ncep": set_plevels = ncep_levels
-    elif zInterp == "am3": set_plevels = am3_levels
-    elif zInterp == "hs20": set_plevels = hs20_levels
-    elif zInterp == "era40": set_plevels = era40_levels
-    elif zInterp == "narcaap": set_plevels = narcaap_levels
-    elif zInterp == "ar5daily": set_plevels = ar5daily_levels
-    elif zInterp == "ncep_subset": set_plevels = ncepSubset_levels
-    elif zInterp == "zgrid": pass
-    else:
-        if zInterp:
-            logs.mailuser(f"zInterp {zInterp} not recognized, not interpolating {outfile}")
-            _log.error(f"zInterp {zInterp} not recognized, not interpolating {outfile}")
+    if zInterp in plevel.LEVEL_SETS or zInterp == "zgrid":
+        pass
+    elif zInterp:
+        logs.mailuser(f"zInterp {zInterp} not recognized, not interpolating {outfile}")
+        _log.error(f"zInterp {zInterp} not recognized, not interpolating {outfile}")
     check_plevel  = logs.errorstr(f"PLEVEL ({outfile})")
-    check_ncdump  = logs.errorstr(f"NCDUMP ({outfile})")
     check_ncks    = logs.errorstr(f"NCKS ({outfile})")
     check_zgrid   = logs.errorstr(f"ZGRID (Calling Resample_on_Z for {outfile})")
-    check_ncatted = logs.errorstr(f"NCATTED ({outfile})")
-    plev_command  = 'PLEVEL -a'
 
     if variables:
         variables = variables.replace(',', ' ')
         variables = variables.replace("'", '')
 
-        plev_command  = 'PLEVEL'
         if pp.opt['v']:
             count = len(variables.split())
             _log.info(f"will interpolate {count} variables to pressure levels for {infile}")
 
-    if zInterp in ("ncep", "am3", "narcaap", "hs20", "era40", "ar5daily", "ncep_subset"):
+    if zInterp in plevel.LEVEL_SETS:
+        # bk, pk, ps and all 3D variables are interpolated in one pass, with the
+        # CF calendar written directly; only the derived fields need PLEVEL
         csh += _template("""
-            set_plevels
-
-            set reqvars = `\NCVARS -st12 infile | grep -e '^ *bk\' -e '^ *pk\' -e '^ *ps\' -c`
-            set hgtvars = `\NCVARS -st23 infile | grep -e '^ *temp\' -e '^ *sphum\' -e '^ *zsurf\' -c`
-
-            set vars3d  = `\NCVARS -st3  infile`
-
-            if ( \reqvars == 3 && \#vars3d > 0 ) then
-                set vlist = ()
-                if ( \hgtvars == 3 ) then
-                    set vlist = (divv rvort hght slp)
+            echo 'Using zInterp $zInterp'
+            set reqvars = `\$NCVARS -st12 $infile | grep -e '^ *bk\$' -e '^ *pk\$' -e '^ *ps\$' -c`
+            set hgtvars = `\$NCVARS -st23 $infile | grep -e '^ *temp\$' -e '^ *sphum\$' -e '^ *zsurf\$' -c`
+
+            set vars3d  = `\$NCVARS -st3  $infile`
+
+            if ( \$reqvars == 3 && \$#vars3d > 0 ) then
+                $time_plevel \$PYFRE_ENGINE pyFRE.frepp.plevel -l $zInterp -C "$caltype" -i $infile -o plev.nc $variables
+                $check_plevel
+                if ( \$hgtvars == 3 ) then
+                    set levels = ( `\$PYFRE_ENGINE pyFRE.frepp.plevel -l $zInterp --list` )
+                    $time_plevel PLEVEL -p "\$levels" -i $infile -o derived.nc divv rvort hght slp
+                    $check_plevel
+                    $time_ncks ncks -A -h derived.nc plev.nc
+                    $check_ncks
+                    rm -f derived.nc
                 endif
-                time_plevel plev_command -p "\levels" -i infile -o plev.nc \vlist variables
-                check_plevel
-                set string = `ncdump -h plev.nc | grep UNLIMITED`
-                check_ncdump
-                set timename   = `echo \string[1]`
-                set string = `ncdump -h plev.nc | grep calendar_type`
-                set caltype   = `echo \string[3] | sed 's/"//g'`
-                if ( "\caltype" == "" ) set caltype = caltype
-                time_ncatted ncatted -h -O -a calendar,\timename,c,c,\caltype plev.nc
-                check_ncatted
-                time_mv mv plev.nc outfile
-                time_rm rm -f infile
-            else if ( \reqvars < 3 && \#vars3d > 0 ) then
-                echo ERROR: zInterp requested for source, but missing one or more required variables
+                $time_mv mv plev.nc $outfile
+                $time_rm rm -f $infile
+            else if ( \$reqvars < 3 && \$#vars3d > 0 ) then
+                echo ERROR: zInterp requested for $source, but missing one or more required variables
                 exit 1
             else
-                time_mv mv infile outfile
+                $time_mv mv $infile $outfile
             endif
         """, locals(), pp)
     elif zInterp == "zgrid": # ocean
@@ -128,9 +77,9 @@ def zInterpolate(zInterp, infile, outfile, caltype, variables, source, pp):
             pass # already cleaned variables
         if pp.platform == "x86_64":
             csh += _template("""
-                set taxis = `ncdump -h infile | grep -i '.*=.*unlimited.*currently' | awk '{print \1}'`
+                set taxis = `\$PYFRE_ENGINE pyFRE.frepp.ncheader -d \$headerdb timename infile`
                 #set hasclimbounds = `ncdump -h infile | grep 'climatology_bounds' | wc -l`
-                if ( `ncdump -h infile | grep -c " climatology_bounds("` == 1 ) then
+                if ( `\$PYFRE_ENGINE pyFRE.frepp.ncheader -d \$headerdb has climatology_bounds infile` == 1 ) then
                     time_zgrid /home/rwh/data/regrid_MESO/Resample_on_Z_new -d/home/rwh/data/regrid_MESO/OM3_zgrid.nc -V:variables -T:average_T1,average_T2,average_DT,climatology_bounds -ee -ooutfile infile
                     check_zgrid
                 else
@@ -142,6 +91,7 @@ def zInterpolate(zInterp, infile, outfile, caltype, variables, source, pp):
         csh += _template("""
             time_mv mv infile outfile
         """, locals(), pp)
+    return csh
 
 
 def segStartMonths(segTime, segUnits):
@@ -166,223 +116,51 @@ def segStartMonths(segTime, segUnits):
             "Try 1,2,3,4,6 or 12 month segments."))
         sys.exit(1)
 
+def _segment_months(segTime, segUnits):
+    """Length in months of the history segments, or None if convertSegments
+    doesn't split them (monthly segments) or doesn't support them.
+    """
+    if (segTime == 1 and segUnits == 'years') or \
+        (segTime == 12 and segUnits == 'months'):
+        return 12
+    elif segTime in (2, 3, 4, 6):
+        return segTime
+    return None
+
+def decSegStart(segTime, segUnits):
+    """Start (MMDD) of the history segment holding December, which names the
+    history archive the previous December is taken from.
+    """
+    nmonths = _segment_months(segTime, segUnits)
+    if nmonths is None:
+        return '1201'
+    # keys are history file names: {date}{MM}01.{source}.nc
+    segment = next(iter(segsplit.segment_plan('', nmonths, 'x', months={12})))
+    return segment[:4]
+
 def convertSegments(segTime, segUnits, diag_source, type, sourceGrid, pp):
     """Make csh for splitting history files into monthly files."""
     # frepp.pl l.3485
-    if sourceGrid == 'cubedsphere':
-        cubicLoopStart = "set i = 1\nwhile ( \i <= 6 )";
-        cubicLoopEnd   = "@ i ++\nend";
-        diag_source    = "diag_source.tile\i";
-
-    if segTime == 6:
-        if sourceGrid == 'cubedsphere':
-            cubicLinkGridSpec = dedent("""
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0201.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0301.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0401.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0501.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0601.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0801.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0901.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1001.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1101.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1201.grid_spec.tile\i.nc
-            """)
-        convertSeg = _template("""
-            cubicLoopStart
-            set string = `ncdump -h \{hDate}0101.diag_source.nc | grep UNLIMITED`
-            set timename   = `echo \string[1]`
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0101.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0101.diag_source.nc \{hDate}0201.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}0101.diag_source.nc \{hDate}0301.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,4,4 \{hDate}0101.diag_source.nc \{hDate}0401.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,5,5 \{hDate}0101.diag_source.nc \{hDate}0501.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,6,6 \{hDate}0101.diag_source.nc \{hDate}0601.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0101.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0701.diag_source.nc tmp07.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0701.diag_source.nc \{hDate}0801.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}0701.diag_source.nc \{hDate}0901.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,4,4 \{hDate}0701.diag_source.nc \{hDate}1001.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,5,5 \{hDate}0701.diag_source.nc \{hDate}1101.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,6,6 \{hDate}0701.diag_source.nc \{hDate}1201.diag_source.nc > ncks.out
-            time_mv mv -f tmp07.nc \{hDate}0701.diag_source.nc
-            cubicLinkGridSpec
-            cubicLoopEnd
-        """, locals(), pp)
-        convertDec = _template("""
-            time_ncks ncks \ncksopt -d \timename,6,6 \{prevyear}0701.diag_source.nc \{prevyear}1201.diag_source.nc > ncks.out
-        """, locals(), pp)
-    elif segTime == 2:
-        if sourceGrid == 'cubedsphere':
-            cubicLinkGridSpec = dedent("""
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0201.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0401.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0601.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0801.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1001.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1201.grid_spec.tile\i.nc
-            """)
-        convertSeg = _template("""
-            cubicLoopStart
-            set string = `ncdump -h \{hDate}0101.diag_source.nc | grep UNLIMITED`
-            set timename   = `echo \string[1]`
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0101.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0101.diag_source.nc \{hDate}0201.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0101.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0301.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0301.diag_source.nc \{hDate}0401.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0301.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0501.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0501.diag_source.nc \{hDate}0601.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0501.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0701.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0701.diag_source.nc \{hDate}0801.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0701.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0901.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0901.diag_source.nc \{hDate}1001.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0901.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}1101.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}1101.diag_source.nc \{hDate}1201.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}1101.diag_source.nc
-            cubicLinkGridSpec
-            cubicLoopEnd
-        """, locals(), pp)
-        convertDec = _template("""
-            time_ncks ncks \ncksopt -d \timename,2,2 \{prevyear}1101.diag_source.nc \{prevyear}1201.diag_source.nc > ncks.out
-        """, locals(), pp)
-    elif segTime == 3:
-        if sourceGrid == 'cubedsphere':
-            cubicLinkGridSpec = dedent("""
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0201.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0301.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0501.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0601.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0801.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0901.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1101.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1201.grid_spec.tile\i.nc
-            """)
-        convertSeg = _template("""
-            cubicLoopStart
-            set string = `ncdump -h \{hDate}0101.diag_source.nc | grep UNLIMITED`
-            set timename   = `echo \string[1]`
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0101.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0101.diag_source.nc \{hDate}0201.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}0101.diag_source.nc \{hDate}0301.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0101.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0401.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0401.diag_source.nc \{hDate}0501.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}0401.diag_source.nc \{hDate}0601.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0401.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0701.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0701.diag_source.nc \{hDate}0801.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}0701.diag_source.nc \{hDate}0901.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0701.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}1001.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}1001.diag_source.nc \{hDate}1101.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}1001.diag_source.nc \{hDate}1201.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}1001.diag_source.nc
-            cubicLinkGridSpec
-            cubicLoopEnd
-        """, locals(), pp)
-        convertDec = _template("""
-            time_ncks ncks \ncksopt -d \timename,3,3 \{prevyear}1001.diag_source.nc \{prevyear}1201.diag_source.nc > ncks.out
-        """, locals(), pp)
-    elif segTime == 4:
-        if sourceGrid == 'cubedsphere':
-            cubicLinkGridSpec = dedent("""
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0201.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0301.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0401.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0601.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0701.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0801.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1001.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1101.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1201.grid_spec.tile\i.nc
-            """)
-        convertSeg = _template("""
-            cubicLoopStart
-            set string = `ncdump -h \{hDate}0101.diag_source.nc | grep UNLIMITED`
-            set timename   = `echo \string[1]`
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0101.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0101.diag_source.nc \{hDate}0201.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}0101.diag_source.nc \{hDate}0301.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,4,4 \{hDate}0101.diag_source.nc \{hDate}0401.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0101.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0501.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0501.diag_source.nc \{hDate}0601.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}0501.diag_source.nc \{hDate}0701.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,4,4 \{hDate}0501.diag_source.nc \{hDate}0801.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0501.diag_source.nc
-
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0901.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0901.diag_source.nc \{hDate}1001.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}0901.diag_source.nc \{hDate}1101.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,4,4 \{hDate}0901.diag_source.nc \{hDate}1201.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0901.diag_source.nc
-            cubicLinkGridSpec
-            cubicLoopEnd
-        """, locals(), pp)
-        convertDec = _template("""
-            time_ncks ncks \ncksopt -d \timename,4,4 \{prevyear}0901.diag_source.nc \{prevyear}1201.diag_source.nc > ncks.out
-        """, locals(), pp)
-    elif (segTime == 1 and segUnits == 'years') or \
-        (segTime == 12 and segUnits == 'months'):
-        if sourceGrid == 'cubedsphere':
-            cubicLinkGridSpec = dedent("""
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0201.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0301.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0401.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0501.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0601.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0701.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0801.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}0901.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1001.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1101.grid_spec.tile\i.nc
-                ln -s \{hDate}0101.grid_spec.tile\i.nc \{hDate}1201.grid_spec.tile\i.nc
-            """)
-        convertSeg = _template("""
-            cubicLoopStart
-            set string = `ncdump -h \{hDate}0101.diag_source.nc | grep UNLIMITED`
-            set timename   = `echo \string[1]`
-            time_ncks ncks \ncksopt -d \timename,1,1 \{hDate}0101.diag_source.nc tmp01.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,2,2 \{hDate}0101.diag_source.nc \{hDate}0201.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,3,3 \{hDate}0101.diag_source.nc \{hDate}0301.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,4,4 \{hDate}0101.diag_source.nc \{hDate}0401.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,5,5 \{hDate}0101.diag_source.nc \{hDate}0501.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,6,6 \{hDate}0101.diag_source.nc \{hDate}0601.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,7,7 \{hDate}0101.diag_source.nc \{hDate}0701.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,8,8 \{hDate}0101.diag_source.nc \{hDate}0801.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,9,9 \{hDate}0101.diag_source.nc \{hDate}0901.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,10,10 \{hDate}0101.diag_source.nc \{hDate}1001.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,11,11 \{hDate}0101.diag_source.nc \{hDate}1101.diag_source.nc > ncks.out
-            time_ncks ncks \ncksopt -d \timename,12,12 \{hDate}0101.diag_source.nc \{hDate}1201.diag_source.nc > ncks.out
-            time_mv mv -f tmp01.nc \{hDate}0101.diag_source.nc
-            cubicLinkGridSpec
-            cubicLoopEnd
-        """, locals(), pp)
-        convertDec = _template("""
-            time_ncks ncks \ncksopt -d \timename,12,12 \{prevyear}0101.diag_source.nc \{prevyear}1201.diag_source.nc > ncks.out
-        """, locals(), pp)
-    else:
+    nmonths = _segment_months(segTime, segUnits)
+    if nmonths is None:
         _log.error((f"{diag_source}: segTime {segTime} not supported for seasonal "
             "calculations.  Try 1,2,3,4,6 or 12 month segments."))
+        return ""
 
+    # each history file is read once and the cubed-sphere tiles are split in
+    # parallel; see segsplit
+    tile_opts = "-t 6 -g" if sourceGrid == 'cubedsphere' else ""
+    check_segsplit = logs.errorstr(f"SEGSPLIT ({diag_source} history segments)")
     if type == "dec":
-        return convertDec
-    return convertSeg
+        tile_opts = "-t 6" if sourceGrid == 'cubedsphere' else ""
+        return _template("""
+            $time_ncks \$PYFRE_ENGINE pyFRE.frepp.segsplit -y \$prevyear -n $nmonths -m 12 $tile_opts $diag_source
+            $check_segsplit
+        """, locals(), pp)
+    return _template("""
+        $time_ncks \$PYFRE_ENGINE pyFRE.frepp.segsplit -y \$hDate -n $nmonths $tile_opts $diag_source
+        $check_segsplit
+    """, locals(), pp)
 
 def get_subint(node, intervals, t0, sim0):
     """Return appropriate subinterval."""
@@ -447,10 +225,10 @@ def gettimelevels(freq, cl):
         _log.warning(f"frequency {freq} not recognized in gettimelevels")
         return cl
 
-def segmentLengthInMonths(pp):
+def segmentLengthInMonths(pp, exp):
     """"""
     # frepp.pl l.7985
-    segTime, segUnits = getSegmentLength(pp)
+    segTime, segUnits = getSegmentLength(pp, exp)
     if segUnits == 'months':
         return segTime
     elif segUnits == 'years':
@@ -460,14 +238,14 @@ def segmentLengthInMonths(pp):
             "setting segment_months = 1"))
         return 1
 
-def getSegmentLength(pp):
+def getSegmentLength(pp, exp):
     """"""
     # frepp.pl l.7994
     if pp.opt['S']:
         return (pp.opt['S'], "months")
     else:
-        segTime  = FREUtil.getxpathval('runtime/production/segment/@simTime')
-        segUnits = FREUtil.getxpathval('runtime/production/segment/@units')
+        segTime  = FREUtil.getxpathval('runtime/production/segment/@simTime', exp.expt, pp.root)
+        segUnits = FREUtil.getxpathval('runtime/production/segment/@units', exp.expt, pp.root)
         if segUnits == 'month':
             segUnits = 'months'
         elif segUnits == 'year':
@@ -501,7 +279,9 @@ def annualTS(tsNode, exp, cpt):
     #need timeSeries freq=monthly chunkLength=something.  Then split apart into yearly data.
     #prefer identical chunklength if available
     TSchunkLength = ""
-    for node in ppcNode.findnodes(f"timeSeries[\@freq='monthly' and \@chunkLength='{chunkLength}']"):
+    for node in ppcNode.timeseries('monthly'):
+        if node.findvalue('@chunkLength') != chunkLength:
+            continue
         TSchunkLength = node.findvalue('@chunkLength')
         if TSchunkLength:
             _log.debug(f'will use monthly_ts cl={TSchunkLength}')
@@ -509,7 +289,7 @@ def annualTS(tsNode, exp, cpt):
 
     #otherwise use whatever is available, but we don't support 1yr for now
     if not TSchunkLength:
-        for node in ppcNode.findnodes("timeSeries[\@freq='monthly']"):
+        for node in ppcNode.timeseries('monthly'):
             TSchunkLength = node.findvalue('@chunkLength')
             if TSchunkLength != "" and TSchunkLength != "1yr":
                 _log.debug(f'will use monthly_ts cl={TSchunkLength}')
@@ -550,7 +330,7 @@ def annualTS(tsNode, exp, cpt):
     mod_ = int(yrsSoFar) % int_
     if mod_ != 0:
         return ""
-    mkdircommand = exp.mkdircommand + f"{outdir} "
+    exp.dirplan.add(outdir)
     cl = int(chunkLength.replace('yr', ""))
     if int_ > exp.maxyrs:
         exp.maxyrs = int_
@@ -559,11 +339,10 @@ def annualTS(tsNode, exp, cpt):
     # cl and to leave it in TMP till everything's done. then change this to cl
 
     #check that all files up to current time exist
-    monthnodes  = ppcNode.findnodes('timeSeries[@freq="monthly"]')
+    monthnodes  = ppcNode.timeseries('monthly')
     diag_source = ""
     if monthnodes:
-        monthnode = ppcNode.findnodes('timeSeries[@freq="monthly"]')->get_node(1); # XXX
-        diag_source = monthnode.getAttribute('@source')
+        diag_source = monthnodes[0].getAttribute('@source')
     if not diag_source:
         diag_source = tsNode.findvalue('../@source')
     if not diag_source:
@@ -572,20 +351,15 @@ def annualTS(tsNode, exp, cpt):
     #get variables
     variables = FREUtil.cleanstr(tsNode.findvalue('variables'))
     _log.debug(f"\t\tfrom xml, vars are '{variables}'")
-    variables = [f"{s}.nc" for s in variables.split(' ')]
+    variables = [f"{s}.nc" for s in variables.split()]
         # if ( "variables" ne "" ) { variables =~ s//.nc/g } # XXX
 
     tBEG = FREUtil.modifydate(pp.tEND, f"-{int_} years +1 sec")
     tBEGf = FREUtil.graindate(tBEG, 'monthly')
     tENDf = FREUtil.graindate(pp.tEND, 'monthly')
-    check_ncdump  = logs.errorstr(f"NCDUMP ({cpt.component} {freq} ts from {source})")
-    check_ncks    = logs.errorstr(f"NCKS ({cpt.component} {freq} ts from {source})")
-    check_timavg  = logs.retryonerrorend(f"TIMAVG ({cpt.component} {freq} ts from {source})")
-    retry_timavg  = logs.retryonerrorstart(f"TIMAVG")
-    check_ncrcat  = logs.errorstr(f"NCRCAT ({cpt.component} {freq} ts from {source})")
-    check_ncatted = logs.errorstr(f"NCATTED ({cpt.component} {freq} ts from {source})")
+    check_tsengine = logs.errorstr(f"TSENGINE ({cpt.component} {freq} ts from {source})")
+    check_ncconcat = logs.errorstr(f"NCCONCAT ({cpt.component} {freq} ts from {source})")
     check_dmget   = logs.errorstr(f"DMGET ({cpt.component} {freq} ts from {source})")
-    check_nccopy  = logs.errorstr(f"NCCOPY ({cpt.component} {freq} ts from {source})")
     csh           = logs.setcheckpt(f"annualTS_{chunkLength}")
     csh += _template("""
 
@@ -600,11 +374,43 @@ def annualTS(tsNode, exp, cpt):
     if pp.opt['z']:
         csh += logs.begin_systime()
 
-    for chunkyear in range(int_):
-        tYEAR = FREUtil.modifydate(tBEG, f"+ {chunkyear} years" )
+    #set up loop over variables
+    if not variables:
+        loopvar = 'file'
+        loopvalues = f"{reqpath}/{cpt.component}.{tBEGf}-{tENDf}.*.nc"
+        setloop = _template("""
+            set var = `echo \$file | sed "s#.*/##;s/$component.$tBEGf-$tENDf.//"`
+        """, locals(), component=cpt.component)
+    else:
+        loopvar = 'var'
+        loopvalues = ' '.join(variables)
+        setloop = _template("""
+            set file = $reqpath/$component.$tBEGf-$tENDf.\$var
+        """, locals(), component=cpt.component)
+    forloop = f"foreach {loopvar} ( {loopvalues} )\n{setloop}"
+
+    # all annual means for the chunk are computed from each monthly file in
+    # one pass, instead of ncks + TIMAVG per variable per year
+    tBEGyr = FREUtil.graindate(tBEG, 'annual')
+    csh += varpool.foreach_csh(loopvar, loopvalues, _template("""
+            $setloop
+            if ( ! -e \$file ) then
+                echo "ERROR: input file \$file does not exist"
+            endif
+            \$PYFRE_ENGINE pyFRE.frepp.tsengine annual -c $component -y $tBEGyr -n $int_ -o \$tempCache \$file
+            $check_tsengine
+        """, locals(), component=cpt.component),
+        f"TSENGINE ({cpt.component} {freq} ts from {source})",
+        f"annualTS_{chunkLength}", npool=cpt.npool
+    )
+
+    # dates of all chunk years, and of the start of the chunk each one ends,
+    # in one pass
+    tYEARs = FREUtil.modifydateBatch([tBEG] * int_,
+        [f"+ {chunkyear} years" for chunkyear in range(int_)])
+    chunkBEGs = FREUtil.modifydateBatch(tYEARs, f"- {cl - 1} years")
+    for tYEAR, chunkBEG in zip(tYEARs, chunkBEGs):
         tYEARf = FREUtil.graindate(tYEAR, 'annual')
-        startmonth = chunkyear * 12 + 1
-        endmonth   = startmonth + 11
 
         #if it is time, chunk the files`
         #if tYEARf-sim0 % chunklength == 0 then cat files to outfile
@@ -614,89 +420,53 @@ def annualTS(tsNode, exp, cpt):
         chunkedoutfile = ""
 
         #print "tYEARf=tYEARf sim0=sim0 cl=cl\n";
-        if (tYEARf - FREUtil.graindate(cpt.sim0, 'annual')) % cl == 0:
-            n = cl -1
-            begin = FREUtil.modifydate(tYEAR, f"- {n} years" )
-            chunkedoutfile = f"{cpt.component}.{begin}-{tYEARf}.\var"
+        if (int(tYEARf) - int(FREUtil.graindate(cpt.sim0, 'annual'))) % cl == 0:
+            begin = FREUtil.graindate(chunkBEG, 'annual')
+            chunkedoutfile = f"{cpt.component}.{begin}-{tYEARf}.$var"
             filelist = ""
-            for year in range(begin, tYEARf + 1):
+            for year in range(int(begin), int(tYEARf) + 1):
                 year = FREUtil.padzeros(year)
-                filelist += f"\tempCache/{cpt.component}.{year}.\var ";
+                filelist += f"$tempCache/{cpt.component}.{year}.$var ";
                 getlist  += f"{cpt.component}.{year}.*.nc ";
-            }
             if exp.aggregateTS:
                 makecpio = sub.createcpio(
-                    "\tempCache/outdirpath",
+                    f"$tempCache/{outdirpath}",
                     outdir,
                     f"{cpt.component}.{begin}-{tYEARf}",
                     FREUtil.timeabbrev(freq),
-                    1
+                    1,
+                    pp
                 )
-            }
-            compress = sub.compress_csh(chunkedoutfile, check_nccopy)
+            # written once, with its filename attribute and compression,
+            # instead of by ncrcat, ncatted and nccopy in turn
             catfiles = _template("""
-                if ( -e chunkedoutfile ) rm -f chunkedoutfile
-                time_ncrcat ncrcat \ncrcatopt filelist chunkedoutfile
-                check_ncrcat
-                time_ncatted ncatted -h -O -a filename,global,m,c,"chunkedoutfile" chunkedoutfile
-                check_ncatted
-                compress
-                time_mv mvfile chunkedoutfile outdir/
-                if ( \status ) then
+                if ( -e $chunkedoutfile ) rm -f $chunkedoutfile
+                \$PYFRE_ENGINE pyFRE.frepp.ncconcat -z "\$nc_compression_flags" -o $chunkedoutfile $filelist
+                $check_ncconcat
+                $time_mv $mvfile $chunkedoutfile $outdir/
+                if ( \$status ) then
                     echo "WARNING: data transfer failure, retrying..."
-                    time_mv mvfile chunkedoutfile outdir/
-                    checktransfer
+                    $time_mv $mvfile $chunkedoutfile $outdir/
+                    $checktransfer
                 endif
-                time_mv mv chunkedoutfile \tempCache/outdirpath/
-                time_rm rm -f filelist
-            """, locals())
+                $time_mv mv $chunkedoutfile \$tempCache/$outdirpath/
+                $time_rm rm -f $filelist
+            """, locals(), pp, checktransfer=cpt.checktransfer)
 
-        #set up loop over variables
-        if not variables:
-            forloop = _template("""
-                foreach file ( reqpath/component.tBEGf-tENDf.*.nc )
-                    set var = `echo \file | sed "s#.*/##;s/component.tBEGf-tENDf.//"`
-            """, locals())
-        else:
-            forloop = _template("""
-                foreach var ( variables )
-                    set file = reqpath/component.tBEGf-tENDf.\var
-            """, locals())
-        csh += _template("""
+        if catfiles:
+            csh += _template("""
 
-            forloop
-                if ( chunkyear == 0 ) then
-                time_cp cp \file .
-                if ( \status ) then
-                    echo "WARNING: data transfer failure, retrying..."
-                    time_cp cp \file .
-                    checktransfer
-                endif
-                endif
-                set file = "./\file:t"
-                set string = `ncdump -h \file | grep UNLIMITED`
-                check_ncdump
-                set timename   = `echo \string[1]`
-                time_ncks ncks \ncksopt -d \timename,startmonth,endmonth \file year.nc > ncks.out
-                check_ncks
-                time_timavg \TIMAVG -o \tempCache/component.tYEARf.\var year.nc
-                retry_timavg
-                time_timavg \TIMAVG -o \tempCache/component.tYEARf.\var year.nc
-                check_timavg
-                time_rm rm -f year.nc
-                catfiles
-            end
-            makecpio
-            else
-                echo ERROR: Error: input files do not exist
-            endif
+                $forloop
+                    $catfiles
+                end
+                $makecpio
 
-        """, locals(), cpt)
+            """, locals())
 
-        if pp.opt['z']:
-            csh += logs.end_systime()
-        csh += logs.mailerrors(outdir)
-        return csh
+    if pp.opt['z']:
+        csh += logs.end_systime()
+    csh += logs.mailerrors(outdir)
+    return csh
 
 def seasonalTS(tsNode, sim0):
 """TIMESERIES - SEASONAL"""
@@ -728,9 +498,8 @@ def seasonalTS(tsNode, sim0):
     }
 
     #need timeSeries freq=monthly chunkLength=something.  Then split apart into yearly data.
-    requiredts    = "timeSeries[\@freq='monthly']\n";
     TSchunkLength = "";
-    foreach node ( ppcNode->findnodes("requiredts") ) {
+    foreach node ( ppcNode->timeseries('monthly') ) {
         TSchunkLength = node->findvalue('@chunkLength');
         if ( "TSchunkLength" ne "" ) {
             print STDERR "will use monthly_ts cl=TSchunkLength\n" if opt_v;
@@ -769,14 +538,14 @@ def seasonalTS(tsNode, sim0):
     lcmchunk = lcm( int, cl );
     mod = yrsSoFar % lcmchunk;
     if ( mod != 0 ) { return ""; }
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( cl > maxyrs ) { maxyrs = cl; }
 
     #check that all files up to current time exist
-    my @monthnodes  = ppcNode->findnodes('timeSeries[@freq="monthly"]');
+    my @monthnodes  = ppcNode->timeseries('monthly');
     diag_source = "";
     if ( scalar @monthnodes ) {
-        monthnode = ppcNode->findnodes('timeSeries[@freq="monthly"]')->get_node(1);
+        monthnode = monthnodes[0];
         diag_source = monthnode->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -809,16 +578,10 @@ set file = \tempCache/reqpath/component.tBEGf-tENDf.\var
 EOF
     }
 
-    check_ncks        = errorstr("NCKS (component seasonal ts)");
-    check_ncdump      = errorstr("NCDUMP (component seasonal ts)");
-    check_ncrcat      = errorstr("NCRCAT (component seasonal ts)");
-    check_timavg      = retryonerrorend("TIMAVG (component seasonal ts)");
-    retry_timavg      = retryonerrorstart("TIMAVG");
-    check_ncatted     = errorstr("NCATTED (component seasonal ts)");
+    check_tsengine    = errorstr("TSENGINE (component seasonal ts)");
     check_dmget       = errorstr("DMGET (component seasonal ts)");
     check_splitncvars = errorstr("SPLITNCVARS (component seasonal ts)");
     check_cpio        = errorstr("CPIO/TAR (component seasonal ts)");
-    check_nccopy      = errorstr("NCCOPY (component seasonal ts)");
     csh               = setcheckpt("seasonalTS_chunkLength");
     csh .= <<EOF;
 
@@ -832,57 +595,9 @@ if ( ! -e \tempCache/outdirpath ) mkdir -p \tempCache/outdirpath
 #time_dmget dmget -d reqpath "component.tBEGf-tENDf.*.nc"
 EOF
     if (opt_z) { csh .= begin_systime(); }
-    totalseasons = 4 * lcmchunk;
-    startseason  = 1;
-    startflag    = FREUtil::dateCmp( tBEG, sim0 );
-
-    foreach season ( startseason .. totalseasons ) {
-        nummonths = season * 3 - 4;
-        tSEASON   = FREUtil::modifydate( tBEG, "+ nummonths months" );
-        tSEASONf  = FREUtil::graindate( tSEASON, 'seasonal' );
-        my (year)    = tSEASONf =~ /(\d{4,})\./;
-        catfiles  = "";
-        makecpio  = "";
-        tmp       = FREUtil::graindate( sim0, 'annual' );
-
-        #if it is time, chunk the files.  only put chunked files into archive now.
-        if ( ( year - tmp + 1 ) % cl == 0 ) {
-            tmp = year - tmp + 1;
-            my (abbrev)       = tSEASONf =~ /\d{4,}\.(\w{3})/;
-            begin          = FREUtil::padzeros( year - cl + 1 );
-            chunkedoutfile = "component.begin-year.abbrev.\var";
-            filelist       = "";
-            foreach year ( begin .. year ) {
-                year = FREUtil::padzeros(year);
-                filelist .= "component.year.abbrev.\var ";
-            }
-            if ( abbrev =~ "SON" and aggregateTS ) {
-                makecpio = createcpio( "\tempCache/outdirpath", outdir,
-                    "component.begin-year", FREUtil::timeabbrev(freq), 1 );
-            }
-            compress = compress_csh( chunkedoutfile, check_nccopy );
-            catfiles = <<EOF;
-if ( -e chunkedoutfile ) rm -f chunkedoutfile
-time_ncrcat ncrcat \ncrcatopt filelist chunkedoutfile
-check_ncrcat
-compress
-time_mv mvfile chunkedoutfile \outdir/
-if ( \status ) then
-echo "WARNING: data transfer failure, retrying..."
-time_mv mvfile chunkedoutfile \outdir/
-checktransfer
-endif
-time_mv mv chunkedoutfile \tempCache/outdirpath/
-time_rm rm -f filelist
-
-EOF
-        } ## end if ( ( year - tmp + ...))
-        if ( season == 1 ) {
-            if ( startflag == 0 ) {
-########################## FIRST DJF OF RUN ################################
-                csh .= <<EOF;
-#season season (tSEASONf) note: december used twice
-forloop
+    startflag = FREUtil::dateCmp( tBEG, sim0 );
+    tBEGyr    = FREUtil::graindate( tBEG, 'year' );
+    copyfile  = <<EOF;
 if ( ! -f \file ) then
     if ( -f ppRootDir/reqpath/\file:t ) then
         time_cp cp ppRootDir/reqpath/\file:t \file
@@ -895,45 +610,37 @@ if ( ! -f \file ) then
         echo ERROR: necessary file not found: ppRootDir/reqpath/\file:t
     endif
 endif
-set string = `ncdump -h \file | grep UNLIMITED`
-set timename   = `echo \string[1]`
-time_ncks ncks \ncksopt -d \timename,1,2 -d \timename,12,12 \file janfeb.nc > ncks.out
-check_ncks
-time_timavg \TIMAVG -o component.tSEASONf.\var janfeb.nc
-retry_timavg
-    time_timavg \TIMAVG -o component.tSEASONf.\var janfeb.nc
-check_timavg
-time_rm rm -f janfeb.nc
-catfiles
-end
-
 EOF
-            } ## end if ( startflag == 0 )
-            else {
-########################## FIRST DJF OF THIS PP ################################
-                check_prev = errorstr("Could not acquire previous december");
-                check_hist
-                    = errorstr("Could not acquire previous december from history file");
-                csh .= <<EOF;
-#season season (tSEASONf)
-#time_dmget dmget -d reqpath "component.*-tENDprevf.*.nc"
-forloop
-if ( ! -f \file ) then
-    if ( -f ppRootDir/reqpath/\file:t ) then
-        time_cp cp ppRootDir/reqpath/\file:t \file
-        if ( \status ) then
-        echo "WARNING: data transfer failure, retrying..."
-        time_cp cp ppRootDir/reqpath/\file:t \file
-        checktransfer
-        endif
-    else
-        echo ERROR: necessary file not found: ppRootDir/reqpath/\file:t
-    endif
-endif
-set string = `ncdump -h \file | grep UNLIMITED`
-set timename   = `echo \string[1]`
-time_ncks ncks \ncksopt -d \timename,1,2 \file janfeb.nc > ncks.out
-check_ncks
+
+    #all seasons of all years are computed at once by tsengine, which reads
+    #each monthly file once and writes the cl-year chunks of each season
+    getdec = "";
+    if ( startflag == 0 ) {
+        #first DJF of run: note december used twice
+        decopt = "-s";
+    }
+    else {
+        decopt = "-D dec.nc";
+        check_prev = errorstr("Could not acquire previous december");
+        check_hist
+            = errorstr("Could not acquire previous december from history file");
+
+        #might need to get the data from the history file if previous pp is not done
+        convertDec = convertSegments( segTime, segUnits, diag_source, 'dec', sourceGrid, pp );
+
+        #check for zInterp
+        zInterp     = ppcNode->findvalue('@zInterp');
+        zInterp_csh = "";
+        if ( "zInterp" ne "" ) {
+            zInterp_csh = zInterpolate( zInterp, "\{prevyear}1201.diag_source.nc",
+                'tmp.nc', caltype, variables, diag_source );
+            zInterp_csh .= "\nmv -f tmp.nc \{prevyear}1201.diag_source.nc";
+        }
+
+        prevhistcpio = "prevyear" . "0101.nc.cpio";
+        prevhisttar  = "prevyear" . "0101.nc.tar";
+
+        getdec = <<EOF;
 #get december from previous file
 set prev = (`ls ./component.*-tENDprevf.\var`)
 if ( "\prev" == "" ) then
@@ -959,29 +666,7 @@ if ( "\prev" == "" && -e "ppRootDir/reqpath/component.*-tENDprevf.mon.nc.cpio")
     set prev = (`ls ./component.*-tENDprevf.\var`)
 endif
 if ( "\prev" != "" ) then
-    set decstring = `ncdump -h \prev | grep UNLIMITED`
-    check_ncdump
-    @ len = \#decstring - 1
-    set length = `echo \decstring[\len] | cut -c2-`
-    time_ncks ncks \ncksopt -d \timename,\length,\length \prev dec.nc > ncks.out
-    check_ncks
-EOF
-
-                #might need to get the data from the history file if previous pp is not done
-                convertDec = convertSegments( segTime, segUnits, diag_source, 'dec' );
-
-                #check for zInterp
-                zInterp     = ppcNode->findvalue('@zInterp');
-                zInterp_csh = "";
-                if ( "zInterp" ne "" ) {
-                    zInterp_csh = zInterpolate( zInterp, "\{prevyear}1201.diag_source.nc",
-                        'tmp.nc', caltype, variables, diag_source );
-                    zInterp_csh .= "\nmv -f tmp.nc \{prevyear}1201.diag_source.nc";
-                }
-
-                prevhistcpio = "prevyear" . "0101.nc.cpio";
-                prevhisttar  = "prevyear" . "0101.nc.tar";
-                csh .= <<EOF;
+    ln -sf \prev dec.nc
 else
     if ( ! -e \var ) then
         set prevyear = prevyear
@@ -1000,8 +685,6 @@ else
                 echo ERROR: Previous December (\{prevyear}1201.diag_source.nc) is not available for seasonal calculations
                 exit 1
             endif
-            set string = `ncdump -h \{prevyear}0101.diag_source.nc | grep UNLIMITED`
-            set timename   = `echo \string[1]`
             convertDec
             zInterp_csh
         endif
@@ -1015,65 +698,112 @@ endif
 test -e dec.nc
 check_prev
 
-if ( -e decjanfeb.nc ) rm -f decjanfeb.nc
-time_ncrcat ncrcat \ncrcatopt dec.nc janfeb.nc decjanfeb.nc
-check_ncrcat
-time_timavg \TIMAVG -o component.tSEASONf.\var decjanfeb.nc
-retry_timavg
-    time_timavg \TIMAVG -o component.tSEASONf.\var decjanfeb.nc
-check_timavg
-time_rm rm -f janfeb.nc dec.nc decjanfeb.nc
-catfiles
-end
-
 EOF
-            } ## end else [ if ( startflag == 0 )]
-        } ## end if ( season == 1 )
-        else {
-########################## REMAINING SEASONS ################################
-            startmonth = season * 3 - 3;
-            endmonth   = season * 3 - 1;
-            csh .= <<EOF;
-#season season (tSEASONf)
+    } ## end else [ if ( startflag == 0 )]
+
+    makecpio = "";
+    if (aggregateTS) {
+        foreach chunk ( 0 .. lcmchunk / cl - 1 ) {
+            begin = FREUtil::padzeros( tBEGyr + chunk * cl );
+            end   = FREUtil::padzeros( tBEGyr + chunk * cl + cl - 1 );
+            makecpio .= createcpio( "\tempCache/outdirpath", outdir,
+                "component.begin-end", FREUtil::timeabbrev(freq), 1 );
+        }
+    }
+
+    csh .= <<EOF;
+#seasons tBEGf-tENDf (cl-year chunks)
 forloop
-if ( ! -f \file ) then
-    if ( -f ppRootDir/reqpath/\file:t ) then
-        time_cp cp ppRootDir/reqpath/\file:t \file
-        if ( \status ) then
-        echo "WARNING: data transfer failure, retrying..."
-        time_cp cp ppRootDir/reqpath/\file:t \file
-        checktransfer
-        endif
-    else
-        echo ERROR: necessary file not found: ppRootDir/reqpath/\file:t
-    endif
+copyfile
+getdec
+if ( -e \work/seasonal ) rm -rf \work/seasonal
+mkdir -p \work/seasonal
+time_timavg \PYFRE_ENGINE pyFRE.frepp.tsengine seasonal -c component -y tBEGyr -n cl decopt -z "\nc_compression_flags" -o \work/seasonal \file
+check_tsengine
+foreach seasonfile ( \work/seasonal/* )
+time_mv mvfile \seasonfile \outdir/
+if ( \status ) then
+echo "WARNING: data transfer failure, retrying..."
+time_mv mvfile \seasonfile \outdir/
+checktransfer
 endif
-set string = `ncdump -h \file | grep UNLIMITED`
-set timename   = `echo \string[1]`
-time_ncks ncks \ncksopt -d \timename,startmonth,endmonth \file season.nc > ncks.out
-check_ncks
-time_timavg \TIMAVG -o component.tSEASONf.\var season.nc
-retry_timavg
-    time_timavg \TIMAVG -o component.tSEASONf.\var season.nc
-check_timavg
-time_rm rm -f season.nc
-catfiles
+time_mv mv \seasonfile \tempCache/outdirpath/
+end
+time_rm rm -f dec.nc
 end
 makecpio
 
 EOF
-        } ## end else [ if ( season == 1 ) ]
-    } ## end foreach season ( startseason...)
     if (opt_z) { csh .= end_systime(); }
     csh .= mailerrors(outdir);
     return csh;
 } ## end sub seasonalTS
 
-def monthlyAVfromhist(taNode, sim0):
+def accumulate_csh(ppcNode, component, source, sim0, avfile, period, pp):
+    """Make csh adding the 1-year average *avfile* to the running sums (see
+    :mod:`~pyFRE.frepp.accumstore`) of the multi-year timeAverages of
+    *source* of the component, so that closing them doesn't re-read the
+    1-year averages.
+    """
+    intervals = set()
+    for node in ppcNode.timeaverages(source=source):
+        interval = node.findvalue('@interval')
+        if interval and interval != '1yr':
+            intervals.add(int(interval.replace('yr', '')))
+    if not intervals:
+        return ""
+    intervals = ','.join(str(n) for n in sorted(intervals))
+    start = FREUtil.graindate(sim0, 'year')
+    return _template("""
+        \$PYFRE_ENGINE pyFRE.frepp.accumstore -d \$accumdir add -c $component -p $period -s $start -n $intervals $avfile
+        if ( \$status ) echo "WARNING: could not add $avfile to the running averages"
+    """, locals(), pp)
+
+def close_average_csh(key, outdir, fallback, pp):
+    """Make csh writing the multi-year average *key* (eg.
+    ``atmos.1981-1985.ann``) to *outdir* from its running sums, or running
+    the csh *fallback* (which averages the 1-year files) if some years are
+    missing from them.
+    """
+    return _template("""
+        \$PYFRE_ENGINE pyFRE.frepp.accumstore -d \$accumdir close -o $outdir $key
+        if ( \$status ) then
+            echo "NOTE: running sums for $key incomplete, averaging the files"
+        $fallback
+        endif
+    """, locals(), pp)
+
+def historyAV(component, diag_source, label, variables, pp, prevdec=""):
+    """Make csh setting \$histav to a directory holding all the time averages
+    from history of *diag_source* over the years *label*: monthly
+    climatologies and seasonal and annual means, computed in one pass over the
+    (monthly, see convertSegments) history files in the work directory. The
+    directory is in \$tempCache, so only the first of monthlyAVfromhist,
+    seasonalAVfromhist and annualAV1yrfromhist run for the same files reads
+    them; the others copy their results. Averages computed without the
+    previous December *prevdec* lack the first DJF, so they don't satisfy a
+    call with it: that one runs again, and marks the directory as having it.
+    """
+    prev_opt = f"-d {prevdec}" if prevdec else ""
+    var_opt = f"-v {variables}" if variables else ""
+    marker = ".done.dec" if prevdec else ".done"
+    check_tsengine = logs.errorstr(f"TSENGINE (history averages of {component} {diag_source} {label})")
+    return _template("""
+        set histav = \$tempCache/histav/$component.$diag_source.$label
+        if ( ! -e \$histav/$marker ) then
+            mkdir -p \$histav
+            $time_timavg \$PYFRE_ENGINE pyFRE.frepp.tsengine histav -c $component -o \$histav $prev_opt $var_opt *.$diag_source.nc
+            $check_tsengine
+            touch \$histav/.done \$histav/$marker
+        endif
+    """, locals(), pp)
+
+def monthlyAVfromhist(taNode, sim0, npool=1):
 """TIMEAVERAGES - MONTHLY"""
 # frepp.pl l.4588
     #taNode = _[0] ;
     sim0    = _[1];
+    npool   = _[2] || 1;
     ppcNode = _[0]->parentNode;
 
     #check for appropriate segment lengths
@@ -1089,7 +819,7 @@ def monthlyAVfromhist(taNode, sim0):
     int =~ s/yr//;
     mod = yrsSoFar % int;
     unless ( mod == 0 ) { return ""; }
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( int > maxyrs ) { maxyrs = int; }
 
     hDateyr = userstartyear;
@@ -1103,9 +833,9 @@ def monthlyAVfromhist(taNode, sim0):
     foreach d (@hDates) { historyfiles .= "d" . "0101.nc.tar "; }
 
     diag_source = _[0]->findvalue('@diag_source');
-    my @monthnodes  = ppcNode->findnodes('timeSeries[@freq="monthly"]');
+    my @monthnodes  = ppcNode->timeseries('monthly');
     if ( scalar @monthnodes and "diag_source" eq "" ) {
-        monthnode = ppcNode->findnodes('timeSeries[@freq="monthly"]')->get_node(1);
+        monthnode = monthnodes[0];
         diag_source = monthnode->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -1118,7 +848,7 @@ def monthlyAVfromhist(taNode, sim0):
     zInterp    = ppcNode->findvalue('@zInterp');
     do_zInterp = 0;
     if ( "zInterp" ne "" ) { do_zInterp = 1; }
-    convertSeg = convertSegments( segTime, segUnits, diag_source );
+    convertSeg = convertSegments( segTime, segUnits, diag_source, '', sourceGrid, pp );
     check_ncatted = errorstr("NCATTED (component src interval averages)");
 
     #check_cpio = errorstr("CPIO (component src interval averages)");
@@ -1132,6 +862,13 @@ def monthlyAVfromhist(taNode, sim0):
     check_ncrename = errorstr("NCRENAME (component src interval averages)");
     check_nccopy   = errorstr("NCCOPY (component src interval averages)");
 
+    # the months are run by the pool in scratch directories, so history files
+    # are read from \work; fregrid changes directory to \work, so with
+    # xyInterp the months run one at a time
+    months = '01 02 03 04 05 06 07 08 09 10 11 12';
+    monthpool = ( "xyInterp" ne '' ) ? 1 : npool;
+    monthbody = '';
+
     csh = setcheckpt("monthlyAVfromhist_interval");
     csh .= <<EOF;
 #####################################
@@ -1165,39 +902,38 @@ set avg_vars = (average_T1,average_T2,average_DT,time_bnds)
 set vars = ("variables","\static_vars","\avg_vars")
 unset static_vars avg_vars
 endif
-set month = 1
-while (\month <= 12)
+EOF
+        monthbody .= <<EOF;
 set i = 1
 while ( \i <= 6 )
 
-set monthf = `echo \month | sed 's/.*/0&/;s/.\\(..\\)/\\1/'`
 set histmonth = "\monthf"
 
 if ( "variables" != '' ) then
-    time_ncrcat ncrcat \ncrcatopt -v \vars *\{histmonth}01.diag_sourcetile.nc month.nc
+    time_ncrcat ncrcat \ncrcatopt -v \vars \work/*\{histmonth}01.diag_sourcetile.nc month.nc
 else
-    time_ncrcat ncrcat \ncrcatopt *\{histmonth}01.diag_sourcetile.nc month.nc
+    time_ncrcat ncrcat \ncrcatopt \work/*\{histmonth}01.diag_sourcetile.nc month.nc
 endif
 check_ncrcat
-time_rm rm -f *\{histmonth}01.diag_sourcetile.nc
+time_rm rm -f \work/*\{histmonth}01.diag_sourcetile.nc
 EOF
 
         if (do_zInterp) {
-            csh .= <<EOF;
+            monthbody .= <<EOF;
     time_timavg \TIMAVG -o modellevels.nc month.nc
     retry_timavg
         time_timavg \TIMAVG -o modellevels.nc month.nc
     check_timavg
     time_rm rm -f month.nc
 EOF
-            csh
+            monthbody
                 .= zInterpolate( zInterp, 'modellevels.nc',
                 "hDates[0]\{histmonth}01.diag_sourcetile.nc",
                 caltype, variables, diag_source );
 
         }
         else {    #no zinterp
-            csh .= <<EOF;
+            monthbody .= <<EOF;
     time_timavg \TIMAVG -o hDates[0]\{histmonth}01.diag_sourcetile.nc month.nc
     retry_timavg
         time_timavg \TIMAVG -o hDates[0]\{histmonth}01.diag_sourcetile.nc month.nc
@@ -1220,8 +956,8 @@ EOF
             call_and_check_fregrid =~ s/#check_fregrid/check_fregrid/;
             call_and_check_fregrid =~ s/#check_ncrename/check_ncrename/g;
             call_and_check_fregrid =~ s/#check_ncatted/check_ncatted/g;
-            compress = compress_csh( "component.range.\monthf.nc", check_nccopy );
-            csh .= <<EOF;
+            compress = compress_csh( "component.range.\monthf.nc", check_nccopy, diag_source );
+            monthbody .= <<EOF;
 @ i ++
 end
 
@@ -1256,8 +992,8 @@ EOF
 
         } ## end if ( "xyInterp" ne '')
         else {    #CUBIC - no conversion
-            compress = compress_csh( "component.range.\monthftile.nc", check_nccopy );
-            csh .= <<EOF;
+            compress = compress_csh( "component.range.\monthftile.nc", check_nccopy, diag_source );
+            monthbody .= <<EOF;
 mv hDates[0]\{histmonth}01.diag_sourcetile.nc component.range.\monthftile.nc
 time_ncatted ncatted -h -O -a filename,global,m,c,"component.range.\monthftile.nc" component.range.\monthftile.nc
 check_ncatted
@@ -1275,11 +1011,9 @@ end
 EOF
         }
 
-        csh .= <<EOF;
-@ month++
-end
-
-EOF
+        csh .= varpool::foreach_csh( 'monthf', months, monthbody,
+            "TIMAVG (component src interval averages)", "monthlyAVfromhist_interval",
+            monthpool );
 
     } ## end if ( "sourceGrid" eq ...)
     else {    #IF NOT CUBIC
@@ -1298,38 +1032,38 @@ set avg_vars = (average_T1,average_T2,average_DT,time_bnds)
 set vars = ("variables","\static_vars","\avg_vars")
 unset static_vars avg_vars
 endif
+EOF
+        # all months are averaged in one pass, before the loop
+        unless (do_zInterp) {
+            csh .= historyAV( component, diag_source, range, variables, pp );
+        }
 
-set month = 1
-while (\month <= 12)
-set monthf = `echo \month | sed 's/.*/0&/;s/.\\(..\\)/\\1/'`
+        monthbody .= <<EOF;
 set histmonth = "\monthf"
 
 if ( -e month.nc ) rm -f month.nc
 if ( "variables" != '' ) then
-    time_ncrcat ncrcat \ncrcatopt -v \vars *\{histmonth}01.diag_source.nc month.nc
+    time_ncrcat ncrcat \ncrcatopt -v \vars \work/*\{histmonth}01.diag_source.nc month.nc
 else
-    time_ncrcat ncrcat \ncrcatopt *\{histmonth}01.diag_source.nc month.nc
+    time_ncrcat ncrcat \ncrcatopt \work/*\{histmonth}01.diag_source.nc month.nc
 endif
 check_ncrcat
-time_rm rm -f *\{histmonth}01.diag_source.nc
+time_rm rm -f \work/*\{histmonth}01.diag_source.nc
 EOF
 
         if (do_zInterp) {
-            csh .= <<EOF;
+            monthbody .= <<EOF;
 time_timavg \TIMAVG -o modellevels.nc month.nc
 retry_timavg
     time_timavg \TIMAVG -o modellevels.nc month.nc
 check_timavg
 EOF
-            csh .= zInterpolate( zInterp, 'modellevels.nc', "component.range.\monthf.nc",
+            monthbody .= zInterpolate( zInterp, 'modellevels.nc', "component.range.\monthf.nc",
                 caltype, variables, component );
         }
         else {
-            csh .= <<EOF;
-time_timavg \TIMAVG -o component.range.\monthf.nc month.nc
-retry_timavg
-    time_timavg \TIMAVG -o component.range.\monthf.nc month.nc
-check_timavg
+            monthbody .= <<EOF;
+time_cp cp \histav/component.range.\monthf.nc component.range.\monthf.nc
 EOF
         }
 
@@ -1347,7 +1081,7 @@ EOF
             call_and_check_fregrid =~ s/#check_fregrid/check_fregrid/;
             call_and_check_fregrid =~ s/#check_ncrename/check_ncrename/g;
             call_and_check_fregrid =~ s/#check_ncatted/check_ncatted/g;
-            csh .= <<EOF;
+            monthbody .= <<EOF;
 set fregrid_wt = "fregrid_wt"
 set fregrid_in_date = hDates[0]\{histmonth}01
 set fregrid_in = "component.range.\monthf"
@@ -1364,11 +1098,17 @@ mv \fregrid_in.nc component.range.\monthf.nc
 EOF
         } ## end if ( "xyInterp" ne '')
 
-        compress = compress_csh( "component.range.\monthf.nc", check_nccopy );
+        compress = compress_csh( "component.range.\monthf.nc", check_nccopy, diag_source );
+        accumulate = '';
+        if ( int == 1 ) {
+            accumulate = accumulate_csh( ppcNode, component, 'monthly', sim0,
+                "component.range.\monthf.nc", "\monthf", pp );
+        }
 
-        csh .= <<EOF;
+        monthbody .= <<EOF;
 time_ncatted ncatted -h -O -a filename,global,m,c,"component.range.\monthf.nc" component.range.\monthf.nc
 check_ncatted
+accumulate
 compress
 time_mv mvfile component.range.\monthf.nc \outdir/component.range.\monthf.nc
 if ( \status ) then
@@ -1380,10 +1120,10 @@ time_rm rm component.range.\monthf.nc
 time_dmput dmput \outdir/component.range.\monthf.nc
 
 time_rm rm -f month.nc
-@ month++
-end
-
 EOF
+        csh .= varpool::foreach_csh( 'monthf', months, monthbody,
+            "TIMAVG (component src interval averages)", "monthlyAVfromhist_interval",
+            monthpool );
     } ## end else [ if ( "sourceGrid" eq ...)]
 
     if (opt_z) { csh .= end_systime(); }
@@ -1420,9 +1160,9 @@ def annualAV1yrfromhist(taNode, sim0, write2arch, yr2do):
     my (hDateyr) = FREUtil::splitDate(yr2do);
 
     diag_source = _[0]->findvalue('@diagSource');
-    my @monthnodes  = ppcNode->findnodes('timeSeries[@freq="monthly"]');
+    my @monthnodes  = ppcNode->timeseries('monthly');
     if ( scalar @monthnodes and "diag_source" eq "" ) {
-        monthnode = ppcNode->findnodes('timeSeries[@freq="monthly"]')->get_node(1);
+        monthnode = monthnodes[0];
         diag_source = monthnode->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -1454,7 +1194,7 @@ def annualAV1yrfromhist(taNode, sim0, write2arch, yr2do):
     csh            = setcheckpt('annualAV1yrfromhist');
     if ( "write2arch" eq "1" ) {
         csh          .= "set write2arch = 1\n";
-        mkdircommand .= "outdir ";
+        exp.dirplan.add(outdir)
     }
     else {
         csh .= "set write2arch = 0\n";
@@ -1532,7 +1272,7 @@ EOF
             call_and_check_fregrid =~ s/#check_ncrename/check_ncrename/g;
             call_and_check_fregrid =~ s/#check_ncatted/check_ncatted/g;
             compress = compress_csh( "\tempCache/outdirpath/component.tENDf.ann.nc",
-                check_nccopy );
+                check_nccopy, diag_source );
             csh .= <<EOF;
 @ i ++
 end
@@ -1570,7 +1310,7 @@ EOF
         else {    #CUBIC - no conversion
             compress
                 = compress_csh( "\tempCache/outdirpath/component.tENDf.anntile.nc",
-                check_nccopy );
+                check_nccopy, diag_source );
             csh .= <<EOF;
 mv yr2do.diag_sourcetile.nc component.tENDf.anntile.nc
 time_ncatted ncatted -h -O -a filename,global,m,c,"component.tENDf.anntile.nc" component.tENDf.anntile.nc
@@ -1628,11 +1368,10 @@ EOF
 
         }
         else {
+            histav = historyAV( component, diag_source, tENDf, variables, pp );
             csh .= <<EOF;
-time_timavg \TIMAVG -o component.tENDf.ann.nc annual.nc
-retry_timavg
-time_timavg \TIMAVG -o component.tENDf.ann.nc annual.nc
-check_timavg
+histav
+time_cp cp \histav/component.tENDf.ann.nc component.tENDf.ann.nc
 
 EOF
         }
@@ -1668,12 +1407,15 @@ EOF
         } ## end if ( "xyInterp" ne '')
 
         compress
-            = compress_csh( "\tempCache/outdirpath/component.tENDf.ann.nc", check_nccopy );
+            = compress_csh( "\tempCache/outdirpath/component.tENDf.ann.nc", check_nccopy, diag_source );
+        accumulate = accumulate_csh( ppcNode, component, 'annual', sim0,
+            "\tempCache/outdirpath/component.tENDf.ann.nc", 'ann', pp );
 
         csh .= <<EOF;
 time_ncatted ncatted -h -O -a filename,global,m,c,"component.tENDf.ann.nc" component.tENDf.ann.nc
 check_ncatted
 time_mv mv component.tENDf.ann.nc \tempCache/outdirpath/component.tENDf.ann.nc
+accumulate
 if ( \write2arch ) then
 compress
 time_mv mvfile \tempCache/outdirpath/component.tENDf.ann.nc \outdir/component.tENDf.ann.nc
@@ -1717,16 +1459,15 @@ def annualAVxyrfromann(taNode, sim0, ppcNode, annavnodes, annCalcInterval):
     int =~ s/yr//;
     mod = yrsSoFar % int;
     unless ( mod == 0 ) { return ""; }
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( int > maxyrs ) { maxyrs = int; }
     first = FREUtil::padzeros( t0f - int + 1 );
 
     #check for missing files
     diag_source = _[0]->findvalue('@diagSource');
-    my @monthnodes  = _[0]->parentNode->findnodes('timeSeries[@freq="monthly"]');
+    my @monthnodes  = _[0]->parentNode->timeseries('monthly');
     if ( scalar @monthnodes and "diag_source" eq "" ) {
-        monthnode
-            = _[0]->parentNode->findnodes('timeSeries[@freq="monthly"]')->get_node(1);
+        monthnode = monthnodes[0];
         diag_source = monthnode->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -1804,7 +1545,7 @@ EOF
             compress
                 = compress_csh(
                 "\tempCache/outdirpath/component.first-endinterval.anntile.nc",
-                check_nccopy );
+                check_nccopy, diag_source );
             csh .= <<EOF;
 foreach file (filelist)
 set f = \file:t
@@ -1857,8 +1598,8 @@ EOF
         else {    # LATLON
             compress
                 = compress_csh( "\tempCache/outdirpath/component.first-endinterval.ann.nc",
-                check_nccopy );
-            csh .= <<EOF;
+                check_nccopy, diag_source );
+            fromfiles = <<EOF;
 foreach file (filelist)
 set f = \file:t
 if ( ! -f \f ) then
@@ -1888,6 +1629,10 @@ time_timavg \TIMAVG -o \tempCache/outdirpath/component.first-endinterval.ann.nc
 check_timavg
 time_ncatted ncatted -h -O -a filename,global,m,c,"component.first-endinterval.ann.nc" \tempCache/outdirpath/component.first-endinterval.ann.nc
 check_ncatted
+EOF
+            csh .= close_average_csh( "component.first-endinterval.ann",
+                "\tempCache/outdirpath", fromfiles, pp );
+            csh .= <<EOF;
 compress
 time_mv mvfile \tempCache/outdirpath/component.first-endinterval.ann.nc \outdir/component.first-endinterval.ann.nc
 if ( \status ) then
@@ -1930,7 +1675,7 @@ def monthlyTSfromdailyTS(tsNode, sim0, startofrun):
     yrsSoFar = &Delta_Format( FREUtil::dateCalc( sim0, t0 ), 0, "%yd" );
     mod = ( yrsSoFar + 1 ) % chunkLength;
     if ( mod != 0 ) { return ""; }    #don't do any calculations until a chunk is ready to go.
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( chunkLength > maxyrs ) { maxyrs = chunkLength; }
     indir    = "ppRootDir/component/ts/avgatt/chunkLength" . "yr";
     hDateyr  = userstartyear;
@@ -1986,7 +1731,7 @@ if ( ! -e \outdir ) mkdir -p \outdir
 
 EOF
     if (opt_z) { csh .= begin_systime(); }
-    compress = compress_csh( "\out.\var.nc", check_nccopy );
+    compress = compress_csh( "\out.*.nc", check_nccopy );
     csh .= <<EOF;
 set in = 'component.in_start-in_end'
 set out = 'component.out_start-out_end'
@@ -2026,7 +1771,7 @@ foreach y1 ( @hDates )
     @ monthi ++
     set m1 = `printf '%02i' \monthi`
 
-    set t = `ncdump -h \in.\var.nc | grep -i '.*=.*unlimited.*currently' | awk '{print \1}'`
+    set t = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb timename \in.\var.nc`
     time_ncks ncks \ncksopt -d \t,\d1,\d2 \in.\var.nc \y1\m1.\var.daily.nc
     check_ncks
     time_timavg \TIMAVG -o \y1\m1.\var.nc \y1\m1.\var.daily.nc
@@ -2043,8 +1788,14 @@ time_ncrcat ncrcat \ncrcatopt *??.\var.nc \out.\var.nc
 check_ncrcat
 time_ncatted ncatted -h -O -a filename,global,m,c,"\out.\var.nc" \out.\var.nc
 check_ncatted
+set length = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb nrec \out.\var.nc`
+test \length = numtimelevels
+check_levels
+end
+
+# all variables at once, in parallel
 compress
-set tmpstring = `ncdump -h \out.\var.nc | grep UNLIMITED`
+foreach var ( variables )
 time_mv mvfile \out.\var.nc outdir/
 if ( \status ) then
     echo "WARNING: data transfer failure, retrying..."
@@ -2053,10 +1804,6 @@ if ( \status ) then
 endif
 time_rm rm \out.\var.nc
 time_rm rm -f *??.\var.nc
-@ len = \#tmpstring - 1
-set length = `echo \tmpstring[\len] | cut -c2-`
-test \length = numtimelevels
-check_levels
 end
 
 EOF
@@ -2067,12 +1814,13 @@ EOF
     return csh;
 } ## end sub monthlyTSfromdailyTS
 
-def directTS(tsNode, sim0, startofrun):
+def directTS(tsNode, sim0, startofrun, npool=1):
 """TIMESERIES - HOURLY, DAILY, MONTHLY, ANNUAL"""
 # frepp.pl l.5585
         #tsNode = _[0] ;
     sim0       = _[1];
     startofrun = _[2];
+    npool      = _[3] || 1;
     ppcNode    = _[0]->parentNode;
     avgatt     = _[0]->findvalue('@averageOf');
     freq       = _[0]->findvalue('@freq');
@@ -2125,7 +1873,7 @@ def directTS(tsNode, sim0, startofrun):
     if ( mod != 0 and "iunit" eq "years" ) {
         return "";
     }    #don't do any calculations until a chunk is ready to go.
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( chunkLength > maxyrs ) { maxyrs = chunkLength; }
 
     hDateyr = userstartyear;
@@ -2192,6 +1940,7 @@ def directTS(tsNode, sim0, startofrun):
     check_plevel      = errorstr("PLEVEL (component freq ts from source)");
     check_splitncvars = errorstr("SPLITNCVARS (component freq ts from source)");
     check_ncrcat      = errorstr("NCRCAT (component freq ts from source)");
+    check_ncconcat    = errorstr("NCCONCAT (component freq ts from source)");
     check_ncatted     = errorstr("NCATTED (component freq ts from source)");
     check_ncdump      = errorstr("NCDUMP (component freq ts from source)");
     check_timavg      = retryonerrorend("TIMAVG (component freq ts from source)");
@@ -2383,8 +2132,8 @@ EOF
         else {    #not cubic, just ncrcat
             csh .= <<EOF;
 if ( -e all.nc ) rm -f all.nc
-time_ncrcat ncrcat \ncrcatopt *.source.nc all.nc
-check_ncrcat
+\PYFRE_ENGINE pyFRE.frepp.ncconcat -o all.nc *.source.nc
+check_ncconcat
 time_rm rm -f *.source.nc
 
 EOF
@@ -2430,15 +2179,36 @@ EOF
     # make sure file has bounds, splitncvars, adjust output, send to archive
     variablesopt = '';
     variablesopt = "-v variables" if "variables" ne '';
-    compress = compress_csh( "\file", check_nccopy );
+    compress = compress_csh( "*.nc", check_nccopy, source );
+    # per-variable loops, run by the pool in scratch directories: full paths
+    attrloop = varpool::foreach_csh( 'file', "\cwd/*.nc", <<EOF,
+    set label = "\file:t:r.nc"
+    time_ncatted ncatted -h -O -a filename,global,m,c,"component.start-tENDf.\label" \file
+    check_ncatted
+    set length = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb nrec \file`
+    test \length = numtimelevels
+    check_levels
+EOF
+        "NCATTED (component freq chunkstr ts)", "directTS_freq_chunkstr", npool );
+    mvloop = varpool::foreach_csh( 'file', "\cwd/*.nc", <<EOF,
+    set label = "\file:t:r.nc"
+    time_mv mvfile \file \outdir/component.start-tENDf.\label
+    if ( \status ) then
+        echo "WARNING: data transfer failure, retrying..."
+        time_mv mvfile \file \outdir/component.start-tENDf.\label
+        checktransfer
+    endif
+    time_mv mv \file \tempCache/outdirpath/component.start-tENDf.\label
+EOF
+        "TRANSFER (component freq chunkstr ts)", "directTS_freq_chunkstr_mv", npool );
     csh .= <<EOF;
 foreach filetosplit ( \filestosplit )
 
 # Determine if fields average_T1 and ( *_bounds or *_bnds ) exist in the
 # netCDF file.  If not, add in time_bounds.
-if ( `ncdump -h \filetosplit | grep -c " average_T1("` == 1 && `ncdump -h \filetosplit | grep -c "_b\\(ou\\)\\?nds("` == 0) then
+if ( `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb has average_T1 \filetosplit` == 1 && "`\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb time_bounds \filetosplit`" == "") then
 ncdump -v average_T1,average_T2 \filetosplit | /home/fms/bin/addbounds.pl | ncgen -o tmp.nc
-set taxis = `ncdump -h \filetosplit | grep -i '.*=.*unlimited.*currently' | awk '{print \1}'`
+set taxis = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb timename \filetosplit`
 time_ncks ncks \ncksopt -C -A -v \{taxis}_bounds tmp.nc \filetosplit
 check_ncks
 time_ncatted ncatted -h -O -a bounds,\taxis,c,c,"\{taxis}_bounds" \filetosplit
@@ -2452,24 +2222,10 @@ cd byVar
 test `ls | wc -l` -gt 0
 check_filesexist
 if ( `ls | wc -l` > 0 ) then
-foreach file ( *.nc )
-    set label = "\file:r.nc"
-    time_ncatted ncatted -h -O -a filename,global,m,c,"component.start-tENDf.\label" \file
-    check_ncatted
-    set tmpstring = `ncdump -h \file | grep UNLIMITED`
-    @ len = \#tmpstring - 1
-    set length = `echo \tmpstring[\len] | cut -c2-`
-    test \length = numtimelevels
-    check_levels
-    compress
-    time_mv mvfile \file \outdir/component.start-tENDf.\label
-    if ( \status ) then
-        echo "WARNING: data transfer failure, retrying..."
-        time_mv mvfile \file \outdir/component.start-tENDf.\label
-        checktransfer
-    endif
-    time_mv mv \file \tempCache/outdirpath/component.start-tENDf.\label
-end
+attrloop
+# all variables at once, in parallel
+compress
+mvloop
 cd \work
 time_rm rm -rf byVar
 
@@ -2523,7 +2279,7 @@ def monthlyAVfromav(taNode, sim0, subint):
     int =~ s/yr//;
     mod = yrsSoFar % int;
     unless ( mod == 0 ) { return ""; }
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( int > maxyrs ) { maxyrs = int; }
 
     #get variables
@@ -2532,9 +2288,9 @@ def monthlyAVfromav(taNode, sim0, subint):
 
     #check for missing files
     diag_source = _[0]->findvalue('@diagSource');
-    my @monthnodes  = ppcNode->findnodes('timeSeries[@freq="monthly"]');
+    my @monthnodes  = ppcNode->timeseries('monthly');
     if ( scalar @monthnodes and "diag_source" eq "" ) {
-        monthnode = ppcNode->findnodes('timeSeries[@freq="monthly"]')->get_node(1);
+        monthnode = monthnodes[0];
         diag_source = monthnode->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -2576,7 +2332,27 @@ def monthlyAVfromav(taNode, sim0, subint):
     check_dmget   = errorstr("DMGET (component src interval averages)");
     check_nccopy  = errorstr("NCCOPY (component src interval averages)");
     csh           = setcheckpt("monthlyAVfromav_interval");
-    compress = compress_csh( "component.start-end.\monthf\tile.nc", check_nccopy );
+    compress = compress_csh( "component.start-end.\monthf\tile.nc", check_nccopy, diag_source );
+    average = <<EOF;
+if ( -e month.nc ) rm -f month.nc
+if ( "variables" != '' ) then
+    time_ncrcat ncrcat \ncrcatopt -v \vars filelist month.nc
+else
+    time_ncrcat ncrcat \ncrcatopt filelist month.nc
+endif
+check_ncrcat
+time_timavg \TIMAVG -o component.start-end.\monthf\tile.nc month.nc
+retry_timavg
+time_timavg \TIMAVG -o component.start-end.\monthf\tile.nc month.nc
+check_timavg
+time_ncatted ncatted -h -O -a filename,global,m,c,"component.start-end.\monthf\tile.nc" component.start-end.\monthf\tile.nc
+check_ncatted
+EOF
+    # running sums of the 1-year averages (see accumulate_csh); they are
+    # only kept for latlon and tripolar output
+    unless ( "sourceGrid" eq 'cubedsphere' and "xyInterp" eq '' ) {
+        average = close_average_csh( "component.start-end.\monthf", "\work", average, pp );
+    }
     csh .= <<EOF;
 #####################################
 echo 'timeAverage (component src interval averages from subint yr averages)'
@@ -2615,19 +2391,7 @@ endif
 set month = 1
 while (\month <= 12)
 set monthf = `echo \month | sed 's/.*/0&/;s/.\\(..\\)/\\1/'`
-if ( -e month.nc ) rm -f month.nc
-if ( "variables" != '' ) then
-    time_ncrcat ncrcat \ncrcatopt -v \vars filelist month.nc
-else
-    time_ncrcat ncrcat \ncrcatopt filelist month.nc
-endif
-check_ncrcat
-time_timavg \TIMAVG -o component.start-end.\monthf\tile.nc month.nc
-retry_timavg
-time_timavg \TIMAVG -o component.start-end.\monthf\tile.nc month.nc
-check_timavg
-time_ncatted ncatted -h -O -a filename,global,m,c,"component.start-end.\monthf\tile.nc" component.start-end.\monthf\tile.nc
-check_ncatted
+average
 compress
 time_mv mvfile component.start-end.\monthf\tile.nc \outdir/
 if ( \status ) then
@@ -2672,7 +2436,7 @@ def annualAVfromav(taNode, sim0, subint):
     int =~ s/yr//;
     mod = yrsSoFar % int;
     unless ( mod == 0 ) { return ""; }
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( int > maxyrs ) { maxyrs = int; }
     first = FREUtil::padzeros( t0f - int + 1 );
 
@@ -2682,10 +2446,9 @@ def annualAVfromav(taNode, sim0, subint):
 
     #check for missing files
     diag_source = _[0]->findvalue('@diagSource');
-    my @monthnodes  = _[0]->parentNode->findnodes('timeSeries[@freq="monthly"]');
+    my @monthnodes  = _[0]->parentNode->timeseries('monthly');
     if ( scalar @monthnodes and "diag_source" eq "" ) {
-        monthnode
-            = _[0]->parentNode->findnodes('timeSeries[@freq="monthly"]')->get_node(1);
+        monthnode = monthnodes[0];
         diag_source = monthnode->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -2729,11 +2492,9 @@ EOF
         check_dmget   = errorstr("DMGET (component src interval averages)");
         check_nccopy  = errorstr("NCCOPY (component src interval averages)");
         compress
-            = compress_csh( "component.first-endinterval.ann\tile.nc", check_nccopy );
-        csh .= <<EOF;
+            = compress_csh( "component.first-endinterval.ann\tile.nc", check_nccopy, diag_source );
+        average = <<EOF;
 cd srcdir
-tilestart
-
 time_dmget dmget "filelist"
 
 cd \work
@@ -2764,6 +2525,15 @@ time_timavg \TIMAVG -o component.first-endinterval.ann\tile.nc xyears.nc
 check_timavg
 time_ncatted ncatted -h -O -a filename,global,m,c,"component.first-endinterval.ann\tile.nc" component.first-endinterval.ann\tile.nc
 check_ncatted
+EOF
+        # running sums of the 1-year averages (see accumulate_csh); they are
+        # only kept for latlon and tripolar output
+        unless ( "sourceGrid" eq 'cubedsphere' and "xyInterp" eq '' ) {
+            average = close_average_csh( "component.first-endinterval.ann", "\work", average, pp );
+        }
+        csh .= <<EOF;
+tilestart
+average
 compress
 time_mv mvfile component.first-endinterval.ann\tile.nc \outdir/component.first-endinterval.ann\tile.nc
 if ( \status ) then
@@ -2798,11 +2568,12 @@ def staticvars(diag_source, ptmpDir, tmphistdir, refinedir):
     check_cpio        = errorstr("CPIO (component static variables)");
     check_ncatted     = errorstr("NCATTED (component static variables)");
     check_splitncvars = errorstr("SPLITNCVARS (component static variables)");
+    check_statics     = errorstr("STATICS (component static variables)");
     check_fregrid     = errorstr("FREGRID (component static variables)");
     check_ncrename    = errorstr("NCRENAME (component static variables)");
     check_ncatted     = errorstr("NCATTED (component static variables)");
     check_nccopy      = errorstr("NCCOPY (component static variables)");
-    compress = compress_csh( "ppRootDir/component/component.static.nc", check_nccopy );
+    compress = compress_csh( "ppRootDir/component/component.static.nc", check_nccopy, diag_source );
 
     historyfiles .= "hDate" . ".nc.tar ";
 
@@ -2823,7 +2594,7 @@ endif
 # Get files listed as associated_files
 foreach file ( tmphistdir/hDate.nc/*diag_source* )
     # Get a list of all associated_files
-    set assocFiles = `ncdump -h \file | grepAssocFiles`
+    set assocFiles = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb associated_files \file`
     foreach assocFile ( \assocFiles )
         time_hsmget \hsmget -a opt_d -p ptmpDir/history -w tmphistdir hDate.nc/\\*\{assocFile:r}.\\*
     end
@@ -2838,7 +2609,7 @@ endif
 # Get files listed as associated_files
 foreach file ( tmphistdir/hDate.nc/*diag_source* )
     # Get a list of all associated_files
-    set assocFiles = `ncdump -h \file | grepAssocFiles`
+    set assocFiles = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb associated_files \file`
     foreach assocFile ( \assocFiles )
         time_hsmget \hsmget -a refinedir -p ptmpDir/history_refineDiag -w tmphistdir hDate.nc/\\*\{assocFile:r}.\\*
     end
@@ -2870,7 +2641,7 @@ endif
 # Get files listed as associated_files
 foreach file ( \\*diag_source\\* )
     # Get a list of all associated_files
-    set assocFiles = `ncdump -h \file | grepAssocFiles`
+    set assocFiles = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb associated_files \file`
     foreach assocFile ( \assocFiles )
         time_hsmget \hsmget -a opt_d -p ptmpDir/history -w tmphistdir hDate.nc/\\*\{assocFile:r}.\\*
     end
@@ -2885,7 +2656,7 @@ endif
 # Get files listed as associated_files
 foreach file ( \\*diag_source\\* )
     # Get a list of all associated_files
-    set assocFiles = `ncdump -h \file | grepAssocFiles`
+    set assocFiles = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb associated_files \file`
     foreach assocFile ( \assocFiles )
         time_hsmget \hsmget -a refinedir -p ptmpDir/history_refineDiag -w tmphistdir hDate.nc/\\*\{assocFile:r}.\\*
     end
@@ -2896,23 +2667,13 @@ foreach file ( `ls \histDir/*/*nc`)
 end
 EOF
 
-        foreach i ( 1 .. 6 ) {
-            csh .= <<EOF;
-set files = (`ls -1 hDate.diag_source*tilei.nc | grep -v grid_spec | grep -v ocean_geometry`)
-set static = (`\NCVARS -s012 \files`) # only support up to 2D static fields
-if ( "\static" != "" ) then
-    foreach file ( \files )
-        set static = (`\NCVARS -s012 \file`)
-        if ( "\static" != "" ) then
-        set static = `echo \static | tr ' ' ','`
-        time_splitncvars \SPLITNCVARS -s -v \static -f ppRootDir/component/component.static.tilei.nc \file
-check_splitncvars
-        endif
-    end
-endif
+        # all six tiles' static files, written in parallel
+        csh .= <<EOF;
+set files = (`ls -1 hDate.diag_source*tile[1-6].nc | grep -v grid_spec | grep -v ocean_geometry`)
+\PYFRE_ENGINE pyFRE.frepp.statics -d \headerdb -a tmphistdir/hDate.nc -a . -o ppRootDir/component/component.static.nc \files
+check_statics
 endif
 EOF
-        }
         return csh;
     } ## end if ( "sourceGrid" eq ...)
     elsif ( "sourceGrid" eq 'cubedsphere' and "xyInterp" ne '' ) {
@@ -2958,11 +2719,8 @@ foreach tfile ( \tiles )
     set fregrid_remap_file = xyInterpRegridFile
     set source_grid = sourceGrid
 
-    set onedvars = `\NCVARS -s01 \fregrid_in.tile1.nc`
-    if ( "\onedvars" != "" ) then
-    set onedvarlist = `echo \onedvars | tr ' ' ','`
-    time_splitncvars \SPLITNCVARS -s -v \onedvarlist -f ppRootDir/component/component.static.nc \fregrid_in.tile1.nc
-    endif
+    \PYFRE_ENGINE pyFRE.frepp.statics -n -r 1 -d \headerdb -o ppRootDir/component/component.static.nc \fregrid_in.tile1.nc
+    check_statics
 
 # call and check fregrid start
 call_and_check_fregrid
@@ -3027,18 +2785,10 @@ EOF
     # process latlon files for static variables
     csh .= <<EOF;
 if ( \#output_files > 0 ) then
-    set static = (`\NCVARS -s012 \output_files`) # only support up to 2D static fields
-    if ( "\static" != "" ) then
-        foreach file ( \output_files )
-        set static = (`\NCVARS -s012 \file`)
-        if ( "\static" != "" ) then
-            set static = `echo \static | tr ' ' ','`
-            time_splitncvars \SPLITNCVARS -s -v \static -f ppRootDir/component/component.static.nc \file
-            check_splitncvars
-        endif
-        end
-        time_dmput dmput ppRootDir/component/component.static.nc
-    endif
+    # only support up to 2D static fields
+    \PYFRE_ENGINE pyFRE.frepp.statics -d \headerdb -a tmphistdir/hDate.nc -a . -o ppRootDir/component/component.static.nc \output_files
+    check_statics
+    if ( -e ppRootDir/component/component.static.nc ) time_dmput dmput ppRootDir/component/component.static.nc
 endif
 compress
 endif
@@ -3047,12 +2797,13 @@ EOF
 } ## end sub staticvars
 
 
-def TSfromts(tsNode, sim0, subchunk):
+def TSfromts(tsNode, sim0, subchunk, npool=1):
 """TIMESERIES - from smaller timeSeries"""
 # frepp.pl l.6562
         #tsNode = _[0] ;
     sim0     = _[1];
     subchunk = _[2];
+    npool    = _[3] || 1;
     ppcNode  = _[0]->parentNode;
 
     freq        = _[0]->findvalue('@freq');
@@ -3073,14 +2824,14 @@ def TSfromts(tsNode, sim0, subchunk):
     cl =~ s/yr//;
     mod = yrsSoFar % cl;
     unless ( mod == 0 ) { return ""; }
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( cl > maxyrs ) { maxyrs = cl; }
 
     #check that all files up to current time exist
-    my @nodes       = ppcNode->findnodes("timeSeries[\@freq='freq']");
+    my @nodes       = ppcNode->timeseries(freq);
     diag_source = "";
     if ( scalar @nodes ) {
-        node = ppcNode->findnodes("timeSeries[\@freq='freq']")->get_node(1);
+        node = nodes[0];
         diag_source = node->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -3098,11 +2849,13 @@ def TSfromts(tsNode, sim0, subchunk):
 #print "TSfromts tEND tEND cl cl subchunk subchunk start start startf startf end end endf endf\n";
 
     filelist   = "";
+    workfilelist = "";
     getlist    = "";
     cpiolist   = "";
     periodlist = "";
     until ( endf > tENDf ) {
         filelist = "filelist component.startf-endf.\var";
+        workfilelist = "workfilelist \work/component.startf-endf.\var";
         cpiolist
             = "cpiolist component.startf-endf." . FREUtil::timeabbrev(freq) . ".nc.cpio";
         getlist    = "getlist component.startf-endf.\*.nc";
@@ -3153,7 +2906,27 @@ def TSfromts(tsNode, sim0, subchunk):
     check_vars = errorstr(
         "NOT ALL VARIABLES EXIST FOR (component freq chunkLength ts from subchunk yr ts)");
 
-    compress = compress_csh( "component.startf-tENDf.\var", check_nccopy );
+    check_ncconcat
+        = errorstr("NCCONCAT (component freq chunkLength ts from subchunk yr ts)");
+
+    # run by the pool in scratch directories: inputs are read from \work
+    concatloop = varpool::foreach_csh( 'var', "\varlist", <<EOF,
+    if ( -e component.startf-tENDf.\var ) rm -f component.startf-tENDf.\var
+    \PYFRE_ENGINE pyFRE.frepp.ncconcat -z "\nc_compression_flags" -o component.startf-tENDf.\var workfilelist
+    check_ncconcat
+    set length = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb nrec component.startf-tENDf.\var`
+    test \length = numtimelevels
+    check_levels
+    time_mv mvfile component.startf-tENDf.\var outdir/
+    if ( \status ) then
+        echo "WARNING: data transfer failure, retrying..."
+        time_mv mvfile component.startf-tENDf.\var outdir/
+        checktransfer
+    endif
+    time_mv mv component.startf-tENDf.\var \tempCache/outdirpath/
+EOF
+        "NCCONCAT (component freq chunkLength ts from subchunk yr ts)",
+        "TSfromts_freq" . "_chunkLength", npool );
 
     csh = setcheckpt( "TSfromts_freq" . "_chunkLength" );
     csh .= <<EOF;
@@ -3226,26 +2999,7 @@ endif
 
 
 cd \work
-foreach var (\varlist)
-    if ( -e component.startf-tENDf.\var ) rm -f component.startf-tENDf.\var
-    time_ncrcat ncrcat \ncrcatopt filelist component.startf-tENDf.\var
-    check_ncrcat
-    time_ncatted ncatted -h -O -a filename,global,m,c,"component.startf-tENDf.\var" component.startf-tENDf.\var
-    check_ncatted
-    set tmpstring = `ncdump -h component.startf-tENDf.\var | grep UNLIMITED`
-    @ len = \#tmpstring - 1
-    set length = `echo \tmpstring[\len] | cut -c2-`
-    test \length = numtimelevels
-    check_levels
-    compress
-    time_mv mvfile component.startf-tENDf.\var outdir/
-    if ( \status ) then
-        echo "WARNING: data transfer failure, retrying..."
-        time_mv mvfile component.startf-tENDf.\var outdir/
-        checktransfer
-    endif
-    time_mv mv \work/component.startf-tENDf.\var \tempCache/outdirpath/
-end
+concatloop
 
 EOF
 
@@ -3286,14 +3040,14 @@ def seaTSfromts(tsNode, sim0, subchunk):
     cl =~ s/yr//;
     mod = yrsSoFar % cl;
     unless ( mod == 0 ) { return ""; }
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( cl > maxyrs ) { maxyrs = cl; }
 
     #check that all files up to current time exist
-    my @monthnodes  = ppcNode->findnodes('timeSeries[@freq="monthly"]');
+    my @monthnodes  = ppcNode->timeseries('monthly');
     diag_source = "";
     if ( scalar @monthnodes ) {
-        monthnode = ppcNode->findnodes('timeSeries[@freq="monthly"]')->get_node(1);
+        monthnode = monthnodes[0];
         diag_source = monthnode->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -3336,14 +3090,10 @@ def seaTSfromts(tsNode, sim0, subchunk):
     startf = FREUtil::graindate( start, 'year' );
     numtimelevels = gettimelevels( freq, chunkLength );
 
-    check_ncatted
-        = errorstr("NCATTED (component freq chunkLength ts from subchunk yr ts)");
-    check_ncrcat
-        = errorstr("NCRCAT (component freq chunkLength ts from subchunk yr ts)");
+    check_ncconcat
+        = errorstr("NCCONCAT (component freq chunkLength ts from subchunk yr ts)");
     check_cpio_msg = "CPIO (component freq chunkLength ts from subchunk yr ts)";
     check_dmget = errorstr("DMGET (component freq chunkLength ts from subchunk yr ts)");
-    check_nccopy
-        = errorstr("NCCOPY (component freq chunkLength ts from subchunk yr ts)");
     check_levels = '';
 
     if ( "caltype" eq "NOLEAP" or "caltype" eq "noleap" ) {
@@ -3363,7 +3113,6 @@ def seaTSfromts(tsNode, sim0, subchunk):
         piece =~ s/\sea.\var/*.nc/g;
         dmgetcommand .= "time_dmget dmget \"piece\"\n";
     }
-    compress = compress_csh( "component.startf-tENDf.\sea.\var", check_nccopy );
     csh = setcheckpt("seaTSfromts_chunkLength");
     csh .= <<EOF;
 #####################################
@@ -3430,15 +3179,10 @@ foreach var (\varlist)
     if ( \missingfiles == 0 ) then
 
     if ( -e component.startf-tENDf.\sea.\var ) rm -f component.startf-tENDf.\sea.\var
-    time_ncrcat ncrcat \ncrcatopt filelist component.startf-tENDf.\sea.\var
-    check_ncrcat
-    time_ncatted ncatted -h -O -a filename,global,m,c,"component.startf-tENDf.\sea.\var" component.startf-tENDf.\sea.\var
-    check_ncatted
-    set tmpstring = `ncdump -h component.startf-tENDf.\sea.\var | grep UNLIMITED`
-    @ len = \#tmpstring - 1
-    set length = `echo \tmpstring[\len] | cut -c2-`
+    \PYFRE_ENGINE pyFRE.frepp.ncconcat -z "\nc_compression_flags" -o component.startf-tENDf.\sea.\var filelist
+    check_ncconcat
+    set length = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb nrec component.startf-tENDf.\sea.\var`
     test \length = numtimelevels
-    compress
     time_mv mvfile component.startf-tENDf.\sea.\var \outdir/
     if ( \status ) then
         echo "WARNING: data transfer failure, retrying..."
@@ -3463,11 +3207,12 @@ EOF
     return csh;
 } ## end sub seaTSfromts
 
-def seasonalAVfromhist(taNode, sim0):
+def seasonalAVfromhist(taNode, sim0, npool=1):
 """TIMEAVERAGES - SEASONAL"""
 # frepp.pl l.6978
         #taNode = _[0] ;
     sim0    = _[1];
+    npool   = _[2] || 1;
     ppcNode = _[0]->parentNode;
 
     src         = 'seasonal';
@@ -3480,7 +3225,7 @@ def seasonalAVfromhist(taNode, sim0):
     int =~ s/yr//;
     mod = yrsSoFar % int;
     unless ( mod == 0 ) { return ""; }
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( int > maxyrs ) { maxyrs = int; }
     hDateyr = userstartyear;
     my @hDates  = ( FREUtil::padzeros( hDateyr - int + 1 ) .. "hDateyr" );
@@ -3490,9 +3235,9 @@ def seasonalAVfromhist(taNode, sim0):
     foreach d (@hDates) { historyfiles .= "d" . "0101.nc.tar "; }
 
     diag_source = _[0]->findvalue('@diagSource');
-    my @monthnodes  = ppcNode->findnodes('timeSeries[@freq="monthly"]');
+    my @monthnodes  = ppcNode->timeseries('monthly');
     if ( scalar @monthnodes and "diag_source" eq "" ) {
-        monthnode = ppcNode->findnodes('timeSeries[@freq="monthly"]')->get_node(1);
+        monthnode = monthnodes[0];
         diag_source = monthnode->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -3520,10 +3265,9 @@ def seasonalAVfromhist(taNode, sim0):
         "INCORRECT NUMBER OF SEASONS IN SEASONAL FILE (component src interval averages)");
     check_fregrid  = errorstr("FREGRID (component src interval averages)");
     check_ncrename = errorstr("NCRENAME (component src interval averages)");
-    convertSeg     = convertSegments( segTime, segUnits, diag_source );
-    convertDec     = convertSegments( segTime, segUnits, diag_source, 'dec' );
-    decSeg         = ( split ' ', convertDec )[-4];
-    decSeg =~ s/.*(\d\d01).*/1/;
+    convertSeg     = convertSegments( segTime, segUnits, diag_source, '', sourceGrid, pp );
+    convertDec     = convertSegments( segTime, segUnits, diag_source, 'dec', sourceGrid, pp );
+    decSeg         = decSegStart( segTime, segUnits );
 
     csh = setcheckpt("seasonalAVfromhist_interval");
     csh .= <<EOF;
@@ -3610,31 +3354,23 @@ else if ( -e opt_d/prevhistcpio ) then
     check_cpio
     time_dmput dmput opt_d/prevhistcpio
     set prevyear = prevyear
-    set i = 1
-    while ( \i <= 6 )
     convertDec
-    @ i ++
-    end
 else if ( -e opt_d/prevhisttar ) then
     time_dmget dmget opt_d/prevhisttar
     time_untar tar -xvf opt_d/prevhisttar --wildcards '*.diag_source.tile*.nc'
     check_cpio
     time_dmput dmput opt_d/prevhisttar
     set prevyear = prevyear
-    set i = 1
-    while ( \i <= 6 )
     convertDec
-    @ i ++
-    end
 else
-    set t = `ncdump -h nextdec.tile1.nc | grep -i '.*=.*unlimited.*currently' | awk '{print \1}'`
+    set t = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb timename nextdec.tile1.nc`
     set att_copy = (`ncdump -h nextdec.tile1.nc | sed -ne "s/.*\{t}:\\(.*\\) =.*/\t@\\1=\t@\\1;/gp"`)
-    if ( `ncdump -h nextdec.tile1.nc | grep -c " average_T1("` == 1 ) then
+    if ( `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb has average_T1 nextdec.tile1.nc` == 1 ) then
         # A field with 'long_name =  "time axis boundary"' should be in
         # the file.  Be sure to use the same name in the following
         # commands.  We can rather safely assume the same field name
         # will be used in all the tile files.
-        set tbnds_var = `ncdump -h nextdec.tile1.nc | grep 'long_name = "time axis boundaries"' | awk -F : '{ print 1 }'`
+        set tbnds_var = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb time_bounds nextdec.tile1.nc`
 
         time_ncap ncap2 -h -O -s "\{t}[\{t}]=\{t}-365; average_T1=average_T1-365; average_T2=average_T2-365; \{tbnds_var}=\{tbnds_var}-365; \att_copy" nextdec.tile1.nc seahist.diag_source.tile1.nc
         check_ncap
@@ -3667,7 +3403,7 @@ endif
 EOF
             } ## end if ( season == 1 )
 
-            compress = compress_csh( "component.tSEASONf.nc", check_nccopy );
+            compress = compress_csh( "component.tSEASONf.nc", check_nccopy, diag_source );
 
             csh .= <<EOF;
 if ( -e sea1.nc ) time_rm rm -f sea?.nc
@@ -3832,7 +3568,7 @@ EOF
                 call_and_check_fregrid =~ s/#check_fregrid/check_fregrid/;
                 call_and_check_fregrid =~ s/#check_ncrename/check_ncrename/g;
                 call_and_check_fregrid =~ s/#check_ncatted/check_ncatted/g;
-                compress = compress_csh( "component.dates.nc", check_nccopy );
+                compress = compress_csh( "component.dates.nc", check_nccopy, diag_source );
                 csh .= <<EOF;
 @ i ++
 end
@@ -3934,15 +3670,15 @@ else if ( -e opt_d/prevhisttar ) then
     set prevyear = prevyear
     convertDec
 else
-    set t = `ncdump -h nextdec | grep -i '.*=.*unlimited.*currently' | awk '{print \1}'`
+    set t = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb timename nextdec`
     set att_copy = (`ncdump -h nextdec | sed -ne "s/.*\{t}:\\(.*\\) =.*/\t@\\1=\t@\\1;/gp"`)
     #set hasAVT1 = `ncdump -v average_T1 nextdec | wc -l`
-    if ( `ncdump -h nextdec | grep -c " average_T1("` == 1 ) then
+    if ( `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb has average_T1 nextdec` == 1 ) then
         # A field with 'long_name =  "time axis boundary"' should be in
         # the file.  Be sure to use the same name in the following
         # commands.  We can rather safely assume the same field name
         # will be used in all the tile files.
-        set tbnds_var = `ncdump -h nextdec.tile1.nc | grep 'long_name = "time axis boundaries"' | awk -F : '{ print 1 }'`
+        set tbnds_var = `\PYFRE_ENGINE pyFRE.frepp.ncheader -d \headerdb time_bounds nextdec.tile1.nc`
 
         time_ncap ncap2 -h -O -s "\{t}[\{t}]=\{t}-365; average_T1=average_T1-365; average_T2=average_T2-365; \{tbnds_var}=\{tbnds_var}-365; \att_copy" nextdec seahist.diag_source.nc
         check_ncap
@@ -3969,7 +3705,7 @@ EOF
 
             #put code here to handle 1yr seasons case
             if ( int == 1 ) {
-                compress = compress_csh( "component.tSEASONf.nc", check_nccopy );
+                compress = compress_csh( "component.tSEASONf.nc", check_nccopy, diag_source );
                 if (do_zInterp) {
                     csh .= <<EOF;
 time_timavg \TIMAVG -o modellevels.nc sea.nc
@@ -3992,11 +3728,11 @@ endif
 EOF
                 } ## end if (do_zInterp)
                 else {
+                    histav = historyAV( component, diag_source, year, variables, pp,
+                        "\{prevyear}1201.diag_source.nc" );
                     csh .= <<EOF;
-time_timavg \TIMAVG -o component.tSEASONf.nc sea.nc
-retry_timavg
-time_timavg \TIMAVG -o component.tSEASONf.nc sea.nc
-check_timavg
+histav
+time_cp cp \histav/component.tSEASONf.nc component.tSEASONf.nc
 compress
 time_mv mvfile component.tSEASONf.nc \outdir/
 if ( \status ) then
@@ -4035,42 +3771,43 @@ cd out
 EOF
 
         if ( int > 1 ) {
-            foreach season ( 'DJF', 'MAM', 'JJA', 'SON' ) {
-                dates = "range" . ".season";
-                csh .= <<EOF;
-echo season season =========================================================
-test int = `ls -1 component.*.season.nc | wc -l`
+            # the seasons are run by the pool in scratch directories, reading
+            # the yearly averages from \work/out
+            dates = "range" . ".\season";
+            seasonbody = <<EOF;
+echo season \season =========================================================
+test int = `ls -1 \work/out/component.*.\season.nc | wc -l`
 check_numfiles
-set list = `ls -1 component.*.season.nc`
+set list = `ls -1 \work/out/component.*.\season.nc`
 if ( -e sea.nc ) time_rm rm -f sea.nc
 time_ncrcat ncrcat \ncrcatopt \list sea.nc
 check_ncrcat
 time_rm rm -f \list
 EOF
 
-                if (do_zInterp) {
-                    csh .= <<EOF;
+            if (do_zInterp) {
+                seasonbody .= <<EOF;
 time_timavg \TIMAVG -o modellevels.nc sea.nc
 retry_timavg
 time_timavg \TIMAVG -o modellevels.nc sea.nc
 check_timavg
 
 EOF
-                    csh .= zInterpolate( zInterp, 'modellevels.nc', "component.dates.nc",
-                        caltype, variables, component );
-                }
-                else {
-                    csh .= <<EOF;
+                seasonbody .= zInterpolate( zInterp, 'modellevels.nc', "component.dates.nc",
+                    caltype, variables, component );
+            }
+            else {
+                seasonbody .= <<EOF;
 time_timavg \TIMAVG -o component.dates.nc sea.nc
 retry_timavg
 time_timavg \TIMAVG -o component.dates.nc sea.nc
 check_timavg
 EOF
-                }
+            }
 
-                compress = compress_csh( "component.dates.nc", check_nccopy );
+            compress = compress_csh( "component.dates.nc", check_nccopy, diag_source );
 
-                csh .= <<EOF;
+            seasonbody .= <<EOF;
 time_ncatted ncatted -h -O -a filename,global,m,c,"\outdir/component.dates.nc" component.dates.nc
 check_ncatted
 compress
@@ -4084,7 +3821,9 @@ time_rm rm component.dates.nc
 time_dmput dmput \outdir/component.dates.nc
 time_rm rm sea.nc
 EOF
-            } ## end foreach season ( 'DJF',...)
+            csh .= varpool::foreach_csh( 'season', 'DJF MAM JJA SON', seasonbody,
+                "TIMAVG (component src interval averages)", "seasonalAVfromhist_interval",
+                npool );
         } ## end if ( int > 1 )
 
         #END NOT CUBIC
@@ -4115,14 +3854,14 @@ def seasonalAVfromav(taNode, sim0, subint):
     int =~ s/yr//;
     mod = yrsSoFar % int;
     unless ( mod == 0 ) { return ""; }
-    mkdircommand .= "outdir ";
+    exp.dirplan.add(outdir)
     if ( int > maxyrs ) { maxyrs = int; }
 
     #check for missing files
     diag_source = _[0]->findvalue('@diagSource');
-    my @monthnodes  = ppcNode->findnodes('timeSeries[@freq="monthly"]');
+    my @monthnodes  = ppcNode->timeseries('monthly');
     if ( scalar @monthnodes and "diag_source" eq "" ) {
-        monthnode = ppcNode->findnodes('timeSeries[@freq="monthly"]')->get_node(1);
+        monthnode = monthnodes[0];
         diag_source = monthnode->getAttribute('@source');
     }
     if ( "diag_source" eq "" ) { diag_source = _[0]->findvalue('../@source'); }
@@ -4164,7 +3903,7 @@ if ( ! -e \outdir ) mkdir -p \outdir
 
 EOF
     if (opt_z) { csh .= begin_systime(); }
-    compress = compress_csh( "component.start-end.\sea.nc", check_nccopy );
+    compress = compress_csh( "component.start-end.\sea.nc", check_nccopy, diag_source );
     csh .= <<EOF;
 
 cd srcdir
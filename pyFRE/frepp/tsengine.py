@@ -0,0 +1,514 @@
+"""In-process time series engines, replacing the per-variable, per-year
+ncdump/ncks/TIMAVG chains emitted by :mod:`~pyFRE.frepp.ts_ta`.
+
+Can be called directly or from the generated runscript via
+``python3 -m pyFRE.frepp.tsengine``.
+"""
+import argparse
+import collections
+import contextlib
+import os
+import re
+import sys
+
+import cftime
+import numpy as np
+
+from pyFRE.lib import FREUtil
+from . import ncconcat, ncio
+
+import logging
+_log = logging.getLogger(__name__)
+
+CLIMATOLOGY_BOUNDS = 'climatology_bounds'
+SEASONS = ('DJF', 'MAM', 'JJA', 'SON')
+
+class TSEngineError(Exception):
+    """Raised when input data doesn't match the requested time series."""
+    pass
+
+def _var_label(infile, component):
+    """Return the ``var`` part of a time series filename
+    ``{component}.{dates}.{var}``, as set by the csh loops in ts_ta."""
+    name = os.path.basename(infile)
+    m = re.match(rf"{re.escape(component)}\.[^.]+\.(.+)$", name)
+    if not m:
+        raise TSEngineError(f"Can't parse variable from filename '{name}'.")
+    return m.group(1)
+
+def _write_means(outfile, src, tname, means, t1, t2, dt, climatology=False,
+    exclude=()):
+    """Write one record of averaged data to *outfile*, with time metadata set
+    as TIMAVG does: time at the midpoint of the averaging period and
+    average_T1/T2/DT and time bounds describing the whole period.
+
+    If *climatology* is True (for averages of the same months over several
+    years), the period is instead described by a CF ``climatology_bounds``
+    variable, which replaces the time bounds. Variables named in *exclude*
+    aren't written.
+    """
+    _write_series(outfile, src, tname, {k: np.ma.asarray(v)[None] for k, v in means.items()},
+        np.atleast_1d(t1), np.atleast_1d(t2), np.atleast_1d(dt),
+        climatology=climatology, exclude=exclude)
+
+def _write_series(outfile, src, tname, means, t1, t2, dt, climatology=False,
+    exclude=(), filename=None, complevel=None, shuffle=False):
+    """Write records of averaged data to *outfile*, as :func:`_write_means`
+    does for one: record *i* holds ``means[name][i]`` averaged over the period
+    ``t1[i]``-``t2[i]`` of length ``dt[i]``. With *filename*, the global
+    filename attribute (if present) is set to it; with *complevel*, the
+    record variables are deflated (and shuffled, with *shuffle*).
+    """
+    bnds = ncio.bounds_var(src, tname)
+    tmpfile = outfile + '.tmp'
+    if climatology:
+        exclude = tuple(exclude) + (bnds, CLIMATOLOGY_BOUNDS)
+    fmt = ncio.output_format(src.data_model, compress=bool(complevel))
+    dst = ncio.create_like(tmpfile, src, exclude=exclude, zlib=bool(complevel),
+        complevel=complevel, shuffle=shuffle, fmt=fmt)
+    try:
+        if climatology:
+            nv = src.variables[bnds].dimensions[-1] if bnds is not None else 'nv'
+            if nv not in dst.dimensions:
+                dst.createDimension(nv, 2)
+            clim = dst.createVariable(CLIMATOLOGY_BOUNDS, 'f8', (tname, nv))
+            tvar = dst.variables[tname]
+            for attr in ('units', 'calendar'):
+                if attr in tvar.ncattrs():
+                    clim.setncattr(attr, tvar.getncattr(attr))
+            if 'bounds' in tvar.ncattrs():
+                tvar.delncattr('bounds')
+            tvar.climatology = CLIMATOLOGY_BOUNDS
+            bnds = CLIMATOLOGY_BOUNDS
+        if filename is not None and 'filename' in dst.ncattrs():
+            dst.filename = filename
+        ncio.copy_static_vars(dst, src, tname, exclude=exclude)
+        t1 = np.asarray(t1, dtype='f8')
+        t2 = np.asarray(t2, dtype='f8')
+        n = len(t1)
+        dst.variables[tname][:n] = 0.5 * (t1 + t2)
+        if 'average_T1' in dst.variables:
+            dst.variables['average_T1'][:n] = t1
+            dst.variables['average_T2'][:n] = t2
+            dst.variables['average_DT'][:n] = dt
+        if bnds is not None:
+            dst.variables[bnds][:n, :] = np.stack([t1, t2], axis=1)
+        for name, arr in means.items():
+            dst.variables[name][:n, ...] = arr
+    finally:
+        dst.close()
+    os.replace(tmpfile, outfile)
+
+def annual_means(infile, outdir, component, start_year, nyears=None,
+    months_per_year=12, label=None, use_mmap=True):
+    """Split the monthly time series *infile* into per-year annual means, written
+    to ``{outdir}/{component}.{year}.{label}`` for successive years beginning
+    with *start_year*, which are the files annualTS used to create with
+    ``ncks -d time,...`` and TIMAVG.
+
+    The file is read once and all years are reduced in a single weighted
+    (by average_DT or time bounds) NumPy pass per variable. Returns the list of
+    files written.
+    """
+    if label is None:
+        label = _var_label(infile, component)
+    outfiles = []
+    with ncio.open_dataset(infile, use_mmap=use_mmap) as src:
+        tname = ncio.record_dim(src)
+        if tname is None:
+            raise TSEngineError(f"No record dimension in {infile}.")
+        nrec = len(src.dimensions[tname])
+        if nyears is None:
+            nyears = nrec // months_per_year
+        if nyears < 1 or nyears * months_per_year > nrec:
+            raise TSEngineError((f"{infile} has {nrec} records; need "
+                f"{nyears * months_per_year} for {nyears} years."))
+        n = nyears * months_per_year
+        t1, t2, dt = ncio.averaging_period(src, tname)
+        t1 = t1[:n].reshape(nyears, months_per_year)
+        t2 = t2[:n].reshape(nyears, months_per_year)
+        dt = dt[:n].reshape(nyears, months_per_year)
+
+        skip = set(ncio.AVERAGE_INFO_VARS) | {tname, ncio.bounds_var(src, tname)}
+        means = dict()
+        for name, var in src.variables.items():
+            if name in skip or not ncio.is_record_var(var, tname):
+                continue
+            data = var[:n]
+            data = data.reshape((nyears, months_per_year) + data.shape[1:])
+            means[name] = ncio.weighted_mean(data, dt, axis=1)
+
+        for i in range(nyears):
+            outfile = os.path.join(outdir,
+                f"{component}.{FREUtil.padzeros(int(start_year) + i)}.{label}")
+            _write_means(outfile, src, tname,
+                {k: v[i] for k, v in means.items()},
+                t1[i, 0], t2[i, -1], np.sum(dt[i])
+            )
+            outfiles.append(outfile)
+    return outfiles
+
+class _RunningMean():
+    """Running weighted sums of the record variables over an averaging
+    period, excluding missing values as :func:`ncio.weighted_mean` does.
+    """
+    def __init__(self):
+        self.sums = dict()
+        self.weights = dict()
+        self.t1 = np.inf
+        self.t2 = -np.inf
+        self.dt = 0.0
+        self.nrec = 0
+
+    def add(self, name, data, w):
+        data = np.ma.asarray(data)
+        valid = ~np.ma.getmaskarray(data)
+        values = np.ma.filled(data.astype('f8'), 0.0) * w
+        if name not in self.sums:
+            self.sums[name] = values
+            self.weights[name] = valid * w
+        else:
+            self.sums[name] += values
+            self.weights[name] += valid * w
+
+    def add_period(self, t1, t2, dt):
+        self.t1 = min(self.t1, t1)
+        self.t2 = max(self.t2, t2)
+        self.dt += dt
+        self.nrec += 1
+
+    def merge(self, other):
+        """Add the sums of running mean *other*."""
+        for name, s in other.sums.items():
+            if name not in self.sums:
+                self.sums[name] = s.copy()
+                self.weights[name] = other.weights[name].copy()
+            else:
+                self.sums[name] += s
+                self.weights[name] += other.weights[name]
+        self.t1 = min(self.t1, other.t1)
+        self.t2 = max(self.t2, other.t2)
+        self.dt += other.dt
+        self.nrec += other.nrec
+
+    def means(self):
+        return {name: s / np.ma.masked_equal(self.weights[name], 0.0)
+            for name, s in self.sums.items()}
+
+def _time_axis(src, tname):
+    """(units, calendar) of the time axis *tname*, with the calendar in the
+    form cftime takes.
+    """
+    tvar = src.variables[tname]
+    units = getattr(tvar, 'units', None)
+    calendar = getattr(tvar, 'calendar', None) or getattr(tvar, 'calendar_type', None)
+    calendar = (calendar or 'standard').lower()
+    if calendar in ('no_leap', 'noleap'):
+        calendar = 'noleap'
+    elif calendar == 'thirty_day_months':
+        calendar = '360_day'
+    return units, calendar
+
+def _record_dates(src, tname, t1, t2):
+    """(year, month) of the midpoint of each record's averaging period."""
+    units, calendar = _time_axis(src, tname)
+    dates = cftime.num2date(0.5 * (t1 + t2), units, calendar=calendar)
+    return [(d.year, d.month) for d in np.atleast_1d(dates)]
+
+def _convert_times(t, src_axis, dst_axis):
+    """Times *t* on the time axis *src_axis* (``(units, calendar)``)
+    converted to the units of *dst_axis*. Raises TSEngineError unless the
+    two axes share a calendar and a unit of time (the unit of average_DT),
+    differing at most in their reference dates.
+    """
+    if src_axis == dst_axis:
+        return t
+    (units, calendar), (dst_units, dst_calendar) = src_axis, dst_axis
+    if (calendar != dst_calendar or not units or not dst_units
+        or units.split()[0] != dst_units.split()[0]):
+        raise TSEngineError(f"Can't convert times in '{units}' ({calendar}) "
+            f"to '{dst_units}' ({dst_calendar}).")
+    return cftime.date2num(cftime.num2date(t, units, calendar=calendar),
+        dst_units, calendar=calendar)
+
+def history_averages(infiles, outdir, component, prev_dec=None,
+    products=('monthly', 'seasonal', 'annual'), variables=None, use_mmap=True):
+    """Monthly climatologies, seasonal means and annual means of the monthly
+    history files *infiles*, computed in a single pass over the data instead
+    of the TIMAVG runs of monthlyAVfromhist, seasonalAVfromhist and
+    annualAV1yrfromhist, which each read the same history files.
+
+    Each record is assigned to the month containing the midpoint of its
+    averaging period and added, weighted by its average_DT (or the length of
+    its time bounds), to the running sums of its month, season and year.
+    *prev_dec* is the history file holding the December before the first
+    year, which only goes into the first year's DJF mean. Files written to
+    *outdir*, for the years ``{range}`` (``yyyy`` or ``yyyy-yyyy``) covered:
+
+    * ``monthly``: ``{component}.{range}.{mm}.nc``, the climatology of each
+      month over all years,
+    * ``seasonal``: ``{component}.{yyyy}.{season}.nc`` for each year (DJF
+      using the December of the year before), and
+      ``{component}.{range}.{season}.nc`` over all years,
+    * ``annual``: ``{component}.{yyyy}.ann.nc`` for each year.
+
+    Averages over more than one year are written with climatology_bounds.
+    Returns the list of files written.
+    """
+    if prev_dec:
+        # the previous December may also match the caller's glob
+        prev = os.path.realpath(prev_dec)
+        infiles = [f for f in infiles if os.path.realpath(f) != prev]
+    if not infiles:
+        raise TSEngineError("No history files given.")
+    files = [(f, False) for f in infiles]
+    if prev_dec:
+        files.insert(0, (prev_dec, True))
+
+    monthly = collections.defaultdict(_RunningMean)
+    seasonal = collections.defaultdict(_RunningMean)
+    seasonal_all = collections.defaultdict(_RunningMean)
+    annual = collections.defaultdict(_RunningMean)
+    years = set()
+    template = None
+    for path, is_prev in files:
+        with ncio.open_dataset(path, use_mmap=use_mmap) as src:
+            tname = ncio.record_dim(src)
+            if tname is None:
+                raise TSEngineError(f"No record dimension in {path}.")
+            t1, t2, dt = ncio.averaging_period(src, tname)
+            dates = _record_dates(src, tname, t1, t2)
+            skip = set(ncio.AVERAGE_INFO_VARS) | {tname, ncio.bounds_var(src, tname),
+                CLIMATOLOGY_BOUNDS}
+            names = [name for name, var in src.variables.items()
+                if name not in skip and ncio.is_record_var(var, tname)
+                and (not variables or name in variables)]
+            if template is None and not is_prev:
+                template = path
+            # the running means each record contributes to
+            targets = []
+            for i, (year, month) in enumerate(dates):
+                season = seasonal[_season_key(year, month)]
+                if is_prev:
+                    accs = [season] if month == 12 else []
+                else:
+                    years.add(year)
+                    accs = [monthly[month], annual[year], season]
+                for acc in accs:
+                    acc.add_period(t1[i], t2[i], dt[i])
+                targets.append(accs)
+            # one read of each variable per file, shared by all products
+            for name in names:
+                data = src.variables[name][:]
+                for i, accs in enumerate(targets):
+                    for acc in accs:
+                        acc.add(name, data[i], dt[i])
+
+    first, last = min(years), max(years)
+    label = FREUtil.padzeros(first)
+    if last > first:
+        label += '-' + FREUtil.padzeros(last)
+    multi = last > first
+    # complete seasons of the years processed (the last December starts the
+    # next DJF, and the first DJF needs *prev_dec*)
+    seasonal = {k: acc for k, acc in seasonal.items()
+        if first <= k[0] <= last and acc.nrec == 3}
+    for (year, season), acc in seasonal.items():
+        seasonal_all[season].merge(acc)
+
+    outfiles = []
+    with ncio.open_dataset(template, use_mmap=use_mmap) as src:
+        tname = ncio.record_dim(src)
+        exclude = [name for name, var in src.variables.items()
+            if variables and ncio.is_record_var(var, tname)
+            and name not in variables and name not in ncio.AVERAGE_INFO_VARS
+            and name != tname and name != ncio.bounds_var(src, tname)]
+        def write(name, acc, climatology):
+            outfile = os.path.join(outdir, name)
+            _write_means(outfile, src, tname, acc.means(), acc.t1, acc.t2, acc.dt,
+                climatology=climatology, exclude=exclude)
+            outfiles.append(outfile)
+        if 'monthly' in products:
+            for month in sorted(monthly):
+                write(f"{component}.{label}.{month:02d}.nc", monthly[month], multi)
+        if 'seasonal' in products:
+            for (year, season), acc in sorted(seasonal.items()):
+                write(f"{component}.{FREUtil.padzeros(year)}.{season}.nc", acc, False)
+            if multi:
+                for season in SEASONS:
+                    if season in seasonal_all:
+                        write(f"{component}.{label}.{season}.nc", seasonal_all[season], True)
+        if 'annual' in products:
+            for year in sorted(annual):
+                write(f"{component}.{FREUtil.padzeros(year)}.ann.nc", annual[year], False)
+    return outfiles
+
+def _season_key(year, month):
+    """(year, season) that month *month* of *year* belongs to; December
+    starts the next year's DJF.
+    """
+    return (year + 1 if month == 12 else year, SEASONS[(month % 12) // 3])
+
+def season_index(dates, start_year, nyears, prev_dec=False, run_start=False):
+    """Indices of the records making up each season, as an array of shape
+    (*nyears*, 4, 3) indexing the records ``dates`` (``(year, month)`` of
+    each) -- preceded, with *prev_dec*, by the previous December. The first
+    DJF uses that December; with *run_start* (no December before the run)
+    it uses the December of its own year, as seasonalTS always did.
+    """
+    offset = 1 if prev_dec else 0
+    where = collections.defaultdict(list)
+    for i, (year, month) in enumerate(dates):
+        where[_season_key(year, month)].append(i + offset)
+    if prev_dec:
+        where[(start_year, 'DJF')].insert(0, 0)
+    elif run_start:
+        dec = [i for i, d in enumerate(dates) if d == (start_year, 12)]
+        if dec:
+            where[(start_year, 'DJF')].insert(0, dec[0])
+    idx = np.empty((nyears, len(SEASONS), 3), dtype=np.intp)
+    for y in range(nyears):
+        for k, season in enumerate(SEASONS):
+            records = where.get((start_year + y, season), [])
+            if len(records) != 3:
+                raise TSEngineError((f"{season} {FREUtil.padzeros(start_year + y)} "
+                    f"has {len(records)} months of data; need 3."))
+            idx[y, k] = records
+    return idx
+
+def seasonal_series(infile, outdir, component, start_year, chunk_years=None,
+    prev_dec=None, run_start=False, label=None, complevel=None, shuffle=False,
+    use_mmap=True):
+    """Seasonal time series of the monthly time series *infile*, replacing
+    the per-season ncks/TIMAVG/ncrcat runs of seasonalTS.
+
+    The file (and the last record of *prev_dec*, the December before
+    *start_year*) is read once; the records making up each DJF, MAM, JJA and
+    SON of each year are gathered with :func:`season_index` and averaged,
+    weighted by average_DT, in one NumPy reduction per variable. The series
+    are written in chunks of *chunk_years* years (by default, all years) to
+    ``{outdir}/{component}.{yyyy}-{yyyy}.{season}.{label}``, one record per
+    year, as the files under ``ts/seasonal/<chunk_years>yr``. Returns the
+    list of files written.
+    """
+    if label is None:
+        label = _var_label(infile, component)
+    start_year = int(start_year)
+    with contextlib.ExitStack() as stack:
+        src = stack.enter_context(ncio.open_dataset(infile, use_mmap=use_mmap))
+        tname = ncio.record_dim(src)
+        if tname is None:
+            raise TSEngineError(f"No record dimension in {infile}.")
+        t1, t2, dt = ncio.averaging_period(src, tname)
+        dates = _record_dates(src, tname, t1, t2)
+        nyears = len(dates) // 12
+        if chunk_years is None:
+            chunk_years = nyears
+        if nyears < 1 or nyears % chunk_years:
+            raise TSEngineError((f"{infile} has {len(dates)} months; need a "
+                f"multiple of {chunk_years} years."))
+        prev = None
+        if prev_dec:
+            prev = stack.enter_context(ncio.open_dataset(prev_dec, use_mmap=use_mmap))
+            ptname = ncio.record_dim(prev)
+            p1, p2, pdt = ncio.averaging_period(prev, ptname)
+            if _record_dates(prev, ptname, p1[-1:], p2[-1:]) != [(start_year - 1, 12)]:
+                raise TSEngineError(f"Last record of {prev_dec} isn't December "
+                    f"{FREUtil.padzeros(start_year - 1)}.")
+            axes = (_time_axis(prev, ptname), _time_axis(src, tname))
+            p1, p2 = (_convert_times(p[-1:], *axes) for p in (p1, p2))
+            t1, t2, dt = (np.concatenate([a, b]) for a, b in
+                ((p1, t1), (p2, t2), (pdt[-1:], dt)))
+        idx = season_index(dates, start_year, nyears, prev_dec=bool(prev),
+            run_start=run_start)
+
+        skip = set(ncio.AVERAGE_INFO_VARS) | {tname, ncio.bounds_var(src, tname)}
+        means = dict()
+        for name, var in src.variables.items():
+            if name in skip or not ncio.is_record_var(var, tname):
+                continue
+            data = var[:]
+            if prev is not None:
+                data = np.ma.concatenate([prev.variables[name][-1:], data])
+            means[name] = ncio.weighted_mean(data[idx], dt[idx], axis=2)
+        s1 = np.min(t1[idx], axis=2)
+        s2 = np.max(t2[idx], axis=2)
+        sdt = np.sum(dt[idx], axis=2)
+
+        outfiles = []
+        for c in range(0, nyears, chunk_years):
+            years = slice(c, c + chunk_years)
+            dates_label = (f"{FREUtil.padzeros(start_year + c)}-"
+                f"{FREUtil.padzeros(start_year + c + chunk_years - 1)}")
+            for k, season in enumerate(SEASONS):
+                name = f"{component}.{dates_label}.{season}.{label}"
+                _write_series(os.path.join(outdir, name), src, tname,
+                    {v: m[years, k] for v, m in means.items()},
+                    s1[years, k], s2[years, k], sdt[years, k], filename=name,
+                    complevel=complevel, shuffle=shuffle)
+                outfiles.append(os.path.join(outdir, name))
+    return outfiles
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tsengine',
+        description="In-process time series calculations for frepp.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('annual',
+        help="split monthly time series into per-year annual means")
+    p.add_argument('-c', '--component', required=True)
+    p.add_argument('-y', '--start-year', type=int, required=True)
+    p.add_argument('-n', '--nyears', type=int, default=None)
+    p.add_argument('-o', '--outdir', required=True)
+    p.add_argument('infiles', nargs='+')
+    p = subparsers.add_parser('seasonal',
+        help="seasonal (DJF, MAM, JJA, SON) time series of monthly time series")
+    p.add_argument('-c', '--component', required=True)
+    p.add_argument('-y', '--start-year', type=int, required=True)
+    p.add_argument('-n', '--chunk-years', type=int, default=None,
+        help="years per output file (default: all)")
+    p.add_argument('-D', '--prev-dec', default=None,
+        help="file whose last record is the December before the first year")
+    p.add_argument('-s', '--run-start', action='store_true',
+        help="first year starts the run: its DJF uses its own December")
+    p.add_argument('-z', '--nccopy-flags', default='',
+        help="nccopy options to compress the output with (eg. '-d 2 -s')")
+    p.add_argument('-o', '--outdir', required=True)
+    p.add_argument('infiles', nargs='+')
+    p = subparsers.add_parser('histav',
+        help=("monthly climatologies and seasonal and annual means of monthly "
+            "history files, in one pass"))
+    p.add_argument('-c', '--component', required=True)
+    p.add_argument('-o', '--outdir', required=True)
+    p.add_argument('-d', '--prev-dec', default=None,
+        help="history file with the December before the first year")
+    p.add_argument('-p', '--products', default='monthly,seasonal,annual',
+        help="comma-separated products: monthly, seasonal, annual")
+    p.add_argument('-v', '--variables', default=None,
+        help="comma-separated variables to average (default: all)")
+    p.add_argument('infiles', nargs='+')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'histav':
+            variables = [v for v in (args.variables or '').split(',') if v]
+            history_averages(args.infiles, args.outdir, args.component,
+                prev_dec=args.prev_dec, products=args.products.split(','),
+                variables=variables)
+        elif args.command == 'seasonal':
+            opts = ncconcat.parse_nccopy_flags(args.nccopy_flags)
+            for infile in args.infiles:
+                seasonal_series(infile, args.outdir, args.component, args.start_year,
+                    chunk_years=args.chunk_years, prev_dec=args.prev_dec,
+                    run_start=args.run_start, complevel=opts['complevel'],
+                    shuffle=opts['shuffle'])
+        else:
+            for infile in args.infiles:
+                annual_means(infile, args.outdir, args.component, args.start_year,
+                    nyears=args.nyears)
+    except Exception as exc:
+        print(f"ERROR: tsengine {args.command}: {exc!r}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
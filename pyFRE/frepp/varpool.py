@@ -0,0 +1,148 @@
+"""Bounded worker pool for the per-variable (and per-month or per-season)
+``foreach`` loops in the generated csh runscript.
+
+:func:`foreach_csh` emits either the serial loop ``ts_ta`` has always written or,
+if the component's pool size is > 1, commands that write the loop body to a
+csh fragment and run it once per variable through :func:`run_pool` (``python3 -m
+pyFRE.frepp.varpool``). Each variable runs in its own scratch directory under
+``$work``; the error checks in the loop body append to ``$work/.errors`` as
+before (``errors_found`` is counted once for the pool as a whole), and the pool
+exits nonzero if any variable failed.
+"""
+import argparse
+import concurrent.futures
+import os
+import re
+import shutil
+import subprocess
+import sys
+from textwrap import dedent
+
+import pyFRE.util as util
+from . import logs
+
+import logging
+_log = logging.getLogger(__name__)
+
+_template = util.pl_template # abbreviate
+
+SHELL = ['/bin/csh', '-f']
+HEREDOC_END = 'END_OF_POOL_BODY'
+
+# csh variables that are never copied into the environment of the loop body
+_csh_special_vars = frozenset([
+    'status', 'argv', 'cwd', 'home', 'path', 'prompt', 'shell', 'term', 'user',
+    'echo', 'verbose', 'child'
+])
+
+def csh_vars_referenced(body, exclude=()):
+    """Return the sorted names of csh variables referenced in *body*, eg. as
+    ``$work``, ``${work}``, ``$?work`` or ``$#work``.
+    """
+    names = set(re.findall(r"\$[?#]?\{?([A-Za-z_]\w*)", body))
+    return sorted(names.difference(_csh_special_vars, exclude))
+
+def foreach_csh(loopvar, values, body, msg, label, npool=1):
+    """Return csh for ``foreach $loopvar ( $values ) $body end``. *values* is
+    the (unexpanded) csh word list for the loop. If *npool* > 1, the body is run
+    for up to *npool* values concurrently; *label* names the scratch directory
+    and *msg* is used for the error check on the pool as a whole.
+
+    The body must not depend on the values of variables it sets in previous
+    iterations, or change directory to ``$work`` (each iteration runs in a
+    separate scratch directory.)
+    """
+    body = dedent(body).strip('\n')
+    if npool is None or int(npool) <= 1:
+        return _template("""
+            foreach $loopvar ( $values )
+            $body
+            end
+        """, loopvar=loopvar, values=values, body=body)
+
+    exports = '\n'.join(
+        f'if ( $?{v} ) setenv {v} "${v}"' \
+        for v in csh_vars_referenced(body, exclude=(loopvar,))
+    )
+    check_pool = logs.errorstr(msg)
+    # quoted heredoc delimiter: no substitution when writing out the body
+    return _template("""
+        set pool_script = \$work/.pool.$label.csh
+        cat >! \$pool_script << '$heredoc_end'
+        set errors_found = 0
+        $body
+        $heredoc_end
+        $exports
+        \$PYFRE_ENGINE pyFRE.frepp.varpool -j $npool -l $label -w \$work -v $loopvar \$pool_script $values
+        $check_pool
+        rm -f \$pool_script
+    """, loopvar=loopvar, values=values, body=body, exports=exports,
+        npool=int(npool), label=label, heredoc_end=HEREDOC_END,
+        check_pool=check_pool
+    )
+
+def _run_one(script, loopvar, value, scratch_dir, env):
+    """Run the csh *script* with *loopvar* set to *value*, in *scratch_dir*.
+    Returns (value, returncode, combined output).
+    """
+    os.makedirs(scratch_dir, exist_ok=True)
+    run_env = dict(env)
+    run_env[loopvar] = value
+    proc = subprocess.run(SHELL + [script], cwd=scratch_dir, env=run_env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding='utf-8',
+        errors='replace')
+    if proc.returncode == 0:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return (value, proc.returncode, proc.stdout)
+
+def run_pool(script, values, npool, workdir, label='pool', loopvar='var',
+    env=None, out=None):
+    """Run the csh loop body *script* once for each of *values*, with at most
+    *npool* running at a time. Output of each run is written to *out*
+    (default stdout) in the order of *values*, once it finishes. Returns the
+    list of values whose run exited with nonzero status.
+    """
+    if env is None:
+        env = os.environ
+    if out is None:
+        out = sys.stdout
+    pool_dir = os.path.join(workdir, f".pool.{label}")
+    results = dict()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, npool)) as executor:
+        futures = [
+            executor.submit(_run_one, script, loopvar, v,
+                os.path.join(pool_dir, f"{i:05d}.{os.path.basename(v)}"), env) \
+            for i, v in enumerate(values)
+        ]
+        for i, f in enumerate(futures):
+            value, returncode, output = f.result()
+            results[i] = (value, returncode)
+            out.write(f"# {loopvar} = {value}\n")
+            out.write(output)
+            out.flush()
+    failed = [v for v, rc in (results[i] for i in range(len(values))) if rc != 0]
+    if not failed:
+        shutil.rmtree(pool_dir, ignore_errors=True)
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='varpool',
+        description="Run a csh loop body for each value with a bounded worker pool.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('-l', '--label', default='pool')
+    parser.add_argument('-w', '--workdir', default=os.environ.get('work', os.getcwd()))
+    parser.add_argument('-v', '--loopvar', default='var')
+    parser.add_argument('script')
+    parser.add_argument('values', nargs='*')
+    args = parser.parse_args(argv)
+
+    failed = run_pool(args.script, args.values, args.jobs, args.workdir,
+        label=args.label, loopvar=args.loopvar)
+    if failed:
+        print((f"ERROR: {len(failed)} of {len(args.values)} runs of {args.label} "
+            f"failed: {' '.join(failed)}"), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
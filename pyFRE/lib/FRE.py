@@ -8,9 +8,8 @@ import dataclasses as dc
 import re
 from textwrap import dedent
 import xml.etree.ElementTree as ET
-from xml.etree import ElementInclude
 
-from . import FREDefaults, FREPlatforms, FREProperties, FRETargets, FREUtil
+from . import FREDefaults, FREPlatforms, FREProperties, FRETargets, FREUtil, FREXML
 import pyFRE.util as util
 
 import logging
@@ -57,11 +56,24 @@ class FRE():
 
             # validate and load the configuration file
             # --novalidate option is not advertised
-            if opt.get('novalidate', False):
-                rootNode = cls.xmlLoad(xmlfileAbsPath)
+            # reuse the expanded tree from a previous call if neither the XML
+            # nor any of its included files have changed
+            xmlCache = FREXML.FREXMLCache.default()
+            xmlCacheKey = (opt.get('platform', ''), opt.get('target', ''))
+            xmlCached = xmlCache.get(xmlfileAbsPath, xmlCacheKey) if xmlCache else None
+            if xmlCached and (xmlCached.validated or opt.get('novalidate', False)):
+                rootNode = xmlCached.index.root
             else:
-                # XXX equivalent of xmlValidateAndLoad? uses schema?
-                rootNode = cls.xmlValidateAndLoad(xmlfileAbsPath)
+                xmlCached = None
+                if opt.get('novalidate', False):
+                    rootNode = cls.xmlLoad(xmlfileAbsPath)
+                else:
+                    # XXX equivalent of xmlValidateAndLoad? uses schema?
+                    rootNode = cls.xmlValidateAndLoad(xmlfileAbsPath)
+                if rootNode and xmlCache:
+                    xmlCached = FREXML.FREXMLCacheEntry(rootNode.index,
+                        validated=(not opt.get('novalidate', False)))
+                    xmlCache.put(xmlCached, xmlCacheKey)
             if rootNode:
                 # if platform isn't specified or contains default, print a descriptive message and exit.
                 # let frelist go ahead, setting platform to first available, if no options are specified
@@ -93,9 +105,16 @@ class FRE():
                     if opt['target']:
                         # initialize properties object (properties expansion happens here)
                         siteDir = FREPlatforms.siteDir(platformSite)
-                        properties = FREProperties.new(rootNode, siteDir, opt)
+                        if xmlCached and 'properties' in xmlCached.derived:
+                            properties = xmlCached.derived['properties']
+                        else:
+                            properties = FREProperties.new(rootNode, siteDir, opt)
+                            if properties:
+                                properties = properties.propertiesList(opt['verbose'])
+                                if xmlCached:
+                                    xmlCached.derived['properties'] = properties
+                                    xmlCache.put(xmlCached, xmlCacheKey)
                         if properties:
-                            properties = properties.propertiesList(opt['verbose'])
                             # locate the platform node (no backward compatibility anymore)
                             platformNode = cls.platformNodeGet(rootNode)
                             if platformNode:
@@ -196,22 +215,25 @@ class FRE():
 
     @classmethod
     def xmlLoad(cls, xmlfile):
-        """Return the loaded document."""
+        """Return the root node of the loaded document. The document is parsed
+        once and wrapped in a :class:`~pyFRE.lib.FREXML.FREXMLIndex`, which
+        memoizes XPath queries on it.
+        """
         # FRE.pm l.83
         try:
-            document = ET.parse(xmlfile)
-            root = document.getroot()
-            ElementInclude.include(root)
-            return root
+            return FREXML.load(xmlfile).root
         except Exception as exc:
             _log.error(repr(exc))
             return None
 
     @classmethod
     def xmlValidateAndLoad(cls, xmlfile):
-        """Return the loaded document."""
+        """Return the loaded document, or None if it isn't valid."""
         # FRE.pm l.101
-        return cls.validate(cls.xmlLoad(xmlfile))
+        rootNode = cls.xmlLoad(xmlfile)
+        if rootNode and cls.validate(rootNode):
+            return rootNode
+        return None
 
     @classmethod
     def versionGet(cls, rootNode):
@@ -237,7 +259,7 @@ class FRE():
     def platformNodeGet(cls, rootNode):
         """Return the platform node."""
         # FRE.pm l.148
-        nodes = rootNode.findall('setup/platform')
+        nodes = rootNode.findnodes('setup/platform')
         if len(nodes) == 1:
             return nodes[0]
         else:
@@ -320,7 +342,7 @@ class FRE():
     def curator(cls, xmlFile, expName):
         # FRE.pm l.269
         root = cls.xmlLoad(xmlFile)
-        experimentNode = root.findnodes("experiment[\@label='$expName' or \@name='$expName']")->get_node(1)
+        experimentNode = root.index.experiment(expName)
         publicMetadataNode = experimentNode.findnodes("publicMetadata")->get_node(1);
 
         if publicMetadataNode:
@@ -350,6 +372,9 @@ class FRE():
             schemaName   = 'fre.xsd'
             if isinstance(document, str):
                 document = cls.xmlLoad(document)
+            elif document:
+                # an already loaded root node; report on the file it came from
+                validateWhat = document.index.path
         if document:
             schemaLocation = os.path.join(cls.home(), 'etc', 'schema', schemaName)
             if os.path.isfile(schemaLocation) and util.is_readable(schemaLocation):
@@ -389,7 +414,7 @@ class FRE():
     def xmlAsString(self):
         """Return the XML file with entities expanded."""
         # FRE.pm l.731
-        return f'<?xml version="1.0"?>\n{ET.tostring(self.rootNode)}'
+        return f'<?xml version="1.0"?>\n{ET.tostring(self.rootNode.element)}'
 
     def experimentNames(self):
         """Return list of experiment names."""
@@ -0,0 +1,368 @@
+"""Calendar-aware date arithmetic for FRE's ``yyyymmddhh:mm:ss`` date strings.
+
+Replaces the Date::Manip calls wrapped by FREUtil.pm. Dates are handled as
+integer (year, month, day, second of day) components and converted to integer
+day/second counts since 0001-01-01 00:00:00 for arithmetic, so years beyond 9999
+need no special treatment. Every function accepts scalars or NumPy arrays of
+equal shape and works elementwise; the ``*_batch`` functions take and return
+lists of date strings, so that computations over all chunks or segments of a
+long run are done as single vector operations.
+
+Supported calendars are the CF/FMS ones: ``gregorian`` (proleptic, as in
+Date::Manip; also ``standard``, ``proleptic_gregorian``), ``julian``,
+``noleap`` (``365_day``, ``no_leap``), ``all_leap`` (``366_day``) and
+``360_day`` (``thirty_day_months``).
+"""
+import collections
+import re
+
+import numpy as np
+
+import logging
+_log = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+DEFAULT_CALENDAR = 'gregorian'
+
+# average lengths used to express deltas in years or months, as Date::Manip does
+DAYS_PER_YEAR = 365.2425
+DAYS_PER_MONTH = DAYS_PER_YEAR / 12.0
+
+_calendar_aliases = {
+    'gregorian': 'gregorian', 'standard': 'gregorian',
+    'proleptic_gregorian': 'gregorian',
+    'julian': 'julian',
+    'noleap': 'noleap', 'no_leap': 'noleap', '365_day': 'noleap',
+    'all_leap': 'all_leap', '366_day': 'all_leap',
+    '360_day': '360_day', 'thirty_day_months': '360_day'
+}
+
+_month_days = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+# days before the start of each month (and the end of the year), for
+# [non-leap, leap] years
+_cum_days = np.array([
+    np.concatenate([[0], np.cumsum(_month_days)]),
+    np.concatenate([[0], np.cumsum(_month_days + np.array([0, 1] + [0] * 10))])
+], dtype=np.int64)
+
+_date_regex = re.compile(r"^(\d{4,})(\d{2})(\d{2})(\d{2}):(\d{2}):(\d{2})$")
+
+class FREDateError(ValueError):
+    """Raised on unparseable or invalid dates and deltas."""
+    pass
+
+def calendar_name(calendar):
+    """Canonical name of *calendar* (case-insensitive, CF or FMS spelling)."""
+    if not calendar:
+        return DEFAULT_CALENDAR
+    try:
+        return _calendar_aliases[str(calendar).strip().strip('"\'').lower()]
+    except KeyError:
+        raise FREDateError(f"Unknown calendar '{calendar}'.") from None
+
+def _int(x):
+    return np.asarray(x, dtype=np.int64)
+
+def _unwrap(*arrays):
+    """Return Python ints for 0-d results, arrays otherwise."""
+    out = tuple((int(a) if np.ndim(a) == 0 else a) for a in arrays)
+    return (out[0] if len(out) == 1 else out)
+
+# Calendar tables --------------------------------------------------------------
+
+def is_leap(year, calendar=DEFAULT_CALENDAR):
+    """True if *year* is a leap year in *calendar*."""
+    cal = calendar_name(calendar)
+    y = _int(year)
+    if cal == 'gregorian':
+        leap = (y % 4 == 0) & ((y % 100 != 0) | (y % 400 == 0))
+    elif cal == 'julian':
+        leap = (y % 4 == 0)
+    elif cal == 'all_leap':
+        leap = np.ones_like(y, dtype=bool)
+    else:
+        leap = np.zeros_like(y, dtype=bool)
+    return (bool(leap) if np.ndim(leap) == 0 else leap)
+
+def days_in_year(year, calendar=DEFAULT_CALENDAR):
+    cal = calendar_name(calendar)
+    if cal == '360_day':
+        return _unwrap(np.full_like(_int(year), 360))
+    return _unwrap(365 + _int(is_leap(year, cal)))
+
+def days_in_month(year, month, calendar=DEFAULT_CALENDAR):
+    cal = calendar_name(calendar)
+    m = _int(month)
+    if cal == '360_day':
+        return _unwrap(np.full_like(m + _int(year), 30))
+    leap = _int(is_leap(year, cal))
+    return _unwrap(_cum_days[leap, m] - _cum_days[leap, m - 1])
+
+def days_before_year(year, calendar=DEFAULT_CALENDAR):
+    """Number of days from 0001-01-01 to 1 Jan of *year*."""
+    cal = calendar_name(calendar)
+    n = _int(year) - 1
+    if cal == 'gregorian':
+        days = 365 * n + n // 4 - n // 100 + n // 400
+    elif cal == 'julian':
+        days = 365 * n + n // 4
+    elif cal == 'noleap':
+        days = 365 * n
+    elif cal == 'all_leap':
+        days = 366 * n
+    else:
+        days = 360 * n
+    return _unwrap(days)
+
+def days_before_month(year, month, calendar=DEFAULT_CALENDAR):
+    """Number of days from 1 Jan of *year* to the 1st of *month*."""
+    cal = calendar_name(calendar)
+    m = _int(month)
+    if cal == '360_day':
+        return _unwrap(30 * (m - 1) + 0 * _int(year))
+    return _unwrap(_cum_days[_int(is_leap(year, cal)), m - 1])
+
+# Conversions ------------------------------------------------------------------
+
+def to_days(year, month, day, calendar=DEFAULT_CALENDAR):
+    """Days since 0001-01-01 of the given date(s)."""
+    cal = calendar_name(calendar)
+    return _unwrap(_int(days_before_year(year, cal)) \
+        + _int(days_before_month(year, month, cal)) + _int(day) - 1)
+
+def from_days(days, calendar=DEFAULT_CALENDAR):
+    """Inverse of :func:`to_days`: return (year, month, day)."""
+    cal = calendar_name(calendar)
+    days = _int(days)
+    if cal == 'gregorian':
+        year = (days * 400) // 146097 + 1
+    elif cal == 'julian':
+        year = (days * 4) // 1461 + 1
+    elif cal == 'noleap':
+        year = days // 365 + 1
+    elif cal == 'all_leap':
+        year = days // 366 + 1
+    else:
+        year = days // 360 + 1
+    # estimate above can be off by one near year boundaries
+    while True:
+        lo = days < _int(days_before_year(year, cal))
+        hi = days >= _int(days_before_year(year + 1, cal))
+        if not (np.any(lo) or np.any(hi)):
+            break
+        year = year - lo + hi
+    doy = days - _int(days_before_year(year, cal))
+    if cal == '360_day':
+        month = doy // 30 + 1
+        day = doy % 30 + 1
+    else:
+        leap = _int(is_leap(year, cal))
+        month = np.where(leap == 1,
+            np.searchsorted(_cum_days[1], doy, side='right'),
+            np.searchsorted(_cum_days[0], doy, side='right')
+        ).astype(np.int64)
+        day = doy - _cum_days[leap, month - 1] + 1
+    return _unwrap(year, month, day)
+
+def to_seconds(year, month, day, sec=0, calendar=DEFAULT_CALENDAR):
+    """Seconds since 0001-01-01 00:00:00 of the given date(s); *sec* is the
+    second of the day.
+    """
+    return _unwrap(_int(to_days(year, month, day, calendar)) * SECONDS_PER_DAY + _int(sec))
+
+def from_seconds(seconds, calendar=DEFAULT_CALENDAR):
+    """Inverse of :func:`to_seconds`: return (year, month, day, second of day)."""
+    seconds = _int(seconds)
+    y, m, d = from_days(seconds // SECONDS_PER_DAY, calendar)
+    return _unwrap(_int(y), _int(m), _int(d), seconds % SECONDS_PER_DAY)
+
+def is_valid(year, month, day, sec=0, calendar=DEFAULT_CALENDAR):
+    """True where the components describe a valid date in *calendar*."""
+    y, m, d, s = _int(year), _int(month), _int(day), _int(sec)
+    ok = (y > 0) & (m >= 1) & (m <= 12) & (d >= 1) & (s >= 0) & (s < SECONDS_PER_DAY)
+    ok = ok & (d <= _int(days_in_month(np.where(ok, y, 1), np.where(ok, m, 1), calendar)))
+    return (bool(ok) if np.ndim(ok) == 0 else ok)
+
+# String formats ---------------------------------------------------------------
+
+def parse(date):
+    """Split a ``yyyymmddhh:mm:ss`` string into integer (year, month, day,
+    second of day).
+    """
+    m = _date_regex.match(str(date))
+    if not m:
+        raise FREDateError(f"'{date}' is not a date of the form yyyymmddhh:mm:ss.")
+    y, mo, d, h, mi, s = (int(x) for x in m.groups())
+    return (y, mo, d, 3600 * h + 60 * mi + s)
+
+def format(year, month, day, sec=0):
+    """``yyyymmddhh:mm:ss`` string for the given components (year padded to 4
+    digits.)
+    """
+    year, month, day, sec = int(year), int(month), int(day), int(sec)
+    return (f"{year:04d}{month:02d}{day:02d}"
+        f"{sec // 3600:02d}:{(sec // 60) % 60:02d}:{sec % 60:02d}")
+
+def parse_batch(dates):
+    """Parse a sequence of date strings into four int64 arrays."""
+    return tuple(np.array(c, dtype=np.int64).reshape(-1) \
+        for c in zip(*(parse(d) for d in dates))) if len(dates) else \
+        tuple(np.zeros(0, dtype=np.int64) for _ in range(4))
+
+def format_batch(year, month, day, sec):
+    return [format(*c) for c in zip(np.ravel(year), np.ravel(month),
+        np.ravel(day), np.ravel(sec))]
+
+# Deltas -----------------------------------------------------------------------
+
+Delta = collections.namedtuple('Delta', ['years', 'months', 'days', 'seconds'])
+Delta.__doc__ = """Date::Manip-style delta: a calendar part (years, months),
+    applied first, and an exact part (days, seconds)."""
+
+def _delta_str(self):
+    s = int(self.seconds)
+    sign = -1 if s < 0 else 1
+    s = abs(s)
+    weeks, days = divmod(abs(int(self.days)), 7)
+    dsign = '-' if self.days < 0 else '+'
+    return (f"{int(self.years):+d}:{int(self.months):d}:{dsign}{weeks}:{days}:"
+        f"{sign * (s // 3600):d}:{(s // 60) % 60:d}:{s % 60:d}")
+Delta.__str__ = _delta_str
+
+_delta_units = (
+    (r"y|yrs?|years?", 'years', 1),
+    (r"mon|mons|months?", 'months', 1),
+    (r"w|wks?|weeks?", 'days', 7),
+    (r"d|days?", 'days', 1),
+    (r"h|hrs?|hours?", 'seconds', 3600),
+    (r"mn|mins?|minutes?", 'seconds', 60),
+    (r"s|secs?|seconds?", 'seconds', 1)
+)
+_delta_term_regex = re.compile(
+    r"\s*(?P<sign>[-+]|plus\b|minus\b)?\s*(?P<n>\d+)\s*(?P<unit>[a-z]+)\s*",
+    re.IGNORECASE
+)
+_delta_colon_regex = re.compile(r"^\s*[-+]?\d+(:[-+]?\d+){6}\s*$")
+
+def parse_delta(str_):
+    """Parse a Date::Manip delta such as ``-5 years +1 sec`` or
+    ``+ 12 months`` (a sign applies to following terms until changed), or a
+    ``Y:M:W:D:H:MN:S`` string. Returns a :class:`Delta`.
+    """
+    if isinstance(str_, Delta):
+        return str_
+    if _delta_colon_regex.match(str(str_)):
+        y, mo, w, d, h, mi, s = (int(x) for x in str(str_).split(':'))
+        return Delta(y, mo, 7 * w + d, 3600 * h + 60 * mi + s)
+    totals = dict(years=0, months=0, days=0, seconds=0)
+    sign, pos, text = 1, 0, str(str_).strip()
+    while pos < len(text):
+        m = _delta_term_regex.match(text, pos)
+        if not m or m.end() == pos:
+            raise FREDateError(f"Can't parse date delta '{str_}'.")
+        if m.group('sign'):
+            sign = -1 if m.group('sign').lower() in ('-', 'minus') else 1
+        unit = m.group('unit').lower()
+        for pat, field, mult in _delta_units:
+            if re.fullmatch(pat, unit):
+                totals[field] += sign * mult * int(m.group('n'))
+                break
+        else:
+            raise FREDateError(f"Unknown unit '{unit}' in date delta '{str_}'.")
+        pos = m.end()
+    return Delta(**totals)
+
+def add(year, month, day, sec, delta, calendar=DEFAULT_CALENDAR):
+    """Add *delta* to the given date(s). As in Date::Manip, years and months
+    are added first (keeping the day of month, clamped to the length of the
+    resulting month), then days and seconds are added exactly. The fields of
+    *delta* may be arrays.
+    """
+    cal = calendar_name(calendar)
+    delta = parse_delta(delta)
+    months = _int(year) * 12 + (_int(month) - 1) + 12 * _int(delta.years) + _int(delta.months)
+    y, m = months // 12, months % 12 + 1
+    d = np.minimum(_int(day), _int(days_in_month(y, m, cal)))
+    secs = _int(to_seconds(y, m, d, sec, cal)) \
+        + _int(delta.days) * SECONDS_PER_DAY + _int(delta.seconds)
+    return from_seconds(secs, cal)
+
+def diff(date1, date2, calendar=DEFAULT_CALENDAR):
+    """Approximate Date::Manip delta from *date1* to *date2* (each a tuple of
+    component arrays): the largest number of whole months, then the exact
+    remainder in days and seconds. Negative if *date2* precedes *date1*.
+    """
+    cal = calendar_name(calendar)
+    s1 = _int(to_seconds(*date1, calendar=cal))
+    s2 = _int(to_seconds(*date2, calendar=cal))
+    neg = s2 < s1
+    lo = [np.where(neg, b, a) for a, b in zip(date1, date2)]
+    hi = [np.where(neg, a, b) for a, b in zip(date1, date2)]
+    months = (_int(hi[0]) * 12 + _int(hi[1])) - (_int(lo[0]) * 12 + _int(lo[1]))
+    # back off one month where adding the whole months overshoots
+    for _ in range(2):
+        shifted = _int(to_seconds(*add(*lo, Delta(0, months, 0, 0), calendar=cal), calendar=cal))
+        over = shifted > _int(to_seconds(*hi, calendar=cal))
+        months = months - over
+    shifted = _int(to_seconds(*add(*lo, Delta(0, months, 0, 0), calendar=cal), calendar=cal))
+    rem = _int(to_seconds(*hi, calendar=cal)) - shifted
+    sign = np.where(neg, -1, 1)
+    return Delta(*_unwrap(sign * (months // 12), sign * (months % 12),
+        sign * (rem // SECONDS_PER_DAY), sign * (rem % SECONDS_PER_DAY)))
+
+def delta_format(delta, dec, fmt):
+    """Subset of Date::Manip::Delta_Format: expand ``%Xv`` (value of field X),
+    ``%Xd`` (field X plus all smaller fields, in units of X) and ``%Xt`` (the
+    whole delta in units of X) for X in y, M, w, d, h, m, s, rounded to *dec*
+    decimal places. Years and months are converted to days with their average
+    lengths.
+    """
+    delta = parse_delta(delta)
+    secs = int(delta.seconds)
+    days = int(delta.days) + secs / SECONDS_PER_DAY
+    months = 12 * int(delta.years) + int(delta.months)
+    values = {
+        'y': int(delta.years), 'M': int(delta.months), 'w': int(delta.days) // 7,
+        'd': int(delta.days), 'h': secs // 3600, 'm': (secs // 60) % 60, 's': secs % 60
+    }
+    totals = {
+        'y': months / 12.0 + days / DAYS_PER_YEAR,
+        'M': months + days / DAYS_PER_MONTH,
+        'w': (months * DAYS_PER_MONTH + days) / 7.0,
+        'd': months * DAYS_PER_MONTH + days,
+        'h': (months * DAYS_PER_MONTH + days) * 24.0,
+        'm': (months * DAYS_PER_MONTH + days) * 1440.0,
+        's': (months * DAYS_PER_MONTH + days) * SECONDS_PER_DAY
+    }
+    smaller = {
+        'y': totals['y'],
+        'M': int(delta.months) + days / DAYS_PER_MONTH,
+        'w': days / 7.0,
+        'd': days,
+        'h': secs / 3600.0,
+        'm': (secs % 3600) / 60.0,
+        's': float(secs % 60)
+    }
+
+    def _sub(m):
+        x, kind = m.group(1), m.group(2)
+        if kind == 'v':
+            return str(values[x])
+        val = (smaller if kind == 'd' else totals)[x]
+        return (f"{val:.{int(dec)}f}" if dec else str(int(round(val))))
+    return re.sub(r"%([yMwdhms])([vdt])", _sub, fmt)
+
+# Batch API on date strings ----------------------------------------------------
+
+def modify_batch(dates, deltas, calendar=DEFAULT_CALENDAR):
+    """Apply *deltas* (one delta, or one per date) to the list of date strings
+    *dates* in a single vectorized pass. Returns a list of date strings.
+    """
+    y, m, d, s = parse_batch(dates)
+    if isinstance(deltas, (str, Delta)):
+        delta = parse_delta(deltas)
+    else:
+        parsed = [parse_delta(x) for x in deltas]
+        delta = Delta(*(np.array(c, dtype=np.int64) for c in zip(*parsed))) \
+            if parsed else Delta(0, 0, 0, 0)
+    return format_batch(*add(y, m, d, s, delta, calendar=calendar))
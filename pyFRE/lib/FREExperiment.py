@@ -5,6 +5,7 @@ import dataclasses as dc
 from typing import Any
 
 from . import FRE, FREDefaults, FRETargets, FREUtil
+import pyFRE.util as util
 
 import logging
 _log = logging.getLogger(__name__)
@@ -78,7 +79,6 @@ class FREExperiment():
     batch_job_name: str = ""
     version_info: str = ""
     this_frepp_cmd: str = ""
-    mkdircommand: str = ""
     statefile: str = ""
     frepp_plus_calls: list = dc.field(default_factory=list)
 
@@ -112,11 +112,18 @@ class FREExperiment():
         self.parent = None
 
         self.ppNode = None
+        self.statestore = None # pyFRE.frepp.statestore.StateStore for statedir
+        self.dirplan = None # pyFRE.frepp.dirplan.DirectoryPlan for archive dirs
+        self.fragcache = None # pyFRE.frepp.fragcache.FragmentCache, with --incremental
 
     def template_dict(self):
         """Dict of all configuration key:values for templating .csh fragments."""
         return dc.asdict(self)
 
+    def template_lookup(self, name):
+        """Value of a single key of :meth:`template_dict`."""
+        return util.dataclass_template_lookup(self, name)
+
     @classmethod
     def new(cls, className, fre, expName):
         return _experimentCreate(className, fre, expName)
@@ -273,7 +280,7 @@ class FREExperiment():
         exp = self
         results = []
         while (exp and not results):
-            nodes = exp.node.findall(f'component[@name="{componentName}"]/compile')
+            nodes = exp.node.findnodes(f'component[@name="{componentName}"]/compile')
             for node in nodes:
                 results.append(self.fre.dataFilesMerged(node, 'mkmfTemplate', 'file'))
             exp = exp.parent
@@ -2,6 +2,10 @@
 """
 import os
 import pwd
+import re
+import sys
+
+from . import FREDate
 
 import logging
 _log = logging.getLogger(__name__)
@@ -15,13 +19,27 @@ def checkExptExists(XXX0, XXX1):
     # FREUtil.pm l.34
     raise NotImplementedError()
 
-# TODO
-def getxpathval(XXX0, XXX1):
+def getxpathval(path, expt, root, rootdir="", archivedir=""):
     """Gets a value from xml, recurse using @inherit and optional second
-    argument $expt.
+    argument $expt. *root* is the document's root node, as returned by
+    FRE.xmlLoad; lookups of the experiment and its @inherit chain use the
+    document's precomputed index.
     """
     # FREUtil.pm l.57
-    raise NotImplementedError()
+    index = root.index
+    if index.experiment(expt) is None:
+        _log.error(f"Experiment '{expt}' not found in the xml")
+        return ""
+    for e in index.inherit_chain(expt):
+        value = index.experiment(e).findvalue(path)
+        if value:
+            value = value.replace('$root', rootdir)
+            value = value.replace('$FREROOT', rootdir)
+            value = value.replace('$archive', archivedir)
+            value = value.replace('$name', e)
+            value = value.replace('$label', e)
+            return value
+    return ""
 
 def writescript(outscript, batchCmd, defaultQueue, npes, stdoutPath, project, maxRunTime):
     """Write c-shell runscript, chmod, and optionally submit.
@@ -29,8 +47,7 @@ def writescript(outscript, batchCmd, defaultQueue, npes, stdoutPath, project, ma
     # FREUtil.pm l.86
     raise NotImplementedError()
 
-# TODO
-def parseDate(date):
+def parseDate(date, calendar=FREDate.DEFAULT_CALENDAR):
     """Convert a date string following either yyyy or yyyymmddinto to a
     Date::Manip date ('yyyymmddhh:mm:ss').
     """
@@ -39,14 +56,44 @@ def parseDate(date):
     # guidance on how the passed in date string is interpreted.  Thus, we
     # somewhat arbitrarily decide that if length($opt_t) < 7, we assume a
     # year has been passed in, 8 and beyond assume yyyymmdd.
-    raise NotImplementedError()
+    date = str(date).strip()
+    hhmmss = "00:00:00"
+    if len(date) < 8:
+        year, mmdd = date, "0101"
+    else:
+        m = re.match(r"^(\d{4,}\d{2}\d{2})(\d{2}:\d{2}:\d{2})$", date)
+        if m:
+            year, mmdd = splitDate(m.group(1))
+            hhmmss = m.group(2)
+        else:
+            year, mmdd = splitDate(date) or ("", "")
+    try:
+        y, mo, d = int(year), int(mmdd[:2]), int(mmdd[2:4])
+        h, mi, sec = (int(x) for x in hhmmss.split(':'))
+    except ValueError:
+        _log.error(f"Date '{date}' is not a valid date.")
+        return None
+    if y <= 0:
+        _log.error("Non-positive years are not supported.")
+        return None
+    sec = 3600 * h + 60 * mi + sec
+    if not FREDate.is_valid(y, mo, d, sec, calendar):
+        _log.error(f"Date '{date}' is not a valid date.")
+        return None
+    return FREDate.format(y, mo, d, sec)
 
-# TODO
 def parseFortranDate(date):
     """Convert a fortran date string ( "1,1,1,0,0,0" ) to a Date::Manip date.
     """
     # FREUtil.pm l.188
-    raise NotImplementedError()
+    fields = [f for f in re.split(r",|\s+", date) if f]
+    if not fields and not date.strip():
+        # date is blank, set a valid date
+        fields = [1, 1, 1, 0, 0, 0]
+    elif len(fields) != 6:
+        _log.critical(f"Date '{date}' is not a valid Fortran date string.")
+        sys.exit(1)
+    return "%04d%02d%02d%02d:%02d:%02d" % tuple(int(f) for f in fields)
 
 def padzeros(date):
     """Pad to 4 digits."""
@@ -63,13 +110,13 @@ def pad8digits(date):
     # FREUtil.pm l.218
     return "%08d" % int(date)
 
-# TODO
 def splitDate(date):
     """splitDate separates a Date::Manip date string into yyyy and
     mmddhh or mmddhh:mm:ss components.
     """
     # FREUtil.pm l.225
-    raise NotImplementedError()
+    m = re.match(r"^(\d{4,})(\d{4}(?:\d{2}:\d{2}:\d{2})?)$", str(date))
+    return (m.groups() if m else None)
 
 def unixDate(dateTime, format):
     """unixDate is a simplified version of Date::Manip::UnixDate.  This
@@ -84,26 +131,71 @@ def unixDate(dateTime, format):
     # This subroutine expects $dateTime to be an the format:
     #   /^\d{4,}\d{4}\d{2}:\d{2}:\d{2}$/
     # or the routine will return undef.
-    raise NotImplementedError()
-
-# TODO
-def dateCalc(date1, date2):
+    m = re.match(r"^(\d{4,})(\d{2})(\d{2})(\d{2}):(\d{2}):(\d{2})$", str(dateTime))
+    if not m:
+        _log.warning(f"'{dateTime}' is not recognized as a date format.")
+        return None
+    if format == "%Y%m%d":
+        return ''.join(m.groups()[:3])
+    elif format == "%Y%m%d%H":
+        return ''.join(m.groups()[:4])
+    # Return dateTime if none of the formats match
+    return dateTime
+
+def dateCalc(date1, date2, calendar=FREDate.DEFAULT_CALENDAR):
     """Calculate the difference between two date and returns a Date::Manip
     delta format.
     """
     # FREUtil.pm l.274
     #   This is not a full wrapper for Date::Manip::DateCalc
     # as we only use it to calculate the difference between two dates.
-    raise NotImplementedError()
+    try:
+        d1, d2 = FREDate.parse(date1), FREDate.parse(date2)
+    except FREDate.FREDateError as exc:
+        _log.warning(str(exc))
+        return None
+    return FREDate.diff(d1, d2, calendar=calendar)
+
+def Delta_Format(delta, dec, fmt):
+    """Replacement for Date::Manip::Delta_Format, for the ``%Xv``, ``%Xd`` and
+    ``%Xt`` formats used in FRE.
+    """
+    if delta is None:
+        return None
+    return FREDate.delta_format(delta, dec, fmt)
 
-# TODO
-def modifydate(date, str_):
+def modifydate(date, str_, calendar=FREDate.DEFAULT_CALENDAR):
     """Wrapper for DateCalc handling low year numbers."""
     # FREUtil.pm l.322
     # modifydate takes a date (usually of format yyyymmddhh:mm:ss), and modifies it via the
     # instructions in $str (i.e. +1 year, -1 second --- using the manipulation rules for
     # Date::Manip.
-    raise NotImplementedError()
+    if not date:
+        # Force the date to be 0001010100:00:00 if date is empty
+        date = "0001010100:00:00"
+    # Force the date to be in the correct format
+    parsed = parseDate(date, calendar)
+    if parsed is None:
+        _log.info(f"Date '{date}' not in the correct format.  Expected 'yyyymmddhh:mm:ss'")
+        return None
+    try:
+        y, mo, d, sec = FREDate.add(*FREDate.parse(parsed), str_, calendar=calendar)
+    except FREDate.FREDateError as exc:
+        _log.info(f"Problem with modifydate '{date}' '{str_}': {exc}")
+        return None
+    if y < 1:
+        _log.info(f"Performing '{str_}' on '{date}' does not give a valid year: got '{y:04d}'")
+        return None
+    return FREDate.format(y, mo, d, sec)
+
+def modifydateBatch(dates, str_, calendar=FREDate.DEFAULT_CALENDAR):
+    """Vectorized :func:`modifydate`: apply *str_* (a single delta, or a list of
+    one delta per date) to each of the list of *dates* in one pass.
+    """
+    dates = [parseDate(d or "0001010100:00:00", calendar) for d in dates]
+    if None in dates:
+        raise FREDate.FREDateError("modifydateBatch: invalid date in input.")
+    return FREDate.modify_batch(dates, str_, calendar=calendar)
 
 def isaLeapYear(year):
     """Determine if a given year is a leap year."""
@@ -111,7 +203,7 @@ def isaLeapYear(year):
     # This routine is to be used within FREUtil.pm.  This is why no checks
     # are done to determine if the year passed in is valid.  The routine
     # calling isaLeapYear should perform the validity check.
-    raise NotImplementedError()
+    return int(FREDate.is_leap(int(year)))
 
 def daysInMonth(month):
     """Return number of days in month."""
@@ -124,17 +216,31 @@ def daysSince01Jan(mon, day, year):
     # FREUtil.pm l.421
     # This routine is only to be used within FREUtil.pm, this is why we
     # ignore checks to determine if the passed in date is valid
-    raise NotImplementedError()
+    return FREDate.days_before_month(year, mon) + day
 
-# TODO
 def daysSince1BC(mon, day, year):
     """Wrapper to Date::Manip::Date_DaysSince1BC to deal with possible years
     beyond 9999.
     """
     # FREUtil.pm l.436
-    raise NotImplementedError()
+    # callers pass perl-style numeric strings, eg. '01', '01', '1980'
+    try:
+        mon, day, year = int(mon), int(day), int(year)
+    except (TypeError, ValueError):
+        _log.info(f"Date ({year}, {mon}, {day}) isn't numeric.")
+        return None
+    if year <= 0:
+        _log.info(f"year ({year}) must be a positive digit.")
+        return None
+    if mon < 1 or mon > 12:
+        _log.info("Month must be in the range [1,12]")
+        return None
+    ndays = FREDate.days_in_month(year, mon)
+    if day < 1 or day > ndays:
+        _log.info(f"Day must be in the range [1,{ndays}]")
+        return None
+    return FREDate.days_before_year(year) + daysSince01Jan(mon, day, year)
 
-# TODO
 def dateCmp(date1, date2):
     """Wrapper for Date::Manip::Date_Cmp."""
     # FREUtil.pm l.472
@@ -142,19 +248,61 @@ def dateCmp(date1, date2):
     # more than use 'cmp'." However, since cmp will not work as required if
     # the two strings have different lengths, this wrapper uses cmp on the
     # separate date components.
-    raise NotImplementedError()
+    c1, c2 = FREDate.parse(date1), FREDate.parse(date2)
+    return (c1 > c2) - (c1 < c2)
 
-# TODO
 def graindate(date, freq):
     """Return appropriate date granularity."""
     # FREUtil.pm l.512
-    raise NotImplementedError()
+    parsed = parseDate(date)
+    if parsed is None:
+        return None
+    m = re.match(r"^(\d{4,})(\d{2})(\d{2})(\d{2}):(\d{2}):\d{2}$", parsed)
+    yyyy, mm, dd, hh, mn = m.groups()
+    if re.search(r"day|daily", freq, re.IGNORECASE):
+        return f"{yyyy}{mm}{dd}"
+    elif re.search(r"mon|month|monthly", freq, re.IGNORECASE):
+        return f"{yyyy}{mm}"
+    elif re.search(r"ann|annual|yr|year", freq, re.IGNORECASE):
+        return yyyy
+    elif re.search(r"hr|hour", freq, re.IGNORECASE):
+        return f"{yyyy}{mm}{dd}{hh}"
+    elif re.search(r"min$", freq, re.IGNORECASE):
+        return f"{yyyy}{mm}{dd}{hh}:{mn}"
+    elif re.search(r"season", freq, re.IGNORECASE):
+        month = int(mm)
+        if month % 3 != 0:
+            _log.debug(f"graindate: {month} is not the beginning of a known season in date {date}.")
+        if month == 12:
+            return f"{padzeros(int(yyyy) + 1)}.DJF"
+        elif month in (1, 2):
+            return f"{yyyy}.DJF"
+        elif month in (3, 4, 5):
+            return f"{yyyy}.MAM"
+        elif month in (6, 7, 8):
+            return f"{yyyy}.JJA"
+        else:
+            return f"{yyyy}.SON"
+    _log.warning("frequency not recognized in graindate")
+    return f"{yyyy}{mm}{dd}{hh}"
 
-# TODO
 def timeabbrev(freq):
     """Return appropriate abbreviation."""
     # FREUtil.pm l.586
-    raise NotImplementedError()
+    if 'daily' in freq or 'day' in freq:
+        return "day"
+    elif 'mon' in freq:
+        return "mon"
+    elif 'ann' in freq or 'yr' in freq or 'year' in freq:
+        return "ann"
+    elif 'hour' in freq or 'hr' in freq:
+        return freq.replace('hour', 'hr', 1)
+    elif 'season' in freq:
+        return "sea"
+    elif freq.endswith('min'):
+        return "min"
+    _log.warning("frequency not recognized in timeabbrev")
+    return "unknown"
 
 # TODO
 def getppNode(e):
@@ -0,0 +1,491 @@
+"""Loading and indexed querying of FRE XML files.
+
+The perl FRE tools query the XML through XML::LibXML's ``findnodes`` and
+``findvalue``, re-evaluating the same XPath strings (eg.
+``timeSeries[@freq="monthly"]``) many times per component. :class:`FREXMLIndex`
+parses the experiment file (including xincludes) once, precomputes lookup tables
+for experiments, @inherit chains and each postprocessing component's
+timeSeries/timeAverage nodes, and memoizes every XPath query made through the
+:class:`FREXMLNode` wrappers it hands out. :class:`FREXMLCache` persists the
+expanded tree between invocations.
+
+Only the XPath subset used by FRE is supported: ``/``-separated steps of
+``.``, ``..``, ``*``, element names and a final ``@attr`` or ``@*``, each
+optionally followed by predicates of ``@attr``, ``@attr="value"`` and
+``@attr!="value"`` terms joined by ``and``/``or``, or a 1-based position.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import re
+import xml.etree.ElementTree as ET
+from xml.etree import ElementInclude
+
+import logging
+_log = logging.getLogger(__name__)
+
+class FREXMLError(Exception):
+    """Raised on XPath expressions outside the supported subset."""
+    pass
+
+# Compiled XPath ---------------------------------------------------------------
+
+_step_regex = re.compile(r"""
+    (?P<axis>\.\.|\.|\*|@\*|@?[\w.:-]+)   # node test
+    (?P<preds>(?:\[[^\]]*\])*)            # predicates
+    """, re.VERBOSE)
+_pred_term_regex = re.compile(r"""
+    \s*\\?@(?P<attr>[\w.:-]+)\s*
+    (?:(?P<op>!?=)\s*(?P<q>["'])(?P<value>.*?)(?P=q))?\s*
+    """, re.VERBOSE)
+
+def _split_steps(xpath):
+    """Split *xpath* on '/' outside of predicate brackets."""
+    steps, depth, cur = [], 0, ''
+    for c in xpath:
+        if c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        if c == '/' and depth == 0:
+            steps.append(cur)
+            cur = ''
+        else:
+            cur += c
+    steps.append(cur)
+    return steps
+
+def _compile_pred(pred):
+    """Compile the text of a single predicate (without brackets) to a function
+    of (element, position) returning bool.
+    """
+    pred = pred.strip()
+    if pred.isdigit():
+        pos = int(pred)
+        return (lambda el, i: i == pos)
+    alternatives = []
+    for alt in re.split(r"\s+or\s+", pred):
+        terms = []
+        for term in re.split(r"\s+and\s+", alt):
+            m = _pred_term_regex.fullmatch(term)
+            if not m:
+                raise FREXMLError(f"Unsupported XPath predicate '[{pred}]'.")
+            terms.append((m.group('attr'), m.group('op'), m.group('value')))
+        alternatives.append(tuple(terms))
+
+    def _test(el, i):
+        for terms in alternatives:
+            for attr, op, value in terms:
+                actual = el.get(attr)
+                if op is None:
+                    ok = actual is not None
+                elif op == '=':
+                    ok = (actual == value)
+                else:
+                    ok = (actual is not None and actual != value)
+                if not ok:
+                    break
+            else:
+                return True
+        return False
+    return _test
+
+@functools.lru_cache(maxsize=None)
+def compile_xpath(xpath):
+    """Parse *xpath* once into a tuple of (node test, predicate functions)
+    steps. Results are cached by expression string.
+    """
+    xpath = xpath.strip()
+    if not xpath or xpath.startswith('/'):
+        raise FREXMLError(f"Only relative XPath expressions are supported ('{xpath}').")
+    compiled = []
+    steps = _split_steps(xpath)
+    for n, step in enumerate(steps):
+        m = _step_regex.fullmatch(step.strip())
+        if not m:
+            raise FREXMLError(f"Unsupported XPath step '{step}' in '{xpath}'.")
+        axis = m.group('axis')
+        if axis.startswith('@') and n != len(steps) - 1:
+            raise FREXMLError(f"Attribute step must be last in '{xpath}'.")
+        preds = tuple(
+            _compile_pred(p) for p in re.findall(r"\[([^\]]*)\]", m.group('preds'))
+        )
+        compiled.append((axis, preds))
+    return tuple(compiled)
+
+# Node wrappers ----------------------------------------------------------------
+
+class FREXMLNode():
+    """Wrapper around an ElementTree element (or one of its attributes) that
+    provides the XML::LibXML methods used in the FRE code, with results
+    memoized by the owning :class:`FREXMLIndex`.
+    """
+    __slots__ = ('index', 'element', 'attr')
+
+    def __init__(self, index, element, attr=None):
+        self.index = index
+        self.element = element
+        self.attr = attr
+
+    def __repr__(self):
+        if self.attr is not None:
+            return f"<FREXMLNode @{self.attr}='{self.element.get(self.attr)}'>"
+        return f"<FREXMLNode {self.element.tag} {self.element.attrib}>"
+
+    @property
+    def nodeName(self):
+        return self.attr if self.attr is not None else self.element.tag
+
+    @property
+    def parentNode(self):
+        if self.attr is not None:
+            return self.index.wrap(self.element)
+        parent = self.index.parent(self.element)
+        return (None if parent is None else self.index.wrap(parent))
+
+    def textContent(self):
+        """String value of the node: the attribute's value, or the
+        concatenated text of the element and its descendants.
+        """
+        if self.attr is not None:
+            return self.element.get(self.attr, '')
+        return ''.join(self.element.itertext())
+
+    def getAttribute(self, name):
+        """Value of attribute *name* (with or without leading '@'), or ''."""
+        if self.attr is not None:
+            return ''
+        return self.element.get(name.lstrip('@'), '')
+
+    def findnodes(self, xpath):
+        """List of nodes matching *xpath*, relative to this node."""
+        if self.attr is not None:
+            if xpath.strip() == '.':
+                return [self]
+            raise FREXMLError(f"Can't evaluate '{xpath}' relative to an attribute.")
+        return self.index.findnodes(self.element, xpath)
+
+    def fingerprint(self):
+        """Digest identifying the content of this node's subtree (or of the
+        attribute).
+        """
+        if self.attr is not None:
+            return hashlib.sha256(
+                f"@{self.attr}={self.element.get(self.attr, '')}".encode('utf-8')
+            ).hexdigest()
+        return self.index.fingerprint(self.element)
+
+    def findvalue(self, xpath):
+        """Concatenated string values of all nodes matching *xpath*, or ''."""
+        if self.attr is not None:
+            return self.findnodes(xpath)[0].textContent()
+        return self.index.findvalue(self.element, xpath)
+
+    def timeseries(self, freq=None):
+        """timeSeries nodes of this postProcess component; see
+        :meth:`FREXMLIndex.timeseries`.
+        """
+        return self.index.timeseries(self, freq)
+
+    def timeaverages(self, source=None, interval=None):
+        """timeAverage nodes of this postProcess component; see
+        :meth:`FREXMLIndex.timeaverages`.
+        """
+        return self.index.timeaverages(self, source, interval)
+
+# Index ------------------------------------------------------------------------
+
+class FREXMLIndex():
+    """Parsed FRE XML document with lookup tables and memoized queries. The
+    tree is treated as read-only once the index is built.
+    """
+    def __init__(self, root, path=None, sources=None, hashes=None):
+        self.path = path
+        # files read to construct the tree: the XML file and everything it includes
+        self.sources = list(sources or ([path] if path else []))
+        # (source, sha256) of the contents the tree was parsed from, if known
+        self.hashes = None if hashes is None else list(hashes)
+        self._root = root
+        self._parents = {c: p for p in root.iter() for c in p}
+        self._wrappers = dict()
+        self._query_cache = dict()
+        self._fingerprints = dict()
+        self._build_tables()
+
+    @classmethod
+    def load(cls, xmlfile):
+        """Parse *xmlfile* and expand its xincludes (relative to the directory
+        of *xmlfile*), once.
+        """
+        xmlfile = os.path.abspath(xmlfile)
+        xml_dir = os.path.dirname(xmlfile)
+        hashes = []
+
+        def _read(path):
+            # hash exactly the bytes that are parsed, for FREXMLCache
+            with open(path, 'rb') as f:
+                data = f.read()
+            hashes.append((path, hashlib.sha256(data).hexdigest()))
+            return data
+
+        def _loader(href, parse, encoding=None):
+            data = _read(os.path.join(xml_dir, href))
+            if parse == 'xml':
+                return ET.fromstring(data)
+            return data.decode(encoding or 'utf-8')
+
+        root = ET.fromstring(_read(xmlfile))
+        ElementInclude.include(root, loader=_loader)
+        return cls(root, path=xmlfile, sources=[path for path, _ in hashes],
+            hashes=hashes)
+
+    @classmethod
+    def fromstring(cls, text):
+        return cls(ET.fromstring(text))
+
+    def _build_tables(self):
+        self.experiments = dict()
+        for exp in self._root.findall('experiment'):
+            for key in ('name', 'label'):
+                if exp.get(key):
+                    self.experiments.setdefault(exp.get(key), exp)
+        self._timeseries = dict()
+        self._timeaverages = dict()
+        # document order of the nodes in the tables
+        self._table_order = dict()
+        for exp in self._root.findall('experiment'):
+            for cpt in exp.findall('postProcess/component'):
+                ts = self._timeseries.setdefault(cpt, dict())
+                for node in cpt.findall('timeSeries'):
+                    ts.setdefault(node.get('freq', ''), []).append(node)
+                    self._table_order[node] = len(self._table_order)
+                ta = self._timeaverages.setdefault(cpt, dict())
+                for node in cpt.findall('timeAverage'):
+                    key = (node.get('source', ''), node.get('interval', ''))
+                    ta.setdefault(key, []).append(node)
+                    self._table_order[node] = len(self._table_order)
+
+    # -- node access
+
+    @property
+    def root(self):
+        return self.wrap(self._root)
+
+    def wrap(self, element, attr=None):
+        """Return the (unique) wrapper for *element* or one of its attributes."""
+        key = (element, attr)
+        if key not in self._wrappers:
+            self._wrappers[key] = FREXMLNode(self, element, attr)
+        return self._wrappers[key]
+
+    def parent(self, element):
+        return self._parents.get(element, None)
+
+    def _eval(self, element, xpath):
+        nodes = [element]
+        attr_step = None
+        for axis, preds in compile_xpath(xpath):
+            if axis.startswith('@'):
+                attr_step = axis[1:]
+                break
+            if axis == '.':
+                matches = [nodes]
+            elif axis == '..':
+                matches = [
+                    [p] for p in (self._parents.get(el) for el in nodes) if p is not None
+                ]
+            elif axis == '*':
+                matches = [list(el) for el in nodes]
+            else:
+                matches = [[c for c in el if c.tag == axis] for el in nodes]
+            new_nodes = []
+            for group in matches:
+                # positional predicates count within each parent's children
+                for pred in preds:
+                    group = [c for i, c in enumerate(group, start=1) if pred(c, i)]
+                new_nodes.extend(group)
+            # remove duplicates, preserving document order
+            nodes = list(dict.fromkeys(new_nodes))
+        if attr_step is None:
+            return tuple(self.wrap(el) for el in nodes)
+        if attr_step == '*':
+            return tuple(self.wrap(el, a) for el in nodes for a in el.attrib)
+        return tuple(self.wrap(el, attr_step) for el in nodes if attr_step in el.attrib)
+
+    def findnodes(self, element, xpath):
+        """Memoized evaluation of *xpath* relative to *element*."""
+        key = (element, xpath)
+        if key not in self._query_cache:
+            self._query_cache[key] = self._eval(element, xpath)
+        return list(self._query_cache[key])
+
+    def findvalue(self, element, xpath):
+        return ''.join(n.textContent() for n in self.findnodes(element, xpath))
+
+    def fingerprint(self, element):
+        """Memoized sha256 hex digest of the canonical XML (C14N, ignoring
+        whitespace-only text) of *element* and its descendants.
+        """
+        if element not in self._fingerprints:
+            text = ET.canonicalize(
+                ET.tostring(element, encoding='unicode'), strip_text=True
+            )
+            self._fingerprints[element] = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return self._fingerprints[element]
+
+    # -- lookup tables
+
+    def experiment(self, name):
+        """Node of the experiment with @name or @label *name*, or None."""
+        exp = self.experiments.get(name, None)
+        return (None if exp is None else self.wrap(exp))
+
+    def inherit_chain(self, name):
+        """List of names of experiment *name* and its @inherit ancestors,
+        nearest first. Stops at a missing experiment or a cycle.
+        """
+        chain = []
+        while name and name not in chain:
+            exp = self.experiments.get(name, None)
+            if exp is None:
+                break
+            chain.append(name)
+            name = exp.get('inherit', '')
+        return chain
+
+    def _in_order(self, nodes):
+        return [self.wrap(n) for n in sorted(nodes, key=self._table_order.get)]
+
+    def timeseries(self, component, freq=None):
+        """timeSeries nodes of postProcess *component* node in document
+        order, optionally only those with @freq *freq* (or one of a tuple of
+        frequencies).
+        """
+        table = self._timeseries.get(component.element, dict())
+        if freq is None:
+            freq = tuple(table)
+        elif isinstance(freq, str):
+            freq = (freq, )
+        return self._in_order(n for f in freq for n in table.get(f, []))
+
+    def timeaverages(self, component, source=None, interval=None):
+        """timeAverage nodes of postProcess *component* node in document
+        order, optionally filtered on @source and @interval.
+        """
+        table = self._timeaverages.get(component.element, dict())
+        return self._in_order(
+            n for (src, intv), nodes in table.items() for n in nodes \
+            if (source is None or src == source) \
+                and (interval is None or intv == interval)
+        )
+
+def load(xmlfile):
+    """Return a :class:`FREXMLIndex` for *xmlfile*."""
+    return FREXMLIndex.load(xmlfile)
+
+# Persistent cache -------------------------------------------------------------
+
+CACHE_VERSION = 1
+CACHE_DIR_VARIABLE = 'FRE_XML_CACHE_DIR'
+
+def _file_hash(path):
+    """sha256 hex digest of the contents of *path*, or None if unreadable."""
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(functools.partial(f.read, 1 << 20), b''):
+                h.update(block)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+class FREXMLCacheEntry():
+    """Cached result of loading an XML file: the :class:`FREXMLIndex`, whether
+    the document passed schema validation, and a dict of any other values
+    derived from it (eg. the expanded properties list).
+    """
+    def __init__(self, index, validated=False, derived=None):
+        self.index = index
+        self.validated = validated
+        self.derived = dict(derived or dict())
+
+class FREXMLCache():
+    """On-disk cache of expanded (and validated) XML trees, so that repeated
+    invocations on an unchanged XML skip parsing and validation.
+
+    Entries are stored per (XML path, *key*), where *key* is a tuple of the
+    other inputs the cached values depend on (eg. platform and target). An
+    entry is only used if the sha256 hashes of the XML file and all files it
+    includes still match the ones recorded when it was written.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    @classmethod
+    def default(cls):
+        """Cache in $FRE_XML_CACHE_DIR (default ~/.cache/pyFRE/xml), or None if
+        that's set to the empty string.
+        """
+        cache_dir = os.environ.get(CACHE_DIR_VARIABLE,
+            os.path.join(os.path.expanduser('~'), '.cache', 'pyFRE', 'xml'))
+        return (cls(cache_dir) if cache_dir else None)
+
+    def _entry_path(self, xmlfile, key):
+        h = hashlib.sha256(
+            '\0'.join([os.path.abspath(xmlfile)] + [str(k) for k in key]).encode('utf-8')
+        )
+        return os.path.join(self.cache_dir, h.hexdigest() + '.pkl')
+
+    def get(self, xmlfile, key=()):
+        """Return the :class:`FREXMLCacheEntry` for *xmlfile* and *key*, or None
+        if there isn't one or any of the files it was built from changed.
+        """
+        path = self._entry_path(xmlfile, key)
+        try:
+            with open(path, 'rb') as f:
+                d = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            _log.debug(f"Ignoring unreadable XML cache entry {path}: {exc!r}")
+            return None
+        if d.get('version', None) != CACHE_VERSION:
+            return None
+        for source, digest in d['hashes']:
+            if _file_hash(source) != digest:
+                _log.debug(f"XML cache entry for {xmlfile} is stale ({source} changed)")
+                return None
+        index = FREXMLIndex(d['root'], path=d['path'],
+            sources=[source for source, _ in d['hashes']], hashes=d['hashes'])
+        _log.debug(f"Using cached XML for {xmlfile} from {path}")
+        return FREXMLCacheEntry(index, d['validated'], d['derived'])
+
+    def put(self, entry, key=()):
+        """Write *entry* to the cache, recording the hashes of the sources taken
+        when its tree was parsed (so that a file edited since then makes the
+        entry stale). Failures are logged and ignored.
+        """
+        index = entry.index
+        path = self._entry_path(index.path, key)
+        if index.hashes is None:
+            _log.debug(f"Not caching XML for {index.path}: source hashes unknown")
+            return
+        d = {
+            'version': CACHE_VERSION,
+            'path': index.path,
+            'hashes': index.hashes,
+            'root': index.root.element,
+            'validated': entry.validated,
+            'derived': entry.derived
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(d, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as exc:
+            _log.warning(f"Couldn't write XML cache entry {path}: {exc!r}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
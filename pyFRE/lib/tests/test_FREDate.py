@@ -0,0 +1,89 @@
+import unittest
+import numpy as np
+from pyFRE.lib import FREDate, FREUtil
+
+class TestCalendars(unittest.TestCase):
+    def test_roundtrip(self):
+        days = np.arange(0, 4000000, 13)
+        for cal in ('gregorian', 'julian', 'noleap', 'all_leap', '360_day'):
+            y, m, d = FREDate.from_days(days, cal)
+            np.testing.assert_array_equal(FREDate.to_days(y, m, d, cal), days)
+            self.assertTrue(np.all(FREDate.is_valid(y, m, d, 0, cal)))
+
+    def test_month_lengths(self):
+        self.assertEqual(FREDate.days_in_month(1900, 2, 'gregorian'), 28)
+        self.assertEqual(FREDate.days_in_month(1900, 2, 'julian'), 29)
+        self.assertEqual(FREDate.days_in_month(2000, 2, 'NOLEAP'), 28)
+        self.assertEqual(FREDate.days_in_month(2001, 2, 'thirty_day_months'), 30)
+        with self.assertRaises(FREDate.FREDateError):
+            FREDate.calendar_name('lunar')
+
+    def test_add(self):
+        # months are added first, clamping the day of month
+        self.assertEqual(FREDate.add(2001, 1, 31, 0, '+1 month'), (2001, 2, 28, 0))
+        self.assertEqual(FREDate.add(2000, 1, 1, 0, '-1 sec'), (1999, 12, 31, 86399))
+        self.assertEqual(FREDate.add(1, 3, 1, 0, '- 1 day', 'julian'), (1, 2, 28, 0))
+
+    def test_parse_delta(self):
+        self.assertEqual(FREDate.parse_delta('-5 years +1 sec'), (-5, 0, 0, 1))
+        self.assertEqual(FREDate.parse_delta('- 20 yr 3 months'), (-20, -3, 0, 0))
+        self.assertEqual(FREDate.parse_delta('+0:2:1:3:0:0:5'), (0, 2, 10, 5))
+        with self.assertRaises(FREDate.FREDateError):
+            FREDate.parse_delta('+1 fortnight')
+
+    def test_batch(self):
+        dates = [f"{y:04d}010100:00:00" for y in range(1, 101)]
+        ends = FREDate.modify_batch(dates, '+1 year -1 sec', 'noleap')
+        self.assertEqual(ends[0], '0001123123:59:59')
+        self.assertEqual(ends[-1], '0100123123:59:59')
+        # one delta per date
+        starts = FREDate.modify_batch(['0001010100:00:00'] * 3,
+            ['+0 years', '+1 years', '+2 years'])
+        self.assertEqual(starts, ['0001010100:00:00', '0002010100:00:00', '0003010100:00:00'])
+
+class TestFREUtilDates(unittest.TestCase):
+    def test_parseDate(self):
+        self.assertEqual(FREUtil.parseDate('1979'), '1979010100:00:00')
+        self.assertEqual(FREUtil.parseDate('19790301'), '1979030100:00:00')
+        self.assertEqual(FREUtil.parseDate('123450601'), '12345060100:00:00')
+        self.assertIsNone(FREUtil.parseDate('19790229'))
+        self.assertIsNone(FREUtil.parseDate('0'))
+
+    def test_modifydate(self):
+        self.assertEqual(FREUtil.modifydate('0010010100:00:00', '-5 years +1 sec'),
+            '0005010100:00:01')
+        self.assertEqual(FREUtil.modifydate('9999', '+1 year -1 sec'),
+            '9999123123:59:59')
+        self.assertEqual(FREUtil.modifydate('', '+ 12 months'), '0002010100:00:00')
+        self.assertIsNone(FREUtil.modifydate('0002', '-2 years'))
+
+    def test_dateCalc(self):
+        delta = FREUtil.dateCalc('0001010100:00:00', '0021010100:00:00')
+        self.assertEqual(FREUtil.Delta_Format(delta, 0, "%yd"), '20')
+        self.assertEqual(FREUtil.Delta_Format(delta, 0, "%Mt"), '240')
+        delta = FREUtil.dateCalc('0021010100:00:00', '0001010100:00:00')
+        self.assertEqual(FREUtil.Delta_Format(delta, 0, "%yt"), '-20')
+
+    def test_graindate(self):
+        self.assertEqual(FREUtil.graindate('0010120100:00:00', 'seasonal'), '0011.DJF')
+        self.assertEqual(FREUtil.graindate('0010040100:00:00', 'seasonal'), '0010.MAM')
+        self.assertEqual(FREUtil.graindate('0010040100:00:00', 'monthly'), '001004')
+        self.assertEqual(FREUtil.graindate('0010040100:00:00', 'annual'), '0010')
+        self.assertEqual(FREUtil.graindate('0010040106:00:00', '6hr'), '0010040106')
+
+    def test_dateCmp(self):
+        self.assertEqual(FREUtil.dateCmp('9999010100:00:00', '10000010100:00:00'), -1)
+        self.assertEqual(FREUtil.dateCmp('0001010100:00:00', '0001010100:00:00'), 0)
+
+    def test_daysSince1BC(self):
+        self.assertEqual(FREUtil.daysSince1BC(1, 1, 1), 1)
+        self.assertEqual(FREUtil.daysSince1BC(3, 1, 2000), 730180)
+        # as passed by checkHistComplete
+        self.assertEqual(FREUtil.daysSince1BC('03', '01', '2000'), 730180)
+        self.assertIsNone(FREUtil.daysSince1BC('13', '01', '2000'))
+
+    def test_modifydateBatch(self):
+        self.assertEqual(FREUtil.modifydateBatch(['1980', '19810701'], '- 1 years'),
+            ['1979010100:00:00', '1980070100:00:00'])
+        with self.assertRaises(FREDate.FREDateError):
+            FREUtil.modifydateBatch(['19790229'], '+1 sec')
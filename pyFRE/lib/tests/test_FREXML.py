@@ -0,0 +1,162 @@
+import os
+import tempfile
+import textwrap
+import unittest
+from pyFRE.lib import FREXML, FREUtil
+
+_xml = textwrap.dedent("""\
+    <experimentSuite rtsVersion="4">
+      <setup><platform name="gfdl.ncrc5-intel"/></setup>
+      <experiment name="base">
+        <description>base run in $root</description>
+        <postProcess>
+          <component type="atmos" source="atmos_month">
+            <timeSeries freq="monthly" source="atmos_month" chunkLength="5yr">
+              <variables>tas pr</variables>
+            </timeSeries>
+            <timeSeries freq="annual" source="atmos_month" chunkLength="10yr"/>
+            <timeAverage source="annual" interval="1yr"/>
+            <timeAverage source="monthly" interval="5yr"/>
+          </component>
+        </postProcess>
+      </experiment>
+      <experiment name="child" inherit="base">
+        <postProcess/>
+      </experiment>
+    </experimentSuite>
+""")
+
+class TestXPath(unittest.TestCase):
+    def setUp(self):
+        self.index = FREXML.FREXMLIndex.fromstring(_xml)
+        self.root = self.index.root
+        self.cpt = self.root.findnodes('experiment/postProcess/component')[0]
+
+    def test_attribute(self):
+        self.assertEqual(self.root.findvalue('@rtsVersion'), '4')
+        self.assertEqual(self.cpt.findvalue('@type'), 'atmos')
+        self.assertEqual(self.cpt.findvalue('@missing'), '')
+
+    def test_predicates(self):
+        nodes = self.cpt.findnodes('timeSeries[@freq="monthly"]')
+        self.assertEqual(len(nodes), 1)
+        self.assertEqual(nodes[0].findvalue('@chunkLength'), '5yr')
+        nodes = self.cpt.findnodes(
+            'timeAverage[@source="annual" and @interval="1yr"]')
+        self.assertEqual(len(nodes), 1)
+        nodes = self.root.findnodes(
+            "experiment[\\@label='child' or \\@name='child']")
+        self.assertEqual(nodes[0].getAttribute('inherit'), 'base')
+        self.assertEqual(len(self.cpt.findnodes('timeSeries[2]')), 1)
+
+    def test_attribute_nodes(self):
+        ts = self.cpt.findnodes('timeSeries')[0]
+        self.assertEqual(ts.findvalue('variables'), 'tas pr')
+        self.assertEqual(ts.findvalue('../@source'), 'atmos_month')
+        srcs = [n.findvalue('.') for n in self.cpt.findnodes('*/@source')]
+        self.assertEqual(srcs, ['atmos_month', 'atmos_month', 'annual', 'monthly'])
+
+    def test_memoized(self):
+        a = self.cpt.findnodes('timeSeries[@freq="monthly"]')
+        b = self.cpt.findnodes('timeSeries[@freq="monthly"]')
+        self.assertIs(a[0], b[0])
+        self.assertIn((self.cpt.element, 'timeSeries[@freq="monthly"]'),
+            self.index._query_cache)
+
+    def test_unsupported(self):
+        with self.assertRaises(FREXML.FREXMLError):
+            self.root.findnodes('//experiment')
+
+    def test_tables(self):
+        self.assertEqual(self.index.inherit_chain('child'), ['child', 'base'])
+        self.assertEqual(
+            [n.findvalue('@freq') for n in self.index.timeseries(self.cpt)],
+            ['monthly', 'annual'])
+        self.assertEqual(len(self.index.timeseries(self.cpt, 'annual')), 1)
+        self.assertEqual(
+            [n.findvalue('@interval') for n in self.index.timeaverages(self.cpt, source='monthly')],
+            ['5yr'])
+        # in document order, and the same as the XPath queries
+        self.assertEqual(
+            [n.findvalue('@freq') for n in self.cpt.timeseries(('annual', 'monthly'))],
+            ['monthly', 'annual'])
+        self.assertEqual(self.cpt.timeseries('monthly'),
+            self.cpt.findnodes('timeSeries[@freq="monthly"]'))
+        self.assertEqual(self.cpt.timeaverages(source='annual', interval='1yr'),
+            self.cpt.findnodes('timeAverage[@source="annual" and @interval="1yr"]'))
+
+    def test_fingerprint(self):
+        ts = self.cpt.findnodes('timeSeries')
+        self.assertNotEqual(ts[0].fingerprint(), ts[1].fingerprint())
+        # formatting doesn't matter, content does
+        other = FREXML.FREXMLIndex.fromstring(_xml.replace('\n      ', '\n  '))
+        other_cpt = other.root.findnodes('experiment/postProcess/component')[0]
+        self.assertEqual(other_cpt.fingerprint(), self.cpt.fingerprint())
+        other = FREXML.FREXMLIndex.fromstring(_xml.replace('tas pr', 'tas'))
+        other_cpt = other.root.findnodes('experiment/postProcess/component')[0]
+        self.assertNotEqual(other_cpt.fingerprint(), self.cpt.fingerprint())
+        self.assertEqual(other_cpt.findnodes('timeSeries')[1].fingerprint(),
+            ts[1].fingerprint())
+
+    def test_getxpathval(self):
+        self.assertEqual(
+            FREUtil.getxpathval('description', 'child', self.root, rootdir='/ROOT'),
+            'base run in /ROOT')
+        self.assertEqual(FREUtil.getxpathval('missing', 'child', self.root), '')
+
+class TestLoad(unittest.TestCase):
+    def test_xinclude(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, 'inc.xml'), 'w') as f:
+                f.write('<experiment name="included"/>')
+            path = os.path.join(d, 'main.xml')
+            with open(path, 'w') as f:
+                f.write('<experimentSuite xmlns:xi="http://www.w3.org/2001/XInclude">'
+                    '<xi:include href="inc.xml"/></experimentSuite>')
+            index = FREXML.load(path)
+        self.assertIsNotNone(index.experiment('included'))
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.inc = os.path.join(self.dir, 'inc.xml')
+        self._write(self.inc, '<experiment name="included"/>')
+        self.xml = os.path.join(self.dir, 'main.xml')
+        self._write(self.xml,
+            '<experimentSuite xmlns:xi="http://www.w3.org/2001/XInclude">'
+            '<xi:include href="inc.xml"/></experimentSuite>')
+        self.cache = FREXML.FREXMLCache(os.path.join(self.dir, 'cache'))
+        self.key = ('gfdl.ncrc5-intel', 'prod')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, path, text):
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def test_roundtrip(self):
+        self.assertIsNone(self.cache.get(self.xml, self.key))
+        entry = FREXML.FREXMLCacheEntry(FREXML.load(self.xml), validated=True,
+            derived={'properties': ['a', 'b']})
+        self.cache.put(entry, self.key)
+        cached = self.cache.get(self.xml, self.key)
+        self.assertTrue(cached.validated)
+        self.assertEqual(cached.derived['properties'], ['a', 'b'])
+        self.assertIsNotNone(cached.index.experiment('included'))
+        self.assertEqual(cached.index.sources, [self.xml, self.inc])
+        # keyed on platform/target too
+        self.assertIsNone(self.cache.get(self.xml, ('gfdl.ncrc5-intel', 'debug')))
+
+    def test_included_file_changed(self):
+        self.cache.put(FREXML.FREXMLCacheEntry(FREXML.load(self.xml)), self.key)
+        self._write(self.inc, '<experiment name="changed"/>')
+        self.assertIsNone(self.cache.get(self.xml, self.key))
+
+    def test_changed_before_put(self):
+        # the hashes are those of the files as parsed, not as at put()
+        index = FREXML.load(self.xml)
+        self._write(self.inc, '<experiment name="changed"/>')
+        self.cache.put(FREXML.FREXMLCacheEntry(index), self.key)
+        self.assertIsNone(self.cache.get(self.xml, self.key))
@@ -75,6 +75,12 @@ class MDTFCalledProcessError(CalledProcessError, MDTFBaseException):
     """Wrapper for :py:class:`subprocess.CalledProcessError`."""
     pass
 
+class WormKeyError(KeyError, MDTFBaseException):
+    """Raised when attempting to overwrite or delete an entry in a
+    :class:`~pyFRE.util.basic.WormDict`.
+    """
+    pass
+
 class UnitsError(ValueError, MDTFBaseException):
     """Raised when trying to convert between quantities with physically
     inequivalent units.
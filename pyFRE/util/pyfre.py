@@ -1,7 +1,8 @@
 """Subroutines for FRE perl to python transliteration."""
 
 import os
-import collections
+import dataclasses
+import functools
 import re
 import string
 from textwrap import dedent
@@ -27,32 +28,154 @@ def regex_match(regex_, str_):
 def regex_search():
     pass
 
-def pl_template(cmds_template, *args, auto_escape_dollars=True, **kwargs):
-    """Do perl-type string templating."""
+class CompiledTemplate():
+    """A csh fragment for :func:`pl_template`, dedented and split into literal
+    text and placeholder names once, so that rendering is a single join.
+    Placeholder syntax is that of :py:class:`string.Template`.
+    """
+    __slots__ = ('literals', 'names')
+
+    def __init__(self, cmds_template, auto_escape_dollars=True):
+        text = dedent(cmds_template)
+        # string.Template escapes $ delimiter as $$; replaced by single $ in output
+        if auto_escape_dollars:
+            text = text.replace('\$', '$$')
+        else:
+            # pass through '\$' as written
+            text = text.replace('\$', '\$$')
+        literals, names = [], []
+        pos, lit = 0, []
+        for m in string.Template.pattern.finditer(text):
+            lit.append(text[pos:m.start()])
+            pos = m.end()
+            if m.group('escaped') is not None:
+                lit.append('$')
+            elif m.group('named') is not None or m.group('braced') is not None:
+                literals.append(''.join(lit))
+                names.append(m.group('named') or m.group('braced'))
+                lit = []
+            else:
+                lineno = text.count('\n', 0, m.start('invalid')) + 1
+                colno = m.start('invalid') - text.rfind('\n', 0, m.start('invalid'))
+                raise ValueError(("Invalid placeholder in string: "
+                    f"line {lineno}, col {colno}"))
+        lit.append(text[pos:])
+        literals.append(''.join(lit))
+        self.literals = tuple(literals)
+        self.names = tuple(names)
+
+    def render(self, lookup):
+        """Substitute placeholders with ``str(lookup[name])``."""
+        if not self.names:
+            return self.literals[0]
+        pieces = [self.literals[0]]
+        for name, lit in zip(self.names, self.literals[1:]):
+            pieces.append(str(lookup[name]))
+            pieces.append(lit)
+        return ''.join(pieces)
+
+@functools.lru_cache(maxsize=None)
+def compile_template(cmds_template, auto_escape_dollars=True):
+    """Return the :class:`CompiledTemplate` for *cmds_template*; compiled on
+    first use and cached by template text. Can be called at import time on
+    module-level fragments.
+    """
+    return CompiledTemplate(cmds_template, auto_escape_dollars)
+
+@functools.lru_cache(maxsize=None)
+def _dedent_template(cmds_template, auto_escape_dollars=True):
     cmds_template = dedent(cmds_template)
+    if not auto_escape_dollars:
+        cmds_template = cmds_template.replace('\$', '$')
+    return cmds_template
+
+_missing = object()
+
+@functools.lru_cache(maxsize=None)
+def _dataclass_field_names(cls):
+    return frozenset(f.name for f in dataclasses.fields(cls))
+
+def dataclass_template_lookup(obj, name):
+    """``template_lookup`` for a dataclass whose ``template_dict`` is
+    ``dataclasses.asdict``: return the value of field *name* without copying
+    the others. Raises KeyError if there's no such field.
+    """
+    if name in _dataclass_field_names(type(obj)):
+        return getattr(obj, name)
+    raise KeyError(name)
+
+def _source_lookup(source, name):
+    """Value of *name* in a single templating source, or _missing."""
+    if isinstance(source, TemplateContext):
+        return source.get(name, _missing)
+    if isinstance(source, dict):
+        return source.get(name, _missing)
+    try:
+        return source.template_lookup(name)
+    except KeyError:
+        return _missing
+
+class TemplateContext():
+    """Read-only mapping over the sources of templating values (dicts, and
+    objects with a ``template_lookup(name)`` method) passed to
+    :func:`pl_template`. Names are looked up lazily, only when a fragment
+    references them, and resolved values are memoized, so one context can be
+    built per component and shared by all of its fragments.
+
+    As in the dict merge this replaces, a name found in more than one source
+    with different values raises WormKeyError.
+    """
+    def __init__(self, *sources, **kwargs):
+        self.sources = []
+        for source in sources + (kwargs, ):
+            if isinstance(source, (dict, TemplateContext)):
+                self.sources.append(source)
+            elif hasattr(source, 'template_lookup'):
+                self.sources.append(source)
+            elif hasattr(source, 'template_dict'):
+                self.sources.append(source.template_dict())
+        self._memo = dict()
+
+    def get(self, name, default=None):
+        if name in self._memo:
+            return self._memo[name]
+        value = _missing
+        for source in self.sources:
+            v = _source_lookup(source, name)
+            if v is _missing:
+                continue
+            if value is not _missing and v != value:
+                raise exceptions.WormKeyError(("Attempting to overwrite entry for "
+                    f"'{name}'. Existing value: '{value}', new value: '{v}'."))
+            value = v
+        if value is _missing:
+            return default
+        self._memo[name] = value
+        return value
+
+    def __getitem__(self, name):
+        value = self.get(name, _missing)
+        if value is _missing:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self.get(name, _missing) is not _missing
 
+def pl_template(cmds_template, *args, auto_escape_dollars=True, **kwargs):
+    """Do perl-type string templating."""
     if not args and not kwargs:
         # first mode: no templating, $ aren't escaped, just concat multiline string
-        if not auto_escape_dollars:
-            cmds_template = cmds_template.replace('\$', '$')
-        return cmds_template
-
-    # build dict of templating replacements
-    template_vals = basic.ConsistentDict
-    for arg in args:
-        if isinstance(arg, dict):
-            template_vals.update(arg)
-        if hasattr(arg, 'template_dict'):
-            template_vals.update(arg.template_dict())
-    template_vals.update(kwargs)
-
-    # string.Template escapes $ delimiter as $$; replaced by single $ in output
-    if auto_escape_dollars:
-        cmds = string.Template(cmds_template.replace('\$', '$$'))
+        return _dedent_template(cmds_template, auto_escape_dollars)
+
+    compiled = compile_template(cmds_template, auto_escape_dollars)
+    if not compiled.names:
+        return compiled.literals[0]
+    if len(args) == 1 and not kwargs and isinstance(args[0], TemplateContext):
+        context = args[0]
     else:
-        # pass through '\$' as written
-        cmds = string.Template(cmds_template.replace('\$', '\$$'))
-    return cmds.substitute(template_vals)
+        context = TemplateContext(*args, **kwargs)
+    return compiled.render(context)
 
 def shell(cmd, log, **kwargs):
     """Replace shell one-liners."""
@@ -61,25 +184,128 @@ def shell(cmd, log, **kwargs):
         raise exceptions.MDTFCalledProcessError(proc.stderr)
     return proc.stdout.rstrip('\n')
 
-class ScriptTemplateParts(collections.OrderedDict):
-    """Class to split up the csh runscript into pieces as it's being assembled."""
-    def __init__(self, *args, **kwargs):
-        super(ScriptTemplateParts, self).__init__(*args, **kwargs)
-        self["_header"] = ""
+class ScriptTemplateParts():
+    """Streaming builder for the csh runscript.
+
+    Text is kept as a list of chunks and only joined when the script is
+    written, so appending commands is constant-time instead of copying the
+    whole script. Text added with :meth:`add_template` is scanned once for
+    placeholder comments (slots, e.g. ``#hsmget_history_files``) and for
+    directive/variable lines (e.g. ``#SBATCH --time``, ``#INFO:max_years=``,
+    ``set histDir``), each of which is kept in its own chunk so it can be
+    filled or edited in place without a pass over the rest of the script.
+    Text added with :meth:`append` (or ``+=``) is stored as-is.
+    """
+    _slot_regex = re.compile(r'#[a-z_]+$')
+    _line_regex = re.compile(r'(#SBATCH --[\w-]+|#INFO:\w+=|setenv \w+|set \w+)')
+
+    def __init__(self, template=""):
+        self._chunks = []
+        self._slots = dict()  # slot marker -> chunk index
+        self._lines = dict()  # line key -> (chunk index, indentation)
+        if template:
+            self.add_template(template)
+
+    def copy(self):
+        """Return an independent copy, e.g. to specialize the experiment-level
+        script for a single component.
+        """
+        new = type(self)()
+        new._chunks = list(self._chunks)
+        new._slots = dict(self._slots)
+        new._lines = dict(self._lines)
+        return new
+
+    def add_template(self, text):
+        """Append *text*, indexing its slots and directive lines. If a slot or
+        line key occurs more than once, only the first occurrence is indexed.
+        """
+        buf = []
+        for line in text.splitlines(keepends=True):
+            content = line.rstrip('\n')
+            stripped = content.lstrip()
+            slot = self._slot_regex.match(stripped)
+            key = self._line_regex.match(stripped)
+            if slot and stripped not in self._slots:
+                self._flush(buf)
+                self._slots[stripped] = len(self._chunks)
+            elif key and key.group(1) not in self._lines:
+                self._flush(buf)
+                indent = content[:len(content) - len(stripped)]
+                self._lines[key.group(1)] = (len(self._chunks), indent)
+            else:
+                buf.append(line)
+                continue
+            self._chunks.append(content)
+            buf.append(line[len(content):])
+        self._flush(buf)
+        return self
 
-    def prepend(self, key, value):
-        """Convenience method to insert key:value at the start of the dict."""
-        self[key] = value
-        self.move_to_end(key, last=False)
+    def _flush(self, buf):
+        if buf:
+            self._chunks.append(''.join(buf))
+            buf.clear()
 
-    def strip_comments(self):
-        """Remove shell comments (starting with #)."""
+    def append(self, text):
+        """Append *text* to the end of the script."""
+        if text:
+            self._chunks.append(text)
+        return self
+
+    def __iadd__(self, text):
+        return self.append(text)
+
+    def fill(self, slot, text):
+        """Replace the placeholder comment *slot* with *text*. Each slot can be
+        filled once; returns False if *slot* was not (or is no longer) present,
+        matching a perl substitution that doesn't match.
+        """
+        idx = self._slots.pop(slot, None)
+        if idx is None:
+            return False
+        self._chunks[idx] = self._chunks[idx].replace(slot, text, 1)
+        return True
+
+    def get_line(self, key):
+        """Return the current text of the line indexed by *key*, or None."""
+        if key not in self._lines:
+            return None
+        return self._chunks[self._lines[key][0]]
+
+    def set_line(self, key, rest=""):
+        """Replace the line indexed by *key* with *key* followed by *rest*,
+        e.g. ``set_line('#SBATCH --time', '=01:00:00')``. Returns False if no
+        line with that key was found.
+        """
+        if key not in self._lines:
+            return False
+        idx, indent = self._lines[key]
+        self._chunks[idx] = indent + key + rest
+        return True
+
+    def sub(self, old_pat, new_pat, key=None):
+        """Apply a regex substitution. If *key* is given, only the line indexed
+        by *key* is touched; otherwise every chunk of the script is scanned.
+        """
+        if key is not None:
+            if key not in self._lines:
+                return
+            idx = self._lines[key][0]
+            self._chunks[idx] = re.sub(old_pat, new_pat, self._chunks[idx])
+            return
+        self._chunks = [re.sub(old_pat, new_pat, c) for c in self._chunks]
+
+    def __iter__(self):
+        return iter(self._chunks)
 
     def join(self):
         """Join parts to a single string."""
-        return '\n'.join(self.values())
+        return ''.join(self._chunks)
+
+    def __str__(self):
+        return self.join()
 
-    def sub(self, old_pat, new_pat):
-        """Apply a regex substitution to all parts of the script."""
-        for k, v in self.items():
-            self[k] = re.sub(old_pat, new_pat, v)
+    def write(self, path, buffering=1 << 20):
+        """Write the script to *path* through a single buffered writer."""
+        with open(path, 'w', buffering=buffering) as f:
+            f.writelines(self._chunks)
@@ -0,0 +1,104 @@
+"""Benchmark of csh script assembly with :func:`~pyFRE.util.pyfre.pl_template`,
+comparing the compiled templates against the previous implementation (dedent,
+dict merge and string.Template on every call.)
+
+Run with ``python -m pyFRE.util.tests.bench_pl_template``.
+"""
+import dataclasses as dc
+import string
+import sys
+import timeit
+from textwrap import dedent
+
+from pyFRE.util import basic, pyfre
+
+def reference_pl_template(cmds_template, *args, auto_escape_dollars=True, **kwargs):
+    """pl_template as it was before fragments were compiled."""
+    cmds_template = dedent(cmds_template)
+    if not args and not kwargs:
+        if not auto_escape_dollars:
+            cmds_template = cmds_template.replace('\\$', '$')
+        return cmds_template
+    template_vals = basic.ConsistentDict()
+    for arg in args:
+        if isinstance(arg, dict):
+            template_vals.update(arg)
+        if hasattr(arg, 'template_dict'):
+            template_vals.update(arg.template_dict())
+    template_vals.update(kwargs)
+    if auto_escape_dollars:
+        cmds = string.Template(cmds_template.replace('\\$', '$$'))
+    else:
+        cmds = string.Template(cmds_template.replace('\\$', '\\$$'))
+    return cmds.substitute(template_vals)
+
+# stand-in for FREExperiment: ~50 path/config fields
+_Experiment = dc.make_dataclass('_Experiment',
+    [(f"field{i}", str, dc.field(default=f"/path/to/dir{i}")) for i in range(45)] \
+    + [('work', str, dc.field(default='/work')),
+       ('tempCache', str, dc.field(default='/tmp/cache')),
+       ('ppRootDir', str, dc.field(default='/pp'))],
+    namespace={
+        'template_dict': lambda self: dc.asdict(self),
+        'template_lookup': lambda self, name: pyfre.dataclass_template_lookup(self, name)
+    }
+)
+
+ERRORSTR = """
+
+    if ( \\$status != 0 ) then
+        @ errors_found += 1
+        echo "ERROR: $msg"
+        echo "ERROR: $msg" >> \\$work/.errors
+        exit 1
+    endif
+
+"""
+
+VARIABLE_BLOCK = """
+    set file = $reqpath/$component.$tBEGf-$tENDf.\\$var
+    if ( ! -e \\$file ) then
+        echo "ERROR: input file \\$file does not exist"
+    endif
+    $time_ncks ncks -d time,$startmonth,$endmonth \\$file year.nc > ncks.out
+    $check_ncks
+    $time_timavg \\$TIMAVG -o $tempCache/$component.$tYEARf.\\$var year.nc
+    $check_timavg
+"""
+
+def generate_component(template_fn, exp, nvars, shared_context=False):
+    """Assemble a script shaped like one component's: an error check and a
+    variable block per variable and year.
+    """
+    parts = []
+    ctx = pyfre.TemplateContext(exp) if shared_context else exp
+    for v in range(nvars):
+        for year in range(5):
+            loc = dict(reqpath='/arch/ts/monthly/5yr', component='atmos',
+                tBEGf='000101', tENDf='000512', startmonth=12 * year + 1,
+                endmonth=12 * year + 12, tYEARf=f"{year + 1:04d}",
+                time_ncks='', time_timavg='')
+            loc['check_ncks'] = template_fn(ERRORSTR, msg=f"NCKS (var{v})")
+            loc['check_timavg'] = template_fn(ERRORSTR, msg=f"TIMAVG (var{v})")
+            parts.append(template_fn(VARIABLE_BLOCK, loc, ctx))
+    return ''.join(parts)
+
+def main(nvars=300, repeat=3):
+    exp = _Experiment()
+    assert generate_component(reference_pl_template, exp, 2) \
+        == generate_component(pyfre.pl_template, exp, 2, shared_context=True)
+    results = [
+        ('before (string.Template per call)',
+            lambda: generate_component(reference_pl_template, exp, nvars)),
+        ('after (compiled)',
+            lambda: generate_component(pyfre.pl_template, exp, nvars)),
+        ('after (compiled, shared context)',
+            lambda: generate_component(pyfre.pl_template, exp, nvars, shared_context=True))
+    ]
+    print(f"Per-component script generation, {nvars} variables x 5 years:")
+    for label, fn in results:
+        t = min(timeit.repeat(fn, number=1, repeat=repeat))
+        print(f"  {label:<36s} {1000 * t:8.1f} ms")
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
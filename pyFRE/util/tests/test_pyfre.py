@@ -0,0 +1,104 @@
+import os
+import dataclasses as dc
+import tempfile
+import unittest
+from pyFRE.util import pyfre as util
+from pyFRE.util import exceptions
+
+@dc.dataclass
+class _Config():
+    component: str = "atmos"
+    work: str = "/work"
+
+    def template_dict(self):
+        return dc.asdict(self)
+
+    def template_lookup(self, name):
+        return util.dataclass_template_lookup(self, name)
+
+class TestPlTemplate(unittest.TestCase):
+    def test_no_templating(self):
+        self.assertEqual(util.pl_template("""
+            echo \\$work $x
+        """), "\necho \\$work $x\n")
+        self.assertEqual(util.pl_template("""
+            echo \\$work
+        """, auto_escape_dollars=False), "\necho $work\n")
+
+    def test_substitution(self):
+        cfg = _Config()
+        self.assertEqual(util.pl_template("""
+            cd \\$work/$component.${freq}
+        """, cfg, dict(freq='monthly')), "\ncd $work/atmos.monthly\n")
+        self.assertEqual(util.pl_template("$a \\$b $$c", a=1,
+            auto_escape_dollars=False), "1 \\$b $c")
+
+    def test_errors(self):
+        with self.assertRaises(KeyError):
+            util.pl_template("$missing", a=1)
+        with self.assertRaises(ValueError):
+            util.pl_template("$ oops", a=1)
+        with self.assertRaises(exceptions.WormKeyError):
+            util.pl_template("$component", _Config(), component='ocean')
+        # consistent duplicates are fine
+        self.assertEqual(util.pl_template("$component", _Config(),
+            component='atmos'), "atmos")
+
+    def test_compiled_once(self):
+        tmpl = "echo $a $b"
+        self.assertIs(util.compile_template(tmpl), util.compile_template(tmpl))
+        self.assertEqual(util.compile_template(tmpl).names, ('a', 'b'))
+
+    def test_shared_context(self):
+        cfg = _Config()
+        ctx = util.TemplateContext(cfg, freq='daily')
+        self.assertEqual(util.pl_template("$component $freq", ctx), "atmos daily")
+        self.assertEqual(util.pl_template("$work", ctx), "/work")
+        self.assertIn('component', ctx)
+        self.assertNotIn('nothing', ctx)
+
+class TestScriptTemplateParts(unittest.TestCase):
+    _tmpl = ("#!/bin/csh -f\n#SBATCH --time\n#INFO:max_years=\nset histDir\n"
+        "    #hsmget_history_files\nset work\n")
+
+    def test_fill_and_set_line(self):
+        script = util.ScriptTemplateParts(self._tmpl)
+        script += "echo one\n"
+        script.append("echo two\n")
+        self.assertTrue(script.set_line('#SBATCH --time', '=01:00:00'))
+        self.assertTrue(script.set_line('#INFO:max_years=', '5'))
+        self.assertTrue(script.set_line('set histDir', ' = /hist'))
+        self.assertTrue(script.fill('#hsmget_history_files', 'hsmget a\n'))
+        self.assertFalse(script.fill('#hsmget_history_files', 'again'))
+        self.assertFalse(script.set_line('#SBATCH --nothing', '=1'))
+        self.assertEqual(script.join(), (
+            "#!/bin/csh -f\n#SBATCH --time=01:00:00\n#INFO:max_years=5\n"
+            "set histDir = /hist\n    hsmget a\n\nset work\necho one\necho two\n"
+        ))
+        self.assertEqual(script.get_line('set histDir'), 'set histDir = /hist')
+
+    def test_copy_is_independent(self):
+        tmpl = util.ScriptTemplateParts(self._tmpl)
+        script = tmpl.copy()
+        script.set_line('set work', ' = /work')
+        script += "echo cpt\n"
+        self.assertEqual(tmpl.join(), self._tmpl)
+        self.assertIn("set work = /work\necho cpt\n", str(script))
+
+    def test_sub(self):
+        script = util.ScriptTemplateParts("#SBATCH --comment=fre\nset work\n")
+        script += "echo '#SBATCH --comment'\n"
+        script.sub(r'(#SBATCH --comment)=?(.*)', r'\1=\2,xtmp', key='#SBATCH --comment')
+        self.assertEqual(str(script),
+            "#SBATCH --comment=fre,xtmp\nset work\necho '#SBATCH --comment'\n")
+        script.sub('echo', 'print')
+        self.assertTrue(str(script).endswith("print '#SBATCH --comment'\n"))
+
+    def test_write(self):
+        script = util.ScriptTemplateParts(self._tmpl)
+        script += "echo done\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'script.csh')
+            script.write(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), self._tmpl + "echo done\n")